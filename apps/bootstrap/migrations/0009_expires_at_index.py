@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bootstrap', '0008_add_pairing_attempts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activesession',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, verbose_name='会话过期时间'),
+        ),
+        migrations.AlterField(
+            model_name='initialtoken',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, verbose_name='AccessToken过期时间'),
+        ),
+    ]
@@ -19,7 +19,7 @@ class InitialToken(models.Model):
 
     token = models.CharField(max_length=255, primary_key=True, verbose_name="AccessToken")
     host = models.ForeignKey(Host, on_delete=models.CASCADE, verbose_name="关联的主机")
-    expires_at = models.DateTimeField(verbose_name="AccessToken过期时间")
+    expires_at = models.DateTimeField(verbose_name="AccessToken过期时间", db_index=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ISSUED', verbose_name="状态")
     pairing_code = models.CharField(max_length=6, verbose_name="配对码", blank=True, null=True)
     pairing_code_expires_at = models.DateTimeField(verbose_name="配对码过期时间", blank=True, null=True)
@@ -73,7 +73,7 @@ class ActiveSession(models.Model):
     session_token = models.CharField(max_length=255, primary_key=True, verbose_name="临时凭证")
     host = models.ForeignKey(Host, on_delete=models.CASCADE, verbose_name="关联的主机")
     bound_ip = models.GenericIPAddressField(verbose_name="绑定的请求源IP")
-    expires_at = models.DateTimeField(verbose_name="会话过期时间")
+    expires_at = models.DateTimeField(verbose_name="会话过期时间", db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     
     class Meta:
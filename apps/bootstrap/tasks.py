@@ -1,7 +1,5 @@
 from celery import shared_task
 from django.utils import timezone
-from .models import ActiveSession, InitialToken
-from datetime import timedelta
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,36 +7,22 @@ logger = logging.getLogger(__name__)
 
 @shared_task
 def cleanup_expired_sessions():
-    """清理过期的活动会话"""
-    try:
-        expired_sessions = ActiveSession.objects.filter(expires_at__lt=timezone.now())
-        count = expired_sessions.count()
-        expired_sessions.delete()
-        
-        logger.info(f"清理了 {count} 个过期的活动会话")
-        return f"清理了 {count} 个过期的活动会话"
-    except Exception as e:
-        logger.error(f"清理过期会话时出错: {str(e)}")
-        raise
+    """清理过期的活动会话（由过期数据清理统一执行，保留以兼容旧调用）"""
+    from apps.tasks.sweeper import run_sweeps
+
+    count = run_sweeps(['active_sessions'])[0].rows
+    logger.info(f"清理了 {count} 个过期的活动会话")
+    return f"清理了 {count} 个过期的活动会话"
 
 
 @shared_task
 def cleanup_expired_initial_tokens():
-    """清理过期的初始令牌"""
-    try:
-        # 删除已过期且已消耗的令牌，或者过期超过7天的令牌
-        cutoff_time = timezone.now() - timedelta(days=7)
-        expired_tokens = InitialToken.objects.filter(
-            expires_at__lt=cutoff_time
-        )
-        count = expired_tokens.count()
-        expired_tokens.delete()
-        
-        logger.info(f"清理了 {count} 个过期的初始令牌")
-        return f"清理了 {count} 个过期的初始令牌"
-    except Exception as e:
-        logger.error(f"清理过期初始令牌时出错: {str(e)}")
-        raise
+    """清理过期超过保留期（默认7天）的初始令牌"""
+    from apps.tasks.sweeper import run_sweeps
+
+    count = run_sweeps(['initial_tokens'])[0].rows
+    logger.info(f"清理了 {count} 个过期的初始令牌")
+    return f"清理了 {count} 个过期的初始令牌"
 
 
 @shared_task
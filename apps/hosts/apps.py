@@ -7,4 +7,9 @@ from django.apps import AppConfig
 class HostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.hosts'
-    verbose_name = '主机管理'
\ No newline at end of file
+    verbose_name = '主机管理'
+
+    def ready(self):
+        """应用就绪时执行的初始化操作"""
+        # 导入信号处理器
+        import apps.hosts.signals  # noqa: F401
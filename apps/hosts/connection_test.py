@@ -0,0 +1,183 @@
+"""
+主机连接测试（异步）
+
+主机创建、编辑、启停等页面原先在请求中同步调用 Host.test_connection()，
+主机不可达时请求要等待完整的 WinRM 超时和重试。改为：
+
+- request_connection_test() 立即返回：最近 HOST_CONNECTION_TEST_CACHE_TTL 秒内
+  有测试结果时直接复用，已有测试在进行时返回其状态，否则投递 Celery 任务
+  test_host_connection（投递失败时在后台线程执行），页面不等待远程 I/O
+- 测试状态保存在缓存中，完成时通过 utils.progress_events 发布事件，
+  页面经 connection_test_stream（SSE）实时获取结果
+
+使用方式：
+    from apps.hosts.connection_test import request_connection_test, connection_test_payload
+
+    entry = request_connection_test(host)
+    return JsonResponse(connection_test_payload(host, entry))
+"""
+import logging
+import threading
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from utils.progress_events import event_stream, publish, sse_response
+
+logger = logging.getLogger("2c2a")
+
+STATE_PENDING = 'pending'
+STATE_DONE = 'done'
+
+DEFAULT_CACHE_TTL = 60
+# 进行中状态的保留时间，任务丢失时到期后允许重新测试
+PENDING_TIMEOUT = 300
+
+
+def _cache_key(host_id: int) -> str:
+    return f'host_connection_test:{host_id}'
+
+
+def connection_test_channel(host_id: int) -> str:
+    return f'host:{host_id}:connection_test'
+
+
+def get_connection_test(host_id: int) -> Optional[Dict]:
+    """读取主机最近一次连接测试的状态，没有时返回 None"""
+    return cache.get(_cache_key(host_id))
+
+
+def request_connection_test(host, refresh_dns: bool = False, force: bool = False,
+                            probe: bool = False) -> Dict:
+    """
+    请求测试主机连接，不等待结果
+
+    参数:
+        host: Host 实例
+        refresh_dns: 测试前清除该主机名的解析缓存
+        force: 忽略最近的测试结果，重新测试（仍复用进行中的测试）
+        probe: 忽略主机熔断状态直接测试，成功后熔断器恢复（管理员手动重测）
+
+    返回:
+        缓存中的测试状态 {'state', 'status', 'old_status', 'error', 'requested_at', 'checked_at'}
+    """
+    previous = get_connection_test(host.pk)
+    if previous is not None and (previous['state'] == STATE_PENDING or not force):
+        return previous
+
+    entry = {
+        'state': STATE_PENDING,
+        'status': host.status,
+        'old_status': host.status,
+        'error': None,
+        'requested_at': timezone.now().isoformat(),
+        'checked_at': None,
+    }
+    if previous is not None:
+        cache.set(_cache_key(host.pk), entry, PENDING_TIMEOUT)
+    elif not cache.add(_cache_key(host.pk), entry, PENDING_TIMEOUT):
+        # 并发请求已经开始测试
+        return get_connection_test(host.pk) or entry
+
+    try:
+        from apps.hosts.tasks import test_host_connection
+        test_host_connection.delay(host.pk, refresh_dns, probe)
+    except Exception as e:
+        logger.warning(f"投递连接测试任务失败，改为后台线程执行: 主机={host.name}, 错误: {str(e)}")
+        threading.Thread(
+            target=_run_in_thread, args=(host.pk, refresh_dns, probe),
+            name=f'host-test-{host.pk}', daemon=True,
+        ).start()
+    return entry
+
+
+def _run_in_thread(host_id: int, refresh_dns: bool, probe: bool = False):
+    try:
+        run_connection_test(host_id, refresh_dns, probe)
+    finally:
+        close_old_connections()
+
+
+def run_connection_test(host_id: int, refresh_dns: bool = False,
+                        probe: bool = False) -> Optional[Dict]:
+    """执行连接测试并保存结果（Celery 任务或后台线程中调用）"""
+    from apps.hosts.models import Host
+
+    host = Host.objects.filter(pk=host_id).first()
+    if host is None:
+        cache.delete(_cache_key(host_id))
+        return None
+
+    pending = get_connection_test(host_id) or {}
+    old_status = pending.get('old_status', host.status)
+    error = None
+    try:
+        host.test_connection(refresh_dns=refresh_dns, probe=probe)
+    except Exception as e:
+        error = str(e)
+        logger.error(f"测试主机连接异常: {host.name}, 错误: {error}")
+    host.refresh_from_db(fields=['status'])
+
+    entry = {
+        'state': STATE_DONE,
+        'status': host.status,
+        'old_status': old_status,
+        'error': error,
+        'requested_at': pending.get('requested_at'),
+        'checked_at': timezone.now().isoformat(),
+    }
+    cache.set(_cache_key(host_id), entry, getattr(
+        settings, 'HOST_CONNECTION_TEST_CACHE_TTL', DEFAULT_CACHE_TTL
+    ))
+    publish(connection_test_channel(host_id), connection_test_payload(host, entry))
+    return entry
+
+
+def connection_test_payload(host, entry: Optional[Dict]) -> Dict:
+    """连接测试状态的 JSON 响应内容"""
+    from apps.hosts.models import Host
+
+    entry = entry or {'state': STATE_DONE, 'status': host.status, 'old_status': host.status}
+    status = entry.get('status') or host.status
+    status_display = dict(Host.STATUS_CHOICES).get(status, status)
+    error = entry.get('error')
+    result = {
+        'state': entry['state'],
+        'success': entry['state'] == STATE_DONE and status == 'online',
+        'status': status,
+        'status_display': status_display,
+        'old_status': entry.get('old_status'),
+        'checked_at': entry.get('checked_at'),
+    }
+    if error:
+        result['error'] = error
+
+    if entry['state'] == STATE_PENDING:
+        result['message'] = '连接测试进行中...'
+    elif status == 'online':
+        result['message'] = f'连接成功，主机状态: {status_display}'
+    elif status == 'error':
+        result['message'] = f'连接失败，主机状态: {status_display}'
+        if error:
+            result['message'] += f'（{error}）'
+    else:
+        result['message'] = f'主机状态: {status_display}'
+    return result
+
+
+def connection_test_stream(host):
+    """以 Server-Sent Events 推送主机连接测试结果"""
+    from apps.hosts.models import Host
+
+    def _snapshot():
+        current = Host.objects.filter(pk=host.pk).first() or host
+        return connection_test_payload(current, get_connection_test(host.pk))
+
+    return sse_response(event_stream(
+        connection_test_channel(host.pk),
+        _snapshot,
+        lambda payload: payload.get('state') != STATE_PENDING,
+    ))
@@ -0,0 +1,214 @@
+"""
+主机组并行执行引擎
+
+对一个主机组（或主机查询集）以有限并发度执行同一段 PowerShell 脚本，
+支持所有连接类型（WinRM、本地WinServer、隧道），每台主机执行完成后
+立即上报进度（实时进度在缓存中，AsyncTask / TaskProgress 按里程碑合并写入），
+调用方无需等待全部主机结束即可看到进度。
+
+使用方式：
+    from apps.hosts.executor import HostGroupExecutor
+
+    executor = HostGroupExecutor(group, 'Get-HotFix | Select -Last 1', task=task)
+    results = executor.run()
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_CONCURRENCY = 16
+# 写入任务结果的单台主机输出上限，避免结果 JSON 过大
+MAX_OUTPUT_CHARS = 4000
+
+
+@dataclass
+class HostExecutionResult:
+    """单台主机的执行结果"""
+    host_id: int
+    host_name: str
+    success: bool
+    status_code: Optional[int] = None
+    std_out: str = ''
+    std_err: str = ''
+    error: str = ''
+    duration: float = 0.0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data['std_out'] = data['std_out'][:MAX_OUTPUT_CHARS]
+        data['std_err'] = data['std_err'][:MAX_OUTPUT_CHARS]
+        data['duration'] = round(self.duration, 3)
+        return data
+
+
+def resolve_hosts(target) -> List:
+    """
+    将执行目标统一为主机列表
+
+    参数:
+        target: HostGroup 实例、Host 查询集或 Host 可迭代对象
+    """
+    from apps.hosts.models import HostGroup
+
+    if isinstance(target, HostGroup):
+        target = target.hosts.all()
+    if isinstance(target, QuerySet):
+        target = target.order_by('id')
+    seen = set()
+    hosts = []
+    for host in target:
+        if host.pk not in seen:
+            seen.add(host.pk)
+            hosts.append(host)
+    return hosts
+
+
+def run_script_on_host(host, script: str) -> HostExecutionResult:
+    """在单台主机上执行脚本，连接或执行异常都转换为失败结果"""
+    started = time.monotonic()
+    try:
+        client = host.get_connection_client()
+        result = client.execute_powershell(script)
+        return HostExecutionResult(
+            host_id=host.pk,
+            host_name=host.name,
+            success=result.success,
+            status_code=result.status_code,
+            std_out=result.std_out or '',
+            std_err=result.std_err or '',
+            duration=time.monotonic() - started,
+        )
+    except Exception as e:
+        logger.error(f"主机 {host.name} 执行脚本失败: {str(e)}")
+        return HostExecutionResult(
+            host_id=host.pk,
+            host_name=host.name,
+            success=False,
+            error=str(e),
+            duration=time.monotonic() - started,
+        )
+
+
+class HostGroupExecutor:
+    """主机组并行执行器"""
+
+    def __init__(
+            self,
+            target,
+            script: str,
+            concurrency: Optional[int] = None,
+            task=None,
+            runner: Callable = run_script_on_host,
+    ):
+        """
+        参数:
+            target: HostGroup 实例、Host 查询集或 Host 可迭代对象
+            script: 要执行的 PowerShell 脚本
+            concurrency: 最大并发主机数，默认 settings.HOST_EXECUTOR_CONCURRENCY
+            task: 可选的 AsyncTask，执行结果会实时写入该任务
+            runner: 单台主机执行函数，签名为 runner(host, script)
+        """
+        self.hosts = resolve_hosts(target)
+        self.script = script
+        self.concurrency = max(1, concurrency or getattr(
+            settings, 'HOST_EXECUTOR_CONCURRENCY', DEFAULT_CONCURRENCY
+        ))
+        self.task = task
+        self.reporter = task.progress_reporter() if task is not None else None
+        self.runner = runner
+
+    def run(
+            self,
+            on_result: Optional[Callable[[HostExecutionResult], None]] = None
+    ) -> List[HostExecutionResult]:
+        """
+        执行脚本并按完成顺序上报结果
+
+        参数:
+            on_result: 每台主机完成时的回调（在调用线程中执行）
+
+        返回:
+            List[HostExecutionResult]: 按主机顺序排列的结果
+        """
+        total = len(self.hosts)
+        if total == 0:
+            self._finish([])
+            return []
+
+        logger.info(
+            f"开始并行执行脚本: 主机数={total}, 并发={self.concurrency}"
+        )
+        results = {}
+        workers = min(self.concurrency, total)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='host-exec') as pool:
+            futures = {
+                pool.submit(self.runner, host, self.script): host
+                for host in self.hosts
+            }
+            for future in as_completed(futures):
+                host = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = HostExecutionResult(
+                        host_id=host.pk, host_name=host.name,
+                        success=False, error=str(e),
+                    )
+                results[host.pk] = result
+                # ORM 写入只在调用线程中进行
+                self._report(result, len(results), total)
+                if on_result:
+                    on_result(result)
+
+        ordered = [results[host.pk] for host in self.hosts]
+        self._finish(ordered)
+        return ordered
+
+    def _report(self, result: HostExecutionResult, done: int, total: int):
+        if self.task is None:
+            return
+        progress = int(done * 100 / total)
+        if result.success:
+            message = f"[{done}/{total}] {result.host_name}: 成功"
+        else:
+            reason = result.error or result.std_err or f"退出码 {result.status_code}"
+            message = f"[{done}/{total}] {result.host_name}: 失败 - {reason[:500]}"
+        # 完成前不写 100，最终状态由 _finish 统一设置
+        self.reporter.update(min(progress, 99), message)
+
+    def _finish(self, results: List[HostExecutionResult]):
+        succeeded = sum(1 for r in results if r.success)
+        failed = len(results) - succeeded
+        logger.info(f"并行执行完成: 成功={succeeded}, 失败={failed}")
+        if self.task is None:
+            return
+        self.reporter.flush()
+
+        summary = {
+            'total': len(results),
+            'succeeded': succeeded,
+            'failed': failed,
+            'results': [r.to_dict() for r in results],
+        }
+        if results and succeeded == 0:
+            self.task.result = summary
+            self.task.complete_failure(f"所有主机执行失败（共 {failed} 台）")
+        else:
+            self.task.complete_success(summary)
+
+
+def execute_on_hosts(
+        target,
+        script: str,
+        concurrency: Optional[int] = None,
+        task=None,
+) -> List[HostExecutionResult]:
+    """HostGroupExecutor 的便捷入口"""
+    return HostGroupExecutor(target, script, concurrency=concurrency, task=task).run()
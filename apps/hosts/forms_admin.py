@@ -58,7 +58,7 @@ class AdminHostForm(forms.ModelForm):
         model = Host
         fields = [
             'name', 'hostname', 'connection_type', 'port', 'rdp_port',
-            'use_ssl', 'username',
+            'use_ssl', 'max_concurrent_operations', 'username',
             'providers',
         ]
         widgets = {
@@ -81,6 +81,11 @@ class AdminHostForm(forms.ModelForm):
                 'class': INPUT_CLASS,
                 'placeholder': '3389',
             }),
+            'max_concurrent_operations': forms.NumberInput(attrs={
+                'class': INPUT_CLASS,
+                'placeholder': '留空使用系统默认值',
+                'min': '0',
+            }),
             'username': forms.TextInput(attrs={
                 'class': INPUT_CLASS,
                 'placeholder': '输入连接用户名',
@@ -100,6 +105,7 @@ class AdminHostForm(forms.ModelForm):
             'port': '连接端口',
             'rdp_port': 'RDP端口',
             'use_ssl': '使用SSL',
+            'max_concurrent_operations': '最大并发操作数',
             'username': '用户名',
             'providers': '管理提供商',
         }
@@ -0,0 +1,202 @@
+"""
+主机健康巡检
+
+Host.test_connection() 只在页面上手动触发，每次执行一次 whoami 并单独 UPDATE，
+没有后台巡检，Host.status 会长期过时。这里由 Celery beat 定时执行巡检：
+
+- 只探测到期（next_probe_at 为空或已到）且未被手动停用（is_active）的主机，
+  探测在线程池中并行执行，并发受 HOST_HEALTH_CONCURRENCY 限制
+- 探测尽量轻量：WinRM 主机只检查端口是否可连接（不建立会话、不执行命令），
+  隧道主机取隧道状态，本地 WinServer 视为在线
+- 结果在调用线程中写回：探测延迟、下次探测时间用一次 bulk_update，
+  状态按（原状态, 新状态）分组条件更新，探测期间被连接测试或手动停用改写的
+  主机不会被覆盖
+- 探测间隔自适应：状态刚变化或异常的主机按 HOST_HEALTH_MIN_INTERVAL 探测，
+  持续在线的主机间隔逐次翻倍，最长 HOST_HEALTH_MAX_INTERVAL
+
+使用方式：
+    from apps.hosts.health import HealthSweeper
+
+    summary = HealthSweeper().run()
+"""
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_CONCURRENCY = 32
+DEFAULT_MIN_INTERVAL = 30
+DEFAULT_MAX_INTERVAL = 600
+DEFAULT_PROBE_TIMEOUT = 3.0
+UPDATE_BATCH_SIZE = 500
+UPDATE_FIELDS = ['last_probe_at', 'probe_latency_ms', 'probe_streak', 'next_probe_at']
+
+
+@dataclass
+class ProbeResult:
+    host_id: int
+    status: str
+    latency_ms: Optional[int] = None
+    error: str = ''
+
+
+def _split_address(host):
+    hostname, port = host.hostname, host.port
+    if ':' in hostname:
+        hostname, _, explicit_port = hostname.partition(':')
+        if explicit_port.isdigit():
+            port = int(explicit_port)
+    return hostname, port
+
+
+def probe_host(host, timeout: Optional[float] = None) -> ProbeResult:
+    """
+    轻量探测单台主机
+
+    返回 online（可连接）、offline（端口不可达 / 隧道离线）或 error（解析失败、
+    WinRM 熔断中等）
+    """
+    if os.environ.get('2C2A_DEMO', '').lower() == '1' or host.connection_type == 'localwinserver':
+        return ProbeResult(host.pk, 'online', 0)
+    if host.connection_type == 'tunnel':
+        status = 'online' if host.tunnel_status == 'online' else 'offline'
+        return ProbeResult(host.pk, status)
+
+    from utils.dns_cache import resolve_hostname
+
+    timeout = timeout or getattr(settings, 'HOST_HEALTH_PROBE_TIMEOUT', DEFAULT_PROBE_TIMEOUT)
+    hostname, port = _split_address(host)
+    if host.connection_type == 'winrm' and getattr(settings, 'WINRM_CIRCUIT_ENABLED', True):
+        from utils.circuit_breaker import STATE_OPEN, get_circuit_breaker
+
+        # 端口可连接不代表 WinRM 可用：远程操作连续失败熔断期间保持 error
+        breaker = get_circuit_breaker(f'{hostname}:{port}')
+        if breaker.state == STATE_OPEN:
+            return ProbeResult(
+                host.pk, 'error',
+                error=f'WinRM 连续失败已熔断，{int(breaker.retry_after()) + 1} 秒后恢复探测',
+            )
+    started = time.monotonic()
+    try:
+        address = resolve_hostname(hostname)
+    except OSError as e:
+        return ProbeResult(host.pk, 'error', error=f'主机名无法解析: {e}')
+    try:
+        with socket.create_connection((address, port), timeout=timeout):
+            pass
+    except OSError as e:
+        return ProbeResult(host.pk, 'offline', error=str(e))
+    return ProbeResult(host.pk, 'online', int((time.monotonic() - started) * 1000))
+
+
+def next_interval(status: str, streak: int) -> int:
+    """
+    计算下次探测间隔（秒）
+
+    参数:
+        status: 本次探测结果
+        streak: 连续相同结果的次数（本次状态变化时为 1）
+    """
+    min_interval = getattr(settings, 'HOST_HEALTH_MIN_INTERVAL', DEFAULT_MIN_INTERVAL)
+    max_interval = getattr(settings, 'HOST_HEALTH_MAX_INTERVAL', DEFAULT_MAX_INTERVAL)
+    if status != 'online' or streak <= 1:
+        return min_interval
+    return min(max_interval, min_interval * 2 ** min(streak - 1, 16))
+
+
+class HealthSweeper:
+    """主机健康巡检"""
+
+    def __init__(
+            self,
+            concurrency: Optional[int] = None,
+            prober: Callable = probe_host,
+    ):
+        """
+        参数:
+            concurrency: 最大并发探测数，默认 settings.HOST_HEALTH_CONCURRENCY
+            prober: 单台主机探测函数 prober(host) -> ProbeResult，测试时可替换
+        """
+        self.concurrency = max(1, concurrency or getattr(
+            settings, 'HOST_HEALTH_CONCURRENCY', DEFAULT_CONCURRENCY
+        ))
+        self.prober = prober
+
+    def due_hosts(self, now=None) -> List:
+        from apps.hosts.models import Host
+
+        now = now or timezone.now()
+        return list(
+            Host.objects.filter(Q(next_probe_at__isnull=True) | Q(next_probe_at__lte=now))
+            .filter(is_active=True)
+            .exclude(connection_type='ssh')
+            .order_by('next_probe_at')
+        )
+
+    def _probe(self, host) -> ProbeResult:
+        try:
+            return self.prober(host)
+        except Exception as e:
+            return ProbeResult(host.pk, 'error', error=str(e))
+
+    def run(self, hosts=None) -> Dict:
+        """
+        探测到期的主机（或指定主机）并写回结果
+
+        返回:
+            {'probed', 'online', 'offline', 'error', 'changed'}
+        """
+        from apps.hosts.models import Host
+
+        hosts = list(hosts) if hosts is not None else self.due_hosts()
+        summary = {'probed': len(hosts), 'online': 0, 'offline': 0, 'error': 0, 'changed': 0}
+        if not hosts:
+            return summary
+
+        workers = min(self.concurrency, len(hosts))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='host-health') as pool:
+            results = list(pool.map(self._probe, hosts))
+
+        # ORM 写入只在调用线程中进行
+        now = timezone.now()
+        # {(原状态, 新状态): [主机 pk]}
+        transitions = {}
+        for host, result in zip(hosts, results):
+            summary[result.status] = summary.get(result.status, 0) + 1
+            if result.status != host.status:
+                summary['changed'] += 1
+                logger.info(
+                    f"主机状态变化: {host.name} {host.status} -> {result.status}"
+                    + (f", {result.error}" if result.error else '')
+                )
+                host.probe_streak = 1
+                transitions.setdefault((host.status, result.status), []).append(host.pk)
+            else:
+                host.probe_streak = (host.probe_streak or 0) + 1
+            host.last_probe_at = now
+            host.probe_latency_ms = result.latency_ms
+            host.next_probe_at = now + timedelta(
+                seconds=next_interval(result.status, host.probe_streak)
+            )
+        Host.objects.bulk_update(hosts, UPDATE_FIELDS, batch_size=UPDATE_BATCH_SIZE)
+        for (old_status, new_status), host_ids in transitions.items():
+            # 只在状态仍是探测前读取的值时写入
+            Host.objects.filter(
+                pk__in=host_ids, status=old_status, is_active=True,
+            ).update(status=new_status)
+
+        logger.info(
+            f"主机健康巡检完成: 探测 {summary['probed']} 台, 在线 {summary['online']}, "
+            f"离线 {summary['offline']}, 错误 {summary['error']}, 状态变化 {summary['changed']}"
+        )
+        return summary
@@ -0,0 +1,247 @@
+"""
+主机资产快照缓存
+
+本地用户列表和磁盘信息原先每次调用都远程获取，磁盘信息接口在每次页面访问时
+都要往返一次。这里按主机缓存这些快照：
+
+- 磁盘快照供磁盘信息接口和放置调度使用
+- 用户快照供开户前的用户名预检使用：快照中不存在即直接开户，快照显示已存在时
+  远程确认一次再拒绝；本地组和密码策略没有开户前查询（加组在组合开户脚本中完成，
+  初始密码在本地生成），不做快照
+- 快照缓存 HOST_INVENTORY_TTL 秒，存放在 Django 缓存中
+- 本系统自身的变更（创建/删除/启用/禁用用户、修改配额）立即更新或失效快照
+- 快照存活超过 TTL × HOST_INVENTORY_REFRESH_AHEAD 后仍返回缓存，
+  同时投递后台任务刷新（同一主机同一时间只投递一次）
+
+使用方式：
+    from apps.hosts.inventory import get_host_inventory, record_user_change
+
+    inventory = get_host_inventory(host)
+    disks = inventory.disks()
+    if inventory.confirm_user_exists('alice'):
+        ...
+    record_user_change(host, 'alice', deleted=True)
+"""
+import json
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger("2c2a")
+
+KIND_USERS = 'users'
+KIND_DISKS = 'disks'
+ALL_KINDS = (KIND_USERS, KIND_DISKS)
+
+DEFAULT_TTL = 600
+DEFAULT_REFRESH_AHEAD = 0.8
+
+USERS_SCRIPT = (
+    'Get-LocalUser | Select-Object Name,Enabled,Description '
+    '| ConvertTo-Json -Compress'
+)
+
+
+def _host_id(host_or_id) -> int:
+    return getattr(host_or_id, 'pk', host_or_id)
+
+
+def _cache_key(host_id: int, kind: str) -> str:
+    return f'inventory:{host_id}:{kind}'
+
+
+def _ttl() -> int:
+    return getattr(settings, 'HOST_INVENTORY_TTL', DEFAULT_TTL)
+
+
+def _parse_users(result) -> Optional[List[Dict[str, Any]]]:
+    if not result.success:
+        logger.error(f"获取用户列表失败: {result.std_err}")
+        return None
+    output = (result.std_out or '').strip()
+    if not output:
+        return []
+    try:
+        data = json.loads(output)
+    except json.JSONDecodeError:
+        logger.error(f"用户列表解析失败: {output[:200]}")
+        return None
+    if isinstance(data, dict):
+        data = [data]
+    return [
+        {
+            'name': item.get('Name', ''),
+            'enabled': bool(item.get('Enabled')),
+            'description': item.get('Description') or '',
+        }
+        for item in data
+    ]
+
+
+class HostInventory:
+    """单台主机的资产快照"""
+
+    def __init__(self, host, ttl: Optional[int] = None, client=None):
+        """
+        参数:
+            host: Host 实例
+            ttl: 快照缓存时间（秒），默认 settings.HOST_INVENTORY_TTL
+            client: 可选的连接客户端，默认在需要远程获取时才创建
+        """
+        self.host = host
+        self.ttl = ttl or _ttl()
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.host.get_connection_client()
+        return self._client
+
+    def _fetch(self, kind: str):
+        if kind == KIND_USERS:
+            return _parse_users(self.client.execute_powershell(USERS_SCRIPT))
+        if kind == KIND_DISKS:
+            from utils.disk_quota import get_disk_info_via_client
+            disks = get_disk_info_via_client(self.client)
+            # 获取失败时返回空列表，不缓存
+            return disks or None
+        raise ValueError(f"未知的资产类型: {kind}")
+
+    def _store(self, kind: str, data):
+        cache.set(
+            _cache_key(self.host.pk, kind),
+            {'data': data, 'fetched_at': time.time()},
+            self.ttl,
+        )
+
+    def get(self, kind: str, refresh: bool = False):
+        """
+        获取快照，缓存缺失或 refresh=True 时远程获取
+
+        返回:
+            快照数据；远程获取失败时返回 None（不缓存）
+        """
+        if not refresh:
+            snapshot = cache.get(_cache_key(self.host.pk, kind))
+            if snapshot is not None:
+                self._maybe_refresh_ahead(kind, snapshot['fetched_at'])
+                return snapshot['data']
+
+        try:
+            data = self._fetch(kind)
+        except Exception as e:
+            logger.error(f"获取主机资产失败: 主机={self.host.name}, 类型={kind}, 错误: {str(e)}")
+            return None
+        if data is not None:
+            self._store(kind, data)
+        return data
+
+    def _maybe_refresh_ahead(self, kind: str, fetched_at: float):
+        ratio = getattr(settings, 'HOST_INVENTORY_REFRESH_AHEAD', DEFAULT_REFRESH_AHEAD)
+        if ratio <= 0 or time.time() - fetched_at < self.ttl * ratio:
+            return
+        lock_key = _cache_key(self.host.pk, f'{kind}:refreshing')
+        if not cache.add(lock_key, 1, max(1, int(self.ttl * (1 - ratio)))):
+            return
+        try:
+            from apps.hosts.tasks import refresh_host_inventory
+            refresh_host_inventory.delay(self.host.pk, [kind])
+        except Exception as e:
+            cache.delete(lock_key)
+            logger.warning(f"投递资产刷新任务失败: 主机={self.host.name}, 错误: {str(e)}")
+
+    def users(self, refresh: bool = False) -> Optional[List[Dict[str, Any]]]:
+        return self.get(KIND_USERS, refresh)
+
+    def disks(self, refresh: bool = False) -> Optional[List[Dict[str, Any]]]:
+        return self.get(KIND_DISKS, refresh)
+
+    def user_exists(self, username: str, refresh: bool = False) -> bool:
+        """
+        用户是否存在（Windows 用户名不区分大小写）
+
+        用户列表无法获取时退化为远程 check_user_exists。
+        """
+        users = self.users(refresh)
+        if users is None:
+            checker = getattr(self.client, 'check_user_exists', None)
+            return bool(checker and checker(username))
+        lowered = username.lower()
+        return any(u['name'].lower() == lowered for u in users)
+
+    def confirm_user_exists(self, username: str) -> bool:
+        """
+        开户前预检：用户是否已存在
+
+        快照中不存在时直接返回 False（不远程访问）；快照显示已存在时远程刷新确认，
+        避免主机上手动删除的用户因快照过时而无法重新开户。
+        """
+        return self.user_exists(username) and self.user_exists(username, refresh=True)
+
+    def refresh(self, kinds: Iterable[str] = ALL_KINDS) -> Dict[str, bool]:
+        """远程刷新指定快照，返回每类快照是否刷新成功"""
+        result = {}
+        for kind in kinds:
+            result[kind] = self.get(kind, refresh=True) is not None
+            cache.delete(_cache_key(self.host.pk, f'{kind}:refreshing'))
+        return result
+
+
+def get_host_inventory(host, **kwargs) -> HostInventory:
+    return HostInventory(host, **kwargs)
+
+
+def get_cached_snapshot(host_or_id, kind: str):
+    """只读取已缓存的快照数据，不触发远程获取，没有快照时返回 None"""
+    snapshot = cache.get(_cache_key(_host_id(host_or_id), kind))
+    return snapshot['data'] if snapshot is not None else None
+
+
+def invalidate_host_inventory(host_or_id, *kinds: str):
+    """使主机快照失效，不指定类型时失效全部"""
+    host_id = _host_id(host_or_id)
+    cache.delete_many([_cache_key(host_id, kind) for kind in (kinds or ALL_KINDS)])
+
+
+def record_user_change(
+        host_or_id,
+        username: str,
+        created: bool = False,
+        deleted: bool = False,
+        enabled: Optional[bool] = None,
+):
+    """
+    根据本系统执行的用户变更就地更新用户列表快照
+
+    快照不存在时无需处理，下次读取会重新获取。
+    """
+    key = _cache_key(_host_id(host_or_id), KIND_USERS)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        return
+
+    lowered = username.lower()
+    users = [u for u in snapshot['data'] if u['name'].lower() != lowered]
+    existing = next((u for u in snapshot['data'] if u['name'].lower() == lowered), None)
+
+    if not deleted:
+        if existing is None and not created:
+            # 快照中没有该用户且不是新建，说明快照已过时，直接失效
+            cache.delete(key)
+            return
+        entry = dict(existing or {'name': username, 'enabled': True, 'description': ''})
+        if enabled is not None:
+            entry['enabled'] = enabled
+        users.append(entry)
+
+    snapshot['data'] = users
+    # 保持原有的过期时间，就地更新不延长快照寿命
+    remaining = _ttl() - (time.time() - snapshot['fetched_at'])
+    if remaining <= 0:
+        cache.delete(key)
+        return
+    cache.set(key, snapshot, int(remaining) + 1)
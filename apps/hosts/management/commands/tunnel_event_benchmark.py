@@ -0,0 +1,149 @@
+import random
+import secrets
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from apps.hosts.models import Host
+from apps.hosts.tunnel_events import TunnelEventBuffer, TunnelEventIngestor, TunnelTokenIndex
+
+
+def generate_synthetic_events(tokens, count, unknown_ratio=0.01, seed=None):
+    """
+    生成模拟隧道集中重连的事件序列
+
+    每个 token 在离线/上线之间切换，穿插 RDP 连接/断开和远程执行结果事件，
+    按 unknown_ratio 混入未知 token
+    """
+    rng = random.Random(seed)
+    online = {}
+    for i in range(count):
+        if rng.random() < unknown_ratio:
+            yield 'tunnel_online', {'token': f'unknown-{rng.randrange(1000)}'}
+            continue
+        token = rng.choice(tokens)
+        roll = rng.random()
+        if roll < 0.6:
+            event_type = 'tunnel_offline' if online.get(token) else 'tunnel_online'
+            online[token] = event_type == 'tunnel_online'
+            yield event_type, {
+                'token': token,
+                'client_ip': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+                'client_ver': '1.0.0',
+            }
+        elif roll < 0.8:
+            yield 'rdp_gateway_connect', {
+                'token': token, 'session_id': f's{i}', 'user': 'bench',
+                'client_ip': '10.0.0.1', 'target_host': 'localhost',
+            }
+        elif roll < 0.95:
+            yield 'rdp_gateway_disconnect', {
+                'token': token, 'session_id': f's{i}', 'user': 'bench',
+                'client_ip': '10.0.0.1', 'duration': rng.randrange(3600),
+            }
+        else:
+            yield 'remote_exec_result', {
+                'token': token, 'req_id': f'r{i}', 'exit_code': 0,
+            }
+
+
+class _PerEventIngestor(TunnelEventIngestor):
+    """对照组：每个事件立即写入（与改造前一样逐条写库，token 查找仍使用索引）"""
+
+    def handle(self, event_type, payload):
+        super().handle(event_type, payload)
+        self.buffer.flush()
+
+
+class Command(BaseCommand):
+    help = '使用模拟事件测试隧道事件入库吞吐（在回滚的事务中执行，不修改数据）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--events',
+            type=int,
+            default=10000,
+            help='模拟事件数',
+        )
+        parser.add_argument(
+            '--hosts',
+            type=int,
+            default=200,
+            help='模拟的隧道主机数',
+        )
+        parser.add_argument(
+            '--unknown-ratio',
+            type=float,
+            default=0.01,
+            help='未知 token 事件的比例',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='批量写入大小（默认 TUNNEL_EVENT_BATCH_SIZE）',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='随机种子',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=['both', 'per-event', 'batched'],
+            default='both',
+            help='运行模式',
+        )
+
+    def handle(self, *args, **options):
+        modes = ['per-event', 'batched'] if options['mode'] == 'both' else [options['mode']]
+        self.stdout.write(
+            f"模拟主机数: {options['hosts']}, 事件数: {options['events']}, "
+            f"未知 token 比例: {options['unknown_ratio']}"
+        )
+        for mode in modes:
+            with transaction.atomic():
+                tokens = self._create_hosts(options['hosts'])
+                events = list(generate_synthetic_events(
+                    tokens, options['events'], options['unknown_ratio'], options['seed']
+                ))
+                elapsed, queries = self._run(mode, events, options['batch_size'])
+                transaction.set_rollback(True)
+            self._report(mode, elapsed, queries, len(events))
+
+    def _create_hosts(self, count):
+        hosts = []
+        for i in range(count):
+            host = Host(
+                name=f'bench-tunnel-{i}', hostname=f'bench-tunnel-{i}.local',
+                username='bench', connection_type='tunnel',
+                tunnel_token=secrets.token_hex(16), tunnel_status='offline',
+            )
+            host.password = 'bench'
+            hosts.append(host)
+        Host.objects.bulk_create(hosts)
+        return [host.tunnel_token for host in hosts]
+
+    def _run(self, mode, events, batch_size):
+        # 不启动后台写入线程：它使用独立的数据库连接，写入不在回滚范围内
+        cls = _PerEventIngestor if mode == 'per-event' else TunnelEventIngestor
+        ingestor = cls(
+            index=TunnelTokenIndex(),
+            buffer=TunnelEventBuffer(batch_size=batch_size),
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.monotonic()
+            for event_type, payload in events:
+                ingestor.handle(event_type, payload)
+            ingestor.buffer.flush()
+            elapsed = time.monotonic() - started
+        return elapsed, len(ctx.captured_queries)
+
+    def _report(self, label, elapsed, queries, total):
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: 耗时 {elapsed:.2f}s, {rate:.0f} 事件/秒, SQL 查询 {queries} 次'
+        ))
@@ -0,0 +1,104 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.hosts.executor import HostGroupExecutor
+from apps.hosts.models import Host
+
+
+class Command(BaseCommand):
+    help = '对比逐台顺序执行与主机组并行执行器在多主机执行时的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'host_ids',
+            nargs='*',
+            type=int,
+            help='主机ID列表（默认使用所有状态为在线的主机）',
+        )
+        parser.add_argument(
+            '--script',
+            default='$env:COMPUTERNAME',
+            help='每台主机执行的PowerShell脚本',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=1,
+            help='每台主机重复执行的次数',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=32,
+            help='并行模式的最大并发主机数',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=['both', 'sync', 'parallel'],
+            default='both',
+            help='运行模式',
+        )
+
+    def handle(self, *args, **options):
+        host_ids = options['host_ids']
+        repeat = max(1, options['repeat'])
+        script = options['script']
+
+        hosts = Host.objects.all()
+        if host_ids:
+            hosts = hosts.filter(id__in=host_ids)
+        else:
+            hosts = hosts.filter(status='online')
+        hosts = list(hosts)
+        if not hosts:
+            raise CommandError('没有可用于测试的主机')
+
+        jobs = [host for host in hosts for _ in range(repeat)]
+        self.stdout.write(
+            f'主机数: {len(hosts)}, 每主机执行次数: {repeat}, 总操作数: {len(jobs)}'
+        )
+
+        if options['mode'] in ('both', 'sync'):
+            elapsed, ok = self._run_sync(jobs, script)
+            self._report('同步', elapsed, ok, len(jobs))
+
+        if options['mode'] in ('both', 'parallel'):
+            elapsed, ok = self._run_parallel(hosts, script, repeat, options['concurrency'])
+            self._report(f"并行(并发={options['concurrency']})", elapsed, ok, len(jobs))
+
+    def _run_sync(self, jobs, script):
+        clients = {}
+        ok = 0
+        started = time.monotonic()
+        for host in jobs:
+            try:
+                if host.id not in clients:
+                    clients[host.id] = host.get_connection_client()
+                if clients[host.id].execute_powershell(script).success:
+                    ok += 1
+            except Exception as e:
+                self.stderr.write(self.style.WARNING(f'{host.name}: {str(e)}'))
+        return time.monotonic() - started, ok
+
+    def _run_parallel(self, hosts, script, repeat, concurrency):
+        ok = 0
+        started = time.monotonic()
+        for _ in range(repeat):
+            for result in HostGroupExecutor(hosts, script, concurrency=concurrency).run():
+                if result.success:
+                    ok += 1
+                else:
+                    self.stderr.write(self.style.WARNING(
+                        f'{result.host_name}: {result.error or result.std_err}'
+                    ))
+        return time.monotonic() - started, ok
+
+    def _report(self, label, elapsed, ok, total):
+        rate = total / elapsed if elapsed > 0 else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{label}: 耗时 {elapsed:.2f}s, 成功 {ok}/{total}, '
+                f'吞吐 {rate:.1f} 次/秒'
+            )
+        )
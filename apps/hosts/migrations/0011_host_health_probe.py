@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hosts', '0010_remove_host_host_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='last_probe_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最后探测时间'),
+        ),
+        migrations.AddField(
+            model_name='host',
+            name='next_probe_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='下次探测时间'),
+        ),
+        migrations.AddField(
+            model_name='host',
+            name='probe_latency_ms',
+            field=models.IntegerField(blank=True, null=True, verbose_name='探测延迟(毫秒)'),
+        ),
+        migrations.AddField(
+            model_name='host',
+            name='probe_streak',
+            field=models.PositiveIntegerField(default=0, verbose_name='连续相同探测结果次数'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hosts', '0011_host_health_probe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='max_concurrent_operations',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='不超过主机 WinRM 的 MaxShellsPerUser 配置，留空使用系统默认值，0 表示不限制', null=True, verbose_name='最大并发操作数'),
+        ),
+    ]
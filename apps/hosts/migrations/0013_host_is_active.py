@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hosts', '0012_host_max_concurrent_operations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='is_active',
+            field=models.BooleanField(default=True, verbose_name='启用'),
+        ),
+    ]
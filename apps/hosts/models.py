@@ -1,3 +1,4 @@
+from contextlib import ExitStack, contextmanager
 from django.db import models
 from django.conf import settings
 import os
@@ -84,6 +85,29 @@ class Host(models.Model):
         blank=True, verbose_name='隧道公钥(Ed25519)'
     )
 
+    # 同时进行的远程操作数上限（utils.host_semaphore），为空时使用 HOST_MAX_CONCURRENT_OPERATIONS
+    max_concurrent_operations = models.PositiveSmallIntegerField(
+        null=True, blank=True, verbose_name='最大并发操作数',
+        help_text='不超过主机 WinRM 的 MaxShellsPerUser 配置，留空使用系统默认值，0 表示不限制'
+    )
+
+    # 提供商手动停用的主机不参与健康巡检，状态保持离线，直到重新启用
+    is_active = models.BooleanField(default=True, verbose_name='启用')
+
+    # 健康巡检（apps.hosts.health）
+    last_probe_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='最后探测时间'
+    )
+    probe_latency_ms = models.IntegerField(
+        null=True, blank=True, verbose_name='探测延迟(毫秒)'
+    )
+    probe_streak = models.PositiveIntegerField(
+        default=0, verbose_name='连续相同探测结果次数'
+    )
+    next_probe_at = models.DateTimeField(
+        null=True, blank=True, db_index=True, verbose_name='下次探测时间'
+    )
+
     class Meta:
         verbose_name = '主机'
         verbose_name_plural = '主机'
@@ -124,7 +148,7 @@ class Host(models.Model):
         super().save(*args, **kwargs)
         # 暂时禁用自动连接测试，由Admin处理
     
-    def get_connection_client(self):
+    def get_connection_client(self, bypass_circuit=False):
         if self.connection_type == 'winrm':
             from utils.winrm_client import WinrmClient
             return WinrmClient(
@@ -132,7 +156,9 @@ class Host(models.Model):
                 username=self.username,
                 password=self.password,
                 port=self.port,
-                use_ssl=self.use_ssl
+                use_ssl=self.use_ssl,
+                max_concurrency=self.max_concurrent_operations,
+                bypass_circuit=bypass_circuit
             )
         elif self.connection_type == 'localwinserver':
             from utils.local_winserver_client import LocalWinServerClient
@@ -150,7 +176,16 @@ class Host(models.Model):
                 f"不支持的连接类型: {self.connection_type}"
             )
 
-    def test_connection(self):
+    def test_connection(self, refresh_dns=False, probe=False):
+        """
+        测试连接并更新主机状态
+
+        参数:
+            refresh_dns: 为 True 时先清除该主机名的解析缓存（手动重测时使用，
+                避免管理员修正 DNS 后仍命中失败缓存）
+            probe: 为 True 时忽略主机熔断状态直接测试，成功后熔断器恢复
+                （管理员修复主机后手动重测，不必等待熔断到期）
+        """
         if os.environ.get('2C2A_DEMO', '').lower() == '1':
             Host.objects.filter(pk=self.pk).update(status='online')
             return
@@ -160,8 +195,15 @@ class Host(models.Model):
             Host.objects.filter(pk=self.pk).update(status=new_status)
             return
         
+        if refresh_dns and self.connection_type == 'winrm':
+            from utils.dns_cache import invalidate_hostname
+            invalidate_hostname(self.hostname.split(':', 1)[0])
+
         try:
-            client = self.get_connection_client()
+            if self.connection_type == 'winrm':
+                client = self.get_connection_client(bypass_circuit=probe)
+            else:
+                client = self.get_connection_client()
             
             if self.connection_type == 'localwinserver':
                 result = client.execute_command(
@@ -191,11 +233,37 @@ class TunnelConnectionAdapter:
         self.host = host
         self.gateway_client = gateway_client
         self._fallback_client = None
+        self._shell_stack = None
+        from utils.host_semaphore import get_host_semaphore
+        self._slots = get_host_semaphore(f'tunnel:{host.pk}', host.max_concurrent_operations)
+
+    @contextmanager
+    def remote_shell(self):
+        """
+        与 WinrmClient.remote_shell 对应的多命令执行上下文
+
+        Gateway 隧道本身是常驻连接，命令直接经隧道下发；
+        只有回退到 WinRM 直连时才在备用客户端上打开一个共享Shell，
+        该Shell在退出上下文时关闭。
+        """
+        if self._shell_stack is not None:
+            yield self
+            return
+        with ExitStack() as stack:
+            self._shell_stack = stack
+            try:
+                yield self
+            finally:
+                self._shell_stack = None
 
     def _get_fallback_client(self):
         if self._fallback_client is not None:
             return self._fallback_client
         if self.host.connection_type == 'tunnel' and self.host.hostname:
+            from utils.dns_cache import is_resolvable
+            # 未配置真实地址的隧道主机（如 tunnel-pending）命中失败缓存后直接跳过
+            if not is_resolvable(self.host.hostname.split(':', 1)[0]):
+                return None
             try:
                 from utils.winrm_client import WinrmClient
                 self._fallback_client = WinrmClient(
@@ -204,6 +272,7 @@ class TunnelConnectionAdapter:
                     username=self.host.username,
                     password=self.host.password,
                     use_ssl=self.host.use_ssl,
+                    max_concurrency=self.host.max_concurrent_operations,
                 )
                 return self._fallback_client
             except Exception:
@@ -220,14 +289,19 @@ class TunnelConnectionAdapter:
     def execute_powershell(self, script, arguments=None):
         script_bytes = script.encode('utf-8')
 
-        result = self.gateway_client.remote_exec(
-            token=self.host.tunnel_token,
-            script=script_bytes,
-        )
+        # 经隧道执行同样占用主机的并发槽位；回退到 WinRM 直连时由备用客户端自行获取
+        with self._slots.slot():
+            result = self.gateway_client.remote_exec(
+                token=self.host.tunnel_token,
+                script=script_bytes,
+            )
 
         if result is None:
             fallback = self._get_fallback_client()
             if fallback:
+                if (self._shell_stack is not None
+                        and fallback._active_shell is None):
+                    self._shell_stack.enter_context(fallback.remote_shell())
                 return fallback.execute_powershell(script)
             from utils.winrm_client import WinrmResult
             return WinrmResult(
@@ -273,8 +347,9 @@ Add-LocalGroupMember -Group "Users" -Member "{safe_user}" -ErrorAction Stop
             safe_group = _escape_ps_string(group)
             script += f'Add-LocalGroupMember -Group "{safe_group}" -Member "{safe_user}" -ErrorAction Stop\n'
 
-        result = self.execute_powershell(script)
-        self.add_to_remote_users(username)
+        with self.remote_shell():
+            result = self.execute_powershell(script)
+            self.add_to_remote_users(username)
         return result
 
     def delete_user(self, username):
@@ -303,9 +378,10 @@ Add-LocalGroupMember -Group "Users" -Member "{safe_user}" -ErrorAction Stop
 $pw = ConvertTo-SecureString "{safe_pass}" -AsPlainText -Force
 Set-LocalUser -Name "{safe_user}" -Password $pw
 '''
-        result = self.execute_powershell(script)
-        if result.status_code == 0:
-            self.add_to_remote_users(username)
+        with self.remote_shell():
+            result = self.execute_powershell(script)
+            if result.status_code == 0:
+                self.add_to_remote_users(username)
         return result
 
     def add_to_remote_users(self, username):
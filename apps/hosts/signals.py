@@ -0,0 +1,29 @@
+"""
+主机管理信号处理器
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Host
+from .tunnel_events import token_index_changed
+
+
+@receiver(post_save, sender=Host)
+def refresh_tunnel_token_index(sender, instance, created, update_fields=None, **kwargs):
+    """
+    主机保存后更新隧道 token 索引
+
+    只更新了其他字段（update_fields 不含 tunnel_token / name）时跳过，
+    避免状态类的保存让监听进程反复重新加载索引
+    """
+    if not created and update_fields is not None and not (
+        {'tunnel_token', 'name'} & set(update_fields)
+    ):
+        return
+    token_index_changed(instance.pk, instance.tunnel_token, instance.name)
+
+
+@receiver(post_delete, sender=Host)
+def drop_tunnel_token_index(sender, instance, **kwargs):
+    """主机删除后从隧道 token 索引中移除"""
+    token_index_changed(instance.pk, None)
@@ -3,6 +3,12 @@ from django.contrib.auth.models import User
 from apps.hosts.models import Host
 from apps.tasks.models import AsyncTask
 from apps.certificates.models import ServerCertificate, ClientCertificate
+from utils.remote_stream import (
+    PROGRESS_MARKER,
+    progress_marker,
+    stream_powershell,
+    task_progress_callback,
+)
 import logging
 import re
 
@@ -53,9 +59,8 @@ def configure_winrm_on_host(self, host_id, cert_thumbprint=None, operator_id=Non
     try:
         host = Host.objects.get(id=host_id)
         task.start_execution()
-        
-        task.progress = 10
-        task.save()
+        reporter = task.progress_reporter()
+        reporter.update(10)
         
         try:
             from utils.winrm_client import WinrmClient
@@ -72,13 +77,13 @@ def configure_winrm_on_host(self, host_id, cert_thumbprint=None, operator_id=Non
             if actual_thumbprint:
                 actual_thumbprint = validate_cert_thumbprint(actual_thumbprint)
             
-            ps_script = '''
+            ps_script = progress_marker(10, '启用 PSRemoting') + '''
             Enable-PSRemoting -Force
             Set-Service -Name WinRM -StartupType Automatic
             '''
             
             if actual_thumbprint:
-                ps_script += f'''
+                ps_script += progress_marker(40, '配置 HTTPS 监听器') + f'''
                 $selectorset = @{{Transport="HTTPS"}}
                 $resourceset = @{{Port="5986"; CertificateThumbprint="{actual_thumbprint}"}}
                 Get-WSManInstance -ResourceURI winrm/config/listener -SelectorSet $selectorset -ErrorAction SilentlyContinue | Remove-WSManInstance -ErrorAction SilentlyContinue
@@ -88,20 +93,22 @@ def configure_winrm_on_host(self, host_id, cert_thumbprint=None, operator_id=Non
                 }}
                 '''
             
-            ps_script += '''
+            ps_script += progress_marker(70, '更新 WinRM 服务配置') + '''
             Set-Item -Path "WSMan:\\localhost\\Service\\AllowUnencrypted" -Value $false
             Set-Item -Path "WSMan:\\localhost\\Service\\Auth\\Basic" -Value $true
             Restart-Service WinRM
             '''
             
-            task.progress = 30
-            task.save()
+            reporter.update(30)
             
-            result = client.execute_powershell(ps_script)
+            result = stream_powershell(
+                client, ps_script,
+                on_progress=task_progress_callback(task, start=30, end=80, reporter=reporter)
+            )
+            reporter.flush()
             
             if result.status_code == 0:
-                task.progress = 80
-                task.save()
+                reporter.update(80)
                 
                 from django.utils import timezone
                 host.init_status = 'ready'
@@ -110,7 +117,6 @@ def configure_winrm_on_host(self, host_id, cert_thumbprint=None, operator_id=Non
                     host.certificate_thumbprint = cert_thumbprint
                 host.save()
                 
-                task.progress = 100
                 task.complete_success({
                     'status_code': result.status_code,
                     'stdout': result.std_out,
@@ -228,7 +234,6 @@ def test_winrm_connection(self, host_id, use_certificate_auth=False):
             success = result.status_code == 0
         
         if success:
-            task.progress = 100
             task.complete_success({
                 'connected': True,
                 'protocol': 'HTTPS with Certificate' if use_certificate_auth else 'HTTP with Basic Auth',
@@ -290,7 +295,7 @@ def install_certificates_on_host(self, host_id, cert_pem, cert_filename, operato
         safe_cert_content = _escape_for_here_string(cert_pem)
         safe_filename = cert_filename.replace('"', '').replace("'", '').replace(';', '')
         
-        ps_script = f'''
+        ps_script = progress_marker(10, '写入证书文件') + f'''
         $tempDir = "$env:TEMP\\2c2a_Certs"
         if (!(Test-Path $tempDir)) {{
             New-Item -ItemType Directory -Path $tempDir -Force
@@ -303,7 +308,9 @@ def install_certificates_on_host(self, host_id, cert_pem, cert_filename, operato
         $certPath = Join-Path $tempDir "{safe_filename}"
         $certContent | Out-File -FilePath $certPath -Encoding UTF8
         
+        Write-Output '{PROGRESS_MARKER} 50 导入根证书存储'
         Import-Certificate -FilePath $certPath -CertStoreLocation Cert:\\LocalMachine\\Root
+        Write-Output '{PROGRESS_MARKER} 80 导入个人证书存储'
         Import-Certificate -FilePath $certPath -CertStoreLocation Cert:\\LocalMachine\\My
         
         Write-Output "Certificate installed successfully"
@@ -311,10 +318,11 @@ def install_certificates_on_host(self, host_id, cert_pem, cert_filename, operato
         Remove-Item $tempDir -Recurse -Force
         '''
         
-        result = client.execute_powershell(ps_script)
+        on_progress = task_progress_callback(task, start=0, end=95)
+        result = stream_powershell(client, ps_script, on_progress=on_progress)
+        on_progress.reporter.flush()
         
         if result.status_code == 0:
-            task.progress = 100
             task.complete_success({
                 'installed': True,
                 'cert_filename': cert_filename,
@@ -343,3 +351,101 @@ def install_certificates_on_host(self, host_id, cert_pem, cert_filename, operato
             'success': False,
             'error': str(e)
         }
+
+
+@shared_task(bind=True)
+def execute_script_on_hosts(self, script, host_ids=None, group_id=None,
+                            concurrency=None, operator_id=None):
+    """
+    在主机组或指定主机上并行执行脚本
+
+    每台主机完成后立即写入 TaskProgress，最终结果汇总到 AsyncTask.result。
+    """
+    from apps.hosts.executor import HostGroupExecutor
+    from apps.hosts.models import HostGroup
+
+    if group_id is not None:
+        name = f"批量执行脚本 - 主机组 #{group_id}"
+        target_id, target_type = group_id, 'hosts.HostGroup'
+    else:
+        name = f"批量执行脚本 - {len(host_ids or [])} 台主机"
+        target_id, target_type = None, 'hosts.Host'
+
+    task = AsyncTask.objects.create(
+        task_id=self.request.id,
+        name=name,
+        created_by_id=operator_id,
+        target_object_id=target_id,
+        target_content_type=target_type,
+        status='running'
+    )
+
+    try:
+        if group_id is not None:
+            target = HostGroup.objects.get(id=group_id)
+        else:
+            target = Host.objects.filter(id__in=host_ids or [])
+
+        task.start_execution()
+        results = HostGroupExecutor(
+            target, script, concurrency=concurrency, task=task
+        ).run()
+
+        succeeded = sum(1 for r in results if r.success)
+        return {
+            'success': not results or succeeded > 0,
+            'total': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+        }
+
+    except Exception as e:
+        logger.error(f"批量执行脚本失败: {str(e)}", exc_info=True)
+        task.complete_failure(str(e))
+
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+@shared_task
+def refresh_host_inventory(host_id, kinds=None):
+    """刷新单台主机的资产快照（用户、磁盘）"""
+    from apps.hosts.inventory import ALL_KINDS, get_host_inventory
+
+    try:
+        host = Host.objects.get(id=host_id)
+    except Host.DoesNotExist:
+        return {'success': False, 'error': f'主机 {host_id} 不存在'}
+
+    refreshed = get_host_inventory(host).refresh(kinds or ALL_KINDS)
+    logger.info(f"主机资产快照已刷新: {host.name}, 结果: {refreshed}")
+    return {'success': all(refreshed.values()), 'refreshed': refreshed}
+
+
+@shared_task
+def refresh_all_host_inventories(kinds=None):
+    """为所有在线主机投递资产快照刷新任务"""
+    host_ids = list(
+        Host.objects.filter(status='online').values_list('id', flat=True)
+    )
+    for host_id in host_ids:
+        refresh_host_inventory.delay(host_id, kinds)
+    return {'success': True, 'hosts': len(host_ids)}
+
+
+@shared_task
+def test_host_connection(host_id, refresh_dns=False, probe=False):
+    """后台测试主机连接（页面请求投递，结果写入缓存并推送）"""
+    from apps.hosts.connection_test import run_connection_test
+
+    return run_connection_test(host_id, refresh_dns, probe)
+
+
+@shared_task
+def sweep_host_health():
+    """巡检到期主机的连接状态（Celery beat 定时执行）"""
+    from apps.hosts.health import HealthSweeper
+
+    return HealthSweeper().run()
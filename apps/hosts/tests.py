@@ -0,0 +1,562 @@
+import threading
+import time
+
+import pytest
+
+from apps.hosts.executor import HostExecutionResult, HostGroupExecutor
+from apps.hosts.models import Host, HostGroup
+from apps.tasks.models import AsyncTask, TaskProgress
+
+
+def _make_host(name):
+    host = Host(name=name, hostname=f'{name}.local', username='admin')
+    host.password = 'secret'
+    host.save()
+    return host
+
+
+@pytest.mark.django_db
+class TestHostGroupExecutor:
+    def setup_method(self):
+        self.group = HostGroup.objects.create(name='patch-group')
+        self.hosts = [_make_host(f'host{i}') for i in range(6)]
+        self.group.hosts.add(*self.hosts)
+        self.task = AsyncTask.objects.create(task_id='exec-1', name='批量执行')
+
+    def test_runs_hosts_concurrently_and_streams_progress(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def runner(host, script):
+            with lock:
+                active.append(host.pk)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(host.pk)
+            return HostExecutionResult(
+                host_id=host.pk, host_name=host.name,
+                success=host.name != 'host3', status_code=0, std_out=script,
+            )
+
+        results = HostGroupExecutor(
+            self.group, 'hostname', concurrency=3, task=self.task, runner=runner
+        ).run()
+
+        assert [r.host_id for r in results] == [h.pk for h in self.hosts]
+        assert max(peak) <= 3
+        assert TaskProgress.objects.filter(task=self.task).count() == 6
+
+        self.task.refresh_from_db()
+        assert self.task.status == 'success'
+        assert self.task.progress == 100
+        assert self.task.result['succeeded'] == 5
+        assert self.task.result['failed'] == 1
+
+    def test_runner_exception_marks_host_failed(self):
+        def runner(host, script):
+            raise ConnectionError('unreachable')
+
+        results = HostGroupExecutor(
+            Host.objects.filter(pk=self.hosts[0].pk), 'hostname',
+            task=self.task, runner=runner,
+        ).run()
+
+        assert results[0].error == 'unreachable'
+        self.task.refresh_from_db()
+        assert self.task.status == 'failed'
+
+
+@pytest.mark.django_db
+def test_manual_probe_bypasses_open_circuit(monkeypatch):
+    from types import SimpleNamespace
+
+    from django.core.cache import cache
+
+    from utils.circuit_breaker import STATE_CLOSED, STATE_OPEN, CircuitOpenError, get_circuit_breaker
+    from utils.winrm_client import WinrmClient
+    from utils.winrm_pool import reset_session_pool
+
+    cache.clear()
+    host = Host(name='winrm-host', hostname='127.0.0.1', username='admin')
+    host.password = 'secret'
+    host.save()
+    Host.objects.filter(pk=host.pk).update(status='online')
+    breaker = get_circuit_breaker(f'{host.hostname}:{host.port}')
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    host.refresh_from_db()
+    # 熔断发生在工作线程中，不直接写库；主机状态由巡检读取熔断状态后写回
+    assert breaker.state == STATE_OPEN and host.status == 'online'
+
+    sessions = []
+
+    def create_session(client):
+        sessions.append(client)
+        return SimpleNamespace(
+            run_cmd=lambda command, args: SimpleNamespace(status_code=0, std_out=b'admin', std_err=b'')
+        )
+
+    monkeypatch.setattr(WinrmClient, '_create_session', create_session)
+
+    try:
+        # 普通测试在熔断期内直接失败，不访问主机
+        host.test_connection()
+        host.refresh_from_db()
+        assert host.status == 'error' and sessions == []
+        with pytest.raises(CircuitOpenError):
+            host.get_connection_client().execute_command('whoami')
+
+        # 管理员手动重测忽略熔断，成功后熔断器恢复
+        host.test_connection(refresh_dns=True, probe=True)
+        host.refresh_from_db()
+        assert host.status == 'online' and len(sessions) == 1
+        assert breaker.state == STATE_CLOSED
+    finally:
+        cache.clear()
+        reset_session_pool()
+
+
+class _InventoryClient:
+    def __init__(self):
+        self.calls = 0
+
+    def execute_powershell(self, script, arguments=None):
+        from utils.winrm_client import WinrmResult
+        self.calls += 1
+        return WinrmResult(
+            0, '[{"Name":"Administrator","Enabled":true},{"Name":"alice","Enabled":true}]', ''
+        )
+
+
+@pytest.mark.django_db
+class TestHostInventory:
+    def setup_method(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.host = _make_host('inventory-host')
+        self.client = _InventoryClient()
+
+    def teardown_method(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_snapshot_cached_between_calls(self):
+        from apps.hosts.inventory import get_host_inventory
+
+        assert get_host_inventory(self.host, client=self.client).user_exists('ALICE')
+        assert get_host_inventory(self.host, client=self.client).user_exists('alice')
+        assert not get_host_inventory(self.host, client=self.client).user_exists('bob')
+        assert self.client.calls == 1
+
+    def test_confirm_user_exists_rechecks_only_hits(self):
+        from apps.hosts.inventory import get_host_inventory
+
+        inventory = get_host_inventory(self.host, client=self.client)
+        assert not inventory.confirm_user_exists('bob')
+        assert self.client.calls == 1
+        # 快照命中时远程确认一次
+        assert inventory.confirm_user_exists('alice')
+        assert self.client.calls == 2
+
+    def test_own_mutations_update_snapshot(self):
+        from apps.hosts.inventory import get_host_inventory, record_user_change
+
+        inventory = get_host_inventory(self.host, client=self.client)
+        inventory.users()
+        record_user_change(self.host, 'bob', created=True)
+        record_user_change(self.host, 'alice', deleted=True)
+        record_user_change(self.host, 'Administrator', enabled=False)
+
+        users = {u['name']: u['enabled'] for u in inventory.users()}
+        assert users == {'Administrator': False, 'bob': True}
+        assert self.client.calls == 1
+
+    def test_invalidate_forces_refetch(self):
+        from apps.hosts.inventory import KIND_USERS, get_host_inventory, invalidate_host_inventory
+
+        inventory = get_host_inventory(self.host, client=self.client)
+        inventory.users()
+        invalidate_host_inventory(self.host, KIND_USERS)
+        inventory.users()
+        assert self.client.calls == 2
+
+
+@pytest.mark.django_db
+class TestHealthSweeper:
+    def test_probes_concurrently_and_adapts_intervals(self, settings):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from apps.hosts.health import HealthSweeper, ProbeResult
+
+        settings.HOST_HEALTH_MIN_INTERVAL = 30
+        settings.HOST_HEALTH_MAX_INTERVAL = 600
+        hosts = [_make_host(f'health{i}') for i in range(4)]
+        Host.objects.filter(pk=hosts[0].pk).update(status='online', probe_streak=3)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def _prober(host):
+            with lock:
+                active.append(host.pk)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(host.pk)
+            status = 'offline' if host.pk == hosts[3].pk else 'online'
+            return ProbeResult(host.pk, status, latency_ms=5)
+
+        sweeper = HealthSweeper(concurrency=2, prober=_prober)
+        with CaptureQueriesContext(connection) as queries:
+            summary = sweeper.run()
+
+        assert max(peak) == 2
+        assert summary == {'probed': 4, 'online': 3, 'offline': 1, 'error': 0, 'changed': 2}
+        # 一次查询到期主机 + 一次 bulk_update + 每组状态变化一次条件 UPDATE
+        assert len(queries) <= 3
+
+        by_pk = Host.objects.in_bulk([h.pk for h in hosts])
+        stable, changed, unchanged_offline = by_pk[hosts[0].pk], by_pk[hosts[1].pk], by_pk[hosts[3].pk]
+        assert stable.probe_streak == 4
+        assert (stable.next_probe_at - stable.last_probe_at).total_seconds() == 240
+        assert changed.status == 'online' and changed.probe_streak == 1
+        assert (changed.next_probe_at - changed.last_probe_at).total_seconds() == 30
+        assert unchanged_offline.status == 'offline' and unchanged_offline.probe_latency_ms == 5
+        assert (unchanged_offline.next_probe_at - unchanged_offline.last_probe_at).total_seconds() == 30
+
+        # 未到期的主机不再探测
+        assert HealthSweeper(prober=_prober).run()['probed'] == 0
+
+    def test_skips_disabled_hosts_and_keeps_concurrent_status(self):
+        from apps.hosts.health import HealthSweeper, ProbeResult
+
+        disabled, tested, probed = [_make_host(f'sweep{i}') for i in range(3)]
+        Host.objects.filter(pk=disabled.pk).update(is_active=False)
+
+        def _prober(host):
+            if host.pk == tested.pk:
+                # 探测期间连接测试写入了新的状态
+                Host.objects.filter(pk=host.pk).update(status='error')
+            return ProbeResult(host.pk, 'online', latency_ms=5)
+
+        summary = HealthSweeper(prober=_prober).run()
+
+        assert summary['probed'] == 2
+        by_pk = Host.objects.in_bulk([disabled.pk, tested.pk, probed.pk])
+        assert by_pk[disabled.pk].status == 'offline' and by_pk[disabled.pk].last_probe_at is None
+        assert by_pk[tested.pk].status == 'error' and by_pk[tested.pk].last_probe_at is not None
+        assert by_pk[probed.pk].status == 'online'
+
+    def test_provider_toggle_offline_survives_sweep(self, client):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import Group
+
+        from apps.hosts.health import HealthSweeper, ProbeResult
+        from apps.provider.decorators import PROVIDER_GROUP_NAME
+
+        provider = get_user_model().objects.create_user(
+            username='hostprovider', email='hostprovider@test.com', password='testpass123'
+        )
+        provider.groups.add(Group.objects.get_or_create(name=PROVIDER_GROUP_NAME)[0])
+        host = _make_host('toggled')
+        Host.objects.filter(pk=host.pk).update(status='online', created_by=provider)
+
+        client.force_login(provider)
+        assert client.post(f'/provider/hosts/{host.pk}/toggle/').status_code == 200
+        HealthSweeper(prober=lambda h: ProbeResult(h.pk, 'online')).run()
+
+        host.refresh_from_db()
+        assert host.status == 'offline' and not host.is_active
+
+    def test_tcp_probe(self):
+        import socket
+
+        from django.core.cache import cache
+
+        from apps.hosts.health import probe_host
+        from utils.circuit_breaker import get_circuit_breaker
+
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+        host = Host(pk=1, name='tcp', hostname=f'127.0.0.1:{port}', username='admin')
+        breaker = get_circuit_breaker(f'127.0.0.1:{port}')
+        try:
+            result = probe_host(host, timeout=1)
+            # 端口可连接但 WinRM 熔断中：巡检把主机标记为 error
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+            tripped = probe_host(host, timeout=1)
+        finally:
+            server.close()
+            cache.clear()
+        assert result.status == 'online' and result.latency_ms is not None
+        assert tripped.status == 'error' and '熔断' in tripped.error
+        assert probe_host(host, timeout=1).status == 'offline'
+
+
+@pytest.mark.django_db
+class TestConnectionTest:
+    def setup_method(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.host = _make_host('conn')
+        self.queued = []
+
+    def _patch(self, monkeypatch, status='online'):
+        from apps.hosts import tasks
+
+        monkeypatch.setattr(
+            tasks.test_host_connection, 'delay',
+            lambda host_id, refresh_dns=False, probe=False: self.queued.append(
+                (host_id, refresh_dns, probe)
+            ),
+        )
+
+        def _test_connection(host, refresh_dns=False, probe=False):
+            Host.objects.filter(pk=host.pk).update(status=status)
+
+        monkeypatch.setattr(Host, 'test_connection', _test_connection)
+
+    def test_enqueues_once_and_reuses_recent_result(self, monkeypatch):
+        from apps.hosts.connection_test import request_connection_test, run_connection_test
+
+        self._patch(monkeypatch)
+        assert request_connection_test(self.host)['state'] == 'pending'
+        assert request_connection_test(self.host, force=True)['state'] == 'pending'
+        assert self.queued == [(self.host.pk, False, False)]
+
+        entry = run_connection_test(self.host.pk)
+        assert entry['state'] == 'done' and entry['status'] == 'online'
+        assert entry['old_status'] == 'offline'
+
+        assert request_connection_test(self.host) == entry
+        assert len(self.queued) == 1
+        assert request_connection_test(self.host, force=True)['state'] == 'pending'
+        assert len(self.queued) == 2
+
+    def test_admin_endpoint_returns_without_testing_inline(self, client, monkeypatch):
+        from django.contrib.auth import get_user_model
+
+        self._patch(monkeypatch)
+        admin = get_user_model().objects.create_superuser(
+            username='hostadmin', email='hostadmin@test.com', password='testpass123'
+        )
+        client.force_login(admin)
+
+        data = client.post(f'/admin/hosts/{self.host.pk}/test/').json()
+        assert data['state'] == 'pending'
+        # 管理员手动重测忽略熔断状态
+        assert self.queued == [(self.host.pk, True, True)]
+        assert Host.objects.get(pk=self.host.pk).status == 'offline'
+
+
+@pytest.mark.django_db
+class TestTunnelEventIngestion:
+    def setup_method(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.hosts = []
+        for i in range(3):
+            host = _make_host(f'tunnel{i}')
+            host.connection_type = 'tunnel'
+            host.tunnel_token = f'token-{i}'
+            host.save(update_fields=['connection_type', 'tunnel_token'])
+            self.hosts.append(host)
+
+    def _ingestor(self, **buffer_options):
+        from apps.hosts.tunnel_events import (
+            TunnelEventBuffer, TunnelEventIngestor, TunnelTokenIndex,
+        )
+        buffer_options.setdefault('flush_interval', 3600)
+        return TunnelEventIngestor(
+            index=TunnelTokenIndex(), buffer=TunnelEventBuffer(**buffer_options)
+        )
+
+    def test_coalesces_host_updates_and_batches_audit_rows(self, django_assert_max_num_queries):
+        from apps.audit.models import AuditLog
+
+        ingestor = self._ingestor()
+        # 加载索引 + 回查未知 token
+        with django_assert_max_num_queries(2):
+            for _ in range(3):
+                for i in range(3):
+                    ingestor.handle('tunnel_online', {'token': f'token-{i}', 'client_ip': '10.0.0.1'})
+                    ingestor.handle('tunnel_offline', {'token': f'token-{i}'})
+            ingestor.handle('tunnel_online', {'token': 'token-0', 'client_ip': '10.0.0.2'})
+            ingestor.handle('rdp_gateway_connect', {'token': 'token-1', 'session_id': 's1'})
+            ingestor.handle('tunnel_online', {'token': 'missing'})
+        assert AuditLog.objects.count() == 0
+
+        with django_assert_max_num_queries(4):
+            assert ingestor.buffer.flush() == (3, 20)
+
+        states = dict(Host.objects.values_list('tunnel_token', 'tunnel_status'))
+        assert states == {'token-0': 'online', 'token-1': 'offline', 'token-2': 'offline'}
+        host = Host.objects.get(tunnel_token='token-0')
+        assert host.tunnel_client_ip == '10.0.0.2' and host.tunnel_last_seen_at is not None
+        assert AuditLog.objects.filter(action='tunnel_offline').count() == 9
+        assert AuditLog.objects.get(action='rdp_gateway_connect').host_id == self.hosts[1].pk
+
+    def test_flushes_when_batch_size_reached(self):
+        from apps.audit.models import AuditLog
+
+        ingestor = self._ingestor(batch_size=4)
+        for _ in range(2):
+            ingestor.handle('tunnel_online', {'token': 'token-0'})
+            ingestor.handle('tunnel_offline', {'token': 'token-0'})
+        assert AuditLog.objects.count() == 4
+        assert ingestor.buffer.pending == 0
+
+    def test_token_index_follows_host_signals(self):
+        ingestor = self._ingestor()
+        assert ingestor.index.lookup('token-0') == (self.hosts[0].pk, 'tunnel0')
+
+        host = self.hosts[0]
+        host.tunnel_token = 'rotated'
+        host.save(update_fields=['tunnel_token'])
+        new_host = _make_host('tunnel-new')
+        new_host.tunnel_token = 'token-new'
+        new_host.save()
+        self.hosts[1].delete()
+
+        # 信号更新了共享版本号，其他进程的索引在下次版本检查时重新加载
+        ingestor.index._checked_at = 0
+        assert ingestor.index.lookup('token-0') is None
+        assert ingestor.index.lookup('rotated') == (host.pk, 'tunnel0')
+        assert ingestor.index.lookup('token-new') == (new_host.pk, 'tunnel-new')
+        assert ingestor.index.lookup('token-1') is None
+
+    def test_unknown_tokens_are_not_looked_up_repeatedly(self, django_assert_max_num_queries):
+        ingestor = self._ingestor()
+        ingestor.index.reload()
+        with django_assert_max_num_queries(1):
+            for _ in range(5):
+                assert ingestor.index.lookup('missing') is None
+
+
+class TestTunnelEventDispatcher:
+    def _dispatcher(self, handler, **options):
+        from apps.hosts.tunnel_events import TunnelEventDispatcher
+        return TunnelEventDispatcher(handler, **options)
+
+    def test_keeps_per_token_order_and_drains_on_close(self):
+        seen = {}
+        lock = threading.Lock()
+
+        def handler(event_type, payload):
+            time.sleep(0.001)
+            with lock:
+                seen.setdefault(payload['token'], []).append(payload['seq'])
+
+        dispatcher = self._dispatcher(handler, workers=4, queue_size=1000)
+        dispatcher.start()
+        for seq in range(50):
+            for token in ('a', 'b', 'c', 'd', 'e'):
+                assert dispatcher.submit('tunnel_online', {'token': token, 'seq': seq})
+        assert dispatcher.close(timeout=10)
+
+        assert seen == {token: list(range(50)) for token in 'abcde'}
+        metrics = dispatcher.metrics()
+        assert metrics['submitted'] == metrics['handled'] == 250
+        assert metrics['dropped'] == 0 and metrics['queued'] == 0
+        assert not dispatcher.submit('tunnel_online', {'token': 'a', 'seq': 99})
+        assert dispatcher.metrics()['dropped'] == 1
+
+    def test_drops_when_queue_stays_full(self):
+        release = threading.Event()
+        dispatcher = self._dispatcher(
+            lambda event_type, payload: release.wait(5),
+            workers=1, queue_size=2, enqueue_timeout=0.05,
+        )
+        dispatcher.start()
+        accepted = [dispatcher.submit('tunnel_offline', {'token': 't'}) for _ in range(5)]
+        assert accepted.count(False) >= 2
+        release.set()
+        assert dispatcher.close(timeout=5)
+
+        metrics = dispatcher.metrics()
+        assert metrics['dropped'] == accepted.count(False)
+        assert metrics['handled'] == accepted.count(True)
+        assert metrics['max_depth'] <= 2
+
+    def test_handler_errors_do_not_stop_workers(self):
+        def handler(event_type, payload):
+            if payload['token'] == 'bad':
+                raise ValueError('boom')
+
+        dispatcher = self._dispatcher(handler, workers=1, queue_size=10)
+        dispatcher.start()
+        for token in ('bad', 'good', 'bad', 'good'):
+            dispatcher.submit('remote_exec_result', {'token': token})
+        assert dispatcher.close(timeout=5)
+        metrics = dispatcher.metrics()
+        assert metrics['failed'] == 2 and metrics['handled'] == 2
+
+    def test_listener_signal_only_stops_and_drains_once(self, monkeypatch):
+        import signal
+
+        from django.core.management import call_command
+
+        from apps.hosts import tunnel_events
+        from utils import gateway_client
+
+        created = {}
+        handlers = {}
+
+        class Dispatcher(tunnel_events.TunnelEventDispatcher):
+            def __init__(self, handler):
+                super().__init__(handler, workers=1, queue_size=10)
+                self.closed = 0
+                created['dispatcher'] = self
+
+            def close(self, timeout=None):
+                self.closed += 1
+                return super().close(timeout=5)
+
+        class Ingestor:
+            EVENT_TYPES = ('remote_exec_result',)
+
+            def __init__(self):
+                self.closed = 0
+                created['ingestor'] = self
+
+            def handle(self, event_type, payload):
+                pass
+
+            def start(self):
+                pass
+
+            def close(self):
+                self.closed += 1
+
+        class Listener:
+            def __init__(self, socket_path):
+                self.stopped = 0
+
+            def register_handler(self, event_type, handler):
+                pass
+
+            def start(self):
+                created['listener'] = self
+                # 信号到达时主线程正持有分发器的锁（例如正在 submit 中）
+                with created['dispatcher']._lock:
+                    handlers[signal.SIGTERM](signal.SIGTERM, None)
+
+            def stop(self):
+                self.stopped += 1
+
+        monkeypatch.setattr(gateway_client, 'is_gateway_enabled', lambda: True)
+        monkeypatch.setattr(gateway_client, 'GatewayEventListener', Listener)
+        monkeypatch.setattr(tunnel_events, 'TunnelEventDispatcher', Dispatcher)
+        monkeypatch.setattr(tunnel_events, 'TunnelEventIngestor', Ingestor)
+        monkeypatch.setattr(signal, 'signal', lambda signum, handler: handlers.__setitem__(signum, handler))
+
+        call_command('gateway_listener', socket='/tmp/test-control.sock')
+
+        assert created['listener'].stopped == 2
+        assert created['dispatcher'].closed == 1
+        assert created['ingestor'].closed == 1
@@ -0,0 +1,568 @@
+"""
+隧道事件入库
+
+gateway_listener 原先对每个事件执行 Host.objects.get(tunnel_token=...)、
+host.save() 和 AuditLog.objects.create()，隧道集中重连时成千上万个事件
+各自产生多次同步查询。这里改为：
+
+- TunnelTokenIndex：进程内 token -> (主机ID, 主机名) 映射，首次使用时一次查询加载；
+  Host 保存/删除时由信号（apps.hosts.signals）更新本进程索引，并在缓存中递增版本号，
+  其他进程（监听进程）最多 VERSION_CHECK_INTERVAL 秒后发现版本变化并重新加载；
+  索引中没有的 token 回查一次数据库，查不到的短时间内不再回查
+- TunnelEventBuffer：主机的在线/离线/最后心跳更新按主机合并（后到的覆盖先到的），
+  审计日志累积后 bulk_create；每 TUNNEL_EVENT_FLUSH_INTERVAL 秒或缓冲达到
+  TUNNEL_EVENT_BATCH_SIZE 条时写入一次（主机更新为 bulk_update）
+- TunnelEventIngestor：事件处理入口，gateway_listener 和压测命令
+  （manage.py tunnel_event_benchmark）共用
+- TunnelEventDispatcher：接收与处理解耦，事件进入有界队列后由 TUNNEL_EVENT_WORKERS
+  个处理线程处理；按 token 分片保证同一主机的事件按接收顺序处理，队列满时最多阻塞
+  TUNNEL_EVENT_ENQUEUE_TIMEOUT 秒（背压），仍满则丢弃并计数；停止时先处理完队列中的事件
+
+使用方式：
+    from apps.hosts.tunnel_events import TunnelEventIngestor
+
+    ingestor = TunnelEventIngestor()
+    dispatcher = TunnelEventDispatcher(ingestor.handle)
+    ingestor.start()
+    dispatcher.start()
+    dispatcher.submit('tunnel_online', payload)
+    ...
+    dispatcher.close()
+    ingestor.close()
+"""
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_INDEX_TTL = 300
+# 检查缓存中索引版本号的最短间隔（秒）
+VERSION_CHECK_INTERVAL = 1.0
+# 未知 token 的回查间隔（秒）
+MISS_TTL = 30.0
+INDEX_VERSION_CACHE_KEY = 'tunnel_token_index:version'
+# 后台写入线程运行时，缓冲积压超过该批数后由事件处理线程同步写入
+MAX_BACKLOG_BATCHES = 4
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_ENQUEUE_TIMEOUT = 2.0
+DEFAULT_DRAIN_TIMEOUT = 30.0
+DISPATCHER_METRICS_CACHE_KEY = 'tunnel_events:metrics'
+# 处理指标写入缓存的最短间隔（秒）
+METRICS_PUBLISH_INTERVAL = 10.0
+
+
+class TunnelTokenIndex:
+    """隧道 token 到主机的进程内索引"""
+
+    def __init__(self, ttl: Optional[float] = None):
+        """
+        参数:
+            ttl: 全量重新加载的间隔（秒），默认 settings.TUNNEL_TOKEN_INDEX_TTL
+        """
+        self.ttl = ttl or getattr(settings, 'TUNNEL_TOKEN_INDEX_TTL', DEFAULT_INDEX_TTL)
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, Tuple[int, str]] = {}
+        self._misses: Dict[str, float] = {}
+        self._loaded_at: Optional[float] = None
+        self._version = None
+        self._checked_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def reload(self):
+        from apps.hosts.models import Host
+
+        version = cache.get(INDEX_VERSION_CACHE_KEY)
+        rows = Host.objects.exclude(tunnel_token__isnull=True).exclude(
+            tunnel_token=''
+        ).values_list('tunnel_token', 'pk', 'name')
+        tokens = {token: (pk, name) for token, pk, name in rows}
+        with self._lock:
+            self._tokens = tokens
+            self._misses = {}
+            self._version = version
+            self._loaded_at = self._checked_at = time.monotonic()
+        logger.info(f"隧道 token 索引已加载: {len(tokens)} 台主机")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.ttl:
+            self.reload()
+            return
+        if now - self._checked_at >= VERSION_CHECK_INTERVAL:
+            self._checked_at = now
+            if cache.get(INDEX_VERSION_CACHE_KEY) != self._version:
+                self.reload()
+
+    def lookup(self, token: str) -> Optional[Tuple[int, str]]:
+        """返回 (主机ID, 主机名)，未知 token 返回 None"""
+        if not token:
+            return None
+        self._maybe_reload()
+        entry = self._tokens.get(token)
+        if entry is not None:
+            return entry
+
+        missed_at = self._misses.get(token)
+        if missed_at is not None and time.monotonic() - missed_at < MISS_TTL:
+            return None
+        from apps.hosts.models import Host
+        row = Host.objects.filter(tunnel_token=token).values_list('pk', 'name').first()
+        with self._lock:
+            if row is None:
+                self._misses[token] = time.monotonic()
+                return None
+            self._tokens[token] = (row[0], row[1])
+        return self._tokens[token]
+
+    def update_host(self, host_id: int, token: Optional[str], name: str = ''):
+        """主机保存或删除（token 为 None）后更新索引"""
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            for stale in [t for t, (pk, _) in self._tokens.items() if pk == host_id]:
+                del self._tokens[stale]
+            if token:
+                self._tokens[token] = (host_id, name)
+                self._misses.pop(token, None)
+
+
+_index = TunnelTokenIndex()
+
+
+def get_token_index() -> TunnelTokenIndex:
+    return _index
+
+
+def token_index_changed(host_id: int, token: Optional[str], name: str = ''):
+    """Host 保存/删除时调用：更新本进程索引并通知其他进程重新加载"""
+    _index.update_host(host_id, token, name)
+    cache.set(INDEX_VERSION_CACHE_KEY, f'{time.time():.6f}:{host_id}', None)
+
+
+class TunnelEventBuffer:
+    """合并主机状态更新、批量写入审计日志"""
+
+    def __init__(self, flush_interval: Optional[float] = None,
+                 batch_size: Optional[int] = None):
+        self.flush_interval = flush_interval or getattr(
+            settings, 'TUNNEL_EVENT_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL
+        )
+        self.batch_size = batch_size or getattr(
+            settings, 'TUNNEL_EVENT_BATCH_SIZE', DEFAULT_BATCH_SIZE
+        )
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._hosts: Dict[int, Dict] = {}
+        self._audits: List = []
+        self._last_flush = time.monotonic()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def update_host(self, host_id: int, **fields):
+        with self._lock:
+            self._hosts.setdefault(host_id, {}).update(fields)
+
+    def add_audit(self, host_id: int, action: str, details: Dict,
+                  ip_address: Optional[str] = None):
+        from apps.audit.models import AuditLog
+
+        with self._lock:
+            self._audits.append(AuditLog(
+                host_id=host_id, action=action, details=details,
+                ip_address=ip_address or None,
+            ))
+
+    @property
+    def pending(self) -> int:
+        return len(self._hosts) + len(self._audits)
+
+    def maybe_flush(self):
+        """
+        缓冲达到批量大小或距上次写入超过间隔时写入
+
+        后台写入线程运行时只唤醒该线程，事件处理不等待数据库写入；
+        积压超过 MAX_BACKLOG_BATCHES 批（数据库持续变慢）时才同步写入
+        """
+        full = len(self._audits) >= self.batch_size or len(self._hosts) >= self.batch_size
+        if self._thread is not None:
+            if full:
+                self._wake.set()
+            if self.pending >= self.batch_size * MAX_BACKLOG_BATCHES:
+                self.flush()
+            return
+        if full or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> Tuple[int, int]:
+        """
+        写入缓冲的主机更新和审计日志
+
+        返回:
+            (更新的主机数, 写入的审计日志数)
+        """
+        from apps.audit.models import AuditLog
+        from apps.hosts.models import Host
+
+        with self._flush_lock:
+            with self._lock:
+                hosts, self._hosts = self._hosts, {}
+                audits, self._audits = self._audits, []
+                self._last_flush = time.monotonic()
+            if not hosts and not audits:
+                return 0, 0
+
+            # bulk_update 要求同一批对象更新相同的字段，按字段组合分组
+            groups: Dict[Tuple[str, ...], List] = {}
+            for host_id, fields in hosts.items():
+                host = Host(pk=host_id)
+                for name, value in fields.items():
+                    setattr(host, name, value)
+                groups.setdefault(tuple(sorted(fields)), []).append(host)
+            try:
+                for fields, objs in groups.items():
+                    Host.objects.bulk_update(objs, list(fields), batch_size=self.batch_size)
+                if audits:
+                    AuditLog.objects.bulk_create(audits, batch_size=self.batch_size)
+            except Exception as e:
+                logger.error(
+                    f"隧道事件写入失败: 主机 {len(hosts)} 台, 审计日志 {len(audits)} 条, 错误: {str(e)}",
+                    exc_info=True,
+                )
+                return 0, 0
+            return len(hosts), len(audits)
+
+    def start(self):
+        """启动后台定时写入线程（保证事件稀疏时也按间隔写入）"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._wake.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='tunnel-event-flush', daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                if not self._stop.is_set():
+                    self.flush()
+        finally:
+            connection.close()
+
+    def close(self):
+        """停止后台线程并写入剩余内容"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 2 + 5)
+            self._thread = None
+        self.flush()
+
+
+class TunnelEventIngestor:
+    """Gateway 隧道事件处理"""
+
+    EVENT_TYPES = (
+        'tunnel_online', 'tunnel_offline', 'rdp_gateway_connect',
+        'rdp_gateway_disconnect', 'remote_exec_result',
+    )
+
+    def __init__(self, index: Optional[TunnelTokenIndex] = None,
+                 buffer: Optional[TunnelEventBuffer] = None):
+        self.index = index or get_token_index()
+        self.buffer = buffer or TunnelEventBuffer()
+
+    def start(self):
+        self.buffer.start()
+
+    def close(self):
+        self.buffer.close()
+
+    def handle(self, event_type: str, payload: Dict):
+        handler = getattr(self, f'_handle_{event_type}', None)
+        if handler is None:
+            logger.warning(f'Unhandled gateway event: {event_type}')
+            return
+        token = payload.get('token', '')
+        host = self.index.lookup(token)
+        if host is None:
+            logger.warning(
+                f"{event_type.replace('_', ' ').capitalize()} event for unknown token: {token}"
+            )
+            return
+        handler(host[0], host[1], token, payload)
+        self.buffer.maybe_flush()
+
+    def _handle_tunnel_online(self, host_id, host_name, token, payload):
+        client_ip = payload.get('client_ip', '')
+        client_ver = payload.get('client_ver', '')
+        public_key = payload.get('public_key', b'')
+        now = timezone.now()
+
+        fields = {
+            'tunnel_status': 'online',
+            'tunnel_connected_at': now,
+            'tunnel_last_seen_at': now,
+            'tunnel_client_ip': client_ip,
+            'tunnel_client_version': client_ver,
+        }
+        if public_key:
+            fields['tunnel_public_key'] = public_key
+        self.buffer.update_host(host_id, **fields)
+        self.buffer.add_audit(host_id, 'tunnel_online', {
+            'token': token,
+            'client_ip': client_ip,
+            'client_ver': client_ver,
+        })
+        logger.info(
+            f'Tunnel online: host={host_name}, '
+            f'token={token}, ip={client_ip}'
+        )
+
+    def _handle_tunnel_offline(self, host_id, host_name, token, payload):
+        self.buffer.update_host(host_id, tunnel_status='offline')
+        self.buffer.add_audit(host_id, 'tunnel_offline', {'token': token})
+        logger.info(
+            f'Tunnel offline: host={host_name}, token={token}'
+        )
+
+    def _handle_rdp_gateway_connect(self, host_id, host_name, token, payload):
+        session_id = payload.get('session_id', '')
+        user = payload.get('user', '')
+        client_ip = payload.get('client_ip', '')
+
+        self.buffer.add_audit(host_id, 'rdp_gateway_connect', {
+            'session_id': session_id,
+            'token': token,
+            'target_host': payload.get('target_host', ''),
+            'user': user,
+        }, ip_address=client_ip)
+        logger.info(
+            f'RDP gateway connect: host={host_name}, '
+            f'session_id={session_id}, user={user}, ip={client_ip}'
+        )
+
+    def _handle_rdp_gateway_disconnect(self, host_id, host_name, token, payload):
+        session_id = payload.get('session_id', '')
+        user = payload.get('user', '')
+        duration = payload.get('duration', 0)
+
+        self.buffer.add_audit(host_id, 'rdp_gateway_disconnect', {
+            'session_id': session_id,
+            'token': token,
+            'target_host': payload.get('target_host', ''),
+            'user': user,
+            'duration': duration,
+        }, ip_address=payload.get('client_ip', ''))
+        logger.info(
+            f'RDP gateway disconnect: host={host_name}, '
+            f'session_id={session_id}, user={user}, duration={duration}'
+        )
+
+    def _handle_remote_exec_result(self, host_id, host_name, token, payload):
+        req_id = payload.get('req_id', '')
+        exit_code = payload.get('exit_code', -1)
+
+        self.buffer.add_audit(host_id, 'remote_exec_result', {
+            'req_id': req_id,
+            'exit_code': exit_code,
+        })
+        logger.info(
+            f'Remote exec result: host={host_name}, '
+            f'req_id={req_id}, exit_code={exit_code}'
+        )
+
+
+class TunnelEventDispatcher:
+    """有界事件队列与处理线程"""
+
+    def __init__(self, handler, workers: Optional[int] = None,
+                 queue_size: Optional[int] = None,
+                 enqueue_timeout: Optional[float] = None):
+        """
+        参数:
+            handler: 事件处理函数 handler(event_type, payload)，在处理线程中调用
+            workers: 处理线程数，默认 settings.TUNNEL_EVENT_WORKERS
+            queue_size: 队列总容量（平均分给各处理线程），默认 settings.TUNNEL_EVENT_QUEUE_SIZE
+            enqueue_timeout: 队列满时 submit 最多等待的秒数，默认 settings.TUNNEL_EVENT_ENQUEUE_TIMEOUT
+        """
+        self.handler = handler
+        self.workers = max(1, workers or getattr(settings, 'TUNNEL_EVENT_WORKERS', DEFAULT_WORKERS))
+        queue_size = queue_size or getattr(settings, 'TUNNEL_EVENT_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+        if enqueue_timeout is None:
+            enqueue_timeout = getattr(settings, 'TUNNEL_EVENT_ENQUEUE_TIMEOUT', DEFAULT_ENQUEUE_TIMEOUT)
+        self.enqueue_timeout = enqueue_timeout
+        self._queues = [
+            queue.Queue(maxsize=max(1, queue_size // self.workers))
+            for _ in range(self.workers)
+        ]
+        self._threads: List[threading.Thread] = []
+        self._accepting = False
+        self._lock = threading.Lock()
+        self._metrics = {
+            'submitted': 0, 'handled': 0, 'failed': 0, 'dropped': 0,
+            'max_depth': 0, 'lag_total': 0.0, 'lag_max': 0.0,
+        }
+        self._published_at = 0.0
+
+    def start(self):
+        if self._threads:
+            return
+        self._accepting = True
+        for i, events in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._run, args=(events,),
+                name=f'tunnel-event-worker-{i}', daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def depth(self) -> int:
+        return sum(events.qsize() for events in self._queues)
+
+    def submit(self, event_type: str, payload: Dict) -> bool:
+        """
+        接收事件放入队列（网关监听线程调用）
+
+        返回:
+            是否已入队，监听已停止或队列持续满时返回 False
+        """
+        if not self._accepting:
+            self._drop(event_type, payload, '监听已停止')
+            return False
+        token = str(payload.get('token', ''))
+        events = self._queues[zlib.crc32(token.encode()) % self.workers]
+        try:
+            events.put((time.monotonic(), event_type, payload), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._drop(event_type, payload, '队列已满')
+            return False
+        depth = self.depth
+        with self._lock:
+            self._metrics['submitted'] += 1
+            self._metrics['max_depth'] = max(self._metrics['max_depth'], depth)
+        return True
+
+    def _drop(self, event_type: str, payload: Dict, reason: str):
+        with self._lock:
+            self._metrics['dropped'] += 1
+            dropped = self._metrics['dropped']
+        # 持续丢弃时每 1000 条记录一次，避免日志本身拖慢接收
+        if dropped == 1 or dropped % 1000 == 0:
+            logger.warning(
+                f"隧道事件被丢弃（{reason}）: {event_type}, token={payload.get('token', '')}, "
+                f"累计丢弃 {dropped} 条"
+            )
+
+    def _run(self, events: queue.Queue):
+        try:
+            while True:
+                item = events.get()
+                if item is None:
+                    break
+                enqueued_at, event_type, payload = item
+                lag = time.monotonic() - enqueued_at
+                outcome = 'handled'
+                try:
+                    self.handler(event_type, payload)
+                except Exception as e:
+                    outcome = 'failed'
+                    logger.error(f"隧道事件处理失败: {event_type}, 错误: {str(e)}", exc_info=True)
+                with self._lock:
+                    self._metrics[outcome] += 1
+                    self._metrics['lag_total'] += lag
+                    self._metrics['lag_max'] = max(self._metrics['lag_max'], lag)
+                self._maybe_publish()
+        finally:
+            connection.close()
+
+    def metrics(self) -> Dict:
+        """
+        返回处理指标
+
+        返回:
+            {'submitted', 'handled', 'failed', 'dropped', 'queued', 'max_depth',
+             'lag_avg', 'lag_max'}，延迟单位为秒（入队到开始处理）
+        """
+        with self._lock:
+            snapshot = dict(self._metrics)
+        processed = snapshot['handled'] + snapshot['failed']
+        snapshot['lag_avg'] = round(snapshot.pop('lag_total') / processed, 4) if processed else 0.0
+        snapshot['lag_max'] = round(snapshot['lag_max'], 4)
+        snapshot['queued'] = self.depth
+        return snapshot
+
+    def _maybe_publish(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._published_at < METRICS_PUBLISH_INTERVAL:
+            return
+        self._published_at = now
+        try:
+            cache.set(DISPATCHER_METRICS_CACHE_KEY, {
+                'updated_at': timezone.now().isoformat(), **self.metrics(),
+            }, None)
+        except Exception as e:
+            logger.warning(f"隧道事件处理指标写入缓存失败: {str(e)}")
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        停止接收新事件，等待队列中的事件处理完成
+
+        参数:
+            timeout: 最多等待的秒数，默认 settings.TUNNEL_EVENT_DRAIN_TIMEOUT
+
+        返回:
+            是否在超时前处理完所有事件
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'TUNNEL_EVENT_DRAIN_TIMEOUT', DEFAULT_DRAIN_TIMEOUT)
+        self._accepting = False
+        if not self._threads:
+            return True
+        deadline = time.monotonic() + timeout
+        for events in self._queues:
+            try:
+                events.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                pass
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        drained = not any(thread.is_alive() for thread in self._threads)
+        self._threads = []
+
+        metrics = self.metrics()
+        if not drained:
+            logger.warning(f"隧道事件队列未在 {timeout} 秒内处理完, 剩余约 {metrics['queued']} 条")
+        logger.info(
+            f"隧道事件处理已停止: 接收 {metrics['submitted']} 条, 处理 {metrics['handled']} 条, "
+            f"失败 {metrics['failed']} 条, 丢弃 {metrics['dropped']} 条, "
+            f"平均延迟 {metrics['lag_avg']}s, 最大延迟 {metrics['lag_max']}s"
+        )
+        self._maybe_publish(force=True)
+        return drained
+
+
+def get_dispatcher_metrics() -> Optional[Dict]:
+    """读取 gateway_listener 最近写入的事件处理指标"""
+    return cache.get(DISPATCHER_METRICS_CACHE_KEY)
@@ -53,6 +53,11 @@ urlpatterns = [
         views_admin.admin_host_test_connection,
         name='host_test'
     ),
+    path(
+        '<int:pk>/test/stream/',
+        views_admin.admin_host_test_stream,
+        name='host_test_stream'
+    ),
 
     # 主机组管理
     path(
@@ -47,6 +47,11 @@ urlpatterns = [
         views_provider.HostToggleActiveView.as_view(),
         name='host_toggle'
     ),
+    path(
+        '<int:pk>/test/stream/',
+        views_provider.HostConnectionTestStreamView.as_view(),
+        name='host_test_stream'
+    ),
 
     # 主机组管理
     path(
@@ -25,6 +25,9 @@ from django.views.generic import DetailView, TemplateView
 from apps.accounts.provider_decorators import admin_required
 from utils.provider import get_provider_hosts
 
+from .connection_test import (
+    connection_test_payload, connection_test_stream, get_connection_test, request_connection_test,
+)
 from .forms_admin import AdminHostForm, AdminHostGroupForm
 from .forms_wizard import HostWizardForm, CONNECTION_DEFAULT_PORTS, CONNECTION_DEFAULT_SSL
 from .models import Host, HostGroup
@@ -255,23 +258,12 @@ class AdminHostCreateView(TemplateView):
             host.save()
             form.save_m2m()
 
-            # 测试连接
-            try:
-                host.test_connection()
-                status_display = dict(Host.STATUS_CHOICES).get(
-                    host.status, host.status
-                )
-                messages.success(
-                    request,
-                    f'主机 {host.name} 创建成功，状态: '
-                    f'{status_display}'
-                )
-            except Exception as e:
-                messages.warning(
-                    request,
-                    f'主机 {host.name} 创建成功，'
-                    f'但连接测试失败: {str(e)}'
-                )
+            # 后台测试连接，详情页实时显示结果
+            request_connection_test(host)
+            messages.success(
+                request,
+                f'主机 {host.name} 创建成功，正在后台测试连接'
+            )
 
             # 如果自动生成了密码，提示用户
             if hasattr(form, 'generated_password') and \
@@ -337,27 +329,16 @@ class AdminHostUpdateView(TemplateView):
         if form.is_valid():
             host = form.save()
 
-            # 如果密码被修改，测试连接
+            # 如果密码被修改，后台重新测试连接
             if (
                 'password' in form.changed_data
                 and form.cleaned_data.get('password')
             ):
-                try:
-                    host.test_connection()
-                    status_display = dict(
-                        Host.STATUS_CHOICES
-                    ).get(host.status, host.status)
-                    messages.success(
-                        request,
-                        f'主机 {host.name} 更新成功，'
-                        f'状态: {status_display}'
-                    )
-                except Exception as e:
-                    messages.warning(
-                        request,
-                        f'主机 {host.name} 更新成功，'
-                        f'但连接测试失败: {str(e)}'
-                    )
+                request_connection_test(host, force=True)
+                messages.success(
+                    request,
+                    f'主机 {host.name} 更新成功，正在后台测试连接'
+                )
             else:
                 messages.success(
                     request, f'主机 {host.name} 更新成功'
@@ -424,62 +405,32 @@ class AdminHostDeleteView(TemplateView):
         return redirect('admin:admin_hosts:host_list')
 
 
+def _admin_host_or_404(request, pk):
+    if request.user.is_superuser:
+        return get_object_or_404(Host, pk=pk)
+    return get_object_or_404(get_provider_hosts(request.user), pk=pk)
+
+
 @admin_required
 def admin_host_test_connection(request, pk):
     """
     测试主机连接 AJAX 端点
 
-    调用 Host.test_connection() 测试连接，
-    返回 JSON 格式的测试结果。
+    POST 投递连接测试（刷新 DNS 缓存、忽略熔断状态后重新测试）并立即返回，
+    GET 返回最近一次测试状态；结果通过 admin_host_test_stream 实时推送。
     """
-    if request.user.is_superuser:
-        host = get_object_or_404(Host, pk=pk)
+    host = _admin_host_or_404(request, pk)
+    if request.method == 'POST':
+        entry = request_connection_test(host, refresh_dns=True, force=True, probe=True)
     else:
-        host = get_object_or_404(
-            get_provider_hosts(request.user), pk=pk
-        )
+        entry = get_connection_test(host.pk)
+    return JsonResponse(connection_test_payload(host, entry))
 
-    old_status = host.status
-    error_message = None
 
-    try:
-        host.test_connection()
-    except Exception as e:
-        error_message = str(e)
-        logger.error(
-            f"测试主机连接异常: {host.name}, 错误: {error_message}"
-        )
-
-    host.refresh_from_db()
-    new_status = host.status
-    status_display = dict(Host.STATUS_CHOICES).get(
-        new_status, new_status
-    )
-
-    success = new_status == 'online'
-
-    result = {
-        'success': success,
-        'status': new_status,
-        'status_display': status_display,
-        'old_status': old_status,
-    }
-
-    if error_message:
-        result['error'] = error_message
-
-    if success:
-        result['message'] = f'连接成功，主机状态: {status_display}'
-    elif new_status == 'error':
-        result['message'] = (
-            f'连接失败，主机状态: {status_display}'
-        )
-        if error_message:
-            result['message'] += f'（{error_message}）'
-    else:
-        result['message'] = f'主机状态: {status_display}'
-
-    return JsonResponse(result)
+@admin_required
+def admin_host_test_stream(request, pk):
+    """以 Server-Sent Events 推送主机连接测试结果"""
+    return connection_test_stream(_admin_host_or_404(request, pk))
 
 
 # ========== 主机组管理 ==========
@@ -696,23 +647,12 @@ def admin_host_wizard(request):
             host.save()
             form.save_m2m()
 
-            # 测试连接
-            try:
-                host.test_connection()
-                status_display = dict(Host.STATUS_CHOICES).get(
-                    host.status, host.status
-                )
-                messages.success(
-                    request,
-                    f'主机 {host.name} 创建成功，'
-                    f'状态: {status_display}'
-                )
-            except Exception as e:
-                messages.warning(
-                    request,
-                    f'主机 {host.name} 创建成功，'
-                    f'但连接测试失败: {str(e)}'
-                )
+            # 后台测试连接，详情页实时显示结果
+            request_connection_test(host)
+            messages.success(
+                request,
+                f'主机 {host.name} 创建成功，正在后台测试连接'
+            )
 
             # 如果自动生成了密码，提示用户
             if hasattr(form, 'generated_password') and \
@@ -26,6 +26,9 @@ from apps.accounts.provider_decorators import provider_required
 from apps.provider.context_mixin import ProviderContextMixin
 from utils.provider import get_provider_hosts
 
+from .connection_test import (
+    connection_test_payload, connection_test_stream, request_connection_test,
+)
 from .forms_provider import HostCreateForm, HostUpdateForm, HostGroupForm
 from .models import Host, HostGroup
 
@@ -174,22 +177,12 @@ class HostCreateView(ProviderContextMixin, TemplateView):
             # 将创建者添加到管理员列表
             host.administrators.add(request.user)
 
-            # 测试连接
-            try:
-                host.test_connection()
-                status_display = dict(Host.STATUS_CHOICES).get(
-                    host.status, host.status
-                )
-                messages.success(
-                    request,
-                    f'主机 {host.name} 创建成功，状态: {status_display}'
-                )
-            except Exception as e:
-                messages.warning(
-                    request,
-                    f'主机 {host.name} 创建成功，'
-                    f'但连接测试失败: {str(e)}'
-                )
+            # 后台测试连接，不阻塞请求
+            request_connection_test(host)
+            messages.success(
+                request,
+                f'主机 {host.name} 创建成功，正在后台测试连接'
+            )
 
             # 如果自动生成了密码，提示用户
             if form.generated_password:
@@ -248,27 +241,16 @@ class HostUpdateView(ProviderContextMixin, TemplateView):
         if form.is_valid():
             host = form.save()
 
-            # 如果密码被修改，测试连接
+            # 如果密码被修改，后台重新测试连接
             if (
                 'password' in form.changed_data
                 and form.cleaned_data.get('password')
             ):
-                try:
-                    host.test_connection()
-                    status_display = dict(Host.STATUS_CHOICES).get(
-                        host.status, host.status
-                    )
-                    messages.success(
-                        request,
-                        f'主机 {host.name} 更新成功，'
-                        f'状态: {status_display}'
-                    )
-                except Exception as e:
-                    messages.warning(
-                        request,
-                        f'主机 {host.name} 更新成功，'
-                        f'但连接测试失败: {str(e)}'
-                    )
+                request_connection_test(host, force=True)
+                messages.success(
+                    request,
+                    f'主机 {host.name} 更新成功，正在后台测试连接'
+                )
             else:
                 messages.success(
                     request, f'主机 {host.name} 更新成功'
@@ -431,6 +413,7 @@ class HostToggleActiveView(View):
     切换主机活跃状态视图
 
     AJAX 端点，用于快速切换主机的在线/离线状态。
+    切换为在线时在后台测试连接，结果通过 HostConnectionTestStreamView 推送。
     """
 
     def get_host(self):
@@ -442,27 +425,33 @@ class HostToggleActiveView(View):
     def post(self, request, *args, **kwargs):
         host = self.get_host()
 
-        # 切换状态：在线 <-> 离线
+        # 切换状态：在线 -> 离线立即生效（停用后巡检不再探测），
+        # 离线 -> 在线重新启用，以连接测试结果为准
         if host.status == 'online':
-            new_status = 'offline'
+            Host.objects.filter(pk=host.pk).update(status='offline', is_active=False)
+            host.status = 'offline'
+            payload = connection_test_payload(host, None)
         else:
-            # 尝试测试连接
-            try:
-                host.test_connection()
-                new_status = host.status
-            except Exception:
-                new_status = 'error'
+            Host.objects.filter(pk=host.pk).update(is_active=True, next_probe_at=None)
+            entry = request_connection_test(host)
+            if entry['state'] == 'done':
+                # 复用最近的测试结果
+                Host.objects.filter(pk=host.pk).update(status=entry['status'])
+            payload = connection_test_payload(host, entry)
 
-        Host.objects.filter(pk=host.pk).update(status=new_status)
+        payload['success'] = True
+        return JsonResponse(payload)
 
-        status_display = dict(Host.STATUS_CHOICES).get(
-            new_status, new_status
+
+@method_decorator(provider_required, name='dispatch')
+class HostConnectionTestStreamView(View):
+    """以 Server-Sent Events 推送主机连接测试结果"""
+
+    def get(self, request, *args, **kwargs):
+        host = get_object_or_404(
+            get_provider_hosts(request.user), pk=self.kwargs['pk']
         )
-        return JsonResponse({
-            'success': True,
-            'status': new_status,
-            'status_display': status_display,
-        })
+        return connection_test_stream(host)
 
 
 # ========== 主机组管理 ==========
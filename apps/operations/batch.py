@@ -0,0 +1,289 @@
+"""
+开户申请批量处理
+
+原先批量任务逐个投递子任务并同步等待结果，500 个申请完全串行，
+且一个 worker 阻塞等待另一个 worker。这里在任务内按目标主机分组并行处理：
+
+- 开始前在调用线程中通过放置调度器为每个申请选择主机（产品主机池），
+  按实际放置的主机分组，开户时使用该主机；预占由批处理持有，
+  申请失败或被跳过时在汇总时释放
+- 同一主机的申请拆分为最多 per_host 条通道，每条通道内顺序执行，
+  避免同时向一台主机发起过多远程操作
+- 不同主机之间并行，总并发不超过 concurrency
+- 每个申请处理完成立即上报父 AsyncTask 的进度（经 ProgressReporter 合并写入）
+- 通道意外中断时其余申请记为失败；超过 OPENING_BATCH_RESULT_TIMEOUT 秒
+  没有新结果时不再等待，未返回结果的申请记为失败
+
+使用方式：
+    from apps.operations.batch import BatchOpeningProcessor
+
+    results = BatchOpeningProcessor(request_ids, operator, task=task).run()
+"""
+import logging
+import queue
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 2
+DEFAULT_RESULT_TIMEOUT = 900
+
+
+def process_single_request(request_obj, operator, host=None) -> Dict:
+    """
+    处理单个开户申请：待审核的先批准，然后在当前线程执行开户
+
+    异步开户模式下通过开户发件箱执行（不再额外投递 Celery 任务），
+    与审批触发的投递共用认领检查，不会重复开户。
+
+    参数:
+        host: 已放置的主机，为空时由放置调度器选择
+
+    返回:
+        {'success': bool, 'error': str}
+    """
+    if request_obj.status not in ('pending', 'approved'):
+        return {'success': False, 'error': f'申请状态为 {request_obj.status}，无法处理'}
+
+    if not getattr(settings, 'ACCOUNT_PROVISIONING_ASYNC', False):
+        if request_obj.status == 'pending':
+            request_obj.approve(approver=operator, notes='批量处理', host=host)
+        else:
+            request_obj.auto_process_creation(host=host)
+    else:
+        from apps.operations.outbox import enqueue_provisioning, run_entry
+        if request_obj.status == 'pending':
+            entry = request_obj.approve(approver=operator, notes='批量处理', dispatch=False)
+        else:
+            entry = enqueue_provisioning(request_obj, dispatch=False)
+        run_entry(entry.pk, host=host)
+        request_obj.refresh_from_db()
+
+    if request_obj.status == 'completed':
+        return {'success': True, 'error': ''}
+    return {'success': False, 'error': request_obj.result_message or '开户失败'}
+
+
+def place_requests(requests) -> Dict[int, object]:
+    """
+    为可处理的申请选择主机（在调用线程中执行，放置结果在调度器快照中预占）
+
+    返回:
+        {申请ID: Host}
+    """
+    from apps.operations.placement import get_placement_scheduler
+
+    scheduler = get_placement_scheduler()
+    placed = {}
+    for request_obj in requests:
+        if request_obj.target_product is None or request_obj.status not in ('pending', 'approved'):
+            continue
+        placed[request_obj.pk] = scheduler.place(request_obj.target_product)
+    return placed
+
+
+def partition_by_host(requests, placed: Optional[Dict[int, object]] = None) -> List[List]:
+    """
+    按实际放置的主机分组，保持原有顺序
+
+    未放置的申请按产品关联主机分组，没有目标产品的申请单独成组（会在处理时失败）。
+    """
+    placed = placed or {}
+    groups = OrderedDict()
+    for request_obj in requests:
+        product = request_obj.target_product
+        host = placed.get(request_obj.pk)
+        if host is not None:
+            key = host.pk
+        else:
+            key = product.host_id if product is not None else None
+        groups.setdefault(key, []).append(request_obj)
+    return list(groups.values())
+
+
+class BatchOpeningProcessor:
+    """按主机分区并行处理一批开户申请"""
+
+    def __init__(
+            self,
+            request_ids: List[int],
+            operator,
+            task=None,
+            concurrency: Optional[int] = None,
+            per_host: Optional[int] = None,
+            processor: Callable = process_single_request,
+            result_timeout: Optional[float] = None,
+    ):
+        """
+        参数:
+            request_ids: 开户申请 ID 列表
+            operator: 执行批准操作的用户
+            task: 可选的 AsyncTask，用于汇总进度和结果
+            concurrency: 总并发数，默认 settings.OPENING_BATCH_CONCURRENCY
+            per_host: 单台主机的并发上限，默认 settings.OPENING_BATCH_PER_HOST
+            processor: 单个申请的处理函数 processor(request_obj, operator, host)，测试时可替换
+            result_timeout: 等待下一个结果的最长时间（秒），默认 settings.OPENING_BATCH_RESULT_TIMEOUT
+        """
+        self.request_ids = list(request_ids)
+        self.operator = operator
+        self.task = task
+        self.reporter = task.progress_reporter() if task is not None else None
+        self.concurrency = max(1, concurrency or getattr(
+            settings, 'OPENING_BATCH_CONCURRENCY', DEFAULT_CONCURRENCY
+        ))
+        self.per_host = max(1, per_host or getattr(
+            settings, 'OPENING_BATCH_PER_HOST', DEFAULT_PER_HOST
+        ))
+        self.processor = processor
+        self.result_timeout = result_timeout or getattr(
+            settings, 'OPENING_BATCH_RESULT_TIMEOUT', DEFAULT_RESULT_TIMEOUT
+        )
+        self.placed: Dict[int, object] = {}
+        self._products: Dict[int, object] = {}
+
+    def _load_requests(self) -> List:
+        from apps.operations.models import AccountOpeningRequest
+
+        by_id = AccountOpeningRequest.objects.select_related(
+            'target_product', 'target_product__host'
+        ).in_bulk(self.request_ids)
+        return [by_id[pk] for pk in self.request_ids if pk in by_id]
+
+    def _lanes(self, requests) -> List[List]:
+        lanes = []
+        for group in partition_by_host(requests, self.placed):
+            count = min(self.per_host, len(group))
+            lanes.extend(group[i::count] for i in range(count))
+        return lanes
+
+    def _run_lane(self, lane: List, outcomes: queue.Queue):
+        done = 0
+        try:
+            for request_obj in lane:
+                try:
+                    outcome = self.processor(
+                        request_obj, self.operator, self.placed.get(request_obj.pk)
+                    )
+                except Exception as e:
+                    logger.error(f"处理开户申请失败: ID={request_obj.pk}, 错误: {str(e)}", exc_info=True)
+                    outcome = {'success': False, 'error': str(e)}
+                outcomes.put((request_obj.pk, outcome))
+                done += 1
+        except Exception as e:
+            # 通道中断时其余申请记为失败，调用线程不会等待永远不会到来的结果
+            for request_obj in lane[done:]:
+                outcomes.put((request_obj.pk, {'success': False, 'error': f'处理通道异常: {str(e)}'}))
+            logger.error(f"批量开户通道异常: {str(e)}", exc_info=True)
+        finally:
+            # 线程内使用的数据库连接不会被请求周期回收，需手动关闭
+            connection.close()
+
+    def run(self) -> Dict:
+        """
+        执行批量处理，阻塞直到全部完成或等待结果超时
+
+        返回:
+            {'processed', 'successful', 'failed', 'errors': [{'request_id', 'error'}]}
+        """
+        results = {'processed': 0, 'successful': 0, 'failed': 0, 'errors': []}
+
+        requests = self._load_requests()
+        found = {r.pk for r in requests}
+        for request_id in self.request_ids:
+            if request_id not in found:
+                results['processed'] += 1
+                results['failed'] += 1
+                results['errors'].append({'request_id': request_id, 'error': '开户申请不存在'})
+
+        total = len(self.request_ids)
+        self.placed = place_requests(requests)
+        self._products = {r.pk: r.target_product for r in requests}
+        lanes = self._lanes(requests)
+        outcomes = queue.Queue()
+        waiting = Counter(r.pk for r in requests)
+        pool = ThreadPoolExecutor(
+            max_workers=min(self.concurrency, max(1, len(lanes))),
+            thread_name_prefix='opening-batch',
+        )
+        timed_out = False
+        try:
+            for lane in lanes:
+                pool.submit(self._run_lane, lane, outcomes)
+            # 汇总在调用线程中进行，任务记录的写入不与子线程竞争
+            while waiting:
+                try:
+                    request_id, outcome = outcomes.get(timeout=self.result_timeout)
+                except queue.Empty:
+                    timed_out = True
+                    logger.error(
+                        f"批量开户等待结果超时（{self.result_timeout} 秒），"
+                        f"{sum(waiting.values())} 个申请记为失败"
+                    )
+                    error = f'等待开户结果超时（{self.result_timeout} 秒）'
+                    for request_id in list(waiting.elements()):
+                        self._collect(request_id, {'success': False, 'error': error}, results, total)
+                    break
+                waiting[request_id] -= 1
+                if waiting[request_id] <= 0:
+                    del waiting[request_id]
+                self._collect(request_id, outcome, results, total)
+        finally:
+            # 超时后不等待卡住的通道，未开始的通道直接取消
+            pool.shutdown(wait=not timed_out, cancel_futures=True)
+
+        self._finish(results)
+        return results
+
+    def _collect(self, request_id: int, outcome: Dict, results: Dict, total: int):
+        results['processed'] += 1
+        if outcome.get('success'):
+            results['successful'] += 1
+        else:
+            self._release(request_id)
+            results['failed'] += 1
+            results['errors'].append({
+                'request_id': request_id,
+                'error': outcome.get('error') or '未知错误',
+            })
+        self._report(request_id, outcome, results['processed'], total)
+
+    def _release(self, request_id: int):
+        """撤销未开户成功的申请在 place_requests 中的预占"""
+        host = self.placed.pop(request_id, None)
+        if host is None:
+            return
+        from apps.operations.placement import get_placement_scheduler
+
+        product = self._products[request_id]
+        get_placement_scheduler().release(host, product)
+
+    def _report(self, request_id: int, outcome: Dict, done: int, total: int):
+        if self.task is None:
+            return
+        progress = int(done * 100 / total)
+        if outcome.get('success'):
+            message = f"[{done}/{total}] 开户申请 #{request_id}: 成功"
+        else:
+            reason = outcome.get('error') or '未知错误'
+            message = f"[{done}/{total}] 开户申请 #{request_id}: 失败 - {reason[:500]}"
+        # 完成前不写 100，最终状态由 _finish 统一设置
+        self.reporter.update(min(progress, 99), message)
+
+    def _finish(self, results: Dict):
+        logger.info(
+            f"批量开户完成: 成功={results['successful']}, 失败={results['failed']}"
+        )
+        if self.task is None:
+            return
+        self.reporter.flush()
+        if results['processed'] and not results['successful']:
+            self.task.result = results
+            self.task.complete_failure(f"全部开户申请处理失败（共 {results['failed']} 个）")
+        else:
+            self.task.complete_success(results)
@@ -0,0 +1,145 @@
+"""
+非活跃用户清理
+
+按所在主机分组，每台主机通过一个批量脚本检查 LastLogon 并禁用超过
+days_inactive 天未登录的用户；主机之间并行（并发受 HOST_EXECUTOR_CONCURRENCY 限制），
+结果统一用 bulk_update 写回数据库。
+
+远程禁用已经完成，bulk_update 不经过 CloudComputerUser.save()，
+不会再逐个触发 disable_remote_user。
+
+使用方式：
+    from apps.operations.cleanup import cleanup_inactive_users
+
+    summary = cleanup_inactive_users(days_inactive=30, task=task)
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from utils.bulk_user_ops import STATUS_DISABLED, STATUS_ERROR, bulk_disable_users
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_CONCURRENCY = 16
+UPDATE_BATCH_SIZE = 500
+
+
+def _group_by_host(users) -> Dict[int, Tuple[Any, List]]:
+    groups = {}
+    hosts = {}
+    for user in users:
+        host = user.effective_host
+        hosts[host.pk] = host
+        groups.setdefault(host.pk, []).append(user)
+    return {pk: (hosts[pk], members) for pk, members in groups.items()}
+
+
+def cleanup_inactive_users(
+        days_inactive: int = 30,
+        concurrency: Optional[int] = None,
+        task=None,
+        disabler: Callable = bulk_disable_users,
+        client_factory: Optional[Callable] = None,
+) -> Dict:
+    """
+    禁用超过 days_inactive 天未登录的云电脑用户
+
+    候选为创建时间早于截止时间的激活用户，是否真正非活跃以主机上的 LastLogon 为准。
+
+    参数:
+        days_inactive: 未登录天数
+        concurrency: 并行主机数，默认 settings.HOST_EXECUTOR_CONCURRENCY
+        task: 可选的 AsyncTask，用于汇报进度
+        disabler: 批量禁用函数 disabler(client, usernames, inactive_days)，测试时可替换
+        client_factory: 连接客户端工厂 client_factory(host)，默认 host.get_connection_client
+
+    返回:
+        {'cleaned_users', 'total_inactive', 'total_candidates', 'failed', 'errors'}
+    """
+    from apps.operations.models import CloudComputerUser
+
+    cutoff = timezone.now() - timedelta(days=days_inactive)
+    candidates = list(
+        CloudComputerUser.objects
+        .filter(status='active', created_at__lt=cutoff)
+        .select_related('host', 'product__host')
+    )
+    groups = _group_by_host(candidates)
+    concurrency = max(1, concurrency or getattr(
+        settings, 'HOST_EXECUTOR_CONCURRENCY', DEFAULT_CONCURRENCY
+    ))
+
+    def _run_host(host, users):
+        client = client_factory(host) if client_factory else host.get_connection_client()
+        return disabler(client, [u.username for u in users], days_inactive)
+
+    summary = {
+        'cleaned_users': 0,
+        'total_inactive': 0,
+        'total_candidates': len(candidates),
+        'failed': 0,
+        'errors': [],
+    }
+    to_update = []
+    now = timezone.now()
+    done_hosts = 0
+    reporter = task.progress_reporter() if task is not None else None
+
+    with ThreadPoolExecutor(
+            max_workers=min(concurrency, max(1, len(groups))),
+            thread_name_prefix='cleanup-users',
+    ) as pool:
+        futures = {
+            pool.submit(_run_host, host, users): (host, users)
+            for host, users in groups.values()
+        }
+        for future in as_completed(futures):
+            host, users = futures[future]
+            try:
+                statuses = future.result()
+            except Exception as e:
+                logger.error(f"主机 {host.name} 批量禁用失败: {str(e)}")
+                statuses = {}
+                summary['errors'].append({'host': host.name, 'error': str(e)})
+
+            for user in users:
+                status = statuses.get(user.username)
+                if status is None or status.status == STATUS_ERROR:
+                    summary['failed'] += 1
+                    if status is not None:
+                        summary['errors'].append({
+                            'host': host.name, 'username': user.username,
+                            'error': status.message,
+                        })
+                    continue
+                if status.status == STATUS_DISABLED:
+                    summary['total_inactive'] += 1
+                    user.status = 'disabled'
+                    user.updated_at = now
+                    to_update.append(user)
+
+            done_hosts += 1
+            if reporter is not None:
+                reporter.update(min(99, int(done_hosts * 100 / len(groups))))
+
+    if reporter is not None:
+        reporter.flush()
+    if to_update:
+        CloudComputerUser.objects.bulk_update(
+            to_update, ['status', 'updated_at'], batch_size=UPDATE_BATCH_SIZE
+        )
+        summary['cleaned_users'] = len(to_update)
+        from apps.hosts.inventory import KIND_USERS, invalidate_host_inventory
+        for host_id in {u.effective_host.pk for u in to_update}:
+            invalidate_host_inventory(host_id, KIND_USERS)
+
+    logger.info(
+        f"清理非活跃用户完成: 候选 {len(candidates)} 个, 禁用 {summary['cleaned_users']} 个, "
+        f"失败 {summary['failed']} 个, 主机 {len(groups)} 台"
+    )
+    return summary
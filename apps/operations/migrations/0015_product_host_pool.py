@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hosts', '0010_remove_host_host_type'),
+        ('operations', '0014_encrypt_initial_password'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cloudcomputeruser',
+            name='host',
+            field=models.ForeignKey(blank=True, help_text='用户实际创建所在的主机，为空时为产品的关联主机', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cloud_users', to='hosts.host', verbose_name='所在主机'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='host_pool',
+            field=models.ManyToManyField(blank=True, help_text='开户时在关联主机和这些主机中按放置策略选择，为空时只使用关联主机', related_name='pooled_products', to='hosts.host', verbose_name='主机池'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='placement_strategy',
+            field=models.CharField(choices=[('least_loaded', '负载最低'), ('bin_pack', '装箱（优先填满）'), ('spread', '分散（本产品用户均匀分布）')], default='least_loaded', help_text='主机池中选择开户主机的策略', max_length=20, verbose_name='放置策略'),
+        ),
+    ]
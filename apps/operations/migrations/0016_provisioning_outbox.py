@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0015_product_host_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProvisioningOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', '待投递'), ('dispatched', '已投递'), ('processing', '执行中'), ('done', '已完成'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='执行次数')),
+                ('last_error', models.TextField(blank=True, verbose_name='最近错误')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True, verbose_name='投递时间')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='provisioning_outbox', to='operations.accountopeningrequest', verbose_name='开户申请')),
+            ],
+            options={
+                'verbose_name': '开户发件箱',
+                'verbose_name_plural': '开户发件箱',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='operations__status_47804d_idx')],
+            },
+        ),
+    ]
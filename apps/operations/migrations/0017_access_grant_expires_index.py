@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0016_provisioning_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productaccessgrant',
+            index=models.Index(fields=['expires_at'], name='operations__expires_17f334_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0017_access_grant_expires_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='systemtask',
+            index=models.Index(fields=['created_by', '-created_at'], name='operations__created_cf9a2a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemtask',
+            index=models.Index(fields=['status', '-created_at'], name='operations__status_7f74ba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemtask',
+            index=models.Index(fields=['status', 'completed_at'], name='operations__status_031a51_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0018_task_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='provisioningoutbox',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, help_text='执行中的任务定期续期，过期说明执行该记录的 worker 已中断', null=True, verbose_name='执行租约到期时间'),
+        ),
+    ]
@@ -188,6 +188,11 @@ class SystemTask(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['task_type']),
             models.Index(fields=['created_at']),
+            # 任务列表：按创建者 / 状态筛选并按时间倒序分页
+            models.Index(fields=['created_by', '-created_at']),
+            models.Index(fields=['status', '-created_at']),
+            # 保留策略：按状态和完成时间查找可归档的任务
+            models.Index(fields=['status', 'completed_at']),
         ]
 
     def __str__(self):
@@ -200,9 +205,13 @@ class SystemTask(models.Model):
 
         Args:
             progress: 进度值，0-100
+
+        实时进度写入缓存，数据库按里程碑或时间间隔合并写入，见 apps.tasks.progress
         """
-        self.progress = min(max(progress, 0), 100)
-        self.save(update_fields=['progress'])
+        from apps.tasks.progress import ProgressReporter
+        if getattr(self, '_progress_reporter', None) is None:
+            self._progress_reporter = ProgressReporter(self)
+        self._progress_reporter.update(progress)
 
     def start(self):
         """开始执行任务"""
@@ -225,6 +234,7 @@ class SystemTask(models.Model):
         if result:
             self.result = result
         self.save(update_fields=['status', 'completed_at', 'progress', 'result'])
+        self._finish_live_progress()
 
     def fail(self, error_message):
         """
@@ -237,7 +247,12 @@ class SystemTask(models.Model):
         self.status = 'failed'
         self.completed_at = timezone.now()
         self.error_message = error_message
-        self.save(update_fields=['status', 'completed_at', 'error_message'])
+        self.save(update_fields=['status', 'completed_at', 'error_message', 'progress'])
+        self._finish_live_progress()
+
+    def _finish_live_progress(self):
+        from apps.tasks.progress import finish_live_progress
+        finish_live_progress(self)
 
     def cancel(self):
         """取消任务"""
@@ -426,6 +441,26 @@ class Product(models.Model):
         help_text=_('允许用户在申请时额外申请容量的磁盘列表，如 ["C:", "D:"]')
     )
     
+    # 主机池与放置策略
+    host_pool = models.ManyToManyField(
+        'hosts.Host',
+        blank=True,
+        related_name='pooled_products',
+        verbose_name=_('主机池'),
+        help_text=_('开户时在关联主机和这些主机中按放置策略选择，为空时只使用关联主机')
+    )
+    placement_strategy = models.CharField(
+        max_length=20,
+        choices=[
+            ('least_loaded', _('负载最低')),
+            ('bin_pack', _('装箱（优先填满）')),
+            ('spread', _('分散（本产品用户均匀分布）')),
+        ],
+        default='least_loaded',
+        verbose_name=_('放置策略'),
+        help_text=_('主机池中选择开户主机的策略')
+    )
+    
     # 创建者
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -468,6 +503,14 @@ class Product(models.Model):
         """
         return self.host.status
 
+    def candidate_hosts(self):
+        """开户候选主机：关联主机在前，其后为主机池中的主机"""
+        hosts = [self.host]
+        for host in self.host_pool.all():
+            if host.pk != self.host_id:
+                hosts.append(host)
+        return hosts
+
     @property
     def hostname(self):
         """
@@ -622,14 +665,22 @@ class AccountOpeningRequest(models.Model):
         product_name = self.target_product.display_name if self.target_product else 'Unknown Product'
         return f'{self.username} - {product_name}'
 
-    def approve(self, approver, notes=''):
+    def approve(self, approver, notes='', dispatch=True, host=None):
         """
         批准开户申请
 
         Args:
             approver: 批准申请的管理员
             notes: 审核备注
+            dispatch: 异步开户时是否在提交后立即投递开户任务，
+                      批量任务自行处理开户时传 False
+            host: 同步开户时使用的已放置主机（批量任务预先放置），为空时由放置调度器选择
+
+        Returns:
+            异步开户时返回开户发件箱记录，否则返回 None
         """
+        from django.db import transaction
+
         # 获取当前状态以判断是否从pending变更为approved
         old_status = self.status
         
@@ -638,11 +689,17 @@ class AccountOpeningRequest(models.Model):
         self.approval_date = timezone.now()
         self.approval_notes = notes
         # 不直接调用save，而是通过super().save()让重写的save方法处理后续操作
-        super().save()
-        
         # 如果之前的状态是pending，现在变更为approved，则触发自动创建
-        if old_status == 'pending' and self.status == 'approved':
-            self.auto_process_creation()
+        should_provision = old_status == 'pending'
+        entry = None
+        with transaction.atomic():
+            super().save()
+            if should_provision and self._provisioning_async():
+                entry = self.start_provisioning(dispatch=dispatch)
+
+        if should_provision and not self._provisioning_async():
+            self.auto_process_creation(host=host)
+        return entry
 
     def reject(self, approver, notes=''):
         """
@@ -724,18 +781,51 @@ class AccountOpeningRequest(models.Model):
             self.approval_notes = '自动审核通过'
             auto_approved = True
 
-        super().save(*args, **kwargs)
+        should_provision = (
+            (old_status == 'pending' and self.status == 'approved') or
+            (is_new_instance and auto_approved and self.status == 'approved')
+        )
+
+        # 状态变更与开户发件箱记录在同一事务中写入
+        from django.db import transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if should_provision and self._provisioning_async():
+                self.start_provisioning()
 
         if is_new_instance:
             logger.info(f"AccountOpeningRequest.save(): 发送 post-submit 信号，实例ID: {self.pk}, 最终状态: {self.status}")
             account_opening_request_post_submit.send(sender=self.__class__, instance=self)
 
-        if ((old_status == 'pending' and self.status == 'approved') or 
-            (is_new_instance and auto_approved and self.status == 'approved')):
+        if should_provision and not self._provisioning_async():
             self.auto_process_creation()
 
-    def auto_process_creation(self):
-        """审批通过后自动创建用户"""
+    @staticmethod
+    def _provisioning_async():
+        return getattr(settings, 'ACCOUNT_PROVISIONING_ASYNC', False)
+
+    def start_provisioning(self, dispatch=True):
+        """
+        审批通过后开始开户
+
+        异步模式（ACCOUNT_PROVISIONING_ASYNC）下写入开户发件箱，事务提交后由
+        Celery 执行，审批请求立即返回；同步模式下直接在当前线程开户。
+        异步模式下需在保存状态的同一事务中调用。
+        """
+        if not self._provisioning_async():
+            self.auto_process_creation()
+            return None
+        from apps.operations.outbox import enqueue_provisioning
+        return enqueue_provisioning(self, dispatch=dispatch)
+
+    def auto_process_creation(self, host=None):
+        """
+        审批通过后自动创建用户
+
+        Args:
+            host: 调用方已通过放置调度器选择（预占）的主机，为空时在这里选择。
+                调用方传入的主机由调用方在失败时释放预占
+        """
         from django.db import transaction
         import os
 
@@ -743,8 +833,6 @@ class AccountOpeningRequest(models.Model):
         if not product:
             logger.error(f"AccountOpeningRequest {self.id} has no target_product")
             return
-        
-        host = product.host
 
         user_disk_quota = {}
         if product.enable_disk_quota and product.default_disk_quota:
@@ -780,40 +868,43 @@ class AccountOpeningRequest(models.Model):
             return
 
         # 正式模式
+        from apps.operations.placement import get_placement_scheduler
+        scheduler = get_placement_scheduler()
+        placed_here = host is None
+        host = host or scheduler.place(product)
         try:
-            from utils.winrm_client import WinrmClient
-
-            client = WinrmClient(
-                hostname=host.hostname,
-                port=host.port,
-                username=host.username,
-                password=host.password,
-                use_ssl=host.use_ssl
-            )
+            client = host.get_connection_client()
+
+            # 用户名预检走资产快照，快照命中时不额外远程访问
+            from apps.hosts.inventory import get_host_inventory
+            if get_host_inventory(host, client=client).confirm_user_exists(self.username):
+                if placed_here:
+                    scheduler.release(host, product)
+                self.status = 'failed'
+                self.result_message = f"创建用户失败: 用户 {self.username} 已存在于主机 {host.name}"
+                self.save(update_fields=['status', 'result_message'])
+                return
 
             password = CloudComputerUser.generate_complex_password()
-            result = client.create_user(
-                username=self.username,
-                password=password,
-                description=self.user_description
+            # 创建用户、加入用户组/远程桌面组和设置配额在一次远程执行中完成
+            from utils.provisioning import provision_user
+            provision = provision_user(
+                client,
+                self.username,
+                password,
+                description=self.user_description,
+                quotas=user_disk_quota,
             )
 
-            if result.status_code == 0:
-                if user_disk_quota:
-                    try:
-                        from utils.disk_quota import set_user_disk_quotas
-                        quota_result = set_user_disk_quotas(
-                            client, self.username, user_disk_quota
-                        )
-                        if not quota_result['success']:
-                            logger.warning(
-                                f"用户 {self.username} 磁盘配额设置部分失败: "
-                                f"{quota_result.get('errors', [])}"
-                            )
-                    except Exception as e:
-                        logger.error(
-                            f"用户 {self.username} 磁盘配额设置失败: {str(e)}"
-                        )
+            if provision.success:
+                from apps.hosts.inventory import record_user_change
+                record_user_change(host, self.username, created=True)
+
+                if provision.failed_steps:
+                    logger.warning(
+                        f"用户 {self.username} 开户部分可选步骤失败: "
+                        f"{provision.error_message}"
+                    )
 
                 # 远程成功后，事务写本地
                 with transaction.atomic():
@@ -832,15 +923,20 @@ class AccountOpeningRequest(models.Model):
                             'owner': self.applicant,
                             'initial_password': password,
                             'disk_quota': user_disk_quota,
+                            'host': host,
                         }
                     )
             else:
-                error_msg = result.std_err or '未知错误'
+                if placed_here:
+                    scheduler.release(host, product)
+                error_msg = provision.error_message or '未知错误'
                 self.status = 'failed'
                 self.result_message = f"创建用户失败: {error_msg}"
                 self.save(update_fields=['status', 'result_message'])
 
         except Exception as e:
+            if placed_here:
+                scheduler.release(host, product)
             self.status = 'failed'
             self.result_message = f"处理异常: {str(e)}"
             self.save(update_fields=['status', 'result_message'])
@@ -880,6 +976,15 @@ class CloudComputerUser(models.Model):
         verbose_name=_('所属产品'),
         help_text=_('该用户所属的云电脑产品')
     )
+    host = models.ForeignKey(
+        'hosts.Host',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='cloud_users',
+        verbose_name=_('所在主机'),
+        help_text=_('用户实际创建所在的主机，为空时为产品的关联主机')
+    )
 
     # 状态信息
     status = models.CharField(
@@ -996,6 +1101,25 @@ class CloudComputerUser(models.Model):
     def __str__(self):
         return f'{self.username}@{self.product.display_name}'
 
+    @property
+    def effective_host(self):
+        """用户实际所在主机（主机池开户时记录的主机，否则为产品的关联主机）"""
+        return self.host if self.host_id else self.product.host
+
+    @property
+    def rdp_hostname(self):
+        """用户连接地址：落在主机池其他主机上时取该主机地址，否则为产品显示地址"""
+        if self.host_id and self.host_id != self.product.host_id:
+            return self.host.hostname.partition(':')[0]
+        return self.product.display_hostname
+
+    @property
+    def rdp_port(self):
+        """用户连接的 RDP 端口，取值规则同 rdp_hostname"""
+        if self.host_id and self.host_id != self.product.host_id:
+            return self.host.rdp_port
+        return self.product.rdp_port
+
     def activate(self):
         """
         激活用户
@@ -1054,22 +1178,16 @@ class CloudComputerUser(models.Model):
             return
         
         try:
-            from utils.winrm_client import WinrmClient
-            
-            product = self.product
-            host = product.host
-            client = WinrmClient(
-                hostname=host.hostname,
-                port=host.port,
-                username=host.username,
-                password=host.password,
-                use_ssl=host.use_ssl
-            )
+            host = self.effective_host
+            client = host.get_connection_client()
             
             result = client.disabled_user(self.username)
             if result.status_code != 0:
                 error_msg = result.std_err if result.std_err else 'Unknown error'
                 print(f"Failed to disable user {self.username} on host {host.name}: {error_msg}")
+            else:
+                from apps.hosts.inventory import record_user_change
+                record_user_change(host, self.username, enabled=False)
         except Exception as e:
             print(f"Error disabling user {self.username} on host {host.name}: {str(e)}")
 
@@ -1082,22 +1200,16 @@ class CloudComputerUser(models.Model):
             return
         
         try:
-            from utils.winrm_client import WinrmClient
-            
-            product = self.product
-            host = product.host
-            client = WinrmClient(
-                hostname=host.hostname,
-                port=host.port,
-                username=host.username,
-                password=host.password,
-                use_ssl=host.use_ssl
-            )
+            host = self.effective_host
+            client = host.get_connection_client()
             
             result = client.enable_user(self.username)
             if result.status_code != 0:
                 error_msg = result.std_err if result.std_err else 'Unknown error'
                 print(f"Failed to enable user {self.username} on host {host.name}: {error_msg}")
+            else:
+                from apps.hosts.inventory import record_user_change
+                record_user_change(host, self.username, enabled=True)
         except Exception as e:
             print(f"Error enabling user {self.username} on host {host.name}: {str(e)}")
 
@@ -1110,22 +1222,16 @@ class CloudComputerUser(models.Model):
             return
         
         try:
-            from utils.winrm_client import WinrmClient
-            
-            product = self.product
-            host = product.host
-            client = WinrmClient(
-                hostname=host.hostname,
-                port=host.port,
-                username=host.username,
-                password=host.password,
-                use_ssl=host.use_ssl
-            )
+            host = self.effective_host
+            client = host.get_connection_client()
             
             result = client.delete_user(self.username)
             if result.status_code != 0:
                 error_msg = result.std_err if result.std_err else 'Unknown error'
                 print(f"Failed to delete user {self.username} on host {host.name}: {error_msg}")
+            else:
+                from apps.hosts.inventory import record_user_change
+                record_user_change(host, self.username, deleted=True)
         except Exception as e:
             print(f"Error deleting user {self.username} on host {host.name}: {str(e)}")
 
@@ -1154,17 +1260,8 @@ class CloudComputerUser(models.Model):
             return
         
         try:
-            from utils.winrm_client import WinrmClient
-            
-            product = self.product
-            host = product.host
-            client = WinrmClient(
-                hostname=host.hostname,
-                port=host.port,
-                username=host.username,
-                password=host.password,
-                use_ssl=host.use_ssl
-            )
+            host = self.effective_host
+            client = host.get_connection_client()
             
             result = client.reset_password(self.username, new_password)
             if result.status_code != 0:
@@ -1204,6 +1301,75 @@ class CloudComputerUser(models.Model):
                 return password
 
 
+class ProvisioningOutbox(models.Model):
+    """
+    开户发件箱
+
+    与开户申请的状态变更在同一事务中写入，由 Celery 任务执行实际开户。
+    投递失败或 worker 中断（执行租约过期）的记录由定时分发任务重新投递（至少一次），
+    执行前检查云电脑用户是否已存在以保证幂等。
+    """
+    STATUS_CHOICES = [
+        ('pending', _('待投递')),
+        ('dispatched', _('已投递')),
+        ('processing', _('执行中')),
+        ('done', _('已完成')),
+        ('failed', _('失败')),
+    ]
+
+    request = models.ForeignKey(
+        AccountOpeningRequest,
+        on_delete=models.CASCADE,
+        related_name='provisioning_outbox',
+        verbose_name=_('开户申请')
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name=_('状态')
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('执行次数')
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name=_('最近错误')
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('创建时间')
+    )
+    dispatched_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('投递时间')
+    )
+    lease_expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('执行租约到期时间'),
+        help_text=_('执行中的任务定期续期，过期说明执行该记录的 worker 已中断')
+    )
+    completed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('完成时间')
+    )
+
+    class Meta:
+        verbose_name = _('开户发件箱')
+        verbose_name_plural = _('开户发件箱')
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.request_id} - {self.status}'
+
+
 class RdpDomainRoute(models.Model):
     """
     RDP域名路由（SNI路由已弃用，现使用RD Gateway + tunnel_token路由）
@@ -1482,6 +1648,7 @@ class ProductAccessGrant(models.Model):
             models.Index(fields=['product_group']),
             models.Index(fields=['is_revoked']),
             models.Index(fields=['granted_at']),
+            models.Index(fields=['expires_at']),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -0,0 +1,212 @@
+"""
+开户发件箱
+
+审批通过原先在保存时同步调用 auto_process_creation，HTTP 请求要等
+WinRM 远程开户完成才返回。改为：
+
+- 审批的状态变更与 ProvisioningOutbox 记录在同一事务中写入
+- 事务提交后立即投递 Celery 任务 provision_account_request
+- 定时任务 dispatch_provisioning_outbox 重新投递未投递成功、
+  投递后长时间未执行或执行中断的记录（至少一次）
+- 执行中的任务持有租约（lease_expires_at），由心跳线程每 1/3 租约时长续期；
+  只有租约过期（worker 中断）的记录才会退回重新投递，耗时再长的开户也不会被并发重复执行
+- 执行前原子地认领记录，并检查云电脑用户是否已存在，重复投递不会重复开户
+
+使用方式：
+    from apps.operations.outbox import enqueue_provisioning
+
+    with transaction.atomic():
+        request_obj.save()
+        enqueue_provisioning(request_obj)
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_REDISPATCH_AFTER = 300
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 120
+ACTIVE_STATUSES = ('pending', 'dispatched', 'processing')
+
+
+def enqueue_provisioning(request_obj, dispatch: bool = True):
+    """
+    为开户申请写入发件箱记录（已有未完成记录时复用）
+
+    参数:
+        request_obj: AccountOpeningRequest 实例
+        dispatch: 是否在事务提交后立即投递
+    """
+    from apps.operations.models import ProvisioningOutbox
+
+    entry = ProvisioningOutbox.objects.filter(
+        request=request_obj, status__in=ACTIVE_STATUSES
+    ).first()
+    if entry is None:
+        entry = ProvisioningOutbox.objects.create(request=request_obj)
+    if dispatch:
+        transaction.on_commit(lambda: dispatch_entry(entry.pk))
+    return entry
+
+
+def dispatch_entry(entry_id: int) -> bool:
+    """投递单条记录到 Celery，失败时保留待投递状态等待定时任务重试"""
+    from apps.operations.models import ProvisioningOutbox
+
+    try:
+        from apps.operations.tasks import provision_account_request
+
+        provision_account_request.delay(entry_id)
+    except Exception as e:
+        logger.error(f"投递开户任务失败: 发件箱ID={entry_id}, 错误: {str(e)}")
+        return False
+    ProvisioningOutbox.objects.filter(
+        pk=entry_id, status__in=('pending', 'dispatched')
+    ).update(status='dispatched', dispatched_at=timezone.now())
+    return True
+
+
+def _lease_seconds() -> int:
+    return getattr(settings, 'PROVISIONING_OUTBOX_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+
+
+def _claim(entry_id: int) -> bool:
+    """原子地把记录标记为执行中并取得租约，重复投递的任务只有一个能认领成功"""
+    from apps.operations.models import ProvisioningOutbox
+
+    now = timezone.now()
+    return ProvisioningOutbox.objects.filter(
+        pk=entry_id, status__in=('pending', 'dispatched')
+    ).update(
+        status='processing', attempts=F('attempts') + 1, dispatched_at=now,
+        lease_expires_at=now + timedelta(seconds=_lease_seconds()),
+    ) == 1
+
+
+@contextmanager
+def _lease_heartbeat(entry_id: int):
+    """开户执行期间在后台线程中定期续期租约"""
+    from apps.operations.models import ProvisioningOutbox
+
+    lease = _lease_seconds()
+    stop = threading.Event()
+
+    def renew():
+        try:
+            while not stop.wait(lease / 3):
+                try:
+                    ProvisioningOutbox.objects.filter(pk=entry_id, status='processing').update(
+                        lease_expires_at=timezone.now() + timedelta(seconds=lease)
+                    )
+                except Exception as e:
+                    logger.warning(f"开户发件箱租约续期失败: ID={entry_id}, 错误: {str(e)}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=renew, name=f'outbox-lease-{entry_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join(timeout=5)
+
+
+def _finish(entry_id: int, status: str, error: str = ''):
+    from apps.operations.models import ProvisioningOutbox
+
+    ProvisioningOutbox.objects.filter(pk=entry_id).update(
+        status=status, last_error=error[:2000], completed_at=timezone.now(),
+        lease_expires_at=None,
+    )
+
+
+def run_entry(entry_id: int, host=None) -> Optional[str]:
+    """
+    执行一条发件箱记录
+
+    参数:
+        host: 已放置的主机（批量任务预先放置），为空时由放置调度器选择
+
+    返回:
+        记录的最终状态；记录已被其他任务认领或已完成时返回 None
+    """
+    from apps.operations.models import CloudComputerUser, ProvisioningOutbox
+
+    if not _claim(entry_id):
+        logger.info(f"开户发件箱记录已被处理，跳过: ID={entry_id}")
+        return None
+
+    entry = ProvisioningOutbox.objects.select_related(
+        'request', 'request__target_product', 'request__target_product__host'
+    ).get(pk=entry_id)
+    request_obj = entry.request
+
+    # 幂等：之前的执行已经完成开户（例如 worker 在更新发件箱前中断）
+    if (request_obj.status == 'completed' or CloudComputerUser.objects.filter(
+            username=request_obj.username, product=request_obj.target_product_id).exists()):
+        _finish(entry_id, 'done')
+        return 'done'
+
+    if request_obj.status not in ('approved', 'processing'):
+        _finish(entry_id, 'failed', f'申请状态为 {request_obj.status}，不再开户')
+        return 'failed'
+
+    try:
+        with _lease_heartbeat(entry_id):
+            request_obj.start_processing()
+            request_obj.auto_process_creation(host=host)
+    except Exception as e:
+        # 意外异常（数据库等）退回待投递，超过最大次数后标记失败
+        max_attempts = getattr(settings, 'PROVISIONING_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+        logger.error(f"开户任务异常: 发件箱ID={entry_id}, 错误: {str(e)}", exc_info=True)
+        if entry.attempts >= max_attempts:
+            _finish(entry_id, 'failed', str(e))
+            return 'failed'
+        ProvisioningOutbox.objects.filter(pk=entry_id).update(
+            status='pending', last_error=str(e)[:2000], lease_expires_at=None
+        )
+        return 'pending'
+
+    if request_obj.status == 'completed':
+        _finish(entry_id, 'done')
+        return 'done'
+    # 开户业务失败（用户已存在、主机拒绝等）不自动重试，由管理员处理
+    _finish(entry_id, 'failed', request_obj.result_message or '开户失败')
+    return 'failed'
+
+
+def dispatch_pending(limit: int = 100) -> int:
+    """
+    重新投递需要处理的记录，返回投递成功的条数
+
+    - 待投递的记录
+    - 投递后超过 PROVISIONING_OUTBOX_REDISPATCH_AFTER 秒仍未开始执行的记录（消息丢失）
+    - 执行租约已过期的记录（worker 中断，正常执行的任务会持续续期）
+    """
+    from apps.operations.models import ProvisioningOutbox
+
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(
+        settings, 'PROVISIONING_OUTBOX_REDISPATCH_AFTER', DEFAULT_REDISPATCH_AFTER
+    ))
+    # 执行中断的记录先退回待投递，才能被重新认领（没有租约的是升级前认领的记录）
+    ProvisioningOutbox.objects.filter(status='processing').filter(
+        Q(lease_expires_at__lt=now) | Q(lease_expires_at__isnull=True, dispatched_at__lt=cutoff)
+    ).update(status='pending', lease_expires_at=None)
+
+    ids = list(
+        ProvisioningOutbox.objects.filter(
+            Q(status='pending') | Q(status='dispatched', dispatched_at__lt=cutoff)
+        ).order_by('created_at').values_list('pk', flat=True)[:limit]
+    )
+    return sum(1 for entry_id in ids if dispatch_entry(entry_id))
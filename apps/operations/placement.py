@@ -0,0 +1,291 @@
+"""
+开户主机放置调度
+
+产品可以关联一个主机池，开户时按放置策略在池中选择主机，
+而不是所有新用户都落在同一台主机上。
+
+- 决策基于进程内的主机指标快照，快照每 PLACEMENT_METRICS_TTL 秒批量刷新一次，
+  单次放置不查询数据库、不访问远程主机
+- 指标：主机状态、活跃云电脑用户数（按产品细分）、空闲磁盘（来自资产快照缓存）、
+  RDP 会话数（来自 Gateway 统计）
+- 放置后立即在快照中预占，快照刷新前的连续放置也能正确分散
+- 策略可插拔：least_loaded（负载最低）、bin_pack（优先填满）、spread（本产品均匀分布），
+  可通过 register_strategy 注册新策略
+
+使用方式：
+    from apps.operations.placement import get_placement_scheduler
+
+    scheduler = get_placement_scheduler()
+    host = scheduler.place(product)
+    ...
+    if failed:
+        scheduler.release(host, product)
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger("2c2a")
+
+STRATEGY_LEAST_LOADED = 'least_loaded'
+STRATEGY_BIN_PACK = 'bin_pack'
+STRATEGY_SPREAD = 'spread'
+
+DEFAULT_METRICS_TTL = 60
+# 一个 RDP 会话相当于多少个活跃用户的负载
+RDP_SESSION_WEIGHT = 2
+
+
+@dataclass
+class HostMetrics:
+    """单台主机的放置指标"""
+    host_id: int
+    status: str = 'offline'
+    active_users: int = 0
+    product_users: Dict[int, int] = field(default_factory=dict)
+    free_disk_mb: Optional[int] = None
+    rdp_sessions: int = 0
+
+    @property
+    def load(self) -> int:
+        return self.active_users + self.rdp_sessions * RDP_SESSION_WEIGHT
+
+
+_strategies: Dict[str, Callable[[List[HostMetrics], int], HostMetrics]] = {}
+
+
+def register_strategy(name: str):
+    """
+    注册放置策略
+
+    策略函数签名为 strategy(candidates, product_id) -> HostMetrics，
+    candidates 为已过滤的可用主机（非空）。
+    """
+    def decorator(func):
+        _strategies[name] = func
+        return func
+    return decorator
+
+
+def get_strategy(name: str):
+    if name not in _strategies:
+        logger.warning(f"未知的放置策略: {name}，使用 {STRATEGY_LEAST_LOADED}")
+        name = STRATEGY_LEAST_LOADED
+    return _strategies[name]
+
+
+@register_strategy(STRATEGY_LEAST_LOADED)
+def least_loaded(candidates: List[HostMetrics], product_id: int) -> HostMetrics:
+    """负载最低的主机，负载相同时空闲磁盘多者优先"""
+    return min(candidates, key=lambda m: (m.load, -(m.free_disk_mb or 0), m.host_id))
+
+
+@register_strategy(STRATEGY_BIN_PACK)
+def bin_pack(candidates: List[HostMetrics], product_id: int) -> HostMetrics:
+    """负载最高但仍有容量的主机，空闲主机可以关机或留作他用"""
+    return max(candidates, key=lambda m: (m.load, -m.host_id))
+
+
+@register_strategy(STRATEGY_SPREAD)
+def spread(candidates: List[HostMetrics], product_id: int) -> HostMetrics:
+    """本产品用户最少的主机，单台主机故障影响的本产品用户最少"""
+    return min(candidates, key=lambda m: (m.product_users.get(product_id, 0), m.load, m.host_id))
+
+
+def _rdp_sessions_by_token() -> Dict[str, int]:
+    """
+    从 Gateway 统计中按隧道令牌汇总 RDP 会话数
+
+    Gateway 未启用或统计格式无法识别时返回空字典。
+    """
+    try:
+        from utils.gateway_client import GatewayClient, is_gateway_enabled
+        if not is_gateway_enabled():
+            return {}
+        stats = GatewayClient().rdp_session_stats()
+    except Exception as e:
+        logger.warning(f"获取RDP会话统计失败: {str(e)}")
+        return {}
+
+    if isinstance(stats, dict):
+        stats = stats.get('sessions', stats)
+    counts: Dict[str, int] = {}
+    if isinstance(stats, dict):
+        for token, value in stats.items():
+            counts[token] = value if isinstance(value, int) else len(value or ())
+    elif isinstance(stats, list):
+        for session in stats:
+            token = session.get('tunnel_token') if isinstance(session, dict) else None
+            if token:
+                counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+def collect_metrics(host_ids: Iterable[int]) -> Dict[int, HostMetrics]:
+    """批量采集主机指标（两次数据库查询，不访问远程主机）"""
+    from django.db.models import Count
+    from django.db.models.functions import Coalesce
+
+    from apps.hosts.inventory import KIND_DISKS, get_cached_snapshot
+    from apps.hosts.models import Host
+    from apps.operations.models import CloudComputerUser
+
+    host_ids = list(host_ids)
+    metrics = {}
+    tokens = {}
+    for pk, status, token in Host.objects.filter(pk__in=host_ids).values_list(
+            'pk', 'status', 'tunnel_token'):
+        metrics[pk] = HostMetrics(host_id=pk, status=status)
+        if token:
+            tokens[token] = pk
+
+    rows = (
+        CloudComputerUser.objects
+        .filter(status='active')
+        .annotate(placed_host=Coalesce('host_id', 'product__host_id'))
+        .filter(placed_host__in=host_ids)
+        .values('placed_host', 'product_id')
+        .annotate(count=Count('id'))
+    )
+    for row in rows:
+        m = metrics.get(row['placed_host'])
+        if m is not None:
+            m.active_users += row['count']
+            m.product_users[row['product_id']] = row['count']
+
+    for pk, m in metrics.items():
+        disks = get_cached_snapshot(pk, KIND_DISKS)
+        if disks:
+            m.free_disk_mb = sum(d.get('free_mb') or 0 for d in disks)
+
+    for token, count in _rdp_sessions_by_token().items():
+        if token in tokens:
+            metrics[tokens[token]].rdp_sessions = count
+
+    return metrics
+
+
+class PlacementScheduler:
+    """基于进程内指标快照的开户主机选择"""
+
+    def __init__(
+            self,
+            ttl: Optional[float] = None,
+            max_users_per_host: Optional[int] = None,
+            min_free_disk_mb: Optional[int] = None,
+            metrics_loader: Callable[[Iterable[int]], Dict[int, HostMetrics]] = collect_metrics,
+    ):
+        """
+        参数:
+            ttl: 指标快照有效期（秒），默认 settings.PLACEMENT_METRICS_TTL
+            max_users_per_host: 单台主机活跃用户上限，0 表示不限制
+            min_free_disk_mb: 空闲磁盘低于该值（MB）的主机不再放置，0 表示不限制
+            metrics_loader: 指标采集函数，测试时可替换
+        """
+        self.ttl = ttl if ttl is not None else getattr(
+            settings, 'PLACEMENT_METRICS_TTL', DEFAULT_METRICS_TTL
+        )
+        self.max_users_per_host = max_users_per_host if max_users_per_host is not None else getattr(
+            settings, 'PLACEMENT_MAX_USERS_PER_HOST', 0
+        )
+        self.min_free_disk_mb = min_free_disk_mb if min_free_disk_mb is not None else getattr(
+            settings, 'PLACEMENT_MIN_FREE_DISK_MB', 0
+        )
+        self.metrics_loader = metrics_loader
+        self._metrics: Dict[int, HostMetrics] = {}
+        self._loaded_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def _ensure_metrics(self, host_ids: List[int]):
+        """刷新缺失或过期的主机指标（调用方持有锁）"""
+        now = time.monotonic()
+        stale = [pk for pk in host_ids if now - self._loaded_at.get(pk, float('-inf')) >= self.ttl]
+        if not stale:
+            return
+        try:
+            fresh = self.metrics_loader(stale)
+        except Exception as e:
+            logger.error(f"采集放置指标失败: {str(e)}")
+            return
+        for pk in stale:
+            self._metrics[pk] = fresh.get(pk) or HostMetrics(host_id=pk, status='error')
+            self._loaded_at[pk] = now
+
+    def _eligible(self, m: HostMetrics) -> bool:
+        if m.status != 'online':
+            return False
+        if self.max_users_per_host and m.active_users >= self.max_users_per_host:
+            return False
+        if (self.min_free_disk_mb and m.free_disk_mb is not None
+                and m.free_disk_mb < self.min_free_disk_mb):
+            return False
+        return True
+
+    def place(self, product, strategy: Optional[str] = None):
+        """
+        为产品的新用户选择主机并预占
+
+        产品没有主机池时直接返回关联主机；池中没有可用主机时也回退到关联主机，
+        由后续开户流程报告具体错误。
+        """
+        hosts = product.candidate_hosts()
+        if len(hosts) == 1:
+            return hosts[0]
+
+        by_id = {host.pk: host for host in hosts}
+        with self._lock:
+            self._ensure_metrics(list(by_id))
+            candidates = [
+                self._metrics[pk] for pk in by_id
+                if pk in self._metrics and self._eligible(self._metrics[pk])
+            ]
+            if not candidates:
+                logger.warning(f"产品 {product.display_name} 的主机池中没有可用主机，使用关联主机")
+                return product.host
+            chosen = get_strategy(strategy or product.placement_strategy)(candidates, product.pk)
+            chosen.active_users += 1
+            chosen.product_users[product.pk] = chosen.product_users.get(product.pk, 0) + 1
+
+        logger.info(
+            f"开户放置: 产品={product.display_name}, 主机={by_id[chosen.host_id].name}, "
+            f"策略={strategy or product.placement_strategy}"
+        )
+        return by_id[chosen.host_id]
+
+    def release(self, host, product):
+        """开户失败时撤销 place 的预占"""
+        with self._lock:
+            m = self._metrics.get(host.pk)
+            if m is None:
+                return
+            m.active_users = max(0, m.active_users - 1)
+            if m.product_users.get(product.pk):
+                m.product_users[product.pk] -= 1
+
+    def invalidate(self, host_id: Optional[int] = None):
+        """丢弃指标快照，下次放置时重新采集"""
+        with self._lock:
+            if host_id is None:
+                self._metrics.clear()
+                self._loaded_at.clear()
+            else:
+                self._metrics.pop(host_id, None)
+                self._loaded_at.pop(host_id, None)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_placement_scheduler() -> PlacementScheduler:
+    """获取进程级放置调度器"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = PlacementScheduler()
+    return _scheduler
@@ -0,0 +1,222 @@
+"""
+云电脑用户状态批量同步
+
+批量激活 / 停用 / 禁用原先直接 queryset.update(status=...)，不经过
+CloudComputerUser.save()，主机上的 Windows 账户不会被启用或禁用；
+单个用户走 save() 时每个用户又要新建一次 WinRM 连接。这里改为：
+
+- 先按 save() 的规则计算每个用户需要的远程操作（禁用 / 启用 / 无需远程操作）
+- 需要远程操作的用户按所在主机分组，每台主机按操作类型各执行一个批量脚本
+  （utils.bulk_user_ops），主机之间并行，并发受 HOST_EXECUTOR_CONCURRENCY 限制
+- 汇总在调用线程中进行：远程成功或无需远程操作的用户用 bulk_update 写回状态，
+  远程失败的用户保持原状态，每个用户都有一条结果
+
+提供商后台的批量操作经 bulk 队列任务 apps.operations.tasks.reconcile_cloud_user_status
+执行，页面跳转到任务进度页，不在 Web 请求中等待远程操作。
+
+使用方式：
+    from apps.operations.reconcile import reconcile_user_status
+
+    summary = reconcile_user_status(queryset, 'disabled')
+    for result in summary['results']:
+        ...
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from utils.bulk_user_ops import (
+    STATUS_DISABLED,
+    STATUS_ENABLED,
+    STATUS_NOT_FOUND,
+    BulkUserStatus,
+    bulk_disable_users,
+    bulk_enable_users,
+)
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_CONCURRENCY = 16
+UPDATE_BATCH_SIZE = 500
+
+ACTION_DISABLE = 'disable'
+ACTION_ENABLE = 'enable'
+
+RESULT_APPLIED = 'applied'
+RESULT_FAILED = 'failed'
+RESULT_SKIPPED = 'skipped'
+
+SUPPORTED_STATUSES = ('active', 'inactive', 'disabled')
+
+
+@dataclass
+class UserResult:
+    user_id: int
+    username: str
+    host: str
+    result: str
+    message: str = ''
+
+
+def remote_action(old_status: str, new_status: str) -> Optional[str]:
+    """
+    状态变化需要的远程操作（与 CloudComputerUser.save() 一致），不需要时返回 None
+    """
+    if old_status != 'disabled' and new_status == 'disabled':
+        return ACTION_DISABLE
+    if old_status == 'disabled' and new_status == 'active':
+        return ACTION_ENABLE
+    return None
+
+
+def _default_appliers() -> Dict[str, Callable]:
+    return {
+        ACTION_DISABLE: lambda client, usernames: bulk_disable_users(client, usernames),
+        ACTION_ENABLE: bulk_enable_users,
+    }
+
+
+def _succeeded(action: str, status: Optional[BulkUserStatus]) -> bool:
+    if status is None:
+        return False
+    if action == ACTION_DISABLE:
+        # 主机上已不存在的用户无法登录，视为已禁用
+        return status.status in (STATUS_DISABLED, STATUS_NOT_FOUND)
+    return status.status == STATUS_ENABLED
+
+
+def reconcile_user_status(
+        users,
+        status: str,
+        concurrency: Optional[int] = None,
+        client_factory: Optional[Callable] = None,
+        appliers: Optional[Dict[str, Callable]] = None,
+        task=None,
+) -> Dict:
+    """
+    把一批云电脑用户设置为 status，并同步主机上的账户状态
+
+    参数:
+        users: CloudComputerUser 查询集或列表
+        status: 目标状态 active / inactive / disabled
+        concurrency: 并行主机数，默认 settings.HOST_EXECUTOR_CONCURRENCY
+        client_factory: 连接客户端工厂 client_factory(host)，默认 host.get_connection_client
+        appliers: {操作: applier(client, usernames) -> {用户名: BulkUserStatus}}，测试时可替换
+        task: 可选的 AsyncTask，每完成一台主机的批量脚本汇报一次进度
+
+    返回:
+        {'updated', 'failed', 'skipped', 'hosts', 'results': [UserResult]}
+    """
+    from apps.operations.models import CloudComputerUser
+
+    if status not in SUPPORTED_STATUSES:
+        raise ValueError(f'不支持批量设置为该状态: {status}')
+
+    if hasattr(users, 'select_related'):
+        users = users.select_related('host', 'product__host')
+    users = list(users)
+    appliers = appliers or _default_appliers()
+    concurrency = max(1, concurrency or getattr(
+        settings, 'HOST_EXECUTOR_CONCURRENCY', DEFAULT_CONCURRENCY
+    ))
+
+    results: List[UserResult] = []
+    to_update = []
+    # {(主机 pk, 操作): (主机, [用户])}
+    groups = {}
+    for user in users:
+        host = user.effective_host
+        if user.status == status:
+            results.append(UserResult(user.pk, user.username, host.name, RESULT_SKIPPED, '状态未变化'))
+            continue
+        action = remote_action(user.status, status)
+        if action is None:
+            results.append(UserResult(user.pk, user.username, host.name, RESULT_APPLIED))
+            to_update.append(user)
+            continue
+        groups.setdefault((host.pk, action), (host, []))[1].append(user)
+
+    def _run_group(host, action, members):
+        client = client_factory(host) if client_factory else host.get_connection_client()
+        return appliers[action](client, [u.username for u in members])
+
+    remote_hosts = set()
+    done_groups = 0
+    reporter = task.progress_reporter() if task is not None else None
+    if groups:
+        with ThreadPoolExecutor(
+                max_workers=min(concurrency, len(groups)),
+                thread_name_prefix='reconcile-users',
+        ) as pool:
+            futures = {
+                pool.submit(_run_group, host, action, members): (host, action, members)
+                for (_, action), (host, members) in groups.items()
+            }
+            # ORM 写入只在调用线程中进行
+            for future in as_completed(futures):
+                host, action, members = futures[future]
+                try:
+                    statuses = future.result()
+                    host_error = ''
+                except Exception as e:
+                    logger.error(f"主机 {host.name} 批量同步用户状态失败: {str(e)}")
+                    statuses = {}
+                    host_error = str(e)
+
+                for user in members:
+                    user_status = statuses.get(user.username)
+                    if _succeeded(action, user_status):
+                        results.append(UserResult(
+                            user.pk, user.username, host.name, RESULT_APPLIED,
+                            user_status.message,
+                        ))
+                        to_update.append(user)
+                        remote_hosts.add(host.pk)
+                    else:
+                        message = host_error or (
+                            user_status.message or user_status.status if user_status else '未返回执行结果'
+                        )
+                        results.append(UserResult(
+                            user.pk, user.username, host.name, RESULT_FAILED, message,
+                        ))
+
+                done_groups += 1
+                if reporter is not None:
+                    reporter.update(
+                        min(99, int(done_groups * 100 / len(groups))),
+                        f"[{done_groups}/{len(groups)}] 主机 {host.name} 已处理 {len(members)} 个用户",
+                    )
+
+    if reporter is not None:
+        reporter.flush()
+
+    if to_update:
+        now = timezone.now()
+        for user in to_update:
+            user.status = status
+            user.updated_at = now
+        # 远程操作已经完成，bulk_update 不经过 save()，不会再逐个连接主机
+        CloudComputerUser.objects.bulk_update(
+            to_update, ['status', 'updated_at'], batch_size=UPDATE_BATCH_SIZE
+        )
+    if remote_hosts:
+        from apps.hosts.inventory import KIND_USERS, invalidate_host_inventory
+        for host_id in remote_hosts:
+            invalidate_host_inventory(host_id, KIND_USERS)
+
+    summary = {
+        'updated': len(to_update),
+        'failed': sum(1 for r in results if r.result == RESULT_FAILED),
+        'skipped': sum(1 for r in results if r.result == RESULT_SKIPPED),
+        'hosts': len({host.pk for host, _ in groups.values()}),
+        'results': results,
+    }
+    logger.info(
+        f"批量设置用户状态完成: 目标 {status}, 共 {len(users)} 个, 更新 {summary['updated']} 个, "
+        f"失败 {summary['failed']} 个, 远程主机 {summary['hosts']} 台"
+    )
+    return summary
@@ -28,38 +28,45 @@ def execute_account_opening(account_request):
             # 系统生成强密码
             password = CloudComputerUser.generate_complex_password()
             
-            # 连接到目标主机
-            host = account_request.target_product.host
+            # 按放置策略选择目标主机
+            from apps.operations.placement import get_placement_scheduler
+            product = account_request.target_product
+            scheduler = get_placement_scheduler()
+            host = scheduler.place(product)
             client = host.get_connection_client()
+
+            # 用户名预检走资产快照，快照命中时不额外远程访问
+            from apps.hosts.inventory import get_host_inventory
+            if get_host_inventory(host, client=client).confirm_user_exists(account_request.username):
+                scheduler.release(host, product)
+                raise Exception(f"用户 {account_request.username} 已存在于主机 {host.name}")
             
-            # 执行远程用户创建
-            result = client.create_user(account_request.username, password)
-            
-            if result.status_code == 0:
-                # 计算用户磁盘配额
-                user_disk_quota = {}
-                product = account_request.target_product
-                if product.enable_disk_quota and product.default_disk_quota:
-                    user_disk_quota = dict(product.default_disk_quota)
-                    if account_request.requested_disk_capacity:
-                        for disk, capacity in account_request.requested_disk_capacity.items():
-                            if disk in product.allow_extra_quota_disks:
-                                user_disk_quota[disk] = capacity
+            # 计算用户磁盘配额
+            user_disk_quota = {}
+            if product.enable_disk_quota and product.default_disk_quota:
+                user_disk_quota = dict(product.default_disk_quota)
+                if account_request.requested_disk_capacity:
+                    for disk, capacity in account_request.requested_disk_capacity.items():
+                        if disk in product.allow_extra_quota_disks:
+                            user_disk_quota[disk] = capacity
+
+            # 创建用户、加入远程桌面组和设置配额在一次远程执行中完成
+            from utils.provisioning import provision_user
+            provision = provision_user(
+                client,
+                account_request.username,
+                password,
+                quotas=user_disk_quota,
+            )
+
+            if provision.success:
+                from apps.hosts.inventory import record_user_change
+                record_user_change(host, account_request.username, created=True)
 
-                # 设置磁盘配额
-                if user_disk_quota:
-                    try:
-                        from utils.disk_quota import set_user_disk_quotas
-                        quota_result = set_user_disk_quotas(
-                            client, account_request.username, user_disk_quota
-                        )
-                        if not quota_result['success']:
-                            logger.warning(
-                                f"磁盘配额设置部分失败: "
-                                f"{quota_result.get('errors', [])}"
-                            )
-                    except Exception as e:
-                        logger.error(f"磁盘配额设置失败: {str(e)}")
+                if provision.failed_steps:
+                    logger.warning(
+                        f"开户部分可选步骤失败: {provision.error_message}"
+                    )
 
                 # 成功创建用户
                 cloud_user, created = CloudComputerUser.objects.get_or_create(
@@ -72,6 +79,7 @@ def execute_account_opening(account_request):
                         'created_from_request': account_request,
                         'initial_password': password,
                         'disk_quota': user_disk_quota,
+                        'host': host,
                     }
                 )
                 
@@ -86,7 +94,8 @@ def execute_account_opening(account_request):
                 return True
             else:
                 # 创建用户失败
-                error_msg = result.std_err if result.std_err else '未知错误'
+                scheduler.release(host, product)
+                error_msg = provision.error_message or '未知错误'
                 account_request.fail(f"创建用户失败: {error_msg}")
                 logger.error(f"开户申请处理失败: {account_request.username}, 错误: {error_msg}")
                 raise Exception(f"创建用户失败: {error_msg}")
@@ -111,9 +120,8 @@ def update_user_admin_permission(cloud_user, make_admin):
         Exception: 权限操作失败时抛出
     """
     try:
-        # 连接到产品关联的主机
-        product = cloud_user.product
-        host = product.host
+        # 连接到用户所在的主机
+        host = cloud_user.effective_host
         client = host.get_connection_client()
         
         if make_admin:
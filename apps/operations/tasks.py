@@ -1,9 +1,7 @@
 from celery import shared_task
 from django.contrib.auth.models import User
 from apps.operations.models import AccountOpeningRequest, CloudComputerUser
-from apps.hosts.models import Host
 from apps.tasks.models import AsyncTask
-from apps.tasks.models import TaskProgress
 import logging
 import secrets
 import string
@@ -33,137 +31,54 @@ def process_opening_request(self, request_id, operator_id):
         target_content_type='operations.AccountOpeningRequest',
         status='running'
     )
+    reporter = None
     
     try:
-        request_obj = AccountOpeningRequest.objects.get(id=request_id)
+        request_obj = AccountOpeningRequest.objects.select_related(
+            'target_product', 'target_product__host'
+        ).get(id=request_id)
         task.start_execution()
-        
-        task.progress = 10
-        task.save()
-        
-        TaskProgress.objects.create(
-            task=task,
-            progress=10,
-            message="开始处理开户请求"
-        )
-        
-        available_host = Host.objects.filter(
-            is_active=True,
-            init_status='ready'
-        ).first()
-        
-        if not available_host:
-            raise Exception("没有可用的主机资源")
-        
-        task.progress = 30
-        task.save()
-        
-        TaskProgress.objects.create(
-            task=task,
-            progress=30,
-            message="找到可用主机"
-        )
-        
-        from utils.winrm_client import WinrmClient
-        
-        username = request_obj.username
-        password = generate_secure_password()
-        
-        task.progress = 50
-        task.save()
-        
-        TaskProgress.objects.create(
-            task=task,
-            progress=50,
-            message="执行PowerShell命令创建用户"
-        )
-        
-        client = WinrmClient(
-            hostname=available_host.hostname,
-            port=available_host.port,
-            username=available_host.username,
-            password=available_host.password,
-            use_ssl=available_host.use_ssl
-        )
-        
-        result = client.create_user(
-            username=username,
-            password=password,
-            description=getattr(request_obj, 'user_description', 'Cloud computer user')
-        )
-        
-        if result.status_code != 0:
-            error_msg = result.std_err if result.std_err else 'Unknown error'
-            raise Exception(f"创建用户失败: {error_msg}")
-        
-        task.progress = 70
-        task.save()
-        
-        TaskProgress.objects.create(
-            task=task,
-            progress=70,
-            message="用户创建成功"
-        )
-        
-        request_obj.host = available_host
-        request_obj.windows_username = username
-        request_obj.windows_password = password
-        request_obj.status = 'approved'
-        request_obj.save()
-        
-        cloud_user, created = CloudComputerUser.objects.get_or_create(
-            account_opening_request=request_obj,
-            defaults={
-                'windows_username': username,
-                'host': available_host,
-                'status': 'active'
-            }
-        )
-        if not created:
-            cloud_user.windows_username = username
-            cloud_user.host = available_host
-            cloud_user.status = 'active'
-            cloud_user.save()
-        
-        task.progress = 90
-        task.save()
-        
-        TaskProgress.objects.create(
-            task=task,
-            progress=90,
-            message="更新请求状态"
+        reporter = task.progress_reporter()
+        reporter.update(10, "开始处理开户请求")
+
+        if not request_obj.target_product:
+            raise Exception("开户申请没有关联产品")
+
+        # 主机由放置调度器在产品主机池中选择，失败时释放预占
+        reporter.update(30, "按放置策略选择主机并创建用户")
+        request_obj.auto_process_creation()
+
+        if request_obj.status != 'completed':
+            raise Exception(request_obj.result_message or '开户失败')
+
+        reporter.update(90, "更新请求状态")
+        cloud_user = CloudComputerUser.objects.select_related('host').get(
+            username=request_obj.username, product=request_obj.target_product
         )
-        
-        task.progress = 100
+        host = cloud_user.host or request_obj.target_product.host
+
+        reporter.update(100, "开户请求处理完成")
+        reporter.flush()
         task.complete_success({
-            'host': available_host.hostname,
-            'username': username,
+            'host': host.hostname,
+            'username': cloud_user.username,
             'success': True,
             'cloud_user_id': cloud_user.id
         })
         
-        TaskProgress.objects.create(
-            task=task,
-            progress=100,
-            message="开户请求处理完成"
-        )
-        
         return {
             'success': True,
-            'host': available_host.hostname,
-            'username': username,
+            'host': host.hostname,
+            'username': cloud_user.username,
             'cloud_user_id': cloud_user.id
         }
         
     except Exception as e:
         logger.error(f"处理开户请求失败: {str(e)}", exc_info=True)
+        if reporter is not None:
+            reporter.flush()
         task.complete_failure(str(e))
         
-        try:
-            rollback_opening_request(request_id)
-        except Exception as rollback_error:
-            logger.error(f"回滚开户请求失败: {str(rollback_error)}", exc_info=True)
-        
         return {
             'success': False,
             'error': str(e)
@@ -171,23 +86,29 @@ def process_opening_request(self, request_id, operator_id):
 
 
 @shared_task
-def cleanup_expired_rdp_domains():
-    from django.utils import timezone
-    from apps.operations.models import RdpDomainRoute
+def provision_account_request(outbox_id):
+    """执行开户发件箱记录（可重复投递，重复执行会被认领检查跳过）"""
+    from apps.operations.outbox import run_entry
+    return {'outbox_id': outbox_id, 'status': run_entry(outbox_id)}
+
+
+@shared_task
+def dispatch_provisioning_outbox():
+    """定时重新投递未投递成功或执行中断的开户发件箱记录"""
+    from apps.operations.outbox import dispatch_pending
+    dispatched = dispatch_pending()
+    if dispatched:
+        logger.info(f"重新投递开户任务 {dispatched} 个")
+    return {'dispatched': dispatched}
 
-    expired_routes = RdpDomainRoute.objects.filter(
-        is_active=True,
-        expires_at__lt=timezone.now(),
-    )
 
-    cleaned = 0
-    for route in expired_routes:
-        route.is_active = False
-        route.save(update_fields=['is_active'])
-        cleaned += 1
+@shared_task
+def cleanup_expired_rdp_domains():
+    from apps.tasks.sweeper import run_sweeps
 
-    logger.info(f"Cleaned up {cleaned} expired RDP domain routes")
-    return {'cleaned': cleaned}
+    metrics = run_sweeps(['rdp_domain_routes'])[0]
+    logger.info(f"Cleaned up {metrics.rows} expired RDP domain routes")
+    return {'cleaned': metrics.rows}
 
 
 @shared_task
@@ -195,14 +116,22 @@ def allocate_rdp_domain(user_id, product_id):
     from django.contrib.auth import get_user_model
     from django.utils import timezone
     from datetime import timedelta
-    from apps.operations.models import RdpDomainRoute, Product
+    from django.db.models import Q
+    from apps.operations.models import CloudComputerUser, RdpDomainRoute, Product
 
     User = get_user_model()
 
     try:
         user = User.objects.get(id=user_id)
         product = Product.objects.get(id=product_id)
-        host = product.host
+        # 主机池开户的用户可能不在产品主机上，隧道取用户实际所在主机
+        cloud_user = CloudComputerUser.objects.filter(
+            product=product,
+            status='active',
+        ).filter(
+            Q(owner=user) | Q(created_from_request__applicant=user)
+        ).select_related('host', 'product__host').first()
+        host = cloud_user.effective_host if cloud_user else product.host
 
         if not product.enable_host_protection:
             return {
@@ -241,33 +170,6 @@ def allocate_rdp_domain(user_id, product_id):
         }
 
 
-def rollback_opening_request(request_id):
-    try:
-        request_obj = AccountOpeningRequest.objects.get(id=request_id)
-        if request_obj.host and request_obj.windows_username:
-            from utils.winrm_client import WinrmClient
-            client = WinrmClient(
-                hostname=request_obj.host.hostname,
-                port=request_obj.host.port,
-                username=request_obj.host.username,
-                password=request_obj.host.password,
-                use_ssl=request_obj.host.use_ssl
-            )
-            
-            result = client.disabled_user(request_obj.windows_username)
-            
-            if result.status_code == 0:
-                logger.info(f"已禁用用户 {request_obj.windows_username}")
-            else:
-                logger.warning(f"禁用用户失败: {result.std_err}")
-        
-        request_obj.status = 'pending'
-        request_obj.save()
-        
-    except Exception as e:
-        logger.error(f"回滚操作失败: {str(e)}")
-
-
 @shared_task(bind=True)
 def reset_user_password(self, user_id, operator_id):
     task = AsyncTask.objects.create(
@@ -285,16 +187,10 @@ def reset_user_password(self, user_id, operator_id):
         
         new_password = generate_secure_password()
         
-        from utils.winrm_client import WinrmClient
-        client = WinrmClient(
-            hostname=user.host.hostname,
-            port=user.host.port,
-            username=user.host.username,
-            password=user.host.password,
-            use_ssl=user.host.use_ssl
-        )
+        # 用户未单独指定主机时落在产品主机上，按主机连接方式取客户端
+        client = user.effective_host.get_connection_client()
         
-        result = client.reset_password(user.windows_username, new_password)
+        result = client.reset_password(user.username, new_password)
         
         if result.status_code != 0:
             error_msg = result.std_err if result.std_err else 'Unknown error'
@@ -304,17 +200,16 @@ def reset_user_password(self, user_id, operator_id):
             user.account_opening_request.windows_password = new_password
             user.account_opening_request.save()
         
-        task.progress = 100
         task.complete_success({
             'success': True,
             'message': '密码重置成功',
-            'username': user.windows_username
+            'username': user.username
         })
         
         return {
             'success': True,
             'message': '密码重置成功',
-            'username': user.windows_username
+            'username': user.username
         }
         
     except Exception as e:
@@ -328,7 +223,16 @@ def reset_user_password(self, user_id, operator_id):
 
 
 @shared_task(bind=True)
-def batch_process_opening_requests(self, request_ids, operator_id):
+def batch_process_opening_requests(self, request_ids, operator_id, concurrency=None, per_host=None):
+    """
+    批量处理开户申请
+
+    按目标主机分区在任务内并行处理（同一主机并发受 OPENING_BATCH_PER_HOST 限制），
+    每个申请完成后立即汇总到本任务的进度和结果。
+    """
+    from django.contrib.auth import get_user_model
+    from apps.operations.batch import BatchOpeningProcessor
+
     task = AsyncTask.objects.create(
         task_id=self.request.id,
         name=f"批量处理开户请求 ({len(request_ids)}个)",
@@ -338,45 +242,14 @@ def batch_process_opening_requests(self, request_ids, operator_id):
     
     try:
         task.start_execution()
-        
-        results = {
-            'processed': 0,
-            'successful': 0,
-            'failed': 0,
-            'errors': []
-        }
-        
-        total_requests = len(request_ids)
-        
-        for idx, request_id in enumerate(request_ids):
-            try:
-                progress = int((idx / total_requests) * 80) + 10
-                task.progress = progress
-                task.save()
-                
-                result = process_opening_request.delay(request_id, operator_id).get()
-                
-                results['processed'] += 1
-                if result['success']:
-                    results['successful'] += 1
-                else:
-                    results['failed'] += 1
-                    results['errors'].append({
-                        'request_id': request_id,
-                        'error': result.get('error', 'Unknown error')
-                    })
-                    
-            except Exception as e:
-                results['failed'] += 1
-                results['errors'].append({
-                    'request_id': request_id,
-                    'error': str(e)
-                })
-        
-        task.progress = 100
-        task.complete_success(results)
-        
-        return results
+        operator = get_user_model().objects.filter(pk=operator_id).first()
+        return BatchOpeningProcessor(
+            request_ids,
+            operator,
+            task=task,
+            concurrency=concurrency,
+            per_host=per_host,
+        ).run()
         
     except Exception as e:
         logger.error(f"批量处理开户请求失败: {str(e)}", exc_info=True)
@@ -389,7 +262,10 @@ def batch_process_opening_requests(self, request_ids, operator_id):
 
 
 @shared_task(bind=True)
-def cleanup_inactive_users(self, days_inactive=30):
+def cleanup_inactive_users(self, days_inactive=30, concurrency=None):
+    """按主机批量禁用超过 days_inactive 天未登录的云电脑用户"""
+    from apps.operations.cleanup import cleanup_inactive_users as run_cleanup
+
     task = AsyncTask.objects.create(
         task_id=self.request.id,
         name=f"清理非活跃用户 (超过{days_inactive}天未使用)",
@@ -398,47 +274,12 @@ def cleanup_inactive_users(self, days_inactive=30):
     
     try:
         task.start_execution()
-        
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        cutoff_date = timezone.now() - timedelta(days=days_inactive)
-        
-        inactive_users = CloudComputerUser.objects.filter(
-            last_login__lt=cutoff_date,
-            status='active'
-        )
-        
-        cleaned_count = 0
-        for user in inactive_users:
-            from utils.winrm_client import WinrmClient
-            client = WinrmClient(
-                hostname=user.host.hostname,
-                port=user.host.port,
-                username=user.host.username,
-                password=user.host.password,
-                use_ssl=user.host.use_ssl
-            )
-            
-            result = client.disabled_user(user.windows_username)
-            
-            if result.status_code == 0:
-                user.status = 'disabled'
-                user.save()
-                cleaned_count += 1
-            else:
-                logger.warning(f"无法禁用用户 {user.windows_username}: {result.std_err}")
-        
-        task.progress = 100
-        task.complete_success({
-            'cleaned_users': cleaned_count,
-            'total_inactive': inactive_users.count()
-        })
+        summary = run_cleanup(days_inactive, concurrency=concurrency, task=task)
+        task.complete_success(summary)
         
         return {
             'success': True,
-            'cleaned_users': cleaned_count,
-            'total_inactive': inactive_users.count()
+            **summary
         }
         
     except Exception as e:
@@ -449,3 +290,58 @@ def cleanup_inactive_users(self, days_inactive=30):
             'success': False,
             'error': str(e)
         }
+
+
+@shared_task(bind=True)
+def reconcile_cloud_user_status(self, user_ids, status, operator_id=None):
+    """
+    批量设置云电脑用户状态并同步主机账户（提供商后台批量激活 / 停用 / 禁用）
+
+    远程操作按主机批量执行，放在 bulk 队列，不占用 Web 进程；
+    任务记录可由视图预先创建（pending），以便立即跳转到进度页。
+    """
+    from apps.operations.reconcile import RESULT_FAILED, reconcile_user_status
+
+    task, _ = AsyncTask.objects.get_or_create(
+        task_id=self.request.id,
+        defaults={
+            'name': f"批量设置用户状态为 {status} ({len(user_ids)}个)",
+            'created_by_id': operator_id,
+            'status': 'pending',
+        },
+    )
+
+    try:
+        task.start_execution()
+        summary = reconcile_user_status(
+            CloudComputerUser.objects.filter(pk__in=user_ids), status, task=task
+        )
+        result = {
+            'updated': summary['updated'],
+            'failed': summary['failed'],
+            'skipped': summary['skipped'],
+            'hosts': summary['hosts'],
+            'errors': [
+                {'username': r.username, 'host': r.host, 'error': r.message}
+                for r in summary['results'] if r.result == RESULT_FAILED
+            ],
+        }
+        if result['failed'] and not result['updated']:
+            task.result = result
+            task.complete_failure(f"全部用户处理失败（共 {result['failed']} 个）")
+        else:
+            task.complete_success(result)
+
+        return {
+            'success': True,
+            **result
+        }
+
+    except Exception as e:
+        logger.error(f"批量设置用户状态失败: {str(e)}", exc_info=True)
+        task.complete_failure(str(e))
+
+        return {
+            'success': False,
+            'error': str(e)
+        }
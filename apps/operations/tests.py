@@ -0,0 +1,802 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from apps.hosts.models import Host
+from apps.operations.batch import BatchOpeningProcessor
+from apps.operations.models import AccountOpeningRequest, Product
+from apps.tasks.models import AsyncTask, TaskProgress
+
+
+def _make_product(name):
+    host = Host(name=name, hostname=f'{name}.local', username='admin')
+    host.password = 'secret'
+    host.save()
+    return Product.objects.create(
+        name=name, display_name=name, host=host, display_hostname=f'{name}.local'
+    )
+
+
+def _make_user(username, **kwargs):
+    return get_user_model().objects.create_user(
+        username=username, email=f'{username}@test.com', password='testpass123', **kwargs
+    )
+
+
+def _make_request(user, product, username):
+    return AccountOpeningRequest.objects.create(
+        applicant=user,
+        contact_email='user@test.com',
+        username=username,
+        user_fullname=username,
+        user_email=f'{username}@test.com',
+        target_product=product,
+    )
+
+
+@pytest.mark.django_db
+class TestBatchOpeningProcessor:
+    def test_parallel_across_hosts_with_per_host_cap(self):
+        normal_user = _make_user('applicant')
+        admin_user = _make_user('operator', is_staff=True)
+        products = [_make_product(f'lab{i}') for i in range(3)]
+        requests = [
+            _make_request(normal_user, products[i % 3], f'student{i}') for i in range(12)
+        ]
+        task = AsyncTask.objects.create(task_id='batch-1', name='批量开户')
+
+        active = Counter()
+        peak = Counter()
+        lock = threading.Lock()
+
+        def processor(request_obj, operator, host):
+            host_id = host.pk
+            with lock:
+                active[host_id] += 1
+                peak[host_id] = max(peak[host_id], active[host_id])
+            time.sleep(0.02)
+            with lock:
+                active[host_id] -= 1
+            if request_obj.username == 'student5':
+                return {'success': False, 'error': '用户已存在'}
+            return {'success': True, 'error': ''}
+
+        missing_id = max(r.pk for r in requests) + 100
+        results = BatchOpeningProcessor(
+            [r.pk for r in requests] + [missing_id], admin_user,
+            task=task, per_host=2, processor=processor,
+        ).run()
+
+        assert max(peak.values()) <= 2
+        assert results['processed'] == 13
+        assert results['successful'] == 11
+        assert {e['request_id'] for e in results['errors']} == {requests[5].pk, missing_id}
+        assert TaskProgress.objects.filter(task=task).count() == 12
+
+        task.refresh_from_db()
+        assert task.status == 'success'
+        assert task.progress == 100
+        assert task.result['failed'] == 2
+
+    def test_all_failed_marks_task_failed(self):
+        normal_user = _make_user('applicant')
+        admin_user = _make_user('operator', is_staff=True)
+        request_obj = _make_request(normal_user, _make_product('lab'), 'student')
+        task = AsyncTask.objects.create(task_id='batch-2', name='批量开户')
+
+        def processor(request_obj, operator, host):
+            raise ConnectionError('unreachable')
+
+        results = BatchOpeningProcessor(
+            [request_obj.pk], admin_user, task=task, processor=processor
+        ).run()
+
+        assert results['errors'] == [{'request_id': request_obj.pk, 'error': 'unreachable'}]
+        task.refresh_from_db()
+        assert task.status == 'failed'
+
+    def test_partitions_by_placed_host(self, monkeypatch):
+        from django.core.cache import cache
+
+        from apps.operations import placement
+
+        cache.clear()
+        placement._scheduler = None
+        normal_user = _make_user('applicant')
+        admin_user = _make_user('operator', is_staff=True)
+        product = _make_product('pooled')
+        pool = [product.host]
+        for i in range(2):
+            host = Host(name=f'pooled{i}', hostname=f'pooled{i}.local', username='admin')
+            host.password = 'secret'
+            host.save()
+            pool.append(host)
+        product.host_pool.add(*pool[1:])
+        Host.objects.filter(pk__in=[h.pk for h in pool]).update(status='online')
+        requests = [_make_request(normal_user, product, f'pooled{i}') for i in range(6)]
+
+        used = Counter()
+        threads = {}
+        lock = threading.Lock()
+
+        def processor(request_obj, operator, host):
+            with lock:
+                used[host.pk] += 1
+                threads.setdefault(host.pk, set()).add(threading.current_thread().name)
+            return {'success': True, 'error': ''}
+
+        try:
+            results = BatchOpeningProcessor(
+                [r.pk for r in requests], admin_user, per_host=1, processor=processor,
+            ).run()
+        finally:
+            placement._scheduler = None
+            cache.clear()
+
+        assert results['successful'] == 6
+        # 同一产品的申请按放置结果分到池中各主机，每台主机一条通道并行执行
+        assert sorted(used.values()) == [2, 2, 2]
+        assert set(used) == {h.pk for h in pool}
+
+    def test_releases_reservations_of_failed_and_skipped_requests(self, monkeypatch):
+        from apps.operations import placement
+
+        normal_user = _make_user('applicant')
+        admin_user = _make_user('operator', is_staff=True)
+        product = _make_product('lab')
+        requests = [_make_request(normal_user, product, f'student{i}') for i in range(3)]
+
+        released = []
+
+        class _Scheduler:
+            def place(self, product):
+                return product.host
+
+            def release(self, host, product):
+                released.append((host.pk, product.pk))
+
+        monkeypatch.setattr(placement, 'get_placement_scheduler', lambda: _Scheduler())
+
+        def processor(request_obj, operator, host):
+            if request_obj.username == 'student0':
+                return {'success': True, 'error': ''}
+            if request_obj.username == 'student1':
+                # 申请在放置后被其他操作处理，开户前跳过
+                return {'success': False, 'error': '申请状态为 rejected，无法处理'}
+            raise ConnectionError('unreachable')
+
+        results = BatchOpeningProcessor(
+            [r.pk for r in requests], admin_user, processor=processor,
+        ).run()
+
+        assert results['successful'] == 1 and results['failed'] == 2
+        assert released == [(product.host_id, product.pk)] * 2
+
+    def test_dead_or_stuck_lanes_do_not_block(self, monkeypatch):
+        normal_user = _make_user('applicant')
+        admin_user = _make_user('operator', is_staff=True)
+        requests = [
+            _make_request(normal_user, _make_product(f'lane{i}'), f'student{i}') for i in range(3)
+        ]
+        stuck, dead = requests[1].pk, requests[2].pk
+        release = threading.Event()
+
+        def processor(request_obj, operator, host):
+            if request_obj.pk == stuck:
+                release.wait(5)
+            if request_obj.pk == dead:
+                raise ConnectionError('unreachable')
+            return {'success': True, 'error': ''}
+
+        batch = BatchOpeningProcessor(
+            [r.pk for r in requests], admin_user, processor=processor, result_timeout=0.5,
+        )
+
+        # 模拟通道在处理函数之外出现意外异常：处理失败后记录日志时出错
+        class _Logger:
+            def error(self, message, *args, **kwargs):
+                if threading.current_thread() is not threading.main_thread():
+                    raise RuntimeError('lane crashed')
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: None
+
+        monkeypatch.setattr('apps.operations.batch.logger', _Logger())
+        started = time.monotonic()
+        try:
+            results = batch.run()
+        finally:
+            release.set()
+
+        assert time.monotonic() - started < 3
+        assert results['processed'] == 3 and results['successful'] == 1
+        errors = {e['request_id']: e['error'] for e in results['errors']}
+        assert errors[dead] == '处理通道异常: lane crashed'
+        assert errors[stuck].startswith('等待开户结果超时')
+
+
+@pytest.mark.django_db
+class TestPlacementScheduler:
+    def setup_method(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.product = _make_product('pool')
+        self.hosts = [self.product.host]
+        for i in range(2):
+            host = Host(name=f'pool{i}', hostname=f'pool{i}.local', username='admin')
+            host.password = 'secret'
+            host.save()
+            self.hosts.append(host)
+        self.product.host_pool.add(*self.hosts[1:])
+        Host.objects.filter(pk__in=[h.pk for h in self.hosts]).update(status='online')
+        self.owner = _make_user('owner')
+
+    def teardown_method(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _add_users(self, host, count):
+        from apps.operations.models import CloudComputerUser
+        for i in range(count):
+            CloudComputerUser.objects.create(
+                username=f'{host.name}-u{i}', product=self.product, host=host, owner=self.owner
+            )
+
+    def test_metrics_from_users_and_disk_snapshot(self):
+        from apps.hosts.inventory import HostInventory, KIND_DISKS
+        from apps.operations.models import CloudComputerUser
+        from apps.operations.placement import collect_metrics
+
+        self._add_users(self.hosts[1], 2)
+        # 未记录 host 的用户计入产品关联主机
+        CloudComputerUser.objects.create(username='legacy', product=self.product, owner=self.owner)
+        HostInventory(self.hosts[2])._store(KIND_DISKS, [{'drive': 'C:', 'free_mb': 500}])
+
+        metrics = collect_metrics([h.pk for h in self.hosts])
+        assert metrics[self.hosts[0].pk].active_users == 1
+        assert metrics[self.hosts[1].pk].product_users == {self.product.pk: 2}
+        assert metrics[self.hosts[2].pk].free_disk_mb == 500
+
+    def test_least_loaded_reserves_between_refreshes(self):
+        from apps.operations.placement import PlacementScheduler, collect_metrics
+
+        self._add_users(self.hosts[0], 2)
+        self._add_users(self.hosts[1], 1)
+        loads = []
+
+        def loader(host_ids):
+            loads.append(host_ids)
+            return collect_metrics(host_ids)
+
+        scheduler = PlacementScheduler(ttl=600, metrics_loader=loader)
+
+        chosen = [scheduler.place(self.product).name for _ in range(4)]
+        assert chosen == ['pool1', 'pool0', 'pool1', 'pool']
+        assert len(loads) == 1
+
+    def test_strategies_and_fallback(self):
+        from apps.operations.placement import HostMetrics, PlacementScheduler
+
+        metrics = {
+            self.hosts[0].pk: HostMetrics(self.hosts[0].pk, 'online', active_users=5),
+            self.hosts[1].pk: HostMetrics(self.hosts[1].pk, 'online', active_users=3,
+                                          product_users={self.product.pk: 3}),
+            self.hosts[2].pk: HostMetrics(self.hosts[2].pk, 'offline'),
+        }
+        scheduler = PlacementScheduler(ttl=600, metrics_loader=lambda ids: metrics)
+        assert scheduler.place(self.product, 'bin_pack') == self.hosts[0]
+        assert scheduler.place(self.product, 'spread') == self.hosts[0]
+
+        for m in metrics.values():
+            m.status = 'offline'
+        scheduler.invalidate()
+        assert scheduler.place(self.product) == self.product.host
+
+
+@pytest.mark.django_db
+class TestProvisioningOutbox:
+    @pytest.fixture(autouse=True)
+    def _async_provisioning(self, settings):
+        settings.ACCOUNT_PROVISIONING_ASYNC = True
+
+    def setup_method(self):
+        self.applicant = _make_user('applicant')
+        self.operator = _make_user('operator', is_staff=True)
+        self.product = _make_product('outbox')
+        self.request = _make_request(self.applicant, self.product, 'student')
+
+    def _complete(self, request_obj):
+        from apps.operations.models import CloudComputerUser
+        request_obj.status = 'completed'
+        request_obj.save(update_fields=['status'])
+        CloudComputerUser.objects.create(
+            username=request_obj.username, product=request_obj.target_product
+        )
+
+    def test_approve_writes_outbox_and_dispatches_on_commit(
+            self, monkeypatch, django_capture_on_commit_callbacks):
+        from apps.operations import tasks
+        from apps.operations.models import AccountOpeningRequest, ProvisioningOutbox
+
+        monkeypatch.setattr(
+            AccountOpeningRequest, 'auto_process_creation',
+            lambda self, host=None: pytest.fail('不应在审批请求中同步开户'),
+        )
+        sent = []
+        monkeypatch.setattr(tasks.provision_account_request, 'delay', sent.append)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            entry = self.request.approve(approver=self.operator)
+
+        assert self.request.status == 'approved'
+        assert sent == [entry.pk]
+        entry.refresh_from_db()
+        assert entry.status == 'dispatched'
+        assert ProvisioningOutbox.objects.filter(request=self.request).count() == 1
+
+    def test_sync_provisioning_by_default(self, monkeypatch, settings):
+        from apps.operations.models import AccountOpeningRequest, ProvisioningOutbox
+
+        # 未部署 Celery worker/beat 的环境默认在审批请求中同步开户
+        del settings.ACCOUNT_PROVISIONING_ASYNC
+        calls = []
+        monkeypatch.setattr(
+            AccountOpeningRequest, 'auto_process_creation', lambda self, host=None: calls.append(self.pk)
+        )
+        assert self.request.approve(approver=self.operator) is None
+        assert calls == [self.request.pk]
+        assert not ProvisioningOutbox.objects.exists()
+
+    def test_run_entry_is_idempotent(self, monkeypatch):
+        from apps.operations.models import AccountOpeningRequest
+        from apps.operations.outbox import run_entry
+
+        calls = []
+
+        def fake_creation(request_obj, host=None):
+            calls.append(request_obj.pk)
+            self._complete(request_obj)
+
+        monkeypatch.setattr(AccountOpeningRequest, 'auto_process_creation', fake_creation)
+        entry = self.request.approve(approver=self.operator, dispatch=False)
+
+        assert run_entry(entry.pk) == 'done'
+        # 重复投递的消息无法再次认领
+        assert run_entry(entry.pk) is None
+        assert calls == [self.request.pk]
+        self.request.refresh_from_db()
+        assert self.request.status == 'completed'
+
+    def test_redispatch_skips_already_provisioned(self, monkeypatch):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from apps.operations import tasks
+        from apps.operations.models import AccountOpeningRequest, ProvisioningOutbox
+        from apps.operations.outbox import dispatch_pending, run_entry
+
+        monkeypatch.setattr(
+            AccountOpeningRequest, 'auto_process_creation',
+            lambda self, host=None: pytest.fail('已开户的申请不应重复开户'),
+        )
+        sent = []
+        monkeypatch.setattr(tasks.provision_account_request, 'delay', sent.append)
+
+        entry = self.request.approve(approver=self.operator, dispatch=False)
+        # 模拟 worker 开户成功后、更新发件箱前中断
+        self._complete(self.request)
+        ProvisioningOutbox.objects.filter(pk=entry.pk).update(
+            status='processing', dispatched_at=timezone.now() - timedelta(hours=1)
+        )
+
+        assert dispatch_pending() == 1
+        assert sent == [entry.pk]
+        assert run_entry(entry.pk) == 'done'
+
+    def test_running_entry_with_live_lease_is_not_redispatched(self, monkeypatch):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from apps.operations import tasks
+        from apps.operations.models import ProvisioningOutbox
+        from apps.operations.outbox import dispatch_pending
+
+        sent = []
+        monkeypatch.setattr(tasks.provision_account_request, 'delay', sent.append)
+        entry = self.request.approve(approver=self.operator, dispatch=False)
+        now = timezone.now()
+        # 开户已执行一小时（等待主机并发槽、WinRM 重试），但租约仍在续期
+        ProvisioningOutbox.objects.filter(pk=entry.pk).update(
+            status='processing', dispatched_at=now - timedelta(hours=1),
+            lease_expires_at=now + timedelta(seconds=60),
+        )
+        assert dispatch_pending() == 0
+        assert ProvisioningOutbox.objects.get(pk=entry.pk).status == 'processing'
+
+        ProvisioningOutbox.objects.filter(pk=entry.pk).update(
+            lease_expires_at=now - timedelta(seconds=1)
+        )
+        assert dispatch_pending() == 1
+        assert sent == [entry.pk]
+
+    def test_run_entry_holds_lease_while_provisioning(self, monkeypatch):
+        from contextlib import contextmanager
+
+        from apps.operations import outbox
+        from apps.operations.models import AccountOpeningRequest, ProvisioningOutbox
+
+        leases = []
+
+        @contextmanager
+        def heartbeat(entry_id):
+            leases.append(ProvisioningOutbox.objects.get(pk=entry_id).lease_expires_at)
+            yield
+
+        def creation(request_obj, host=None):
+            assert leases, '开户必须在租约心跳范围内执行'
+            self._complete(request_obj)
+
+        monkeypatch.setattr(outbox, '_lease_heartbeat', heartbeat)
+        monkeypatch.setattr(AccountOpeningRequest, 'auto_process_creation', creation)
+        entry = self.request.approve(approver=self.operator, dispatch=False)
+
+        assert outbox.run_entry(entry.pk) == 'done'
+        assert leases[0] is not None
+        entry.refresh_from_db()
+        assert entry.lease_expires_at is None
+
+    def test_dispatch_import_error_keeps_entry_pending(self, monkeypatch):
+        import builtins
+
+        from apps.operations.models import ProvisioningOutbox
+        from apps.operations.outbox import dispatch_entry
+
+        entry = self.request.approve(approver=self.operator, dispatch=False)
+        real_import = builtins.__import__
+
+        def broken_import(name, *args, **kwargs):
+            if name == 'apps.operations.tasks':
+                raise ImportError('broken')
+            return real_import(name, *args, **kwargs)
+
+        monkeypatch.setattr(builtins, '__import__', broken_import)
+        assert dispatch_entry(entry.pk) is False
+        monkeypatch.setattr(builtins, '__import__', real_import)
+        assert ProvisioningOutbox.objects.get(pk=entry.pk).status == 'pending'
+
+
+@pytest.mark.django_db
+def test_cleanup_inactive_users_groups_by_host(monkeypatch):
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from apps.operations.cleanup import cleanup_inactive_users
+    from apps.operations.models import CloudComputerUser
+    from utils.bulk_user_ops import BulkUserStatus
+
+    owner = _make_user('owner')
+    products = [_make_product('lab-a'), _make_product('lab-b')]
+    for product in products:
+        for i in range(3):
+            CloudComputerUser.objects.create(username=f'{product.name}-{i}', product=product, owner=owner)
+    CloudComputerUser.objects.create(username='fresh', product=products[0], owner=owner)
+    CloudComputerUser.objects.exclude(username='fresh').update(
+        created_at=timezone.now() - timedelta(days=90)
+    )
+    monkeypatch.setattr(
+        CloudComputerUser, 'disable_remote_user',
+        lambda self: pytest.fail('不应逐个远程禁用'),
+    )
+
+    calls = []
+
+    def disabler(client, usernames, inactive_days):
+        calls.append(sorted(usernames))
+        return {
+            u: BulkUserStatus(u, 'active' if u.endswith('-0') else 'disabled')
+            for u in usernames
+        }
+
+    summary = cleanup_inactive_users(30, disabler=disabler, client_factory=lambda host: None)
+
+    assert sorted(calls) == [
+        ['lab-a-0', 'lab-a-1', 'lab-a-2'], ['lab-b-0', 'lab-b-1', 'lab-b-2'],
+    ]
+    assert summary['cleaned_users'] == 4
+    assert summary['total_candidates'] == 6
+    assert set(
+        CloudComputerUser.objects.filter(status='disabled').values_list('username', flat=True)
+    ) == {'lab-a-1', 'lab-a-2', 'lab-b-1', 'lab-b-2'}
+
+
+@pytest.mark.django_db
+def test_reconcile_user_status_batches_per_host_and_keeps_failures(monkeypatch):
+    from apps.operations.models import CloudComputerUser
+    from apps.operations.reconcile import RESULT_FAILED, RESULT_SKIPPED, reconcile_user_status
+    from utils.bulk_user_ops import BulkUserStatus
+
+    owner = _make_user('owner')
+    products = [_make_product('lab-a'), _make_product('lab-b')]
+    for product in products:
+        for i in range(2):
+            CloudComputerUser.objects.create(username=f'{product.name}-{i}', product=product, owner=owner)
+    CloudComputerUser.objects.filter(username='lab-b-1').update(status='disabled')
+    monkeypatch.setattr(
+        CloudComputerUser, 'disable_remote_user',
+        lambda self: pytest.fail('不应逐个远程禁用'),
+    )
+
+    calls = []
+
+    def disable(client, usernames):
+        calls.append(sorted(usernames))
+        return {
+            u: BulkUserStatus(u, 'error', 'Access denied') if u == 'lab-a-1' else BulkUserStatus(u, 'disabled')
+            for u in usernames
+        }
+
+    summary = reconcile_user_status(
+        CloudComputerUser.objects.all(), 'disabled',
+        client_factory=lambda host: None, appliers={'disable': disable},
+    )
+
+    assert sorted(calls) == [['lab-a-0', 'lab-a-1'], ['lab-b-0']]
+    assert summary['updated'] == 2
+    assert summary['failed'] == 1
+    assert summary['skipped'] == 1
+    by_name = {r.username: r for r in summary['results']}
+    assert by_name['lab-a-1'].result == RESULT_FAILED
+    assert by_name['lab-a-1'].message == 'Access denied'
+    assert by_name['lab-b-1'].result == RESULT_SKIPPED
+    assert set(
+        CloudComputerUser.objects.filter(status='disabled').values_list('username', flat=True)
+    ) == {'lab-a-0', 'lab-b-0', 'lab-b-1'}
+
+
+@pytest.mark.django_db
+def test_reconcile_user_status_enables_only_disabled_users():
+    from apps.operations.models import CloudComputerUser
+    from apps.operations.reconcile import reconcile_user_status
+    from utils.bulk_user_ops import BulkUserStatus
+
+    owner = _make_user('owner')
+    product = _make_product('lab-a')
+    CloudComputerUser.objects.create(username='was-disabled', product=product, owner=owner)
+    CloudComputerUser.objects.create(username='was-inactive', product=product, owner=owner)
+    CloudComputerUser.objects.filter(username='was-disabled').update(status='disabled')
+    CloudComputerUser.objects.filter(username='was-inactive').update(status='inactive')
+
+    calls = []
+
+    def enable(client, usernames):
+        calls.append(usernames)
+        return {u: BulkUserStatus(u, 'enabled') for u in usernames}
+
+    def unreachable(host):
+        raise AssertionError('host unreachable')
+
+    summary = reconcile_user_status(
+        CloudComputerUser.objects.all(), 'active',
+        client_factory=lambda host: None, appliers={'enable': enable},
+    )
+    assert calls == [['was-disabled']]
+    assert summary['updated'] == 2
+    assert CloudComputerUser.objects.filter(status='active').count() == 2
+
+    # 连接失败时用户保持原状态
+    CloudComputerUser.objects.update(status='disabled')
+    summary = reconcile_user_status(
+        CloudComputerUser.objects.all(), 'active',
+        client_factory=unreachable, appliers={'enable': enable},
+    )
+    assert summary['failed'] == 2
+    assert summary['updated'] == 0
+    assert CloudComputerUser.objects.filter(status='disabled').count() == 2
+
+
+@pytest.mark.django_db
+def test_batch_disable_view_runs_reconcile_as_bulk_task(client, monkeypatch):
+    from django.contrib.auth.models import Group
+
+    from apps.operations import tasks
+    from apps.operations.models import CloudComputerUser
+    from apps.provider.decorators import PROVIDER_GROUP_NAME
+    from utils.bulk_user_ops import BulkUserStatus
+
+    provider = _make_user('provider')
+    provider.groups.add(Group.objects.get_or_create(name=PROVIDER_GROUP_NAME)[0])
+    other = _make_user('other-provider')
+    other.groups.add(Group.objects.get(name=PROVIDER_GROUP_NAME))
+    product = _make_product('lab-a')
+    Product.objects.filter(pk=product.pk).update(created_by=provider)
+    users = [
+        CloudComputerUser.objects.create(username=f'lab-a-{i}', product=product, owner=provider)
+        for i in range(3)
+    ]
+    monkeypatch.setattr(Host, 'get_connection_client', lambda self: None)
+    monkeypatch.setattr(
+        'apps.operations.reconcile._default_appliers',
+        lambda: {'disable': lambda client, usernames: {u: BulkUserStatus(u, 'disabled') for u in usernames}},
+    )
+    sent = []
+    monkeypatch.setattr(
+        tasks.reconcile_cloud_user_status, 'apply_async',
+        lambda args, task_id: sent.append((args, task_id)),
+    )
+
+    client.force_login(provider)
+    response = client.post(
+        '/provider/operations/users/batch-disable/', {'selected_ids': [u.pk for u in users]}
+    )
+
+    # Web 请求只提交任务并跳转到进度页，不执行远程操作
+    (args, task_id), = sent
+    assert response.status_code == 302
+    assert response['Location'] == f'/provider/operations/async-tasks/{task_id}/'
+    assert sorted(args[0]) == sorted(u.pk for u in users)
+    assert args[1:] == ('disabled', provider.pk)
+    task = AsyncTask.objects.get(task_id=task_id)
+    assert task.status == 'pending' and task.created_by == provider
+    assert not CloudComputerUser.objects.filter(status='disabled').exists()
+    assert client.get(response['Location']).status_code == 200
+
+    tasks.reconcile_cloud_user_status.apply(args=args, task_id=task_id)
+
+    task.refresh_from_db()
+    assert task.status == 'success'
+    assert task.result['updated'] == 3 and task.result['errors'] == []
+    assert CloudComputerUser.objects.filter(status='disabled').count() == 3
+    assert AsyncTask.objects.count() == 1
+
+    client.force_login(other)
+    assert client.get(response['Location']).status_code == 404
+
+
+@pytest.mark.django_db
+def test_process_opening_request_uses_placement(monkeypatch):
+    from types import SimpleNamespace
+
+    from apps.operations import placement
+    from apps.operations.models import CloudComputerUser
+    from apps.operations.tasks import process_opening_request
+    from utils import provisioning
+
+    operator = _make_user('operator', is_staff=True)
+    product = _make_product('placed')
+    pooled = Host(name='pooled', hostname='pooled.local', username='admin')
+    pooled.password = 'secret'
+    pooled.save()
+    request_obj = _make_request(_make_user('applicant'), product, 'student')
+    AccountOpeningRequest.objects.filter(pk=request_obj.pk).update(status='approved')
+
+    placed = []
+
+    class _Scheduler:
+        def place(self, product):
+            placed.append(product.pk)
+            return pooled
+
+        def release(self, host, product):
+            pytest.fail('开户成功不应释放预占')
+
+    monkeypatch.setattr(placement, 'get_placement_scheduler', lambda: _Scheduler())
+    monkeypatch.setattr('utils.winrm_client.WinrmClient', lambda **kwargs: SimpleNamespace(**kwargs))
+    monkeypatch.setattr(provisioning, 'provision_user', lambda client, username, password, **kwargs:
+                        SimpleNamespace(success=True, failed_steps=[], error_message=''))
+
+    result = process_opening_request.apply(args=(request_obj.pk, operator.pk)).get()
+
+    assert result['success'] and result['host'] == 'pooled.local'
+    assert placed == [product.pk]
+    assert CloudComputerUser.objects.get(username='student').host == pooled
+    assert AsyncTask.objects.get(name=f'处理开户请求 #{request_obj.pk}').status == 'success'
+
+
+@pytest.mark.django_db
+def test_reset_user_password_uses_effective_host(monkeypatch):
+    from types import SimpleNamespace
+
+    from apps.operations.models import CloudComputerUser
+    from apps.operations.tasks import reset_user_password
+
+    operator = _make_user('operator', is_staff=True)
+    product = _make_product('shared')
+    # 未单独指定主机的用户落在产品主机上
+    user = CloudComputerUser.objects.create(username='student', product=product, owner=operator)
+    assert user.host_id is None
+
+    resets = []
+
+    class _Client:
+        def reset_password(self, username, password):
+            resets.append(username)
+            return SimpleNamespace(status_code=0, std_out='', std_err='')
+
+    hosts = []
+
+    def get_connection_client(host, bypass_circuit=False):
+        hosts.append(host.pk)
+        return _Client()
+
+    monkeypatch.setattr(Host, 'get_connection_client', get_connection_client)
+
+    result = reset_user_password.apply(args=(user.pk, operator.pk)).get()
+
+    assert result == {'success': True, 'message': '密码重置成功', 'username': 'student'}
+    assert hosts == [product.host_id] and resets == ['student']
+    assert AsyncTask.objects.get(target_object_id=user.pk).status == 'success'
+
+
+@pytest.mark.django_db
+def test_pooled_user_connects_through_effective_host():
+    from apps.operations.models import CloudComputerUser, RdpDomainRoute
+    from apps.operations.tasks import allocate_rdp_domain
+
+    owner = _make_user('owner')
+    product = _make_product('pool')
+    Product.objects.filter(pk=product.pk).update(enable_host_protection=True)
+    pooled = Host(
+        name='pooled', hostname='pooled.local:5986', username='admin', rdp_port=13389,
+        connection_type='tunnel', tunnel_token='pooled-token',
+    )
+    pooled.password = 'secret'
+    pooled.save()
+    on_product = CloudComputerUser.objects.create(username='a', product=product, owner=owner)
+    on_pooled = CloudComputerUser.objects.create(
+        username='b', product=product, owner=owner, host=pooled, status='active',
+    )
+
+    assert (on_product.rdp_hostname, on_product.rdp_port) == ('pool.local', 3389)
+    assert (on_pooled.rdp_hostname, on_pooled.rdp_port) == ('pooled.local', 13389)
+
+    result = allocate_rdp_domain(owner.pk, product.pk)
+
+    assert result['success']
+    assert RdpDomainRoute.objects.get(domain=result['domain']).tunnel_token == 'pooled-token'
+
+
+@pytest.mark.django_db
+def test_opening_preflight_uses_inventory_snapshot(monkeypatch):
+    from types import SimpleNamespace
+
+    from django.core.cache import cache
+
+    from apps.hosts.inventory import KIND_USERS, HostInventory
+    from utils import provisioning
+
+    cache.clear()
+    product = _make_product('preflight')
+    applicant = _make_user('applicant')
+    HostInventory(product.host)._store(KIND_USERS, [{'name': 'taken', 'enabled': True, 'description': ''}])
+
+    class _Client:
+        calls = 0
+
+        def execute_powershell(self, script, arguments=None):
+            from utils.winrm_client import WinrmResult
+            _Client.calls += 1
+            return WinrmResult(0, '[{"Name":"taken","Enabled":true}]', '')
+
+    provisioned = []
+    monkeypatch.setattr(Host, 'get_connection_client', lambda host, bypass_circuit=False: _Client())
+    monkeypatch.setattr(provisioning, 'provision_user', lambda client, username, password, **kwargs:
+                        provisioned.append(username) or SimpleNamespace(success=True, failed_steps=[], error_message=''))
+
+    try:
+        fresh = _make_request(applicant, product, 'fresh')
+        fresh.auto_process_creation(host=product.host)
+        taken = _make_request(applicant, product, 'taken')
+        taken.auto_process_creation(host=product.host)
+    finally:
+        cache.clear()
+
+    # 快照中不存在的用户名不远程预检；已存在的远程确认后拒绝，不执行开户脚本
+    assert fresh.status == 'completed'
+    assert taken.status == 'failed' and '已存在' in taken.result_message
+    assert provisioned == ['fresh'] and _Client.calls == 1
@@ -10,6 +10,10 @@ urlpatterns = [
     # 系统任务相关URL
     path('tasks/', views.SystemTaskListView.as_view(), name='task_list'),
     path('tasks/<int:pk>/', views.SystemTaskDetailView.as_view(), name='task_detail'),
+    path('tasks/<int:task_id>/progress/', views.task_progress, name='task_progress'),
+    path('tasks/<int:task_id>/progress/stream/', views.task_progress_stream, name='task_progress_stream'),
+    path('async-tasks/<str:task_id>/progress/stream/', views.async_task_progress_stream,
+         name='async_task_progress_stream'),
     
     # 开户申请相关URL
     path('account-openings/', views.AccountOpeningRequestListView.as_view(), name='account_opening_list'),
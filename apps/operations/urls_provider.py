@@ -200,4 +200,9 @@ urlpatterns = [
         views_provider.SystemTaskListView.as_view(),
         name='task_list',
     ),
+    path(
+        'async-tasks/<str:task_id>/',
+        views_provider.AsyncTaskProgressView.as_view(),
+        name='async_task_progress',
+    ),
 ]
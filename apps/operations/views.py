@@ -20,6 +20,10 @@ from datetime import timedelta
 from .models import AccountOpeningRequest, SystemTask, CloudComputerUser, Product
 from .forms import AccountOpeningRequestForm, AccountOpeningRequestFilterForm, CloudComputerUserFilterForm
 from apps.hosts.models import Host
+from apps.tasks.progress import (
+    apply_live_progress, get_live_progress, progress_channel, progress_payload,
+)
+from utils.progress_events import event_stream, sse_response
 
 
 @method_decorator(login_required, name='dispatch')
@@ -60,6 +64,8 @@ class SystemTaskListView(ListView):
         """获取模板上下文数据"""
         context = super().get_context_data(**kwargs)
         context['filter_form'] = SystemTaskFilterForm(self.request.GET)
+        # 执行中的任务优先显示缓存中的实时进度
+        context['tasks'] = context['object_list'] = apply_live_progress(context['object_list'])
         return context
 
 
@@ -86,6 +92,9 @@ def task_progress(request, task_id):
     """
     try:
         task = SystemTask.objects.get(pk=task_id)
+        live = get_live_progress(task) if task.status == 'running' else None
+        if live:
+            task.progress = max(task.progress, live['progress'])
         return JsonResponse({
             'success': True,
             'data': {
@@ -93,6 +102,7 @@ def task_progress(request, task_id):
                 'name': task.name,
                 'status': task.status,
                 'progress': task.progress,
+                'message': live.get('message') if live else None,
                 'result': task.result,
                 'error_message': task.error_message,
             }
@@ -104,6 +114,50 @@ def task_progress(request, task_id):
         })
 
 
+def _task_snapshot(model, **lookup):
+    """读取任务当前进度（实时进度优先取缓存），任务不存在时返回 None"""
+    task = model.objects.filter(**lookup).first()
+    if task is None:
+        return None
+    live = get_live_progress(task) if task.status == 'running' else None
+    return progress_payload(task, live)
+
+
+def _task_finished(payload):
+    return payload.get('status') not in ('pending', 'running')
+
+
+@login_required
+def task_progress_stream(request, task_id):
+    """
+    以 Server-Sent Events 推送系统任务进度
+
+    进度变化时由 ProgressReporter 发布事件，替代轮询 task_progress
+    """
+    task = get_object_or_404(SystemTask, pk=task_id)
+    return sse_response(event_stream(
+        progress_channel(task),
+        lambda: _task_snapshot(SystemTask, pk=task.pk),
+        _task_finished,
+    ))
+
+
+@login_required
+def async_task_progress_stream(request, task_id):
+    """以 Server-Sent Events 推送异步任务（AsyncTask）进度，仅任务创建者和管理员可见"""
+    from apps.tasks.models import AsyncTask
+
+    task = get_object_or_404(AsyncTask, task_id=task_id)
+    if task.created_by_id != request.user.pk and not (
+            request.user.is_staff or request.user.is_superuser):
+        return HttpResponseForbidden('无权查看该任务')
+    return sse_response(event_stream(
+        progress_channel(task),
+        lambda: _task_snapshot(AsyncTask, pk=task.pk),
+        _task_finished,
+    ))
+
+
 @method_decorator(login_required, name='dispatch')
 class AccountOpeningRequestCreateView(CreateView):
     """创建开户申请视图"""
@@ -414,7 +468,7 @@ class MyCloudComputersView(ListView):
         if product_filter:
             queryset = queryset.filter(product__display_name=product_filter)
 
-        return queryset.select_related('product', 'created_from_request').order_by('-created_at')
+        return queryset.select_related('product', 'host', 'created_from_request').order_by('-created_at')
 
     def get_context_data(self, **kwargs):
         """获取模板上下文数据"""
@@ -438,7 +492,9 @@ class MyCloudComputersView(ListView):
 @login_required
 def my_cloud_computer_detail(request, pk):
     """我的云电脑用户详情页面"""
-    cloud_user = get_object_or_404(CloudComputerUser, pk=pk)
+    cloud_user = get_object_or_404(
+        CloudComputerUser.objects.select_related('product', 'product__host', 'host'), pk=pk
+    )
 
     # 权限检查：owner优先，兼容旧数据用created_from_request
     if cloud_user.owner:
@@ -498,8 +554,8 @@ def get_product_disk_config(request, product_id):
 
 @login_required
 def get_host_disk_info(request, host_id):
-    """获取主机的磁盘信息"""
-    from utils.disk_quota import get_disk_info_via_client
+    """获取主机的磁盘信息（读取资产快照，缓存缺失时才远程获取）"""
+    from apps.hosts.inventory import get_host_inventory
 
     try:
         host = Host.objects.get(pk=host_id)
@@ -511,9 +567,10 @@ def get_host_disk_info(request, host_id):
             return JsonResponse({'success': False, 'error': '无权访问'}, status=403)
 
     try:
-        client = host.get_connection_client()
-        disks = get_disk_info_via_client(client)
-        return JsonResponse({'success': True, 'data': disks})
+        disks = get_host_inventory(host).disks(
+            refresh=request.GET.get('refresh') == '1'
+        )
+        return JsonResponse({'success': True, 'data': disks or []})
     except Exception as e:
         logger.error(f"Error getting disk info: {str(e)}", exc_info=True)
         return JsonResponse({'success': False, 'error': 'Failed to get disk info'})
@@ -648,7 +705,7 @@ def rdp_connect(request, product_id):
         messages.error(request, '您没有访问此云电脑的权限。')
         return redirect('operations:my_cloud_computers')
 
-    host = product.host
+    host = cloud_user.effective_host
     if not host or not host.tunnel_token:
         messages.error(request, '该产品关联的主机未配置隧道，无法通过RD Gateway连接。')
         return redirect('operations:my_cloud_computers')
@@ -23,6 +23,7 @@ from django.views import View
 from django.views.generic import DetailView, ListView, TemplateView
 
 from apps.accounts.provider_decorators import admin_required
+from apps.tasks.progress import apply_live_progress
 from utils.provider import get_provider_products
 from apps.operations.models import (
     AccountOpeningRequest,
@@ -925,6 +926,7 @@ class AdminCloudUserListView(TemplateView):
             queryset = CloudComputerUser.objects.select_related(
                 'product',
                 'product__host',
+                'host',
                 'created_from_request',
                 'created_from_request__applicant',
                 'owner',
@@ -938,6 +940,7 @@ class AdminCloudUserListView(TemplateView):
             ).select_related(
                 'product',
                 'product__host',
+                'host',
                 'created_from_request',
                 'created_from_request__applicant',
                 'owner',
@@ -1016,6 +1019,7 @@ class AdminCloudUserDetailView(DetailView):
         qs = CloudComputerUser.objects.select_related(
             'product',
             'product__host',
+            'host',
             'created_from_request',
             'created_from_request__applicant',
             'owner',
@@ -1096,7 +1100,7 @@ def admin_cloud_user_action(request, pk):
         cloud_user.save(update_fields=['is_admin', 'updated_at'])
         try:
             from utils.winrm_client import WinrmClient
-            host = cloud_user.product.host
+            host = cloud_user.effective_host
             client = WinrmClient(
                 hostname=host.hostname, port=host.port,
                 username=host.username, password=host.password,
@@ -1118,7 +1122,7 @@ def admin_cloud_user_action(request, pk):
         cloud_user.save(update_fields=['is_admin', 'updated_at'])
         try:
             from utils.winrm_client import WinrmClient
-            host = cloud_user.product.host
+            host = cloud_user.effective_host
             client = WinrmClient(
                 hostname=host.hostname, port=host.port,
                 username=host.username, password=host.password,
@@ -1194,7 +1198,7 @@ def admin_cloud_user_set_quota(request, pk):
     try:
         from utils.disk_quota import set_disk_quota_via_client
         from utils.winrm_client import WinrmClient
-        host = cloud_user.product.host
+        host = cloud_user.effective_host
         client = WinrmClient(
             hostname=host.hostname, port=host.port,
             username=host.username, password=host.password,
@@ -1419,4 +1423,5 @@ class AdminTaskListView(ListView):
         context = super().get_context_data(**kwargs)
         context['active_nav'] = 'operations_tasks'
         context['page_title'] = '系统任务'
+        context['tasks'] = context['object_list'] = apply_live_progress(context['object_list'])
         return context
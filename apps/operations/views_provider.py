@@ -8,6 +8,7 @@
 
 import json
 import logging
+import uuid
 
 from django.contrib import messages
 from django.contrib.auth import get_user_model
@@ -31,6 +32,8 @@ from apps.operations.models import (
 )
 from apps.provider.decorators import is_provider, provider_required
 from apps.provider.context_mixin import ProviderContextMixin
+from apps.tasks.models import AsyncTask
+from apps.tasks.progress import apply_live_progress
 from utils.provider import get_provider_products
 
 from .forms_provider import (
@@ -74,6 +77,7 @@ class ProviderOperationBaseView(View):
         ).select_related(
             'product',
             'product__host',
+            'host',
             'created_from_request',
             'created_from_request__applicant',
         )
@@ -270,11 +274,13 @@ class CloudComputerUserSetDiskQuotaView(ProviderContextMixin, ProviderOperationB
                 if disk_quota and cloud_user.product.enable_disk_quota:
                     from utils.disk_quota import set_user_disk_quotas
 
-                    host = cloud_user.product.host
+                    host = cloud_user.effective_host
                     client = host.get_connection_client()
                     result = set_user_disk_quotas(
                         client, cloud_user.username, disk_quota
                     )
+                    from apps.hosts.inventory import KIND_DISKS, invalidate_host_inventory
+                    invalidate_host_inventory(host, KIND_DISKS)
 
                     if result['success']:
                         messages.success(
@@ -386,21 +392,14 @@ class CloudComputerUserBatchActivateView(ProviderOperationBaseView, View):
 
         if not user_ids:
             messages.warning(request, '未选择任何用户')
-            return HttpResponseRedirect(reverse('provider_operations:user_list'))
+            return redirect('provider:provider_operations:user_list')
 
         queryset = self.get_provider_queryset().filter(
             pk__in=user_ids,
             status__in=['inactive', 'disabled'],
         )
 
-        updated_count = queryset.update(status='active')
-
-        if updated_count > 0:
-            messages.success(request, f'成功激活了 {updated_count} 个用户')
-        else:
-            messages.warning(request, '没有符合条件的用户需要激活')
-
-        return HttpResponseRedirect(reverse('provider_operations:user_list'))
+        return _start_user_status_task(request, queryset, 'active', '激活')
 
 
 class CloudComputerUserBatchDeactivateView(ProviderOperationBaseView, View):
@@ -415,21 +414,14 @@ class CloudComputerUserBatchDeactivateView(ProviderOperationBaseView, View):
 
         if not user_ids:
             messages.warning(request, '未选择任何用户')
-            return HttpResponseRedirect(reverse('provider_operations:user_list'))
+            return redirect('provider:provider_operations:user_list')
 
         queryset = self.get_provider_queryset().filter(
             pk__in=user_ids,
             status='active',
         )
 
-        updated_count = queryset.update(status='inactive')
-
-        if updated_count > 0:
-            messages.success(request, f'成功停用了 {updated_count} 个用户')
-        else:
-            messages.warning(request, '没有符合条件的用户需要停用')
-
-        return HttpResponseRedirect(reverse('provider_operations:user_list'))
+        return _start_user_status_task(request, queryset, 'inactive', '停用')
 
 
 class CloudComputerUserBatchDisableView(ProviderOperationBaseView, View):
@@ -444,20 +436,13 @@ class CloudComputerUserBatchDisableView(ProviderOperationBaseView, View):
 
         if not user_ids:
             messages.warning(request, '未选择任何用户')
-            return HttpResponseRedirect(reverse('provider_operations:user_list'))
+            return redirect('provider:provider_operations:user_list')
 
         queryset = self.get_provider_queryset().filter(
             pk__in=user_ids,
         ).exclude(status='deleted')
 
-        updated_count = queryset.update(status='disabled')
-
-        if updated_count > 0:
-            messages.success(request, f'成功禁用了 {updated_count} 个用户')
-        else:
-            messages.warning(request, '没有符合条件的用户需要禁用')
-
-        return HttpResponseRedirect(reverse('provider_operations:user_list'))
+        return _start_user_status_task(request, queryset, 'disabled', '禁用')
 
 
 # ===========================================================================
@@ -465,6 +450,40 @@ class CloudComputerUserBatchDisableView(ProviderOperationBaseView, View):
 # ===========================================================================
 
 
+def _start_user_status_task(request, queryset, status, verb):
+    """
+    提交批量设置用户状态的后台任务，并跳转到任务进度页
+
+    远程操作可能持续数分钟，放在 bulk 队列执行，Web 请求只记录任务。
+    """
+    from apps.operations.tasks import reconcile_cloud_user_status
+
+    user_ids = list(queryset.values_list('pk', flat=True))
+    if not user_ids:
+        messages.warning(request, f'没有符合条件的用户需要{verb}')
+        return redirect('provider:provider_operations:user_list')
+
+    # 先创建任务记录，进度页在 worker 接手前即可打开
+    task = AsyncTask.objects.create(
+        task_id=str(uuid.uuid4()),
+        name=f'批量{verb}用户 ({len(user_ids)}个)',
+        created_by=request.user,
+        status='pending',
+    )
+    try:
+        reconcile_cloud_user_status.apply_async(
+            args=(user_ids, status, request.user.pk), task_id=task.task_id,
+        )
+    except Exception as e:
+        logger.error(f'提交批量{verb}任务失败: {e}', exc_info=True)
+        task.complete_failure(f'任务提交失败: {e}')
+        messages.error(request, f'批量{verb}任务提交失败，请稍后重试')
+        return redirect('provider:provider_operations:user_list')
+
+    messages.info(request, f'已提交后台任务，正在{verb} {len(user_ids)} 个用户')
+    return redirect('provider:provider_operations:async_task_progress', task_id=task.task_id)
+
+
 def _get_selected_ids(request):
     """
     从 POST 请求中提取选中的 ID 列表
@@ -1239,6 +1258,28 @@ class SystemTaskListView(ProviderRequestMixin, ListView):
         context = super().get_context_data(**kwargs)
         context['active_nav'] = 'activity_log'
         context['page_title'] = '系统任务'
+        context['tasks'] = context['object_list'] = apply_live_progress(context['object_list'])
+        return context
+
+
+class AsyncTaskProgressView(ProviderRequestMixin, TemplateView):
+    """
+    后台任务进度页
+
+    - 通过 operations:async_task_progress_stream 实时推送进度
+    - 提供商数据隔离：只能查看自己创建的任务
+    """
+
+    template_name = 'admin_base/operations/async_task_progress.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        task = get_object_or_404(
+            AsyncTask, task_id=self.kwargs['task_id'], created_by=self.request.user,
+        )
+        context['task'] = apply_live_progress([task])[0]
+        context['active_nav'] = 'cloud_users'
+        context['page_title'] = task.name
         return context
 
 
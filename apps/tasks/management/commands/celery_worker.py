@@ -0,0 +1,56 @@
+import shlex
+
+from django.core.management.base import BaseCommand
+
+from config.celery import WORKER_PROFILES, app
+
+
+def build_worker_argv(profile, concurrency=None, loglevel='INFO'):
+    """按 WORKER_PROFILES 中的配置生成 celery worker 参数"""
+    config = WORKER_PROFILES[profile]
+    return [
+        'worker',
+        '-Q', ','.join(config['queues']),
+        '-n', f'{profile}@%h',
+        '-c', str(concurrency or config['concurrency']),
+        '--prefetch-multiplier', str(config['prefetch']),
+        '--max-tasks-per-child', str(config['max_tasks_per_child']),
+        '-O', 'fair',
+        '-l', loglevel,
+    ]
+
+
+class Command(BaseCommand):
+    help = '按通道配置启动 Celery worker（interactive / default / bulk / all）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'profile',
+            choices=sorted(WORKER_PROFILES),
+            help='worker 通道配置',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='覆盖配置中的并发进程数',
+        )
+        parser.add_argument(
+            '--loglevel',
+            default='INFO',
+            help='日志级别',
+        )
+        parser.add_argument(
+            '--print',
+            action='store_true',
+            dest='print_only',
+            help='只输出等价的 celery 命令（用于 supervisor/systemd 配置），不启动 worker',
+        )
+
+    def handle(self, *args, **options):
+        argv = build_worker_argv(
+            options['profile'], options['concurrency'], options['loglevel']
+        )
+        if options['print_only']:
+            self.stdout.write(shlex.join(['celery', '-A', 'config'] + argv))
+            return
+        app.worker_main(argv)
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asynctask',
+            index=models.Index(fields=['created_by', '-created_at'], name='async_task_created_60405a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asynctask',
+            index=models.Index(fields=['status', '-created_at'], name='async_task_status_3de5d4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asynctask',
+            index=models.Index(fields=['status', 'completed_at'], name='async_task_status_982962_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskprogress',
+            index=models.Index(fields=['task', 'timestamp'], name='task_progre_task_id_ac6beb_idx'),
+        ),
+    ]
@@ -41,6 +41,13 @@ class AsyncTask(models.Model):
         verbose_name_plural = "异步任务"
         db_table = "async_task"
         ordering = ['-created_at']
+        indexes = [
+            # 任务列表：按创建者 / 状态筛选并按时间倒序分页
+            models.Index(fields=['created_by', '-created_at']),
+            models.Index(fields=['status', '-created_at']),
+            # 保留策略：按状态和完成时间查找可归档的任务
+            models.Index(fields=['status', 'completed_at']),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.status}"
@@ -59,6 +66,7 @@ class AsyncTask(models.Model):
         if result_data:
             self.result = result_data
         self.save()
+        self._finish_live_progress()
 
     def complete_failure(self, error_msg):
         """标记任务执行失败"""
@@ -66,12 +74,23 @@ class AsyncTask(models.Model):
         self.completed_at = timezone.now()
         self.error_message = error_msg
         self.save()
+        self._finish_live_progress()
 
     def cancel_task(self):
         """取消任务"""
         self.status = 'cancelled'
         self.completed_at = timezone.now()
         self.save()
+        self._finish_live_progress()
+
+    def progress_reporter(self, **kwargs):
+        """返回缓冲写入的进度上报器，见 apps.tasks.progress"""
+        from apps.tasks.progress import ProgressReporter
+        return ProgressReporter(self, **kwargs)
+
+    def _finish_live_progress(self):
+        from apps.tasks.progress import finish_live_progress
+        finish_live_progress(self)
 
     @property
     def duration(self):
@@ -95,6 +114,9 @@ class TaskProgress(models.Model):
         verbose_name_plural = "任务进度"
         db_table = "task_progress"
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['task', 'timestamp']),
+        ]
 
     def __str__(self):
         return f"{self.task.name} - {self.progress}%"
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""
+任务进度上报
+
+原先每一步都执行 task.progress = N; task.save() 并插入一条 TaskProgress，
+一个任务产生多次整行 UPDATE 和 INSERT，绝大多数很快就被下一步覆盖。
+ProgressReporter 改为：
+
+- 实时进度写入缓存，轮询接口优先读取缓存（get_live_progress / apply_live_progress）
+- 数据库只在跨过里程碑（TASK_PROGRESS_MILESTONE 的整数倍）或距上次写入
+  超过 TASK_PROGRESS_FLUSH_INTERVAL 秒时写入：只更新 progress 一列，
+  期间缓冲的 TaskProgress 记录用一次 bulk_create 插入
+- 任务结束时 flush() 写入剩余内容，complete_* 清除缓存中的实时进度
+- 每次更新和任务结束都通过 utils.progress_events 发布事件，SSE 接口据此推送
+
+AsyncTask 和 SystemTask 都可以使用，TaskProgress 历史只对 AsyncTask 记录。
+
+使用方式：
+    from apps.tasks.progress import ProgressReporter
+
+    reporter = ProgressReporter(task)
+    reporter.update(30, '连接主机')
+    ...
+    reporter.flush()
+    task.complete_success(result)
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from utils.progress_events import publish
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_MILESTONE = 25
+# 实时进度在缓存中的保留时间，任务异常中断时自动过期
+LIVE_PROGRESS_TIMEOUT = 3600
+
+
+def _cache_key(model_label: str, pk) -> str:
+    return f'task_progress:{model_label.lower()}:{pk}'
+
+
+def live_progress_key(task) -> str:
+    return _cache_key(task._meta.label, task.pk)
+
+
+def progress_channel(task) -> str:
+    """任务进度事件频道"""
+    return f'task:{task._meta.label.lower()}:{task.pk}'
+
+
+def progress_payload(task, live: Optional[Dict] = None) -> Dict:
+    """任务进度的推送内容，live 为缓存中的实时进度"""
+    progress = task.progress or 0
+    if live and task.status == 'running':
+        progress = max(progress, live.get('progress', 0))
+    return {
+        'id': task.pk,
+        'status': task.status,
+        'progress': progress,
+        'message': live.get('message') if live else None,
+        'error_message': task.error_message,
+    }
+
+
+def get_live_progress(task) -> Optional[Dict]:
+    """读取任务的实时进度，没有时返回 None"""
+    return cache.get(live_progress_key(task))
+
+
+def apply_live_progress(tasks: Iterable) -> List:
+    """
+    用缓存中的实时进度覆盖一组任务的 progress（一次 get_many）
+
+    返回任务列表，便于在列表视图中直接使用
+    """
+    tasks = list(tasks)
+    if not tasks:
+        return tasks
+    keys = {live_progress_key(task): task for task in tasks}
+    for key, live in cache.get_many(list(keys)).items():
+        task = keys[key]
+        task.progress = max(task.progress or 0, live.get('progress', 0))
+        task.live_message = live.get('message')
+    return tasks
+
+
+def finish_live_progress(task):
+    """任务结束：清除缓存中的实时进度并推送最终状态"""
+    cache.delete(live_progress_key(task))
+    publish(progress_channel(task), progress_payload(task))
+
+
+class ProgressReporter:
+    """
+    缓冲并合并任务进度写入
+
+    进度只增不减；线程安全，可以在远程输出读取线程中调用 update。
+    """
+
+    def __init__(self, task, flush_interval: Optional[float] = None,
+                 milestone: Optional[int] = None):
+        self.task = task
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else getattr(settings, 'TASK_PROGRESS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        )
+        self.milestone = max(1, milestone or getattr(
+            settings, 'TASK_PROGRESS_MILESTONE', DEFAULT_MILESTONE
+        ))
+        self.progress = task.progress or 0
+        self._stored_progress = self.progress
+        self._pending: List = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._keeps_history = task._meta.label == 'tasks.AsyncTask'
+
+    def update(self, progress: int, message: Optional[str] = None, force: bool = False):
+        """
+        上报进度
+
+        参数:
+            progress: 进度 0-100，小于当前进度时只记录消息
+            message: 进度消息，会写入 TaskProgress 历史
+            force: 立即写入数据库
+        """
+        with self._lock:
+            progress = min(max(int(progress), 0), 100)
+            if progress > self.progress:
+                self.progress = progress
+                self.task.progress = progress
+            if message and self._keeps_history:
+                from apps.tasks.models import TaskProgress
+                self._pending.append(TaskProgress(
+                    task=self.task, progress=self.progress, message=message
+                ))
+
+            live = {
+                'progress': self.progress,
+                'message': message,
+                'updated_at': timezone.now().isoformat(),
+            }
+            cache.set(live_progress_key(self.task), live, LIVE_PROGRESS_TIMEOUT)
+            publish(progress_channel(self.task), progress_payload(self.task, live))
+
+            crossed = self.progress // self.milestone > self._stored_progress // self.milestone
+            elapsed = time.monotonic() - self._last_flush >= self.flush_interval
+            if force or crossed or elapsed:
+                self._flush()
+
+    def flush(self):
+        """写入缓冲的进度和历史（任务结束前调用）"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        if self.progress != self._stored_progress:
+            type(self.task).objects.filter(pk=self.task.pk).update(progress=self.progress)
+            self._stored_progress = self.progress
+        if pending:
+            from apps.tasks.models import TaskProgress
+            TaskProgress.objects.bulk_create(pending)
+        self._last_flush = time.monotonic()
@@ -0,0 +1,227 @@
+"""
+任务记录保留策略
+
+AsyncTask、TaskProgress、SystemTask 每个任务、每个进度步骤都会产生记录，
+从不清理，任务列表的分页和计数随表增长越来越慢。由 Celery beat 定时执行
+apply_task_retention：
+
+- 合并进度：结束超过 TASK_PROGRESS_COMPACT_DAYS 天的任务，多条 TaskProgress
+  合并为一条摘要（保留最后一条记录，消息替换为全部进度消息的汇总）
+- 归档：结束超过 TASK_RETENTION_DAYS 天的任务按主键分块写入
+  TASK_ARCHIVE_DIR 下的 gzip 压缩 JSONL 文件（AsyncTask 连同其进度记录），
+  每块写入并 flush 后再删除该块，中断时最多重复归档一块，不会丢失
+- 分块大小沿用 EXPIRY_SWEEP_CHUNK_SIZE，执行中的任务不受影响
+
+使用方式：
+    from apps.tasks.retention import run_task_retention
+
+    summary = run_task_retention()
+"""
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_COMPACT_DAYS = 1
+DEFAULT_CHUNK_SIZE = 1000
+LAST_RUN_CACHE_KEY = 'task_retention:last_run'
+FINISHED_STATUSES = ('success', 'failed', 'cancelled')
+# 合并后的进度摘要最多保留的字符数（保留末尾）
+MAX_SUMMARY_CHARS = 8000
+
+# 归档的模型及随任务一起归档的进度记录关联
+ARCHIVE_MODELS = (
+    ('tasks.AsyncTask', 'tasks.TaskProgress'),
+    ('operations.SystemTask', None),
+)
+
+
+def _chunk_size() -> int:
+    return getattr(settings, 'EXPIRY_SWEEP_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def _archive_dir() -> str:
+    return str(
+        getattr(settings, 'TASK_ARCHIVE_DIR', '')
+        or os.path.join(settings.BASE_DIR, 'archive', 'tasks')
+    )
+
+
+def _finished_before(cutoff: datetime) -> Q:
+    return Q(status__in=FINISHED_STATUSES) & (
+        Q(completed_at__lt=cutoff) | Q(completed_at__isnull=True, created_at__lt=cutoff)
+    )
+
+
+def _summarize(rows: List[Dict]) -> str:
+    lines = [
+        f"{row['timestamp']:%Y-%m-%d %H:%M:%S} {row['progress']}% {row['message']}"
+        for row in rows if row['message']
+    ]
+    summary = f"已合并 {len(rows)} 条进度记录\n" + '\n'.join(lines)
+    if len(summary) > MAX_SUMMARY_CHARS:
+        summary = '...\n' + summary[-MAX_SUMMARY_CHARS:]
+    return summary
+
+
+def compact_task_progress(now: Optional[datetime] = None,
+                          chunk_size: Optional[int] = None) -> Dict[str, int]:
+    """
+    合并已结束任务的进度记录
+
+    返回:
+        {'tasks': 合并的任务数, 'rows': 删除的进度记录数}
+    """
+    from apps.tasks.models import TaskProgress
+
+    now = now or timezone.now()
+    chunk_size = chunk_size or _chunk_size()
+    cutoff = now - timedelta(days=getattr(settings, 'TASK_PROGRESS_COMPACT_DAYS', DEFAULT_COMPACT_DAYS))
+    finished = Q(task__status__in=FINISHED_STATUSES, task__completed_at__lt=cutoff)
+    metrics = {'tasks': 0, 'rows': 0}
+    last_task_id = 0
+
+    while True:
+        task_ids = list(
+            TaskProgress.objects.filter(finished, task_id__gt=last_task_id)
+            .values('task_id').annotate(rows=Count('id')).filter(rows__gt=1)
+            .order_by('task_id').values_list('task_id', flat=True)[:chunk_size]
+        )
+        if not task_ids:
+            break
+
+        groups: Dict[int, List[Dict]] = {}
+        for row in (TaskProgress.objects.filter(task_id__in=task_ids)
+                    .order_by('task_id', 'timestamp', 'pk')
+                    .values('id', 'task_id', 'progress', 'message', 'timestamp')):
+            groups.setdefault(row['task_id'], []).append(row)
+
+        kept = [
+            TaskProgress(id=rows[-1]['id'], message=_summarize(rows))
+            for rows in groups.values()
+        ]
+        with transaction.atomic():
+            deleted = TaskProgress.objects.filter(task_id__in=task_ids).exclude(
+                id__in=[row.id for row in kept]
+            ).delete()[1].get(TaskProgress._meta.label, 0)
+            TaskProgress.objects.bulk_update(kept, ['message'], batch_size=500)
+
+        metrics['tasks'] += len(kept)
+        metrics['rows'] += deleted
+        last_task_id = task_ids[-1]
+        if len(task_ids) < chunk_size:
+            break
+    return metrics
+
+
+def archive_tasks(label: str, children: Optional[str] = None,
+                  now: Optional[datetime] = None, chunk_size: Optional[int] = None,
+                  archive_dir: Optional[str] = None) -> Dict:
+    """
+    归档并删除已结束超过保留期的任务
+
+    参数:
+        label: 任务模型标签
+        children: 随任务一起归档的进度记录模型标签（外键名为 task）
+
+    返回:
+        {'model', 'rows', 'file'}，没有需要归档的记录时 file 为 None
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or _chunk_size()
+    archive_dir = archive_dir or _archive_dir()
+    model = apps.get_model(label)
+    child_model = apps.get_model(children) if children else None
+    cutoff = now - timedelta(days=getattr(settings, 'TASK_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+    condition = _finished_before(cutoff)
+    result = {'model': label, 'rows': 0, 'file': None}
+    handle = None
+    last_pk = 0
+
+    try:
+        while True:
+            records = list(
+                model.objects.filter(condition, pk__gt=last_pk).order_by('pk').values()[:chunk_size]
+            )
+            if not records:
+                break
+            pks = [record['id'] for record in records]
+
+            if child_model is not None:
+                updates: Dict[int, List[Dict]] = {}
+                for row in (child_model.objects.filter(task_id__in=pks)
+                            .order_by('timestamp', 'pk')
+                            .values('progress', 'message', 'timestamp', 'task_id')):
+                    updates.setdefault(row.pop('task_id'), []).append(row)
+                for record in records:
+                    record['progress_updates'] = updates.get(record['id'], [])
+
+            if handle is None:
+                os.makedirs(archive_dir, exist_ok=True)
+                result['file'] = os.path.join(
+                    archive_dir, f"{model._meta.db_table}-{now:%Y%m%d-%H%M%S}.jsonl.gz"
+                )
+                handle = gzip.open(result['file'], 'at', encoding='utf-8')
+            for record in records:
+                handle.write(json.dumps(record, default=str, ensure_ascii=False) + '\n')
+            # 先落盘再删除，中断时最多重复归档这一块
+            handle.flush()
+
+            model.objects.filter(pk__in=pks).delete()
+            result['rows'] += len(pks)
+            last_pk = pks[-1]
+            if len(pks) < chunk_size:
+                break
+    finally:
+        if handle is not None:
+            handle.close()
+    return result
+
+
+def run_task_retention(now: Optional[datetime] = None) -> Dict:
+    """
+    执行任务保留策略：先合并进度记录，再归档过期任务
+
+    返回:
+        {'compacted_tasks', 'compacted_rows', 'archived': [...], 'duration', 'errors'}
+    """
+    now = now or timezone.now()
+    started = time.monotonic()
+    summary = {'compacted_tasks': 0, 'compacted_rows': 0, 'archived': [], 'errors': []}
+
+    try:
+        compacted = compact_task_progress(now)
+        summary['compacted_tasks'] = compacted['tasks']
+        summary['compacted_rows'] = compacted['rows']
+    except Exception as e:
+        logger.error(f"合并任务进度记录失败: {str(e)}", exc_info=True)
+        summary['errors'].append(str(e))
+
+    for label, children in ARCHIVE_MODELS:
+        try:
+            summary['archived'].append(archive_tasks(label, children, now))
+        except Exception as e:
+            logger.error(f"归档任务记录失败: {label}, 错误: {str(e)}", exc_info=True)
+            summary['errors'].append(f'{label}: {str(e)}')
+
+    summary['duration'] = round(time.monotonic() - started, 3)
+    archived = ', '.join(f"{item['model']} {item['rows']} 条" for item in summary['archived'])
+    logger.info(
+        f"任务保留策略执行完成: 合并 {summary['compacted_tasks']} 个任务的进度记录"
+        f"（删除 {summary['compacted_rows']} 条）, 归档 {archived}, 耗时 {summary['duration']} 秒"
+    )
+    cache.set(LAST_RUN_CACHE_KEY, {'finished_at': timezone.now().isoformat(), **summary}, None)
+    return summary
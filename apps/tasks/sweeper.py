@@ -0,0 +1,183 @@
+"""
+过期数据清理
+
+统一处理各模型的过期记录，由 Celery beat 定时执行 sweep_expired_records：
+
+- 每条规则按索引字段筛选过期记录，按主键分块（EXPIRY_SWEEP_CHUNK_SIZE）
+  执行集合式 UPDATE 或 DELETE，不逐条 save()
+- 每条规则记录处理行数和耗时，最近一次结果写入缓存供查看
+- 新的过期规则通过 register_sweep 注册
+
+使用方式：
+    from apps.tasks.sweeper import run_sweeps
+
+    metrics = run_sweeps()             # 全部规则
+    metrics = run_sweeps(['active_sessions'])
+"""
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_RETENTION_DAYS = 7
+LAST_RUN_CACHE_KEY = 'expiry_sweeper:last_run'
+
+ACTION_UPDATE = 'update'
+ACTION_DELETE = 'delete'
+
+
+@dataclass
+class SweepRule:
+    """
+    一条过期规则
+
+    属性:
+        name: 规则名称
+        model: 模型标签，如 'operations.RdpDomainRoute'
+        condition: condition(now) -> Q，筛选需要处理的记录（应命中索引）
+        action: ACTION_UPDATE 或 ACTION_DELETE
+        values: values(now) -> dict，ACTION_UPDATE 时写入的字段
+    """
+    name: str
+    model: str
+    condition: Callable[[datetime], Q]
+    action: str = ACTION_DELETE
+    values: Optional[Callable[[datetime], Dict]] = None
+
+
+@dataclass
+class SweepMetrics:
+    name: str
+    rows: int = 0
+    chunks: int = 0
+    duration: float = 0.0
+    error: str = ''
+
+
+_rules: Dict[str, SweepRule] = {}
+
+
+def register_sweep(rule: SweepRule) -> SweepRule:
+    _rules[rule.name] = rule
+    return rule
+
+
+def get_sweep_rules() -> List[SweepRule]:
+    return list(_rules.values())
+
+
+def _retention() -> timedelta:
+    return timedelta(days=getattr(settings, 'EXPIRY_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+
+
+def run_sweep(rule: SweepRule, now: Optional[datetime] = None,
+              chunk_size: Optional[int] = None) -> SweepMetrics:
+    """执行单条规则，直到没有符合条件的记录"""
+    now = now or timezone.now()
+    chunk_size = chunk_size or getattr(settings, 'EXPIRY_SWEEP_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    model = apps.get_model(rule.model)
+    metrics = SweepMetrics(rule.name)
+    started = time.monotonic()
+
+    try:
+        condition = rule.condition(now)
+        values = rule.values(now) if rule.values else {}
+        last_pk = None
+        while True:
+            qs = model.objects.filter(condition)
+            if last_pk is not None:
+                qs = qs.filter(pk__gt=last_pk)
+            pks = list(qs.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            chunk = model.objects.filter(pk__in=pks)
+            if rule.action == ACTION_UPDATE:
+                metrics.rows += chunk.update(**values)
+            else:
+                metrics.rows += chunk.delete()[1].get(model._meta.label, 0)
+            metrics.chunks += 1
+            last_pk = pks[-1]
+            if len(pks) < chunk_size:
+                break
+    except Exception as e:
+        logger.error(f"过期清理规则 {rule.name} 执行失败: {str(e)}", exc_info=True)
+        metrics.error = str(e)
+
+    metrics.duration = round(time.monotonic() - started, 3)
+    return metrics
+
+
+def run_sweeps(names: Optional[Iterable[str]] = None) -> List[SweepMetrics]:
+    """
+    执行过期规则
+
+    参数:
+        names: 要执行的规则名称，默认全部
+    """
+    rules = get_sweep_rules() if names is None else [_rules[name] for name in names]
+    now = timezone.now()
+    results = []
+    for rule in rules:
+        metrics = run_sweep(rule, now)
+        results.append(metrics)
+        if metrics.rows or metrics.error:
+            logger.info(
+                f"过期清理: 规则={metrics.name}, 处理 {metrics.rows} 行, "
+                f"{metrics.chunks} 批, 耗时 {metrics.duration} 秒"
+            )
+    cache.set(LAST_RUN_CACHE_KEY, {
+        'finished_at': timezone.now().isoformat(),
+        'rules': [asdict(m) for m in results],
+    }, None)
+    return results
+
+
+# RDP 临时域名：过期即停用，停用超过保留期后删除
+register_sweep(SweepRule(
+    name='rdp_domain_routes',
+    model='operations.RdpDomainRoute',
+    condition=lambda now: Q(is_active=True, expires_at__lt=now),
+    action=ACTION_UPDATE,
+    values=lambda now: {'is_active': False},
+))
+register_sweep(SweepRule(
+    name='rdp_domain_routes_purge',
+    model='operations.RdpDomainRoute',
+    condition=lambda now: Q(is_active=False, expires_at__lt=now - _retention()),
+))
+
+# 邀请令牌：过期或用完即停用
+register_sweep(SweepRule(
+    name='invitation_tokens',
+    model='operations.ProductInvitationToken',
+    condition=lambda now: Q(is_active=True) & (
+        Q(expires_at__lt=now) | Q(max_uses__gt=0, used_count__gte=F('max_uses'))
+    ),
+    action=ACTION_UPDATE,
+    values=lambda now: {'is_active': False, 'updated_at': now},
+))
+
+# 产品访问授权不在这里处理：过期由 expires_at 判断（已建索引），
+# is_revoked 只表示管理员撤销，界面上“已撤销”和“已过期”是两种状态
+
+# 引导会话与初始令牌
+register_sweep(SweepRule(
+    name='active_sessions',
+    model='bootstrap.ActiveSession',
+    condition=lambda now: Q(expires_at__lt=now),
+))
+register_sweep(SweepRule(
+    name='initial_tokens',
+    model='bootstrap.InitialToken',
+    condition=lambda now: Q(expires_at__lt=now - _retention()),
+))
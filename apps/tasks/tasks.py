@@ -0,0 +1,21 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger("2c2a")
+
+
+@shared_task
+def sweep_expired_records(names=None):
+    """定时清理各模型的过期记录，返回每条规则的处理行数和耗时"""
+    from dataclasses import asdict
+    from apps.tasks.sweeper import run_sweeps
+
+    return [asdict(m) for m in run_sweeps(names)]
+
+
+@shared_task
+def apply_task_retention():
+    """定时合并已结束任务的进度记录，并归档、删除超过保留期的任务"""
+    from apps.tasks.retention import run_task_retention
+
+    return run_task_retention()
@@ -0,0 +1,298 @@
+import json
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.bootstrap.models import ActiveSession, InitialToken
+from apps.hosts.models import Host
+from apps.operations.models import (
+    Product, ProductAccessGrant, ProductInvitationToken, RdpDomainRoute,
+)
+from apps.tasks.models import AsyncTask, TaskProgress
+from apps.tasks.progress import ProgressReporter, apply_live_progress, get_live_progress
+from apps.tasks.sweeper import LAST_RUN_CACHE_KEY, run_sweeps
+
+
+@pytest.mark.django_db
+class TestExpirySweeper:
+    def setup_method(self):
+        self.host = Host(name='sweep', hostname='sweep.local', username='admin')
+        self.host.password = 'secret'
+        self.host.save()
+        self.product = Product.objects.create(
+            name='sweep', display_name='sweep', host=self.host, display_hostname='sweep.local'
+        )
+        self.user = get_user_model().objects.create_user(
+            username='sweeper', email='sweeper@test.com', password='testpass123'
+        )
+        self.now = timezone.now()
+
+    def test_rdp_routes_deactivated_in_chunks_and_purged(self, settings):
+        settings.EXPIRY_SWEEP_CHUNK_SIZE = 2
+        for i in range(5):
+            RdpDomainRoute.objects.create(
+                domain=f'expired{i}.rdp', product=self.product, assigned_to=self.user,
+                expires_at=self.now - timedelta(minutes=1),
+            )
+        RdpDomainRoute.objects.create(
+            domain='live.rdp', product=self.product, assigned_to=self.user,
+            expires_at=self.now + timedelta(minutes=10),
+        )
+        RdpDomainRoute.objects.create(
+            domain='old.rdp', product=self.product, assigned_to=self.user,
+            is_active=False, expires_at=self.now - timedelta(days=30),
+        )
+
+        metrics = {m.name: m for m in run_sweeps(['rdp_domain_routes', 'rdp_domain_routes_purge'])}
+
+        assert metrics['rdp_domain_routes'].rows == 5
+        assert metrics['rdp_domain_routes'].chunks == 3
+        assert metrics['rdp_domain_routes_purge'].rows == 1
+        assert list(RdpDomainRoute.objects.filter(is_active=True).values_list(
+            'domain', flat=True)) == ['live.rdp']
+        assert not RdpDomainRoute.objects.filter(domain='old.rdp').exists()
+        assert RdpDomainRoute.objects.count() == 6
+
+    def test_invitation_tokens(self):
+        expired = ProductInvitationToken.objects.create(
+            token='expired', product=self.product, created_by=self.user,
+            expires_at=self.now - timedelta(hours=1),
+        )
+        exhausted = ProductInvitationToken.objects.create(
+            token='exhausted', product=self.product, created_by=self.user,
+            max_uses=2, used_count=2, expires_at=self.now + timedelta(days=1),
+        )
+        valid = ProductInvitationToken.objects.create(
+            token='valid', product=self.product, created_by=self.user,
+            max_uses=0, used_count=5, expires_at=self.now + timedelta(days=1),
+        )
+        grant = ProductAccessGrant.objects.create(
+            user=self.user, product=self.product, expires_at=self.now - timedelta(hours=2)
+        )
+
+        run_sweeps()
+
+        expired.refresh_from_db()
+        exhausted.refresh_from_db()
+        valid.refresh_from_db()
+        grant.refresh_from_db()
+        assert not expired.is_active
+        assert not exhausted.is_active
+        assert valid.is_active
+        # 过期的授权保持“已过期”，不会被改写为管理员撤销
+        assert not grant.is_revoked and grant.revoked_at is None
+        assert not grant.is_effective()
+
+    def test_bootstrap_records_deleted_and_metrics_cached(self):
+        ActiveSession.objects.create(
+            session_token='old', host=self.host, bound_ip='127.0.0.1',
+            expires_at=self.now - timedelta(minutes=1),
+        )
+        ActiveSession.objects.create(
+            session_token='live', host=self.host, bound_ip='127.0.0.1',
+            expires_at=self.now + timedelta(minutes=30),
+        )
+        InitialToken.objects.create(
+            token='stale', host=self.host, expires_at=self.now - timedelta(days=8)
+        )
+        InitialToken.objects.create(
+            token='recent', host=self.host, expires_at=self.now - timedelta(days=1)
+        )
+
+        run_sweeps()
+
+        assert list(ActiveSession.objects.values_list('pk', flat=True)) == ['live']
+        assert list(InitialToken.objects.values_list('pk', flat=True)) == ['recent']
+        last_run = cache.get(LAST_RUN_CACHE_KEY)
+        rows = {r['name']: r['rows'] for r in last_run['rules']}
+        assert rows['active_sessions'] == 1
+        assert rows['initial_tokens'] == 1
+        assert all(not r['error'] for r in last_run['rules'])
+
+
+@pytest.mark.django_db
+class TestProgressReporter:
+    def setup_method(self):
+        self.task = AsyncTask.objects.create(task_id='progress-1', name='progress', status='running')
+
+    def _stored(self):
+        return AsyncTask.objects.get(pk=self.task.pk).progress
+
+    def test_writes_db_only_at_milestones(self):
+        reporter = ProgressReporter(self.task, flush_interval=3600, milestone=25)
+        for step in range(1, 21):
+            reporter.update(step, f'step {step}')
+
+        assert get_live_progress(self.task)['progress'] == 20
+        assert self._stored() == 0
+        assert not TaskProgress.objects.filter(task=self.task).exists()
+
+        reporter.update(26, 'milestone')
+        assert self._stored() == 26
+        assert TaskProgress.objects.filter(task=self.task).count() == 21
+
+        reporter.update(27)
+        reporter.update(10, 'late message')
+        assert self.task.progress == 27
+        reporter.flush()
+        assert self._stored() == 27
+        assert TaskProgress.objects.filter(task=self.task).count() == 22
+
+    def test_interval_flush_and_completion_clears_live_progress(self):
+        reporter = ProgressReporter(self.task, flush_interval=0, milestone=100)
+        reporter.update(5)
+        assert self._stored() == 5
+
+        other = AsyncTask.objects.create(task_id='progress-2', name='other', status='running')
+        tasks = apply_live_progress(AsyncTask.objects.filter(pk__in=[self.task.pk, other.pk]))
+        assert {t.pk: t.progress for t in tasks} == {self.task.pk: 5, other.pk: 0}
+
+        self.task.complete_success({'ok': True})
+        assert get_live_progress(self.task) is None
+        assert self._stored() == 100
+
+
+@pytest.mark.django_db
+def test_task_progress_stream_pushes_reporter_updates(client):
+    user = get_user_model().objects.create_user(
+        username='streamer', email='streamer@test.com', password='testpass123'
+    )
+    task = AsyncTask.objects.create(
+        task_id='stream-1', name='stream', status='running', created_by=user
+    )
+    client.force_login(user)
+    response = client.get(f'/operations/async-tasks/{task.task_id}/progress/stream/')
+    assert response['Content-Type'] == 'text/event-stream'
+    chunks = (c.decode() for c in response.streaming_content)
+    next(chunks)
+    assert '"progress": 0' in next(chunks)
+
+    ProgressReporter(task, flush_interval=3600).update(40, '执行中')
+    assert '"progress": 40' in next(chunks)
+    task.complete_success()
+    final = next(chunks)
+    assert '"status": "success"' in final and '"progress": 100' in final
+    assert list(chunks) == []
+
+
+
+@pytest.mark.django_db
+class TestTaskRetention:
+    def setup_method(self):
+        self.now = timezone.now()
+
+    def _task(self, task_id, status='success', age_days=0, progress_rows=0):
+        task = AsyncTask.objects.create(task_id=task_id, name=task_id, status=status)
+        finished_at = self.now - timedelta(days=age_days)
+        AsyncTask.objects.filter(pk=task.pk).update(
+            completed_at=finished_at if status != 'running' else None,
+            created_at=finished_at,
+        )
+        TaskProgress.objects.bulk_create([
+            TaskProgress(task=task, progress=i * 10, message=f'{task_id} step {i}')
+            for i in range(progress_rows)
+        ])
+        return task
+
+    def test_compacts_finished_task_progress_into_summary(self, settings):
+        from apps.tasks.retention import compact_task_progress
+
+        settings.TASK_PROGRESS_COMPACT_DAYS = 1
+        old = self._task('old', age_days=2, progress_rows=4)
+        running = self._task('running', status='running', age_days=2, progress_rows=3)
+        recent = self._task('recent', age_days=0, progress_rows=3)
+
+        metrics = compact_task_progress(self.now, chunk_size=1)
+
+        assert metrics == {'tasks': 1, 'rows': 3}
+        summary = TaskProgress.objects.get(task=old)
+        assert summary.message.startswith('已合并 4 条进度记录')
+        assert 'old step 0' in summary.message and 'old step 3' in summary.message
+        assert TaskProgress.objects.filter(task=running).count() == 3
+        assert TaskProgress.objects.filter(task=recent).count() == 3
+        # 已合并的任务不会再次处理
+        assert compact_task_progress(self.now) == {'tasks': 0, 'rows': 0}
+
+    def test_archives_old_tasks_to_jsonl_and_deletes_in_chunks(self, settings, tmp_path):
+        import gzip
+
+        from apps.operations.models import SystemTask
+        from apps.tasks.retention import run_task_retention
+
+        settings.TASK_RETENTION_DAYS = 30
+        settings.TASK_ARCHIVE_DIR = str(tmp_path)
+        settings.EXPIRY_SWEEP_CHUNK_SIZE = 2
+        for i in range(3):
+            self._task(f'archived-{i}', age_days=40, progress_rows=2)
+        self._task('kept', age_days=5)
+        self._task('stuck', status='running', age_days=40)
+        system_task = SystemTask.objects.create(name='old', task_type='cleanup', status='failed')
+        SystemTask.objects.filter(pk=system_task.pk).update(
+            completed_at=self.now - timedelta(days=40)
+        )
+
+        summary = run_task_retention(self.now)
+
+        archived = {item['model']: item for item in summary['archived']}
+        assert archived['tasks.AsyncTask']['rows'] == 3
+        assert archived['operations.SystemTask']['rows'] == 1
+        assert set(AsyncTask.objects.values_list('task_id', flat=True)) == {'kept', 'stuck'}
+        assert not SystemTask.objects.exists()
+        assert not TaskProgress.objects.filter(task__task_id__startswith='archived').exists()
+
+        with gzip.open(archived['tasks.AsyncTask']['file'], 'rt', encoding='utf-8') as fh:
+            records = [json.loads(line) for line in fh]
+        assert [r['task_id'] for r in records] == ['archived-0', 'archived-1', 'archived-2']
+        # 归档前进度记录已合并为一条摘要
+        assert len(records[0]['progress_updates']) == 1
+        assert records[0]['progress_updates'][0]['message'].startswith('已合并 2 条进度记录')
+        assert summary['errors'] == []
+
+class TestCeleryRouting:
+    def test_every_task_is_routed_to_a_known_queue(self):
+        from config.celery import QUEUES, TASK_QUEUES, app
+
+        app.loader.import_default_modules()
+        names = {
+            name for name in app.tasks
+            if name.startswith(('apps.', 'plugins.'))
+        }
+        # 路由表只能引用真实存在的任务名（插件未启用时其任务不会注册）
+        assert {n for n in TASK_QUEUES if n.startswith('apps.')} <= names
+        assert names <= set(TASK_QUEUES)
+        for name in names:
+            route = app.amqp.router.route({}, name)
+            assert route['queue'].name in QUEUES
+
+    def test_django_startup_loads_project_app(self):
+        # 不显式导入 config.celery：Web 进程中 shared_task 必须绑定到项目的 Celery 应用
+        from celery import current_app
+
+        from apps.operations.tasks import provision_account_request
+
+        assert current_app.main == '2c2a'
+        assert provision_account_request.app is current_app._get_current_object()
+        route = current_app.amqp.router.route({}, 'apps.operations.tasks.provision_account_request')
+        assert route['queue'].name == 'interactive'
+
+    def test_interactive_tasks_do_not_share_bulk_queue(self):
+        from config.celery import app
+
+        def queue(name):
+            return app.amqp.router.route({}, name)['queue'].name
+
+        assert queue('apps.operations.tasks.reset_user_password') == 'interactive'
+        assert queue('apps.hosts.tasks.test_winrm_connection') == 'interactive'
+        assert queue('apps.operations.tasks.cleanup_inactive_users') == 'bulk'
+        assert queue('plugins.beta_push.tasks.push_to_beta') == 'bulk'
+
+    def test_worker_command_builds_profile_argv(self):
+        from apps.tasks.management.commands.celery_worker import build_worker_argv
+
+        argv = build_worker_argv('bulk', concurrency=3)
+        assert argv[argv.index('-Q') + 1] == 'bulk'
+        assert argv[argv.index('-c') + 1] == '3'
+        assert argv[argv.index('--prefetch-multiplier') + 1] == '1'
@@ -1,3 +1,7 @@
 """
 2c2a配置模块
 """
+# 确保 Django 启动时加载 Celery 应用，shared_task 绑定到该应用（队列路由、优先级、broker 配置）
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from kombu import Queue
 from django.conf import settings
 
 # 设置Django环境
@@ -21,12 +22,122 @@ app.conf.update(
 )
 
 # 队列配置
+#
+# 按延迟要求划分通道，而不是按应用划分：
+#   interactive  用户在页面上等待结果的单个操作（重置密码、连接测试、单个开户）
+#   default      单台主机上的管理操作（配置 WinRM、安装证书）
+#   periodic     beat 定时任务（过期清理、健康巡检、发件箱投递）
+#   bulk         批量任务（批量开户、清理非活跃用户、内测推送、主机组脚本）
+# 批量任务再多也只会在 bulk 队列中排队，不会挡住 interactive 队列。
+# 生产环境按 WORKER_PROFILES 分别启动 worker（python manage.py celery_worker <profile>），
+# 未指定 -Q 的 worker 消费全部队列，interactive 最先被取出。
+QUEUE_INTERACTIVE = 'interactive'
+QUEUE_DEFAULT = 'default'
+QUEUE_PERIODIC = 'periodic'
+QUEUE_BULK = 'bulk'
+
+# 队列顺序即同一 worker 消费多个队列时的取用顺序
+QUEUES = (QUEUE_INTERACTIVE, QUEUE_DEFAULT, QUEUE_PERIODIC, QUEUE_BULK)
+
+# 消息优先级（Redis 传输：数值越小越先执行）
+QUEUE_PRIORITIES = {
+    QUEUE_INTERACTIVE: 0,
+    QUEUE_DEFAULT: 3,
+    QUEUE_PERIODIC: 6,
+    QUEUE_BULK: 9,
+}
+
+TASK_QUEUES = {
+    # 交互通道
+    'apps.operations.tasks.reset_user_password': QUEUE_INTERACTIVE,
+    'apps.operations.tasks.process_opening_request': QUEUE_INTERACTIVE,
+    'apps.operations.tasks.provision_account_request': QUEUE_INTERACTIVE,
+    'apps.operations.tasks.allocate_rdp_domain': QUEUE_INTERACTIVE,
+    'apps.hosts.tasks.test_winrm_connection': QUEUE_INTERACTIVE,
+    'apps.hosts.tasks.test_host_connection': QUEUE_INTERACTIVE,
+    'apps.hosts.tasks.refresh_host_inventory': QUEUE_INTERACTIVE,
+    'apps.bootstrap.tasks.generate_bootstrap_config': QUEUE_INTERACTIVE,
+    # 单主机管理操作
+    'apps.hosts.tasks.configure_winrm_on_host': QUEUE_DEFAULT,
+    'apps.hosts.tasks.install_certificates_on_host': QUEUE_DEFAULT,
+    'apps.bootstrap.tasks.initialize_host_bootstrap': QUEUE_DEFAULT,
+    # 定时任务
+    'apps.operations.tasks.dispatch_provisioning_outbox': QUEUE_PERIODIC,
+    'apps.operations.tasks.cleanup_expired_rdp_domains': QUEUE_PERIODIC,
+    'apps.bootstrap.tasks.cleanup_expired_sessions': QUEUE_PERIODIC,
+    'apps.bootstrap.tasks.cleanup_expired_initial_tokens': QUEUE_PERIODIC,
+    'apps.tasks.tasks.sweep_expired_records': QUEUE_PERIODIC,
+    'apps.tasks.tasks.apply_task_retention': QUEUE_PERIODIC,
+    'apps.hosts.tasks.sweep_host_health': QUEUE_PERIODIC,
+    # 批量通道
+    'apps.operations.tasks.batch_process_opening_requests': QUEUE_BULK,
+    'apps.operations.tasks.cleanup_inactive_users': QUEUE_BULK,
+    'apps.operations.tasks.reconcile_cloud_user_status': QUEUE_BULK,
+    'apps.hosts.tasks.execute_script_on_hosts': QUEUE_BULK,
+    'apps.hosts.tasks.refresh_all_host_inventories': QUEUE_BULK,
+    'plugins.beta_push.tasks.push_to_beta': QUEUE_BULK,
+}
+
+app.conf.task_queues = tuple(Queue(name) for name in QUEUES)
+app.conf.task_default_queue = QUEUE_DEFAULT
+app.conf.task_default_priority = QUEUE_PRIORITIES[QUEUE_DEFAULT]
 app.conf.task_routes = {
-    'certificates.tasks.*': {'queue': 'certificates'},
-    'hosts.tasks.*': {'queue': 'hosts'},
-    'operations.tasks.*': {'queue': 'operations'},
-    'bootstrap.tasks.*': {'queue': 'bootstrap'},
-    'plugins.beta_push.tasks.*': {'queue': 'beta_push'},
+    name: {'queue': queue, 'priority': QUEUE_PRIORITIES[queue]}
+    for name, queue in TASK_QUEUES.items()
+}
+
+# worker 配置：prefetch 只能按 worker 设置，因此按通道分别启动 worker
+#   queues       消费的队列
+#   concurrency  并发进程数
+#   prefetch     每个进程预取的消息数，长任务设为 1，避免一个进程囤积多个批量任务
+#   max_tasks_per_child  进程执行多少个任务后重启，释放长任务占用的内存
+WORKER_PROFILES = {
+    'interactive': {
+        'queues': [QUEUE_INTERACTIVE],
+        'concurrency': getattr(settings, 'WORKER_INTERACTIVE_CONCURRENCY', 8),
+        'prefetch': getattr(settings, 'WORKER_INTERACTIVE_PREFETCH', 1),
+        'max_tasks_per_child': 1000,
+    },
+    'default': {
+        'queues': [QUEUE_DEFAULT, QUEUE_PERIODIC],
+        'concurrency': getattr(settings, 'WORKER_DEFAULT_CONCURRENCY', 4),
+        'prefetch': getattr(settings, 'WORKER_DEFAULT_PREFETCH', 4),
+        'max_tasks_per_child': 500,
+    },
+    'bulk': {
+        'queues': [QUEUE_BULK],
+        'concurrency': getattr(settings, 'WORKER_BULK_CONCURRENCY', 2),
+        'prefetch': getattr(settings, 'WORKER_BULK_PREFETCH', 1),
+        'max_tasks_per_child': 50,
+    },
+    # 单机部署：一个 worker 消费全部队列
+    'all': {
+        'queues': list(QUEUES),
+        'concurrency': getattr(settings, 'WORKER_DEFAULT_CONCURRENCY', 4),
+        'prefetch': 1,
+        'max_tasks_per_child': 200,
+    },
+}
+
+# 定时任务
+app.conf.beat_schedule = {
+    'dispatch-provisioning-outbox': {
+        'task': 'apps.operations.tasks.dispatch_provisioning_outbox',
+        'schedule': 60.0,
+    },
+    'sweep-expired-records': {
+        'task': 'apps.tasks.tasks.sweep_expired_records',
+        'schedule': float(getattr(settings, 'EXPIRY_SWEEP_INTERVAL', 300)),
+    },
+    'apply-task-retention': {
+        'task': 'apps.tasks.tasks.apply_task_retention',
+        'schedule': float(getattr(settings, 'TASK_RETENTION_INTERVAL', 3600)),
+    },
+    # 每次只探测到期的主机，实际探测间隔由 HOST_HEALTH_MIN/MAX_INTERVAL 自适应
+    'sweep-host-health': {
+        'task': 'apps.hosts.tasks.sweep_host_health',
+        'schedule': float(getattr(settings, 'HOST_HEALTH_SWEEP_TICK', 15)),
+    },
 }
 
 # 任务重试配置
@@ -11,6 +11,7 @@ DEMO 模式（2C2A_DEMO=1）会强制锁定特定配置，不受 .env 影响。
 
 import os
 import importlib
+import shlex
 from pathlib import Path
 from django.core.exceptions import ImproperlyConfigured
 
@@ -310,6 +311,55 @@ CORS_ALLOWED_ORIGINS = [
 # Winrm settings
 WINRM_TIMEOUT = int(_env('WINRM_TIMEOUT', '30'))  # Winrm连接超时时间（秒）
 WINRM_MAX_RETRIES = int(_env('WINRM_RETRY_COUNT', '3'))  # Winrm连接最大重试次数
+WINRM_POOL_MAX_PER_HOST = int(_env('WINRM_POOL_MAX_PER_HOST', '4'))  # 每主机最大复用会话数
+WINRM_POOL_IDLE_TIMEOUT = int(_env('WINRM_POOL_IDLE_TIMEOUT', '300'))  # 空闲会话淘汰时间（秒）
+WINRM_POOL_MAX_LIFETIME = int(_env('WINRM_POOL_MAX_LIFETIME', '3600'))  # 会话最大生命周期（秒）
+WINRM_POOL_ACQUIRE_TIMEOUT = int(_env('WINRM_POOL_ACQUIRE_TIMEOUT', '30'))  # 等待空闲会话的最长时间（秒）
+HOST_EXECUTOR_CONCURRENCY = int(_env('HOST_EXECUTOR_CONCURRENCY', '16'))  # 主机组并行执行的默认并发数
+WINRM_RETRY_BACKOFF_BASE = float(_env('WINRM_RETRY_BACKOFF_BASE', '1'))  # 重试退避基准时间（秒）
+WINRM_RETRY_BACKOFF_MAX = float(_env('WINRM_RETRY_BACKOFF_MAX', '10'))  # 重试退避最长时间（秒）
+WINRM_CIRCUIT_ENABLED = _env('WINRM_CIRCUIT_ENABLED', 'True').lower() in ('true', '1', 'yes')  # 是否启用主机熔断
+WINRM_CIRCUIT_FAILURE_THRESHOLD = int(_env('WINRM_CIRCUIT_FAILURE_THRESHOLD', '3'))  # 连续失败多少次后熔断
+WINRM_CIRCUIT_RESET_TIMEOUT = int(_env('WINRM_CIRCUIT_RESET_TIMEOUT', '30'))  # 首次熔断时长（秒）
+WINRM_CIRCUIT_MAX_RESET_TIMEOUT = int(_env('WINRM_CIRCUIT_MAX_RESET_TIMEOUT', '600'))  # 最长熔断时长（秒）
+HOST_MAX_CONCURRENT_OPERATIONS = int(_env('HOST_MAX_CONCURRENT_OPERATIONS', '5'))  # 每台主机同时进行的远程操作数（0 不限制）
+HOST_SLOT_WAIT_TIMEOUT = int(_env('HOST_SLOT_WAIT_TIMEOUT', '120'))  # 等待主机并发槽位的最长时间（秒）
+HOST_SLOT_LEASE_TIMEOUT = int(_env('HOST_SLOT_LEASE_TIMEOUT', '1800'))  # 槽位租约，持有进程异常退出后到期释放（秒）
+DNS_CACHE_TTL = int(_env('DNS_CACHE_TTL', '300'))  # 主机名解析结果缓存时间（秒）
+DNS_CACHE_NEGATIVE_TTL = int(_env('DNS_CACHE_NEGATIVE_TTL', '30'))  # 解析失败的缓存时间（秒）
+DNS_CACHE_REFRESH_AHEAD = float(_env('DNS_CACHE_REFRESH_AHEAD', '0.8'))  # 超过 TTL 的该比例后后台预刷新，0 关闭
+HOST_INVENTORY_TTL = int(_env('HOST_INVENTORY_TTL', '600'))  # 主机资产快照（用户/磁盘）缓存时间（秒）
+HOST_INVENTORY_REFRESH_AHEAD = float(_env('HOST_INVENTORY_REFRESH_AHEAD', '0.8'))  # 超过 TTL 的该比例后后台刷新，0 关闭
+LOCAL_POWERSHELL_WORKERS = int(_env('LOCAL_POWERSHELL_WORKERS', '2'))  # 本地WinServer常驻PowerShell进程数，0 关闭
+LOCAL_POWERSHELL_MAX_REQUESTS = int(_env('LOCAL_POWERSHELL_MAX_REQUESTS', '500'))  # 常驻进程处理多少个请求后重启
+LOCAL_POWERSHELL_WORKER_COMMAND = shlex.split(_env('LOCAL_POWERSHELL_WORKER_COMMAND', '')) or None  # 自定义常驻进程命令行，默认 powershell.exe
+OPENING_BATCH_CONCURRENCY = int(_env('OPENING_BATCH_CONCURRENCY', '16'))  # 批量开户的总并发数
+OPENING_BATCH_PER_HOST = int(_env('OPENING_BATCH_PER_HOST', '2'))  # 批量开户时单台主机的并发上限
+OPENING_BATCH_RESULT_TIMEOUT = int(_env('OPENING_BATCH_RESULT_TIMEOUT', '900'))  # 批量开户等待下一个结果的最长时间（秒），超时后剩余申请记为失败
+PLACEMENT_METRICS_TTL = int(_env('PLACEMENT_METRICS_TTL', '60'))  # 开户放置指标快照刷新间隔（秒）
+PLACEMENT_MAX_USERS_PER_HOST = int(_env('PLACEMENT_MAX_USERS_PER_HOST', '0'))  # 单台主机活跃用户上限，0 不限制
+PLACEMENT_MIN_FREE_DISK_MB = int(_env('PLACEMENT_MIN_FREE_DISK_MB', '0'))  # 空闲磁盘低于该值的主机不再放置新用户，0 不限制
+ACCOUNT_PROVISIONING_ASYNC = _env('ACCOUNT_PROVISIONING_ASYNC', 'False').lower() in ('true', '1', 'yes')  # 审批后通过开户发件箱异步开户（需运行 Celery worker 和 beat，未部署时保持 False 同步开户）
+PROVISIONING_OUTBOX_REDISPATCH_AFTER = int(_env('PROVISIONING_OUTBOX_REDISPATCH_AFTER', '300'))  # 投递后超过该时间（秒）仍未开始执行则重新投递
+PROVISIONING_OUTBOX_LEASE_SECONDS = int(_env('PROVISIONING_OUTBOX_LEASE_SECONDS', '120'))  # 开户执行租约时长（秒），执行中每 1/3 时长续期，过期才重新投递
+PROVISIONING_OUTBOX_MAX_ATTEMPTS = int(_env('PROVISIONING_OUTBOX_MAX_ATTEMPTS', '3'))  # 开户任务异常时的最大执行次数
+EXPIRY_SWEEP_INTERVAL = int(_env('EXPIRY_SWEEP_INTERVAL', '300'))  # 过期数据清理的执行间隔（秒）
+EXPIRY_SWEEP_CHUNK_SIZE = int(_env('EXPIRY_SWEEP_CHUNK_SIZE', '1000'))  # 过期数据清理每批处理的行数
+EXPIRY_RETENTION_DAYS = int(_env('EXPIRY_RETENTION_DAYS', '7'))  # 已过期记录保留多少天后删除
+TASK_RETENTION_INTERVAL = int(_env('TASK_RETENTION_INTERVAL', '3600'))  # 任务记录保留策略的执行间隔（秒）
+TASK_RETENTION_DAYS = int(_env('TASK_RETENTION_DAYS', '90'))  # 已结束任务保留多少天后归档并删除
+TASK_PROGRESS_COMPACT_DAYS = int(_env('TASK_PROGRESS_COMPACT_DAYS', '1'))  # 任务结束多少天后合并进度记录
+TASK_ARCHIVE_DIR = _env('TASK_ARCHIVE_DIR', str(BASE_DIR / 'archive' / 'tasks'))  # 任务归档文件目录（gzip 压缩的 JSONL）
+TASK_PROGRESS_FLUSH_INTERVAL = float(_env('TASK_PROGRESS_FLUSH_INTERVAL', '5'))  # 任务进度写入数据库的最短间隔（秒），期间只更新缓存
+TASK_PROGRESS_MILESTONE = int(_env('TASK_PROGRESS_MILESTONE', '25'))  # 进度每跨过该百分比立即写入数据库
+PROGRESS_STREAM_HEARTBEAT = int(_env('PROGRESS_STREAM_HEARTBEAT', '15'))  # 进度推送（SSE）无事件时重新读取快照的间隔（秒）
+PROGRESS_STREAM_MAX_SECONDS = int(_env('PROGRESS_STREAM_MAX_SECONDS', '20'))  # 单个 SSE 连接最长保持时间（秒），到期后浏览器自动重连，必须小于 Gunicorn worker timeout
+HOST_HEALTH_SWEEP_TICK = int(_env('HOST_HEALTH_SWEEP_TICK', '15'))  # 主机健康巡检的调度间隔（秒），每次只探测到期主机
+HOST_HEALTH_CONCURRENCY = int(_env('HOST_HEALTH_CONCURRENCY', '32'))  # 主机健康巡检的并发探测数
+HOST_HEALTH_MIN_INTERVAL = int(_env('HOST_HEALTH_MIN_INTERVAL', '30'))  # 状态变化或异常主机的探测间隔（秒）
+HOST_HEALTH_MAX_INTERVAL = int(_env('HOST_HEALTH_MAX_INTERVAL', '600'))  # 持续在线主机的最长探测间隔（秒）
+HOST_HEALTH_PROBE_TIMEOUT = float(_env('HOST_HEALTH_PROBE_TIMEOUT', '3'))  # 单次端口探测超时（秒）
+HOST_CONNECTION_TEST_CACHE_TTL = int(_env('HOST_CONNECTION_TEST_CACHE_TTL', '60'))  # 页面触发的连接测试结果复用时间（秒）
 
 # Logging settings
 # 默认只输出到 stdout，方便 nohup/systemd 等收集日志
@@ -465,6 +515,8 @@ if REDIS_ENABLED:
     CELERY_BROKER_TRANSPORT_OPTIONS = {
         'polling_interval': 1,
         'max_connections': 20,
+        # 同一 worker 消费多个队列时按 config.celery.QUEUES 的顺序取任务（interactive 优先）
+        'queue_order_strategy': 'priority',
     }
 else:
     CELERY_BROKER_URL = f'sqla+sqlite:///{BASE_DIR / "celery_broker.sqlite3"}'
@@ -473,6 +525,14 @@ else:
         'polling_interval': 1,
     }
 
+# worker 通道配置（config.celery.WORKER_PROFILES，python manage.py celery_worker <profile>）
+WORKER_INTERACTIVE_CONCURRENCY = int(_env('WORKER_INTERACTIVE_CONCURRENCY', '8'))  # 交互通道 worker 并发数
+WORKER_INTERACTIVE_PREFETCH = int(_env('WORKER_INTERACTIVE_PREFETCH', '1'))  # 交互通道每进程预取消息数
+WORKER_DEFAULT_CONCURRENCY = int(_env('WORKER_DEFAULT_CONCURRENCY', '4'))  # 默认/定时通道 worker 并发数
+WORKER_DEFAULT_PREFETCH = int(_env('WORKER_DEFAULT_PREFETCH', '4'))  # 默认/定时通道每进程预取消息数
+WORKER_BULK_CONCURRENCY = int(_env('WORKER_BULK_CONCURRENCY', '2'))  # 批量通道 worker 并发数
+WORKER_BULK_PREFETCH = int(_env('WORKER_BULK_PREFETCH', '1'))  # 批量通道每进程预取消息数
+
 # ========== 限流配置 ==========
 LOGIN_RATE_LIMIT = int(_env('LOGIN_RATE_LIMIT', '5'))
 API_RATE_LIMIT = int(_env('API_RATE_LIMIT', '100'))
@@ -484,6 +544,17 @@ GATEWAY_ENABLED = _env(
 GATEWAY_CONTROL_SOCKET = _env(
     'GATEWAY_CONTROL_SOCKET', '/run/2c2a/control.sock'
 )
+# 隧道事件入库：主机状态更新按主机合并、审计日志批量写入，按间隔（秒）或批量大小写入一次
+TUNNEL_EVENT_FLUSH_INTERVAL = float(_env('TUNNEL_EVENT_FLUSH_INTERVAL', '1'))
+TUNNEL_EVENT_BATCH_SIZE = int(_env('TUNNEL_EVENT_BATCH_SIZE', '500'))
+# 隧道事件处理：有界队列容量、处理线程数（同一 token 的事件固定由同一线程按序处理），
+# 队列满时接收方最多等待的秒数（超时丢弃），停止时等待队列处理完的秒数
+TUNNEL_EVENT_QUEUE_SIZE = int(_env('TUNNEL_EVENT_QUEUE_SIZE', '10000'))
+TUNNEL_EVENT_WORKERS = int(_env('TUNNEL_EVENT_WORKERS', '4'))
+TUNNEL_EVENT_ENQUEUE_TIMEOUT = float(_env('TUNNEL_EVENT_ENQUEUE_TIMEOUT', '2'))
+TUNNEL_EVENT_DRAIN_TIMEOUT = float(_env('TUNNEL_EVENT_DRAIN_TIMEOUT', '30'))
+# 隧道 token -> 主机索引的全量重新加载间隔（秒），主机保存/删除时会立即通知重新加载
+TUNNEL_TOKEN_INDEX_TTL = int(_env('TUNNEL_TOKEN_INDEX_TTL', '300'))
 
 GATEWAY_PAA_TOKEN_SIGNING_KEY = _env(
     'GATEWAY_PAA_TOKEN_SIGNING_KEY', 'change-me-32-chars-minimum!!'
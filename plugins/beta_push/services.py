@@ -8,6 +8,8 @@ from django.utils import timezone
 
 import redis as redis_lib
 
+from utils.progress_events import publish
+
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
@@ -28,7 +30,39 @@ def _get_redis():
         return None
 
 
+def progress_channel(task_id):
+    """推送进度事件频道，见 utils.progress_events"""
+    return f'beta_push:{task_id}'
+
+
+def sync_log_status(sync_log):
+    return {
+        'status': sync_log.status,
+        'records_pushed': sync_log.records_pushed,
+        'records_skipped': sync_log.records_skipped,
+        'records_failed': sync_log.records_failed,
+        'error_message': sync_log.error_message,
+        'completed_at': sync_log.completed_at.isoformat() if sync_log.completed_at else None,
+    }
+
+
+def publish_status(sync_log):
+    """推送任务结束时发布最终状态"""
+    if sync_log.task_id:
+        publish(progress_channel(sync_log.task_id), {
+            'success': True,
+            'progress': get_progress(sync_log.task_id),
+            **sync_log_status(sync_log),
+        })
+
+
 def set_progress(task_id, current, total, message=''):
+    progress = {
+        'current': current,
+        'total': total,
+        'message': message,
+    }
+    publish(progress_channel(task_id), {'success': True, 'status': 'running', 'progress': progress})
     r = _get_redis()
     if not r:
         return
@@ -36,11 +70,7 @@ def set_progress(task_id, current, total, message=''):
     r.setex(
         f'{REDIS_KEY_PREFIX}:{task_id}',
         3600,
-        json.dumps({
-            'current': current,
-            'total': total,
-            'message': message,
-        }),
+        json.dumps(progress),
     )
 
 
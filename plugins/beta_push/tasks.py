@@ -9,7 +9,7 @@ logger = logging.getLogger(__name__)
 @shared_task(bind=True, max_retries=1, default_retry_delay=10)
 def push_to_beta(self, user_id, sync_log_id):
     from .models import SyncLog
-    from .services import BetaPushService
+    from .services import BetaPushService, publish_status
 
     try:
         sync_log = SyncLog.objects.get(pk=sync_log_id)
@@ -34,6 +34,7 @@ def push_to_beta(self, user_id, sync_log_id):
             sync_log.error_message = '\n'.join(stats['errors'][:20])
         sync_log.completed_at = timezone.now()
         sync_log.save()
+        publish_status(sync_log)
 
         logger.info(
             f'Beta推送完成: user={user_id}, '
@@ -48,4 +49,5 @@ def push_to_beta(self, user_id, sync_log_id):
         sync_log.error_message = str(e)[:2000]
         sync_log.completed_at = timezone.now()
         sync_log.save()
+        publish_status(sync_log)
         raise self.retry(exc=e)
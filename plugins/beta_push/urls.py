@@ -8,4 +8,5 @@ urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('push/', views.start_push, name='start_push'),
     path('status/', views.push_status, name='push_status'),
+    path('status/stream/', views.push_status_stream, name='push_status_stream'),
 ]
@@ -10,7 +10,8 @@ from django.utils import timezone
 from apps.accounts.provider_decorators import is_provider
 
 from .models import SyncLog
-from .services import get_progress
+from .services import get_progress, progress_channel, sync_log_status
+from utils.progress_events import event_stream, sse_response
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -119,26 +120,35 @@ def push_status(request):
             'completed_at': latest_log.completed_at.isoformat() if latest_log.completed_at else None,
         })
 
-    progress = get_progress(task_id)
+    return JsonResponse(_task_status(request.user, task_id))
+
+
+def push_status_stream(request):
+    """以 Server-Sent Events 推送任务进度，替代轮询 push_status"""
+    if not _check_permission(request.user):
+        return JsonResponse({'success': False, 'error': '权限不足'}, status=403)
+
+    task_id = request.GET.get('task_id', '')
+    if not task_id:
+        return JsonResponse({'success': False, 'error': '缺少 task_id'}, status=400)
+
+    user = request.user
+    return sse_response(event_stream(
+        progress_channel(task_id),
+        lambda: _task_status(user, task_id),
+        lambda payload: payload.get('status') in ('success', 'failed'),
+    ))
 
-    sync_log = SyncLog.objects.filter(
-        user=request.user,
-        task_id=task_id,
-    ).order_by('-created_at').first()
 
+def _task_status(user, task_id):
     response_data = {
         'success': True,
-        'progress': progress,
+        'progress': get_progress(task_id),
     }
-
+    sync_log = SyncLog.objects.filter(
+        user=user,
+        task_id=task_id,
+    ).order_by('-created_at').first()
     if sync_log:
-        response_data.update({
-            'status': sync_log.status,
-            'records_pushed': sync_log.records_pushed,
-            'records_skipped': sync_log.records_skipped,
-            'records_failed': sync_log.records_failed,
-            'error_message': sync_log.error_message,
-            'completed_at': sync_log.completed_at.isoformat() if sync_log.completed_at else None,
-        })
-
-    return JsonResponse(response_data)
+        response_data.update(sync_log_status(sync_log))
+    return response_data
@@ -519,7 +519,9 @@ def _page_result(stdscr, success, answers, backup_name=None):
             "4. 启动服务                uv run python manage.py runserver",
         ]
         if answers.get("celery"):
-            steps.append("5. 启动 Celery             uv run celery -A config worker -l info")
+            steps.append("5. 启动 Celery             uv run python manage.py celery_worker all")
+            steps.append("6. 启动 Celery beat        uv run celery -A config beat")
+            steps.append("7. 异步开户（可选）        worker/beat 运行后在 .env 设置 ACCOUNT_PROVISIONING_ASYNC=True")
 
         box_h = 4 + len(steps) + (2 if not answers.get("redis") and answers.get("celery") else 0) + (1 if backup_name else 0)
         box_h = max(box_h, 8)
@@ -0,0 +1,283 @@
+"""
+批量用户操作脚本
+
+清理非活跃用户原先对每个用户新建一个 WinRM 客户端并逐个禁用，
+一万个用户需要一万次远程往返。这里把同一主机上的一批用户合并为
+一个 PowerShell 脚本：
+
+- 逐个检查用户的 LastLogon，指定 inactive_days 时跳过最近登录过的用户
+- 禁用其余用户（已禁用的用户视为成功）
+- 最后输出一段 JSON，每个用户一条 name / status / message / last_logon
+
+批量启用（bulk_enable_users）使用同样的输出格式。
+
+脚本以 powershell -encodedcommand <UTF-16LE Base64> 的形式在 cmd.exe 命令行中执行，
+命令行不能超过 8191 个字符，因此按编码后的命令长度（MAX_COMMAND_LENGTH）分批，
+而不是固定的用户数。
+
+status 取值：
+    disabled   已禁用（包括本来就是禁用状态）
+    enabled    已启用（包括本来就是启用状态）
+    active     最近登录过，未禁用
+    not_found  主机上不存在该用户
+    error      禁用失败，message 为错误信息
+
+使用方式：
+    from utils.bulk_user_ops import bulk_disable_users
+
+    statuses = bulk_disable_users(client, ['alice', 'bob'], inactive_days=30)
+    if statuses['alice'].status == 'disabled':
+        ...
+"""
+import json
+import logging
+import os
+from base64 import b64encode
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from utils.winrm_client import CommandInjectionError, _escape_ps_string, validate_username
+
+logger = logging.getLogger("2c2a")
+
+RESULT_MARKER = '<<<2C2A_BULK_RESULT>>>'
+# 单个脚本处理的最大用户数，避免输出过大
+MAX_USERS_PER_SCRIPT = 200
+# 编码后的命令行最大长度（cmd.exe 限制 8191 个字符，留出余量）
+MAX_COMMAND_LENGTH = 8000
+ENCODED_COMMAND_PREFIX = 'powershell -encodedcommand '
+
+STATUS_DISABLED = 'disabled'
+STATUS_ENABLED = 'enabled'
+STATUS_ACTIVE = 'active'
+STATUS_NOT_FOUND = 'not_found'
+STATUS_ERROR = 'error'
+
+
+@dataclass
+class BulkUserStatus:
+    name: str
+    status: str
+    message: str = ''
+    last_logon: Optional[str] = None
+
+
+def build_bulk_disable_script(usernames: List[str], inactive_days: Optional[int] = None) -> str:
+    """
+    生成批量禁用用户的 PowerShell 脚本
+
+    参数:
+        usernames: Windows 用户名列表
+        inactive_days: 只禁用超过该天数未登录（或从未登录）的用户，None 表示全部禁用
+
+    异常:
+        CommandInjectionError: 用户名校验失败
+    """
+    for username in usernames:
+        validate_username(username)
+    names = ', '.join(f'"{_escape_ps_string(u)}"' for u in usernames)
+
+    lines = [
+        "$results = New-Object System.Collections.ArrayList",
+        f"$names = @({names})",
+    ]
+    if inactive_days is not None:
+        lines.append(f"$cutoff = (Get-Date).AddDays(-{int(inactive_days)})")
+    else:
+        lines.append("$cutoff = $null")
+    lines += [
+        "foreach ($name in $names) {",
+        "    $user = Get-LocalUser -Name $name -ErrorAction SilentlyContinue",
+        "    if (-not $user) {",
+        "        [void]$results.Add([PSCustomObject]@{ name = $name; status = 'not_found'; "
+        "message = ''; last_logon = $null })",
+        "        continue",
+        "    }",
+        "    $logon = $null",
+        "    if ($user.LastLogon) { $logon = $user.LastLogon.ToString('o') }",
+        "    if ($cutoff -and $user.LastLogon -and $user.LastLogon -gt $cutoff) {",
+        "        [void]$results.Add([PSCustomObject]@{ name = $name; status = 'active'; "
+        "message = ''; last_logon = $logon })",
+        "        continue",
+        "    }",
+        "    try {",
+        "        if ($user.Enabled) { Disable-LocalUser -Name $name -ErrorAction Stop }",
+        "        [void]$results.Add([PSCustomObject]@{ name = $name; status = 'disabled'; "
+        "message = ''; last_logon = $logon })",
+        "    } catch {",
+        "        [void]$results.Add([PSCustomObject]@{ name = $name; status = 'error'; "
+        "message = [string]$_.Exception.Message; last_logon = $logon })",
+        "    }",
+        "}",
+        f"Write-Output '{RESULT_MARKER}'",
+        "ConvertTo-Json -InputObject @($results) -Compress",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def build_bulk_enable_script(usernames: List[str]) -> str:
+    """
+    生成批量启用用户的 PowerShell 脚本
+
+    异常:
+        CommandInjectionError: 用户名校验失败
+    """
+    for username in usernames:
+        validate_username(username)
+    names = ', '.join(f'"{_escape_ps_string(u)}"' for u in usernames)
+
+    lines = [
+        "$results = New-Object System.Collections.ArrayList",
+        f"$names = @({names})",
+        "foreach ($name in $names) {",
+        "    $user = Get-LocalUser -Name $name -ErrorAction SilentlyContinue",
+        "    if (-not $user) {",
+        "        [void]$results.Add([PSCustomObject]@{ name = $name; status = 'not_found'; "
+        "message = ''; last_logon = $null })",
+        "        continue",
+        "    }",
+        "    $logon = $null",
+        "    if ($user.LastLogon) { $logon = $user.LastLogon.ToString('o') }",
+        "    try {",
+        "        if (-not $user.Enabled) { Enable-LocalUser -Name $name -ErrorAction Stop }",
+        "        [void]$results.Add([PSCustomObject]@{ name = $name; status = 'enabled'; "
+        "message = ''; last_logon = $logon })",
+        "    } catch {",
+        "        [void]$results.Add([PSCustomObject]@{ name = $name; status = 'error'; "
+        "message = [string]$_.Exception.Message; last_logon = $logon })",
+        "    }",
+        "}",
+        f"Write-Output '{RESULT_MARKER}'",
+        "ConvertTo-Json -InputObject @($results) -Compress",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def encoded_command_length(script: str) -> int:
+    """脚本按 WinrmClient.execute_powershell 的方式编码后的命令行长度"""
+    return len(ENCODED_COMMAND_PREFIX) + len(b64encode(script.encode('utf_16_le')))
+
+
+def chunk_usernames(usernames: List[str], build_script: Callable[[List[str]], str]) -> List[List[str]]:
+    """
+    把用户分批，每批生成的脚本编码后不超过 MAX_COMMAND_LENGTH，
+    且不超过 MAX_USERS_PER_SCRIPT 个用户
+    """
+    chunks = []
+    start = 0
+    while start < len(usernames):
+        # 二分查找当前位置起能放下的最多用户数（至少一个）
+        lo, hi = 1, min(MAX_USERS_PER_SCRIPT, len(usernames) - start)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if encoded_command_length(build_script(usernames[start:start + mid])) <= MAX_COMMAND_LENGTH:
+                lo = mid
+            else:
+                hi = mid - 1
+        chunks.append(usernames[start:start + lo])
+        start += lo
+    return chunks
+
+
+def parse_bulk_output(result, usernames: List[str]) -> Dict[str, BulkUserStatus]:
+    """
+    解析批量脚本输出
+
+    脚本执行失败或没有某个用户的结果时，该用户记为 error。
+    """
+    statuses = {}
+    output = result.std_out or ''
+    if RESULT_MARKER in output:
+        payload = output.split(RESULT_MARKER, 1)[1].strip()
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError:
+            logger.error(f"批量操作结果解析失败: {payload[:200]}")
+            data = []
+        if isinstance(data, dict):
+            data = [data]
+        for item in data:
+            name = str(item.get('name', ''))
+            statuses[name.lower()] = BulkUserStatus(
+                name=name,
+                status=str(item.get('status') or STATUS_ERROR),
+                message=str(item.get('message') or ''),
+                last_logon=item.get('last_logon'),
+            )
+
+    error = (result.std_err or '').strip() or '未返回执行结果'
+    return {
+        username: statuses.get(username.lower()) or BulkUserStatus(username, STATUS_ERROR, error)
+        for username in usernames
+    }
+
+
+def bulk_disable_users(
+        client,
+        usernames: List[str],
+        inactive_days: Optional[int] = None,
+) -> Dict[str, BulkUserStatus]:
+    """
+    在一台主机上批量禁用用户（按命令行长度分批，每批一次远程执行）
+
+    参数:
+        client: WinrmClient / LocalWinServerClient / TunnelConnectionAdapter 实例
+        usernames: Windows 用户名列表
+        inactive_days: 只禁用超过该天数未登录的用户，None 表示全部禁用
+
+    返回:
+        {用户名: BulkUserStatus}
+    """
+    statuses = _run_bulk(
+        client, usernames, STATUS_DISABLED,
+        lambda chunk: build_bulk_disable_script(chunk, inactive_days), '禁用',
+    )
+    disabled = sum(1 for s in statuses.values() if s.status == STATUS_DISABLED)
+    logger.info(f"批量禁用用户完成: 共 {len(usernames)} 个, 已禁用 {disabled} 个")
+    return statuses
+
+
+def bulk_enable_users(client, usernames: List[str]) -> Dict[str, BulkUserStatus]:
+    """
+    在一台主机上批量启用用户（按命令行长度分批，每批一次远程执行）
+
+    返回:
+        {用户名: BulkUserStatus}，成功时 status 为 enabled
+    """
+    statuses = _run_bulk(client, usernames, STATUS_ENABLED, build_bulk_enable_script, '启用')
+    enabled = sum(1 for s in statuses.values() if s.status == STATUS_ENABLED)
+    logger.info(f"批量启用用户完成: 共 {len(usernames)} 个, 已启用 {enabled} 个")
+    return statuses
+
+
+def _run_bulk(
+        client,
+        usernames: List[str],
+        demo_status: str,
+        build_script: Callable[[List[str]], str],
+        action: str,
+) -> Dict[str, BulkUserStatus]:
+    statuses = {}
+    valid = []
+    for username in usernames:
+        try:
+            validate_username(username)
+            valid.append(username)
+        except CommandInjectionError as e:
+            statuses[username] = BulkUserStatus(username, STATUS_ERROR, str(e))
+
+    if os.environ.get('2C2A_DEMO', '').lower() == '1':
+        logger.info(f"DEMO模式: 模拟批量{action} {len(valid)} 个用户")
+        statuses.update({u: BulkUserStatus(u, demo_status) for u in valid})
+        return statuses
+
+    for chunk in chunk_usernames(valid, build_script):
+        script = build_script(chunk)
+        try:
+            result = client.execute_powershell(script)
+        except Exception as e:
+            logger.error(f"批量{action}用户执行失败: {str(e)}")
+            statuses.update({u: BulkUserStatus(u, STATUS_ERROR, str(e)) for u in chunk})
+            continue
+        statuses.update(parse_bulk_output(result, chunk))
+    return statuses
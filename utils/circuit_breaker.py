@@ -0,0 +1,188 @@
+"""
+主机级熔断器
+
+同一主机连续连接失败达到阈值后熔断（open），熔断期间所有调用方直接失败，
+不再占用 worker 等待超时；熔断时间到期后进入半开（half_open）状态，
+只放行一个探测请求，成功则恢复（closed），失败则以指数退避延长熔断时间。
+
+状态保存在 Django 缓存中（Redis 可用时跨进程共享，否则为进程内 LocMem）。
+熔断状态由健康巡检（apps.hosts.health.probe_host）读取：熔断中的 WinRM 主机
+标记为 error，在巡检的调用线程中统一写回 Host.status，不在执行远程操作的工作线程中写库。
+
+使用方式：
+    from utils.circuit_breaker import get_circuit_breaker, CircuitOpenError
+
+    breaker = get_circuit_breaker('http://10.0.0.5:5985/wsman')
+    if not breaker.allow_request():
+        raise CircuitOpenError(...)
+    try:
+        ...
+        breaker.record_success()
+    except Exception:
+        breaker.record_failure()
+"""
+import hashlib
+import logging
+import random
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger("2c2a")
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RESET_TIMEOUT = 30
+DEFAULT_MAX_RESET_TIMEOUT = 600
+# 熔断状态在缓存中的保留时间，需大于最长熔断时间
+STATE_TTL = 24 * 3600
+
+
+class CircuitOpenError(Exception):
+    """主机处于熔断状态，调用被直接拒绝"""
+
+    def __init__(self, name: str, retry_after: float = 0):
+        self.name = name
+        self.retry_after = max(0.0, retry_after)
+        super().__init__(
+            f'主机 {name} 连续连接失败，已暂停访问，'
+            f'{int(self.retry_after) + 1} 秒后重试'
+        )
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    带抖动的指数退避时间
+
+    第 attempt 次（从 0 开始）的基准时间为 min(cap, base * 2^attempt)，
+    实际取值在基准时间的一半到全部之间随机，避免多个调用方同时重试。
+    """
+    delay = min(cap, base * (2 ** max(0, attempt)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class HostCircuitBreaker:
+    """基于缓存的主机熔断器"""
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: Optional[int] = None,
+            reset_timeout: Optional[float] = None,
+            max_reset_timeout: Optional[float] = None,
+    ):
+        """
+        参数:
+            name: 熔断对象标识（如 WinRM 端点）
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 首次熔断的持续时间（秒）
+            max_reset_timeout: 指数退避后的最长熔断时间（秒）
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or getattr(
+            settings, 'WINRM_CIRCUIT_FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD
+        )
+        self.reset_timeout = reset_timeout or getattr(
+            settings, 'WINRM_CIRCUIT_RESET_TIMEOUT', DEFAULT_RESET_TIMEOUT
+        )
+        self.max_reset_timeout = max_reset_timeout or getattr(
+            settings, 'WINRM_CIRCUIT_MAX_RESET_TIMEOUT', DEFAULT_MAX_RESET_TIMEOUT
+        )
+        digest = hashlib.sha256(name.encode('utf-8')).hexdigest()[:32]
+        self._key = f'circuit:{digest}'
+        self._probe_key = f'circuit:{digest}:probe'
+
+    def _load(self) -> dict:
+        state = cache.get(self._key)
+        if not state:
+            return {'state': STATE_CLOSED, 'failures': 0, 'trips': 0, 'open_until': 0}
+        return state
+
+    def _save(self, state: dict):
+        cache.set(self._key, state, STATE_TTL)
+
+    def _transition(self, old: str, new: str):
+        if old == new:
+            return
+        log = logger.warning if new == STATE_OPEN else logger.info
+        log(f"熔断器状态变化: {self.name} {old} -> {new}")
+
+    @property
+    def state(self) -> str:
+        state = self._load()
+        if state['state'] == STATE_OPEN and time.time() >= state['open_until']:
+            return STATE_HALF_OPEN
+        return state['state']
+
+    def retry_after(self) -> float:
+        """距离允许下一次探测的剩余秒数"""
+        return max(0.0, self._load()['open_until'] - time.time())
+
+    def allow_request(self) -> bool:
+        """
+        判断当前是否允许访问主机
+
+        熔断期间返回 False；熔断到期后只有一个调用方能拿到探测机会。
+        """
+        state = self._load()
+        if state['state'] == STATE_CLOSED:
+            return True
+        if time.time() < state['open_until']:
+            return False
+        # 半开：cache.add 是原子操作，保证只放行一个探测请求
+        probe_timeout = max(1, int(self.reset_timeout))
+        if not cache.add(self._probe_key, 1, probe_timeout):
+            return False
+        if state['state'] != STATE_HALF_OPEN:
+            old = state['state']
+            state['state'] = STATE_HALF_OPEN
+            self._save(state)
+            self._transition(old, STATE_HALF_OPEN)
+        return True
+
+    def record_success(self):
+        state = self._load()
+        old = state['state']
+        if old == STATE_CLOSED and state['failures'] == 0:
+            return
+        self._save({'state': STATE_CLOSED, 'failures': 0, 'trips': 0, 'open_until': 0})
+        cache.delete(self._probe_key)
+        self._transition(old, STATE_CLOSED)
+
+    def record_failure(self):
+        state = self._load()
+        old = state['state']
+        state['failures'] += 1
+        if old == STATE_HALF_OPEN or state['failures'] >= self.failure_threshold:
+            state['trips'] += 1
+            duration = backoff_delay(
+                state['trips'] - 1, self.reset_timeout, self.max_reset_timeout
+            )
+            state['state'] = STATE_OPEN
+            state['open_until'] = time.time() + duration
+            self._save(state)
+            cache.delete(self._probe_key)
+            if old != STATE_OPEN:
+                logger.warning(
+                    f"主机熔断: {self.name}, 连续失败={state['failures']}, "
+                    f"熔断时长={duration:.1f}秒"
+                )
+            self._transition(old, STATE_OPEN)
+        else:
+            self._save(state)
+
+    def reset(self):
+        """手动恢复（如管理员确认主机已修复）"""
+        old = self._load()['state']
+        cache.delete_many([self._key, self._probe_key])
+        self._transition(old, STATE_CLOSED)
+
+
+def get_circuit_breaker(name: str) -> HostCircuitBreaker:
+    """获取主机熔断器（状态按 name 在缓存中共享）"""
+    return HostCircuitBreaker(name)
@@ -0,0 +1,204 @@
+"""
+DNS 解析缓存
+
+WinrmClient 每次构造都会校验主机名可解析，解析慢或超时的 DNS
+会拖慢每一次远程操作。这里提供进程内的解析缓存：
+
+- 成功结果缓存 DNS_CACHE_TTL 秒
+- 解析失败同样缓存（DNS_CACHE_NEGATIVE_TTL 秒），避免反复等待失败的解析
+- 预刷新：缓存条目的存活时间超过 TTL × DNS_CACHE_REFRESH_AHEAD 后，
+  仍返回旧结果，同时在后台线程中重新解析，热点主机不会在过期时阻塞
+
+使用方式：
+    from utils.dns_cache import resolve_hostname, is_resolvable
+
+    address = resolve_hostname('win-01.example.com')  # 失败时抛出 socket.gaierror
+"""
+import ipaddress
+import logging
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_TTL = 300
+DEFAULT_NEGATIVE_TTL = 30
+DEFAULT_REFRESH_AHEAD = 0.8
+MAX_ENTRIES = 4096
+
+
+@dataclass
+class _Entry:
+    address: Optional[str]
+    error: Optional[str]
+    resolved_at: float
+    expires_at: float
+    refreshing: bool = False
+
+
+class DnsResolverCache:
+    """带 TTL、失败缓存和预刷新的主机名解析缓存"""
+
+    def __init__(
+            self,
+            ttl: float = DEFAULT_TTL,
+            negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+            refresh_ahead: float = DEFAULT_REFRESH_AHEAD,
+            resolver: Callable[[str], str] = socket.gethostbyname,
+    ):
+        """
+        参数:
+            ttl: 成功结果的缓存时间（秒）
+            negative_ttl: 解析失败的缓存时间（秒），0 表示不缓存失败
+            refresh_ahead: 预刷新阈值（TTL 的比例），0 表示关闭预刷新
+            resolver: 实际解析函数，默认 socket.gethostbyname
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh_ahead = refresh_ahead
+        self.resolver = resolver
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _is_ip(hostname: str) -> bool:
+        try:
+            ipaddress.ip_address(hostname)
+            return True
+        except ValueError:
+            return False
+
+    def _lookup(self, hostname: str) -> _Entry:
+        now = time.monotonic()
+        try:
+            address = self.resolver(hostname)
+            return _Entry(address, None, now, now + self.ttl)
+        except socket.gaierror as e:
+            return _Entry(None, str(e), now, now + self.negative_ttl)
+
+    def _store(self, hostname: str, entry: _Entry):
+        with self._lock:
+            if len(self._entries) >= MAX_ENTRIES and hostname not in self._entries:
+                # 超出容量时丢弃最早解析的条目
+                oldest = min(self._entries, key=lambda k: self._entries[k].resolved_at)
+                del self._entries[oldest]
+            self._entries[hostname] = entry
+
+    def _refresh_in_background(self, hostname: str):
+        def _refresh():
+            try:
+                entry = self._lookup(hostname)
+                if entry.address is None:
+                    # 预刷新失败时保留旧结果直到过期，避免短暂的解析抖动
+                    logger.warning(f"DNS预刷新失败: {hostname}, 错误: {entry.error}")
+                    return
+                self._store(hostname, entry)
+            except Exception as e:
+                logger.warning(f"DNS预刷新异常: {hostname}, 错误: {str(e)}")
+            finally:
+                # 无论成功与否都清除刷新标记，否则该主机名不会再触发预刷新
+                with self._lock:
+                    current = self._entries.get(hostname)
+                    if current is not None:
+                        current.refreshing = False
+
+        thread = threading.Thread(target=_refresh, name='dns-refresh', daemon=True)
+        thread.start()
+
+    def resolve(self, hostname: str) -> str:
+        """
+        解析主机名
+
+        返回:
+            str: IPv4 地址
+
+        异常:
+            socket.gaierror: 主机名无法解析（包括命中失败缓存）
+        """
+        if self._is_ip(hostname):
+            return hostname
+
+        now = time.monotonic()
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(hostname)
+            if entry is not None and now < entry.expires_at:
+                self.hits += 1
+                if (entry.address is not None and self.refresh_ahead > 0
+                        and not entry.refreshing
+                        and now - entry.resolved_at >= self.ttl * self.refresh_ahead):
+                    entry.refreshing = True
+                    refresh = True
+            else:
+                entry = None
+                self.misses += 1
+
+        if entry is None:
+            entry = self._lookup(hostname)
+            if entry.address is not None or self.negative_ttl > 0:
+                self._store(hostname, entry)
+        elif refresh:
+            self._refresh_in_background(hostname)
+
+        if entry.address is None:
+            raise socket.gaierror(socket.EAI_NONAME, entry.error or f'无法解析主机名: {hostname}')
+        return entry.address
+
+    def invalidate(self, hostname: Optional[str] = None):
+        """删除指定主机名（或全部）的缓存"""
+        with self._lock:
+            if hostname is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(hostname, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_dns_cache = None
+_dns_cache_lock = threading.Lock()
+
+
+def get_dns_cache() -> DnsResolverCache:
+    """获取进程级 DNS 解析缓存（首次调用时读取配置）"""
+    global _dns_cache
+    if _dns_cache is None:
+        with _dns_cache_lock:
+            if _dns_cache is None:
+                from django.conf import settings
+                _dns_cache = DnsResolverCache(
+                    ttl=getattr(settings, 'DNS_CACHE_TTL', DEFAULT_TTL),
+                    negative_ttl=getattr(settings, 'DNS_CACHE_NEGATIVE_TTL', DEFAULT_NEGATIVE_TTL),
+                    refresh_ahead=getattr(settings, 'DNS_CACHE_REFRESH_AHEAD', DEFAULT_REFRESH_AHEAD),
+                )
+    return _dns_cache
+
+
+def resolve_hostname(hostname: str) -> str:
+    """通过进程级缓存解析主机名，失败时抛出 socket.gaierror"""
+    return get_dns_cache().resolve(hostname)
+
+
+def is_resolvable(hostname: str) -> bool:
+    """主机名是否可解析（使用缓存）"""
+    try:
+        resolve_hostname(hostname)
+        return True
+    except socket.gaierror:
+        return False
+
+
+def invalidate_hostname(hostname: Optional[str] = None):
+    """清除主机名解析缓存，如管理员修改 DNS 后手动重新测试连接"""
+    get_dns_cache().invalidate(hostname)
@@ -128,6 +128,7 @@ class GatewayEventListener:
         self._socket_path = socket_path
         self._running = False
         self._handlers = {}
+        self._listener = None
 
     def register_handler(self, event_type: str, handler):
         self._handlers[event_type] = handler
@@ -138,6 +139,7 @@ class GatewayEventListener:
         plugin = pm.get_plugin('gateway')
         if plugin and hasattr(plugin, 'get_event_listener'):
             listener = plugin.get_event_listener(self._socket_path)
+            self._listener = listener
             for event_type, handler in self._handlers.items():
                 listener.register_handler(event_type, handler)
             listener.start()
@@ -148,3 +150,5 @@ class GatewayEventListener:
 
     def stop(self):
         self._running = False
+        if self._listener is not None and hasattr(self._listener, 'stop'):
+            self._listener.stop()
@@ -0,0 +1,344 @@
+"""
+主机级并发限制
+
+同一台 Windows 主机上同时进行的远程操作没有上限，批量开户、主机组执行
+等并发场景会超过 WinRM 的 MaxShellsPerUser / MaxConcurrentOperationsPerUser，
+主机返回限流错误后又触发重试，进一步加重负载。这里为每台主机提供一个
+分布式信号量：
+
+- Redis 可用时用有序集合实现（跨进程、跨 worker 共享）：持有者带租约，
+  进程异常退出后到期自动释放；等待者按排队号先来先得（公平排队）
+- Redis 不可用时退化为进程内的公平信号量（与 utils.redis_helper 的降级策略一致）
+- 同一线程已持有某主机的槽位时再次申请直接复用（例如远程Shell内执行命令），
+  不会自己等待自己
+- 等待超过 HOST_SLOT_WAIT_TIMEOUT 秒抛出 HostBusyError，不进入重试
+- 每台主机的获取次数、等待时间、超时次数记录在进程内，见 get_wait_metrics()
+
+上限默认 HOST_MAX_CONCURRENT_OPERATIONS，可按主机配置
+（Host.max_concurrent_operations），为 0 时不限制。
+
+使用方式：
+    from utils.host_semaphore import get_host_semaphore
+
+    with get_host_semaphore('10.0.0.5:5985').slot():
+        ...
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from utils.redis_helper import get_redis_client
+
+logger = logging.getLogger("2c2a")
+
+DEFAULT_LIMIT = 5
+DEFAULT_WAIT_TIMEOUT = 120
+DEFAULT_LEASE_TIMEOUT = 1800
+KEY_PREFIX = '2c2a:host_slots:'
+# Redis 轮询间隔（秒），逐次增大到上限
+POLL_MIN = 0.05
+POLL_MAX = 0.5
+# 等待者的存活时间，超过未轮询视为已放弃，从队列中移除
+WAITER_TTL = 5
+# 等待超过该时间（秒）时记录日志
+SLOW_WAIT_LOG_THRESHOLD = 1.0
+
+# KEYS: holders, queue, waiting, counter
+# ARGV: limit, member, lease, waiter_ttl
+_ACQUIRE_SCRIPT = """
+local holders, queue, waiting, counter = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local limit = tonumber(ARGV[1])
+local member = ARGV[2]
+local lease = tonumber(ARGV[3])
+local waiter_ttl = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+redis.call('ZREMRANGEBYSCORE', holders, '-inf', now)
+local stale = redis.call('ZRANGEBYSCORE', waiting, '-inf', now)
+for _, m in ipairs(stale) do
+    redis.call('ZREM', queue, m)
+end
+redis.call('ZREMRANGEBYSCORE', waiting, '-inf', now)
+
+if not redis.call('ZSCORE', queue, member) then
+    redis.call('ZADD', queue, redis.call('INCR', counter), member)
+end
+redis.call('ZADD', waiting, now + waiter_ttl, member)
+local ttl = math.ceil(math.max(lease, waiter_ttl) * 2)
+for _, key in ipairs(KEYS) do
+    redis.call('EXPIRE', key, ttl)
+end
+
+local free = limit - redis.call('ZCARD', holders)
+if free > 0 and redis.call('ZRANK', queue, member) < free then
+    redis.call('ZREM', queue, member)
+    redis.call('ZREM', waiting, member)
+    redis.call('ZADD', holders, now + lease, member)
+    return 1
+end
+return 0
+"""
+
+
+class HostBusyError(Exception):
+    """等待主机并发槽位超时"""
+
+    def __init__(self, name: str, waited: float):
+        self.name = name
+        self.waited = waited
+        super().__init__(f'主机 {name} 并发操作已达上限，等待 {waited:.0f} 秒后仍无空闲槽位')
+
+
+class _LocalSemaphore:
+    """进程内公平信号量（Redis 不可用时使用）"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._holders = 0
+        self._queue = deque()
+
+    def acquire(self, limit: int, timeout: float) -> bool:
+        ticket = object()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while not (self._queue[0] is ticket and self._holders < limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self._queue.popleft()
+                self._holders += 1
+                return True
+            finally:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._holders = max(0, self._holders - 1)
+            self._cond.notify_all()
+
+
+_local_lock = threading.Lock()
+_local_semaphores: Dict[str, _LocalSemaphore] = {}
+_held = threading.local()
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Dict] = {}
+_acquire_scripts = {}
+
+
+def _local_semaphore(name: str) -> _LocalSemaphore:
+    with _local_lock:
+        semaphore = _local_semaphores.get(name)
+        if semaphore is None:
+            semaphore = _local_semaphores[name] = _LocalSemaphore()
+        return semaphore
+
+
+def _held_counts() -> Dict[str, int]:
+    if not hasattr(_held, 'counts'):
+        _held.counts = {}
+    return _held.counts
+
+
+def _record(name: str, waited: float, acquired: bool):
+    with _metrics_lock:
+        stats = _metrics.setdefault(name, {
+            'acquired': 0, 'timeouts': 0, 'total_wait': 0.0, 'max_wait': 0.0,
+        })
+        if acquired:
+            stats['acquired'] += 1
+        else:
+            stats['timeouts'] += 1
+        stats['total_wait'] += waited
+        stats['max_wait'] = max(stats['max_wait'], waited)
+
+
+def get_wait_metrics(name: Optional[str] = None) -> Dict:
+    """
+    槽位等待统计（进程内）
+
+    返回:
+        {名称: {'acquired', 'timeouts', 'total_wait', 'max_wait', 'avg_wait'}}，
+        指定 name 时只返回该主机的统计
+    """
+    with _metrics_lock:
+        snapshot = {key: dict(stats) for key, stats in _metrics.items()}
+    for stats in snapshot.values():
+        count = stats['acquired'] + stats['timeouts']
+        stats['avg_wait'] = stats['total_wait'] / count if count else 0.0
+    if name is not None:
+        return snapshot.get(name, {})
+    return snapshot
+
+
+def reset_wait_metrics():
+    """清空等待统计（主要用于测试）"""
+    with _metrics_lock:
+        _metrics.clear()
+
+
+class Slot:
+    """已获取的槽位，release() 可重复调用"""
+
+    def __init__(self, semaphore: 'HostSemaphore', member: Optional[str], backend: str):
+        self.semaphore = semaphore
+        self.member = member
+        self.backend = backend
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.semaphore._release(self)
+
+    def __enter__(self) -> 'Slot':
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class HostSemaphore:
+    """主机并发信号量"""
+
+    def __init__(
+            self,
+            name: str,
+            limit: Optional[int] = None,
+            wait_timeout: Optional[float] = None,
+            lease_timeout: Optional[float] = None,
+    ):
+        """
+        参数:
+            name: 主机标识（如 hostname:port）
+            limit: 同时持有的槽位数，默认 settings.HOST_MAX_CONCURRENT_OPERATIONS，0 表示不限制
+            wait_timeout: 最长等待时间（秒），默认 settings.HOST_SLOT_WAIT_TIMEOUT
+            lease_timeout: 槽位租约（秒），持有者异常退出后到期释放，
+                默认 settings.HOST_SLOT_LEASE_TIMEOUT
+        """
+        self.name = name
+        self.limit = limit if limit is not None else getattr(
+            settings, 'HOST_MAX_CONCURRENT_OPERATIONS', DEFAULT_LIMIT
+        )
+        self.wait_timeout = wait_timeout or getattr(
+            settings, 'HOST_SLOT_WAIT_TIMEOUT', DEFAULT_WAIT_TIMEOUT
+        )
+        self.lease_timeout = lease_timeout or getattr(
+            settings, 'HOST_SLOT_LEASE_TIMEOUT', DEFAULT_LEASE_TIMEOUT
+        )
+        digest = hashlib.sha256(name.encode('utf-8')).hexdigest()[:32]
+        self._keys = [
+            f'{KEY_PREFIX}{digest}:{suffix}'
+            for suffix in ('holders', 'queue', 'waiting', 'counter')
+        ]
+
+    def acquire(self) -> Slot:
+        """
+        获取一个槽位，等待超时抛出 HostBusyError
+
+        同一线程已持有该主机的槽位时直接返回（不占用新槽位）。
+        """
+        counts = _held_counts()
+        if self.limit <= 0 or counts.get(self.name):
+            counts[self.name] = counts.get(self.name, 0) + 1
+            return Slot(self, None, 'reentrant')
+
+        started = time.monotonic()
+        slot = self._acquire_redis()
+        if slot is None:
+            slot = self._acquire_local()
+        waited = time.monotonic() - started
+
+        acquired = slot is not False
+        _record(self.name, waited, acquired)
+        if not acquired:
+            logger.warning(f"等待主机并发槽位超时: {self.name}, 上限 {self.limit}, 已等待 {waited:.1f} 秒")
+            raise HostBusyError(self.name, waited)
+        if waited >= SLOW_WAIT_LOG_THRESHOLD:
+            logger.info(f"主机并发槽位等待 {waited:.1f} 秒: {self.name}, 上限 {self.limit}")
+        counts[self.name] = 1
+        return slot
+
+    def slot(self) -> Slot:
+        """with 语句使用：with semaphore.slot(): ..."""
+        return self.acquire()
+
+    def _acquire_redis(self):
+        """Redis 不可用时返回 None，超时返回 False"""
+        client = get_redis_client()
+        if client is None:
+            return None
+        member = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        poll = POLL_MIN
+        try:
+            script = _acquire_scripts.get(id(client))
+            if script is None:
+                script = _acquire_scripts[id(client)] = client.register_script(_ACQUIRE_SCRIPT)
+            while True:
+                if script(keys=self._keys, args=[
+                    self.limit, member, self.lease_timeout, max(WAITER_TTL, POLL_MAX * 4),
+                ]):
+                    return Slot(self, member, 'redis')
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._leave_queue(client, member)
+                    return False
+                time.sleep(min(remaining, poll * random.uniform(0.8, 1.2)))
+                poll = min(POLL_MAX, poll * 2)
+        except Exception as e:
+            logger.warning(f"Redis 主机并发槽位不可用，改用进程内限制: {self.name}, 错误: {str(e)}")
+            self._leave_queue(client, member)
+            return None
+
+    def _leave_queue(self, client, member: str):
+        try:
+            pipe = client.pipeline()
+            pipe.zrem(self._keys[1], member)
+            pipe.zrem(self._keys[2], member)
+            pipe.execute()
+        except Exception:
+            pass
+
+    def _acquire_local(self):
+        if _local_semaphore(self.name).acquire(self.limit, self.wait_timeout):
+            return Slot(self, None, 'local')
+        return False
+
+    def _release(self, slot: Slot):
+        counts = _held_counts()
+        remaining = counts.get(self.name, 1) - 1
+        if remaining > 0:
+            counts[self.name] = remaining
+        else:
+            counts.pop(self.name, None)
+        if slot.backend == 'redis':
+            client = get_redis_client()
+            if client is not None:
+                try:
+                    client.zrem(self._keys[0], slot.member)
+                except Exception as e:
+                    # 释放失败时由租约到期回收
+                    logger.warning(f"释放主机并发槽位失败: {self.name}, 错误: {str(e)}")
+        elif slot.backend == 'local':
+            _local_semaphore(self.name).release()
+
+
+def get_host_semaphore(name: str, limit: Optional[int] = None) -> HostSemaphore:
+    """获取主机并发信号量，limit 为 None 时使用 settings.HOST_MAX_CONCURRENT_OPERATIONS"""
+    return HostSemaphore(name, limit)
+
@@ -19,10 +19,13 @@ import logging
 import subprocess
 import os
 import re
+from contextlib import contextmanager
 from dataclasses import dataclass
 from typing import Optional, Dict, Any
 from django.conf import settings
 
+from utils.powershell_worker import PowerShellWorkerTimeout, get_powershell_pool
+
 logger = logging.getLogger("2c2a")
 
 USERNAME_PATTERN = re.compile(r'^[a-zA-Z0-9_]{1,150}$')
@@ -129,6 +132,37 @@ class LocalWinServerClient:
             f"超时={self.timeout}秒, 最大重试={self.max_retries}次"
         )
 
+    @contextmanager
+    def remote_shell(self):
+        """
+        与 WinrmClient.remote_shell 保持接口一致
+
+        本地执行没有远程Shell的建立开销，块内命令照常逐条执行。
+        """
+        yield self
+
+    def _run(self, script: str, full_command: list) -> subprocess.CompletedProcess:
+        """
+        执行 PowerShell 脚本
+
+        配置了常驻 PowerShell 进程池时在常驻进程中执行，
+        否则为每次调用启动新的 powershell.exe。
+        超时统一抛出 subprocess.TimeoutExpired。
+        """
+        pool = get_powershell_pool()
+        if pool is None:
+            return subprocess.run(
+                full_command,
+                capture_output=True,
+                text=True,
+                timeout=self.timeout
+            )
+        try:
+            status_code, std_out, std_err = pool.execute(script, self.timeout)
+        except PowerShellWorkerTimeout:
+            raise subprocess.TimeoutExpired(full_command, self.timeout)
+        return subprocess.CompletedProcess(full_command, status_code, std_out, std_err)
+
     def execute_command(
             self,
             command: str,
@@ -168,12 +202,7 @@ class LocalWinServerClient:
             full_command = ['powershell.exe', '-Command', ps_command]
             
             # 执行命令
-            result = subprocess.run(
-                full_command,
-                capture_output=True,
-                text=True,
-                timeout=self.timeout
-            )
+            result = self._run(ps_command, full_command)
             
             local_result = LocalWinServerResult(
                 status_code=result.returncode,
@@ -237,12 +266,7 @@ class LocalWinServerClient:
             full_command = ['powershell.exe', '-ExecutionPolicy', 'Bypass', '-Command', script]
             
             # 执行命令
-            result = subprocess.run(
-                full_command,
-                capture_output=True,
-                text=True,
-                timeout=self.timeout
-            )
+            result = self._run(script, full_command)
             
             local_result = LocalWinServerResult(
                 status_code=result.returncode,
@@ -394,6 +418,34 @@ class LocalWinServerClient:
 
         return result
 
+    def reset_password(self, username: str, password: str) -> LocalWinServerResult:
+        """
+        重置本地用户密码
+
+        参数:
+            username: 用户名
+            password: 新密码
+
+        返回:
+            LocalWinServerResult对象，包含执行结果
+        """
+        validate_username(username)
+        validate_string_length(password, 256, "密码")
+        escaped_username = _escape_ps_string(username)
+        escaped_password = _escape_ps_string(password)
+        script = f'''
+        $pw = ConvertTo-SecureString "{escaped_password}" -AsPlainText -Force
+        Set-LocalUser -Name "{escaped_username}" -Password $pw -ErrorAction Stop
+        '''
+
+        logger.info(f"重置本地用户密码: {username}")
+        result = self.execute_powershell(script)
+
+        if result.success:
+            logger.info(f"本地用户密码重置成功: {username}")
+
+        return result
+
     def get_user_info(self, username: str) -> LocalWinServerResult:
         """
         获取本地用户信息
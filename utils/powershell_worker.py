@@ -0,0 +1,328 @@
+"""
+常驻 PowerShell 工作进程
+
+LocalWinServerClient 原先每次操作都启动一个新的 powershell.exe，
+启动开销数百毫秒且占用大量内存。这里维护少量常驻 PowerShell 进程，
+通过 stdin/stdout 上的分帧协议下发脚本：
+
+请求（一行 JSON，写入 stdin）：
+    {"id": 1, "script": "<UTF-8 脚本的 base64>"}
+
+响应（一行，写入 stdout，前缀为 RESPONSE_MARKER）：
+    <<<2C2A_PS_RESPONSE>>>{"id": 1, "status": 0, "stdout": "<base64>", "stderr": "<base64>"}
+
+- 每个请求在独立的 Runspace 中执行，请求之间不共享变量（避免密码残留）
+- 超时的请求会终止对应进程，下次使用时自动重启
+- 进程意外退出时当前请求返回失败（不自动重试，用户创建等操作不是幂等的）
+- 任何实现了同样协议的进程都可以作为工作进程，测试中使用 Python 替身进程
+
+使用方式：
+    from utils.powershell_worker import get_powershell_pool
+
+    pool = get_powershell_pool()
+    if pool is not None:
+        status, stdout, stderr = pool.execute('Get-LocalUser', timeout=30)
+"""
+import atexit
+import base64
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("2c2a")
+
+RESPONSE_MARKER = '<<<2C2A_PS_RESPONSE>>>'
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_REQUESTS = 500
+DEFAULT_ACQUIRE_TIMEOUT = 60
+
+# 常驻进程中运行的请求循环
+HOST_SCRIPT = r'''
+$ErrorActionPreference = 'Stop'
+$utf8 = New-Object System.Text.UTF8Encoding $false
+[Console]::InputEncoding = $utf8
+[Console]::OutputEncoding = $utf8
+$marker = '<<<2C2A_PS_RESPONSE>>>'
+while ($true) {
+    $line = [Console]::In.ReadLine()
+    if ($null -eq $line) { break }
+    if ($line.Trim().Length -eq 0) { continue }
+    $id = $null; $status = 0; $out = ''; $err = ''; $ps = $null
+    try {
+        $req = ConvertFrom-Json $line
+        $id = $req.id
+        $script = $utf8.GetString([Convert]::FromBase64String($req.script))
+        $ps = [PowerShell]::Create()
+        [void]$ps.AddScript($script)
+        $results = $ps.Invoke()
+        $out = ($results | Out-String -Width 4096)
+        if ($ps.Streams.Error.Count -gt 0) {
+            $err = ($ps.Streams.Error | Out-String -Width 4096)
+        }
+        $code = $ps.Runspace.SessionStateProxy.GetVariable('LASTEXITCODE')
+        if ($code -is [int] -and $code -ne 0) { $status = $code }
+        elseif ($ps.HadErrors) { $status = 1 }
+    } catch {
+        $status = 1
+        $err += ($_ | Out-String -Width 4096)
+    } finally {
+        if ($null -ne $ps) { $ps.Dispose() }
+    }
+    $resp = @{
+        id = $id
+        status = $status
+        stdout = [Convert]::ToBase64String($utf8.GetBytes([string]$out))
+        stderr = [Convert]::ToBase64String($utf8.GetBytes([string]$err))
+    } | ConvertTo-Json -Compress
+    [Console]::Out.WriteLine($marker + $resp)
+    [Console]::Out.Flush()
+}
+'''
+
+
+class PowerShellWorkerError(Exception):
+    """工作进程异常退出或协议错误"""
+    pass
+
+
+class PowerShellWorkerTimeout(PowerShellWorkerError):
+    """请求在超时时间内未返回"""
+    pass
+
+
+def default_worker_command() -> List[str]:
+    """启动常驻 powershell.exe 的命令行"""
+    encoded = base64.b64encode(HOST_SCRIPT.encode('utf_16_le')).decode('ascii')
+    return [
+        'powershell.exe', '-NoLogo', '-NoProfile', '-NonInteractive',
+        '-ExecutionPolicy', 'Bypass', '-EncodedCommand', encoded,
+    ]
+
+
+class PowerShellWorker:
+    """单个常驻工作进程"""
+
+    def __init__(self, command: List[str], max_requests: int = DEFAULT_MAX_REQUESTS):
+        """
+        参数:
+            command: 启动工作进程的命令行
+            max_requests: 处理多少个请求后重启进程（防止内存增长），0 表示不限制
+        """
+        self.command = command
+        self.max_requests = max_requests
+        self.process = None
+        self.requests = 0
+        self._next_id = 0
+        self._lines = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.requests = 0
+        self._lines = queue.Queue()
+        threading.Thread(
+            target=self._read_stdout, args=(self.process, self._lines),
+            name='ps-worker-stdout', daemon=True,
+        ).start()
+        threading.Thread(
+            target=self._drain_stderr, args=(self.process,),
+            name='ps-worker-stderr', daemon=True,
+        ).start()
+        logger.info(f"已启动常驻PowerShell进程: pid={self.process.pid}")
+
+    @staticmethod
+    def _read_stdout(process, lines: queue.Queue):
+        for raw in iter(process.stdout.readline, b''):
+            lines.put(raw.decode('utf-8', errors='replace').rstrip('\r\n'))
+        lines.put(None)
+
+    @staticmethod
+    def _drain_stderr(process):
+        for raw in iter(process.stderr.readline, b''):
+            logger.debug(f"PowerShell进程输出: {raw.decode('utf-8', errors='replace').rstrip()}")
+
+    def stop(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            if process.poll() is None:
+                process.kill()
+            process.wait(timeout=5)
+        except Exception as e:
+            logger.warning(f"停止PowerShell进程失败: pid={process.pid}, 错误: {str(e)}")
+        for stream in (process.stdin, process.stdout, process.stderr):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def execute(self, script: str, timeout: float) -> Tuple[int, str, str]:
+        """
+        执行脚本
+
+        返回:
+            (status_code, stdout, stderr)
+
+        异常:
+            PowerShellWorkerTimeout: 超时（进程已被终止）
+            PowerShellWorkerError: 进程异常退出
+        """
+        if not self.alive:
+            self.stop()
+            self.start()
+
+        self._next_id += 1
+        request_id = self._next_id
+        payload = json.dumps({
+            'id': request_id,
+            'script': base64.b64encode(script.encode('utf-8')).decode('ascii'),
+        }) + '\n'
+        try:
+            self.process.stdin.write(payload.encode('utf-8'))
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.stop()
+            raise PowerShellWorkerError(f'PowerShell进程已退出: {str(e)}')
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"PowerShell进程请求超时，终止进程: pid={self.process.pid}")
+                self.stop()
+                raise PowerShellWorkerTimeout(f'命令执行超时 ({timeout}秒)')
+            try:
+                line = self._lines.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if line is None:
+                self.stop()
+                raise PowerShellWorkerError('PowerShell进程意外退出')
+            if not line.startswith(RESPONSE_MARKER):
+                logger.debug(f"忽略PowerShell进程的非协议输出: {line[:200]}")
+                continue
+            try:
+                data = json.loads(line[len(RESPONSE_MARKER):])
+            except json.JSONDecodeError:
+                self.stop()
+                raise PowerShellWorkerError('PowerShell进程响应格式错误')
+            if data.get('id') != request_id:
+                # 之前超时请求的迟到响应
+                continue
+            break
+
+        self.requests += 1
+        if self.max_requests and self.requests >= self.max_requests:
+            logger.info(f"PowerShell进程已处理 {self.requests} 个请求，重启以释放内存")
+            self.stop()
+
+        return (
+            int(data.get('status', 1)),
+            base64.b64decode(data.get('stdout') or '').decode('utf-8', errors='replace'),
+            base64.b64decode(data.get('stderr') or '').decode('utf-8', errors='replace'),
+        )
+
+
+class PowerShellWorkerPool:
+    """常驻 PowerShell 进程池，每个进程同一时间只处理一个请求"""
+
+    def __init__(
+            self,
+            command: Optional[List[str]] = None,
+            size: int = DEFAULT_POOL_SIZE,
+            max_requests: int = DEFAULT_MAX_REQUESTS,
+            acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+    ):
+        self.command = command or default_worker_command()
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._workers = [PowerShellWorker(self.command, max_requests) for _ in range(self.size)]
+        for worker in self._workers:
+            self._idle.put(worker)
+
+    def execute(self, script: str, timeout: float) -> Tuple[int, str, str]:
+        """
+        在空闲进程中执行脚本（进程按需启动）
+
+        异常:
+            PowerShellWorkerTimeout / PowerShellWorkerError
+        """
+        try:
+            worker = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise PowerShellWorkerTimeout(
+                f'等待空闲PowerShell进程超时 ({self.acquire_timeout}秒)'
+            )
+        try:
+            return worker.execute(script, timeout)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_powershell_pool() -> Optional[PowerShellWorkerPool]:
+    """
+    获取进程级 PowerShell 进程池
+
+    LOCAL_POWERSHELL_WORKERS 为 0，或非 Windows 且未配置
+    LOCAL_POWERSHELL_WORKER_COMMAND 时返回 None（调用方回退为逐次启动进程）。
+    """
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+
+    from django.conf import settings
+    size = getattr(settings, 'LOCAL_POWERSHELL_WORKERS', DEFAULT_POOL_SIZE)
+    command = getattr(settings, 'LOCAL_POWERSHELL_WORKER_COMMAND', None)
+    if size <= 0 or (os.name != 'nt' and not command):
+        return None
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # fork 后子进程不能复用父进程的管道
+            _pool = PowerShellWorkerPool(
+                command=command,
+                size=size,
+                max_requests=getattr(
+                    settings, 'LOCAL_POWERSHELL_MAX_REQUESTS', DEFAULT_MAX_REQUESTS
+                ),
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def reset_powershell_pool():
+    """关闭并丢弃进程级进程池（测试和进程退出时使用）"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+        _pool_pid = None
+
+
+atexit.register(reset_powershell_pool)
@@ -0,0 +1,201 @@
+"""
+进度事件推送（Server-Sent Events）
+
+进度页面原先每 1~2 秒轮询一次 JSON 接口，每个打开的页面都在持续查询数据库或 Redis。
+这里提供发布/订阅和 SSE 流：
+
+- publish(channel, payload)：进度变化时发布事件
+  Redis 可用时通过 Redis PUBLISH 跨进程推送（Celery worker -> Web 进程），
+  否则退化为进程内广播（LocMem 环境，仅同进程可见）
+- event_stream(channel, snapshot, is_finished)：先发送当前快照，之后推送事件；
+  PROGRESS_STREAM_HEARTBEAT 秒内没有事件时重新读取一次快照（覆盖进程内广播
+  收不到的事件），有变化则推送，否则发送心跳注释
+- 流最长保持 PROGRESS_STREAM_MAX_SECONDS 秒（有界长轮询），浏览器 EventSource
+  在 RECONNECT_DELAY_MS 毫秒后自动重连；该时长必须小于 Gunicorn 的 worker timeout
+  （部署手册中 sync worker 为 30 秒），否则流会被当作超时请求强制终止
+
+使用方式：
+    from utils.progress_events import event_stream, publish, sse_response
+
+    publish('task:tasks.asynctask:1', {'progress': 30})
+
+    return sse_response(event_stream(channel, snapshot, is_finished))
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from utils.redis_helper import get_redis_client
+
+logger = logging.getLogger("2c2a")
+
+CHANNEL_PREFIX = '2c2a:progress:'
+DEFAULT_HEARTBEAT = 15
+DEFAULT_MAX_SECONDS = 20
+# 流结束或断开后浏览器重连的等待时间（毫秒）
+RECONNECT_DELAY_MS = 1000
+# 进程内订阅队列长度，消费过慢时丢弃事件，由心跳快照补齐
+LOCAL_QUEUE_SIZE = 100
+
+
+class _LocalBroker:
+    """进程内发布/订阅（Redis 不可用时使用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, set] = {}
+
+    def subscribe(self, channel: str) -> queue.Queue:
+        q = queue.Queue(maxsize=LOCAL_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(q)
+        return q
+
+    def unsubscribe(self, channel: str, q: queue.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, channel: str, data: str) -> int:
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(data)
+            except queue.Full:
+                pass
+        return len(subscribers)
+
+
+_local_broker = _LocalBroker()
+
+
+def publish(channel: str, payload: Dict) -> None:
+    """发布进度事件，失败只记录日志，不影响任务执行"""
+    data = json.dumps(payload, default=str)
+    client = get_redis_client()
+    if client is None:
+        _local_broker.publish(channel, data)
+        return
+    try:
+        client.publish(CHANNEL_PREFIX + channel, data)
+    except Exception as e:
+        logger.debug(f"发布进度事件失败: channel={channel}, 错误: {str(e)}")
+
+
+class Subscription:
+    """单个频道的订阅，get() 返回下一条事件或超时返回 None"""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._pubsub = None
+        self._queue = None
+        client = get_redis_client()
+        if client is not None:
+            try:
+                self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(CHANNEL_PREFIX + channel)
+            except Exception as e:
+                logger.warning(f"订阅进度事件失败，改用进程内广播: {str(e)}")
+                self._pubsub = None
+        if self._pubsub is None:
+            self._queue = _local_broker.subscribe(channel)
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        if self._queue is not None:
+            try:
+                return json.loads(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                return None
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            message = self._pubsub.get_message(timeout=remaining)
+            if message and message.get('type') == 'message':
+                return json.loads(message['data'])
+
+    def close(self):
+        if self._queue is not None:
+            _local_broker.unsubscribe(self.channel, self._queue)
+        if self._pubsub is not None:
+            try:
+                self._pubsub.close()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def subscribe(channel: str) -> Subscription:
+    return Subscription(channel)
+
+
+def format_event(payload: Dict) -> str:
+    return f"data: {json.dumps(payload, default=str, ensure_ascii=False)}\n\n"
+
+
+def event_stream(
+        channel: str,
+        snapshot: Callable[[], Optional[Dict]],
+        is_finished: Callable[[Dict], bool],
+        heartbeat: Optional[float] = None,
+        max_seconds: Optional[float] = None,
+) -> Iterator[str]:
+    """
+    生成 SSE 数据
+
+    参数:
+        channel: 事件频道
+        snapshot: 返回当前完整状态（优先读缓存），用于首次发送和心跳补齐
+        is_finished: 状态已结束时返回 True，发送后关闭流
+        heartbeat: 无事件时的快照间隔，默认 settings.PROGRESS_STREAM_HEARTBEAT
+        max_seconds: 流最长保持时间，默认 settings.PROGRESS_STREAM_MAX_SECONDS
+    """
+    heartbeat = heartbeat or getattr(settings, 'PROGRESS_STREAM_HEARTBEAT', DEFAULT_HEARTBEAT)
+    max_seconds = max_seconds or getattr(settings, 'PROGRESS_STREAM_MAX_SECONDS', DEFAULT_MAX_SECONDS)
+    deadline = time.monotonic() + max_seconds
+
+    # 先订阅再读快照，避免两者之间的事件丢失
+    with subscribe(channel) as subscription:
+        yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+        last = snapshot()
+        if last is not None:
+            yield format_event(last)
+            if is_finished(last):
+                return
+
+        while time.monotonic() < deadline:
+            payload = subscription.get(min(heartbeat, max(0.0, deadline - time.monotonic())))
+            if payload is None:
+                payload = snapshot()
+                if payload is None or payload == last:
+                    yield ": keepalive\n\n"
+                    continue
+            last = payload
+            yield format_event(payload)
+            if is_finished(payload):
+                return
+
+
+def sse_response(stream: Iterator[str]) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 关闭 Nginx 代理缓冲，事件立即送达浏览器
+    response['X-Accel-Buffering'] = 'no'
+    return response
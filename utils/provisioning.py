@@ -0,0 +1,346 @@
+"""
+开户组合脚本
+
+将开户涉及的多个远程步骤（创建用户、加入用户组、加入远程桌面组、
+设置各磁盘配额）合并为一个 PowerShell 脚本，只需一次远程执行。
+
+脚本逐步执行并记录每一步的结果，最后输出一段 JSON：
+- 每一步都有 step / success / message / required 字段
+- 必需步骤失败且启用回滚时，删除本次创建的用户并追加 rollback 步骤
+
+使用方式：
+    from utils.provisioning import provision_user
+
+    result = provision_user(client, 'alice', password, quotas={'C:': 10240})
+    if not result.success:
+        print(result.error_message)
+"""
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from utils.disk_quota import MB_TO_BYTES, validate_disk_letter, validate_quota_value
+from utils.winrm_client import (
+    CommandInjectionError,
+    _escape_ps_string,
+    validate_groupname,
+    validate_string_length,
+    validate_username,
+)
+
+logger = logging.getLogger("2c2a")
+
+RESULT_MARKER = '<<<2C2A_PROVISION_RESULT>>>'
+REMOTE_DESKTOP_GROUP = 'Remote Desktop Users'
+
+
+@dataclass
+class ProvisioningStep:
+    step: str
+    success: bool
+    message: str = ''
+    required: bool = True
+
+
+@dataclass
+class ProvisioningResult:
+    """
+    组合开户脚本的执行结果
+
+    属性:
+        steps: 每一步的执行结果
+        status_code: 远程执行的状态码
+        std_err: 远程执行的标准错误
+    """
+    steps: List[ProvisioningStep] = field(default_factory=list)
+    status_code: int = 0
+    std_err: str = ''
+
+    def get_step(self, name: str) -> Optional[ProvisioningStep]:
+        for step in self.steps:
+            if step.step == name:
+                return step
+        return None
+
+    @property
+    def user_created(self) -> bool:
+        step = self.get_step('create_user')
+        return bool(step and step.success)
+
+    @property
+    def rolled_back(self) -> bool:
+        step = self.get_step('rollback')
+        return bool(step and step.success)
+
+    @property
+    def failed_steps(self) -> List[ProvisioningStep]:
+        return [s for s in self.steps if not s.success]
+
+    @property
+    def success(self) -> bool:
+        """用户已创建、未回滚且所有必需步骤都成功"""
+        if not self.user_created or self.rolled_back:
+            return False
+        return all(s.success for s in self.steps if s.required)
+
+    @property
+    def error_message(self) -> str:
+        failed = self.failed_steps
+        if failed:
+            return '; '.join(f"{s.step}: {s.message}" for s in failed)
+        if not self.steps:
+            return self.std_err or '未返回开户结果'
+        return ''
+
+
+def build_provisioning_script(
+        username: str,
+        password: str,
+        description: Optional[str] = None,
+        groups: Optional[List[str]] = None,
+        quotas: Optional[Dict[str, Any]] = None,
+        add_to_remote_desktop: bool = True,
+        require_password_change: bool = False,
+        quota_required: bool = False,
+        rollback_on_failure: bool = True,
+) -> str:
+    """
+    生成组合开户 PowerShell 脚本
+
+    参数:
+        username: Windows 用户名
+        password: 初始密码
+        description: 用户描述
+        groups: 额外加入的本地组，"Users" 总是会加入
+        quotas: 磁盘配额配置（MB），如 {"C:": 10240}
+        add_to_remote_desktop: 是否加入远程桌面用户组
+        require_password_change: 是否要求首次登录修改密码
+        quota_required: 配额设置失败是否视为开户失败
+        rollback_on_failure: 必需步骤失败时是否删除已创建的用户
+
+    返回:
+        str: PowerShell 脚本
+
+    异常:
+        CommandInjectionError / ValueError: 参数校验失败
+    """
+    validate_username(username)
+    validate_string_length(password, 256, "密码")
+    if description:
+        validate_string_length(description, 512, "描述")
+
+    all_groups = ['Users']
+    for group in groups or []:
+        validate_groupname(group)
+        if group not in all_groups:
+            all_groups.append(group)
+
+    quota_items = []
+    for disk_letter, quota_mb in (quotas or {}).items():
+        drive = validate_disk_letter(disk_letter)
+        quota_mb = validate_quota_value(quota_mb, f"磁盘 {disk_letter} 配额")
+        warning_mb = int(quota_mb * 0.8)
+        quota_items.append((drive, quota_mb * MB_TO_BYTES, warning_mb * MB_TO_BYTES))
+
+    safe_user = _escape_ps_string(username)
+    safe_pass = _escape_ps_string(password)
+    safe_desc = _escape_ps_string(description or '')
+
+    lines = [
+        "$ErrorActionPreference = 'Stop'",
+        "$steps = New-Object System.Collections.ArrayList",
+        "function Add-Step($name, $ok, $msg, $required) {",
+        "    [void]$steps.Add([PSCustomObject]@{ step = $name; success = [bool]$ok; "
+        "message = [string]$msg; required = [bool]$required })",
+        "}",
+        f'$username = "{safe_user}"',
+        "$created = $false",
+        "try {",
+        f'    $pw = ConvertTo-SecureString "{safe_pass}" -AsPlainText -Force',
+        f'    New-LocalUser -Name $username -Password $pw -Description "{safe_desc}" '
+        '-ErrorAction Stop | Out-Null',
+        "    $created = $true",
+        "    Add-Step 'create_user' $true '' $true",
+        "} catch {",
+        "    Add-Step 'create_user' $false $_.Exception.Message $true",
+        "}",
+        "if ($created) {",
+    ]
+
+    if require_password_change:
+        lines += [
+            "    try {",
+            '        $out = & net user $username /logonpasswordchg:YES 2>&1',
+            "        if ($LASTEXITCODE -ne 0) { throw \"$out\" }",
+            "        Add-Step 'password_change' $true '' $true",
+            "    } catch {",
+            "        Add-Step 'password_change' $false $_.Exception.Message $true",
+            "    }",
+        ]
+
+    for group in all_groups:
+        safe_group = _escape_ps_string(group)
+        lines += [
+            "    try {",
+            f'        Add-LocalGroupMember -Group "{safe_group}" -Member $username -ErrorAction Stop',
+            f"        Add-Step 'group:{safe_group}' $true '' $true",
+            "    } catch {",
+            f"        Add-Step 'group:{safe_group}' $false $_.Exception.Message $true",
+            "    }",
+        ]
+
+    if add_to_remote_desktop:
+        lines += [
+            "    try {",
+            f'        Add-LocalGroupMember -Group "{REMOTE_DESKTOP_GROUP}" -Member $username '
+            '-ErrorAction Stop',
+            "        Add-Step 'remote_desktop' $true '' $false",
+            "    } catch {",
+            "        Add-Step 'remote_desktop' $false $_.Exception.Message $false",
+            "    }",
+        ]
+
+    quota_flag = '$true' if quota_required else '$false'
+    for drive, quota_bytes, warning_bytes in quota_items:
+        lines += [
+            "    try {",
+            f'        $drive = "{drive}"',
+            "        $vol = Get-CimInstance Win32_Volume -Filter \"DriveLetter='$drive'\"",
+            "        if (-not $vol) { throw \"找不到卷 $drive\" }",
+            "        if (-not $vol.QuotasEnabled) {",
+            "            $out = & fsutil quota enforce $drive 2>&1",
+            "            if ($LASTEXITCODE -ne 0) { throw \"启用配额失败: $out\" }",
+            "        }",
+            f"        $out = & fsutil quota modify $drive {warning_bytes} {quota_bytes} $username 2>&1",
+            "        if ($LASTEXITCODE -ne 0) { throw \"设置用户配额失败: $out\" }",
+            f"        Add-Step 'quota:{drive}' $true '' {quota_flag}",
+            "    } catch {",
+            f"        Add-Step 'quota:{drive}' $false $_.Exception.Message {quota_flag}",
+            "    }",
+        ]
+
+    lines.append("}")
+
+    if rollback_on_failure:
+        lines += [
+            "$failed = @($steps | Where-Object { $_.required -and -not $_.success })",
+            "if ($created -and $failed.Count -gt 0) {",
+            "    try {",
+            "        Remove-LocalUser -Name $username -ErrorAction Stop",
+            "        Add-Step 'rollback' $true '' $false",
+            "    } catch {",
+            "        Add-Step 'rollback' $false $_.Exception.Message $false",
+            "    }",
+            "}",
+        ]
+
+    lines += [
+        f"Write-Output '{RESULT_MARKER}'",
+        "ConvertTo-Json -InputObject @($steps) -Compress",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def parse_provisioning_output(result) -> ProvisioningResult:
+    """
+    解析组合开户脚本的输出
+
+    参数:
+        result: WinrmResult / LocalWinServerResult 等执行结果
+
+    返回:
+        ProvisioningResult: 未找到结果标记时 steps 为空
+    """
+    parsed = ProvisioningResult(
+        status_code=result.status_code,
+        std_err=(result.std_err or '').strip(),
+    )
+    output = result.std_out or ''
+    if RESULT_MARKER not in output:
+        return parsed
+
+    payload = output.split(RESULT_MARKER, 1)[1].strip()
+    try:
+        data = json.loads(payload)
+    except json.JSONDecodeError:
+        logger.error(f"开户结果解析失败: {payload[:200]}")
+        return parsed
+
+    if isinstance(data, dict):
+        data = [data]
+
+    for item in data:
+        parsed.steps.append(ProvisioningStep(
+            step=str(item.get('step', '')),
+            success=bool(item.get('success')),
+            message=str(item.get('message') or ''),
+            required=bool(item.get('required', True)),
+        ))
+    return parsed
+
+
+def provision_user(
+        client,
+        username: str,
+        password: str,
+        description: Optional[str] = None,
+        groups: Optional[List[str]] = None,
+        quotas: Optional[Dict[str, Any]] = None,
+        **options,
+) -> ProvisioningResult:
+    """
+    通过客户端一次性完成开户
+
+    Args:
+        client: WinrmClient / LocalWinServerClient / TunnelConnectionAdapter 实例
+        username: Windows 用户名
+        password: 初始密码
+        description: 用户描述
+        groups: 额外加入的本地组
+        quotas: 磁盘配额配置（MB）
+        **options: 透传给 build_provisioning_script 的其他选项
+
+    Returns:
+        ProvisioningResult: 每一步的执行结果
+    """
+    try:
+        script = build_provisioning_script(
+            username, password, description=description,
+            groups=groups, quotas=quotas, **options
+        )
+    except (CommandInjectionError, ValueError) as e:
+        logger.warning(f"开户参数校验失败: {str(e)}")
+        return ProvisioningResult(
+            steps=[ProvisioningStep('validate', False, str(e))],
+            status_code=1,
+        )
+
+    if os.environ.get('2C2A_DEMO', '').lower() == '1':
+        logger.info(f"DEMO模式: 模拟组合开户 {username}")
+        steps = [ProvisioningStep('create_user', True)]
+        steps += [
+            ProvisioningStep(f'quota:{validate_disk_letter(d)}', True, required=False)
+            for d in (quotas or {})
+        ]
+        return ProvisioningResult(steps=steps)
+
+    logger.info(f"执行组合开户脚本: 用户={username}, 配额磁盘={list((quotas or {}).keys())}")
+    result = parse_provisioning_output(client.execute_powershell(script))
+
+    if result.success:
+        failed = result.failed_steps
+        if failed:
+            logger.warning(
+                f"组合开户完成但部分可选步骤失败: 用户={username}, "
+                f"{result.error_message}"
+            )
+        else:
+            logger.info(f"组合开户成功: 用户={username}")
+    else:
+        logger.error(
+            f"组合开户失败: 用户={username}, 已回滚={result.rolled_back}, "
+            f"错误: {result.error_message}"
+        )
+    return result
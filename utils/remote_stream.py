@@ -0,0 +1,250 @@
+"""
+远程脚本流式输出
+
+长时间运行的脚本（配置 WinRM、安装证书等）在 execute_powershell 中
+要等全部执行完成才返回，期间没有任何进度，超大输出也会整体驻留内存。
+这里提供流式执行：
+
+- WS-Man 每次 Receive 响应到达即回调输出片段
+- 只保留最后 max_output 个字符的输出，超出部分丢弃并标记截断
+- 脚本通过进度标记行上报进度，可直接更新 AsyncTask.progress
+
+进度标记行格式（单独一行）：
+    ##2C2A_PROGRESS <0-100> [说明文字]
+
+使用方式：
+    from utils.remote_stream import progress_marker, stream_powershell, task_progress_callback
+
+    script = progress_marker(10, '启用 PSRemoting') + 'Enable-PSRemoting -Force\\n'
+    result = stream_powershell(client, script, on_progress=task_progress_callback(task))
+"""
+import codecs
+import logging
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from utils.winrm_client import WinrmResult
+
+logger = logging.getLogger("2c2a")
+
+PROGRESS_MARKER = '##2C2A_PROGRESS'
+PROGRESS_PATTERN = re.compile(r'^##2C2A_PROGRESS\s+(\d{1,3})(?:\s+(.*))?$')
+DEFAULT_MAX_OUTPUT = 1024 * 1024
+
+
+@dataclass
+class OutputChunk:
+    """
+    一次 Receive 响应中的输出片段
+
+    stream 为 'stdout'、'stderr' 或 'exit'（命令结束，status_code 为退出码）
+    """
+    stream: str
+    data: bytes = b''
+    status_code: Optional[int] = None
+
+
+def progress_marker(percent: int, message: str = '') -> str:
+    """生成输出进度标记行的 PowerShell 语句"""
+    percent = max(0, min(100, int(percent)))
+    safe_message = (message or '').replace("'", "''").replace('\r', ' ').replace('\n', ' ')
+    return f"Write-Output '{PROGRESS_MARKER} {percent} {safe_message}'\n"
+
+
+class _TailBuffer:
+    """只保留最后 limit 个字符的文本缓冲"""
+
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self._parts = deque()
+        self._size = 0
+        self.dropped = 0
+
+    def append(self, text: str):
+        if not text:
+            return
+        self._parts.append(text)
+        self._size += len(text)
+        if self.limit is None:
+            return
+        while self._size > self.limit and self._parts:
+            excess = self._size - self.limit
+            head = self._parts[0]
+            if len(head) <= excess:
+                self._parts.popleft()
+                self._size -= len(head)
+                self.dropped += len(head)
+            else:
+                self._parts[0] = head[excess:]
+                self._size -= excess
+                self.dropped += excess
+
+    def getvalue(self) -> str:
+        text = ''.join(self._parts)
+        if self.dropped:
+            return f'[输出过长，已丢弃前 {self.dropped} 个字符]\n' + text
+        return text
+
+
+class OutputCollector:
+    """
+    汇总流式输出
+
+    参数:
+        max_output: 每个流最多保留的字符数，None 表示不限制
+        on_output: 输出回调 on_output(stream, text)，进度标记行不会回调
+        on_progress: 进度回调 on_progress(percent, message)
+    """
+
+    def __init__(
+            self,
+            max_output: Optional[int] = DEFAULT_MAX_OUTPUT,
+            on_output: Optional[Callable[[str, str], None]] = None,
+            on_progress: Optional[Callable[[int, str], None]] = None,
+    ):
+        self.on_output = on_output
+        self.on_progress = on_progress
+        self.stdout = _TailBuffer(max_output)
+        self.stderr = _TailBuffer(max_output)
+        self.stderr_bytes = bytearray()
+        self.status_code = None
+        self.progress = None
+        self._max_output = max_output
+        self._decoders = {
+            'stdout': codecs.getincrementaldecoder('utf-8')(errors='ignore'),
+            'stderr': codecs.getincrementaldecoder('utf-8')(errors='ignore'),
+        }
+        self._partial_line = ''
+
+    def feed(self, chunk: OutputChunk):
+        if chunk.stream == 'exit':
+            self.status_code = chunk.status_code
+            self._flush_line()
+            return
+        text = self._decoders[chunk.stream].decode(chunk.data)
+        if chunk.stream == 'stderr':
+            # 保留原始字节用于解析 CLIXML，超出上限后不再保留
+            if self.stderr_bytes is not None:
+                if (self._max_output is None
+                        or len(self.stderr_bytes) + len(chunk.data) <= self._max_output):
+                    self.stderr_bytes.extend(chunk.data)
+                else:
+                    self.stderr_bytes = None
+            self.stderr.append(text)
+            self._emit('stderr', text)
+            return
+        self.feed_stdout(text)
+
+    def feed_stdout(self, text: str):
+        """按行处理标准输出，识别进度标记"""
+        text = self._partial_line + text
+        lines = text.splitlines(keepends=True)
+        self._partial_line = ''
+        if lines and not lines[-1].endswith(('\n', '\r')):
+            self._partial_line = lines.pop()
+        for line in lines:
+            self._handle_line(line)
+
+    def _flush_line(self):
+        if self._partial_line:
+            line, self._partial_line = self._partial_line, ''
+            self._handle_line(line)
+
+    def _handle_line(self, line: str):
+        match = PROGRESS_PATTERN.match(line.strip())
+        if match:
+            percent = min(100, int(match.group(1)))
+            message = (match.group(2) or '').strip()
+            self.progress = percent
+            if self.on_progress:
+                try:
+                    self.on_progress(percent, message)
+                except Exception as e:
+                    logger.error(f"进度回调失败: {str(e)}")
+            return
+        self.stdout.append(line)
+        self._emit('stdout', line)
+
+    def _emit(self, stream: str, text: str):
+        if self.on_output and text:
+            try:
+                self.on_output(stream, text)
+            except Exception as e:
+                logger.error(f"输出回调失败: {str(e)}")
+
+    def result(self, status_code: Optional[int] = None,
+               clean_stderr: Optional[Callable[[bytes], bytes]] = None) -> WinrmResult:
+        """
+        生成 WinrmResult
+
+        参数:
+            status_code: 退出码，默认使用 exit 片段中的值
+            clean_stderr: 标准错误清理函数（如 pywinrm 的 CLIXML 解析）
+        """
+        self._flush_line()
+        std_err = self.stderr.getvalue()
+        if clean_stderr and self.stderr_bytes and not self.stderr.dropped:
+            std_err = clean_stderr(bytes(self.stderr_bytes)).decode('utf-8', errors='ignore')
+        if status_code is None:
+            status_code = self.status_code if self.status_code is not None else -1
+        return WinrmResult(
+            status_code=status_code,
+            std_out=self.stdout.getvalue(),
+            std_err=std_err,
+        )
+
+
+def stream_powershell(
+        client,
+        script: str,
+        on_output: Optional[Callable[[str, str], None]] = None,
+        on_progress: Optional[Callable[[int, str], None]] = None,
+        max_output: Optional[int] = DEFAULT_MAX_OUTPUT,
+) -> WinrmResult:
+    """
+    流式执行 PowerShell 脚本
+
+    客户端支持流式执行（WinrmClient）时边执行边回调；
+    其他客户端（本地WinServer、隧道）退化为执行完成后一次性解析输出，
+    进度标记同样会被识别并从结果中剔除。
+
+    参数:
+        client: 连接客户端
+        script: PowerShell 脚本
+        on_output: 输出回调 on_output(stream, text)
+        on_progress: 进度回调 on_progress(percent, message)
+        max_output: 每个流最多保留的字符数
+    """
+    if hasattr(client, 'stream_powershell'):
+        return client.stream_powershell(
+            script, on_output=on_output, on_progress=on_progress, max_output=max_output
+        )
+
+    collector = OutputCollector(max_output, on_output=on_output, on_progress=on_progress)
+    result = client.execute_powershell(script)
+    collector.feed_stdout(result.std_out or '')
+    collector.stderr.append(result.std_err or '')
+    return collector.result(status_code=result.status_code)
+
+
+def task_progress_callback(task, start: int = 0, end: int = 100, reporter=None):
+    """
+    生成把脚本进度写入 AsyncTask 的回调
+
+    脚本上报的 0-100 映射到任务进度的 [start, end] 区间，进度只增不减。
+    进度经 ProgressReporter 缓冲写入；调用方传入自己的 reporter 时，
+    应在任务结束前调用 reporter.flush()，否则由回调的 reporter 属性获取。
+    """
+    if reporter is None:
+        reporter = task.progress_reporter()
+
+    def _callback(percent: int, message: str):
+        mapped = start + int((end - start) * percent / 100)
+        if mapped <= (task.progress or 0):
+            return
+        reporter.update(mapped, message or None)
+
+    _callback.reporter = reporter
+    return _callback
@@ -0,0 +1,660 @@
+import json
+import threading
+import time
+
+import pytest
+
+from utils.winrm_client import WinrmResult
+from utils.winrm_pool import SessionPoolTimeout, WinrmSessionPool, make_pool_key
+
+
+class _FakeSession:
+    def __init__(self):
+        self.closed = False
+
+
+class TestWinrmSessionPool:
+    def setup_method(self):
+        self.key = make_pool_key('http://host:5985/wsman', 'admin', 'secret')
+
+    def test_session_reused_after_release(self):
+        pool = WinrmSessionPool(max_per_host=2)
+        with pool.session(self.key, _FakeSession) as first:
+            pass
+        with pool.session(self.key, _FakeSession) as second:
+            pass
+        assert first is second
+        assert pool.stats()['created'] == 1
+        assert pool.stats()['reused'] == 1
+
+    def test_session_discarded_on_error(self):
+        pool = WinrmSessionPool(max_per_host=2)
+        with pytest.raises(RuntimeError):
+            with pool.session(self.key, _FakeSession) as first:
+                raise RuntimeError('connection reset')
+        with pool.session(self.key, _FakeSession) as second:
+            pass
+        assert first is not second
+
+    def test_idle_session_evicted(self):
+        pool = WinrmSessionPool(max_per_host=2, idle_timeout=0.01)
+        with pool.session(self.key, _FakeSession):
+            pass
+        threading.Event().wait(0.05)
+        assert pool.evict_idle() == 1
+        assert pool.stats()['idle'] == 0
+
+    def test_max_per_host_limit(self):
+        pool = WinrmSessionPool(max_per_host=1, acquire_timeout=0.05)
+        held = pool.acquire(self.key, _FakeSession)
+        with pytest.raises(SessionPoolTimeout):
+            pool.acquire(self.key, _FakeSession)
+        pool.release(self.key, held)
+        assert pool.acquire(self.key, _FakeSession) is held
+
+    def test_key_does_not_contain_password(self):
+        assert 'secret' not in make_pool_key('http://h/wsman', 'u', 'secret')
+
+
+class _FakeProtocol:
+    def __init__(self):
+        self.opened = 0
+        self.closed = 0
+        self.commands = []
+
+    def open_shell(self):
+        self.opened += 1
+        return 'shell-1'
+
+    def run_command(self, shell_id, command, arguments=()):
+        self.commands.append(command)
+        return f'cmd-{len(self.commands)}'
+
+    def get_command_output(self, shell_id, command_id):
+        return b'ok', b'', 0
+
+    def cleanup_command(self, shell_id, command_id):
+        pass
+
+    def close_shell(self, shell_id):
+        self.closed += 1
+
+
+class _FakeWinrmSession:
+    def __init__(self):
+        self.protocol = _FakeProtocol()
+
+    def _clean_error_msg(self, msg):
+        return msg
+
+
+class TestRemoteShell:
+    def _client(self):
+        from utils.winrm_client import WinrmClient
+
+        client = WinrmClient('localhost', 'admin', 'secret', use_pool=False, max_retries=1)
+        client._session = _FakeWinrmSession()
+        return client
+
+    def test_create_user_uses_single_shell(self):
+        client = self._client()
+        result = client.create_user('alice', 'P@ssw0rd!')
+        protocol = client.session.protocol
+        assert result.success
+        assert protocol.opened == 1
+        assert protocol.closed == 1
+        assert len(protocol.commands) == 2
+
+    def test_nested_shell_reuses_outer(self):
+        client = self._client()
+        with client.remote_shell() as outer:
+            with client.remote_shell() as inner:
+                client.execute_powershell('whoami')
+            assert inner is outer
+            client.execute_command('hostname')
+        protocol = client.session.protocol
+        assert protocol.opened == 1
+        assert protocol.closed == 1
+        assert len(protocol.commands) == 2
+
+
+class TestProvisioningScript:
+    def test_script_contains_all_steps(self):
+        from utils.provisioning import RESULT_MARKER, build_provisioning_script
+
+        script = build_provisioning_script(
+            'alice', 'P@ss"word$', groups=['Developers'], quotas={'c:': 1024, 'D:': 2048}
+        )
+        assert "New-LocalUser" in script
+        assert "group:Users" in script and "group:Developers" in script
+        assert "Remote Desktop Users" in script
+        assert "quota:C:" in script and "quota:D:" in script
+        assert 'P@ss`"word`$' in script
+        assert RESULT_MARKER in script
+
+    def test_invalid_username_rejected_without_remote_call(self):
+        from utils.provisioning import provision_user
+
+        client = type('C', (), {'execute_powershell': lambda self, s: pytest.fail('called')})()
+        result = provision_user(client, 'bad;name', 'x')
+        assert not result.success
+        assert result.get_step('validate') is not None
+
+    def test_parse_partial_failure_with_rollback(self):
+        from utils.provisioning import RESULT_MARKER, parse_provisioning_output
+        from utils.winrm_client import WinrmResult
+
+        output = RESULT_MARKER + '\n' + (
+            '[{"step":"create_user","success":true,"message":"","required":true},'
+            '{"step":"group:Users","success":false,"message":"denied","required":true},'
+            '{"step":"rollback","success":true,"message":"","required":false}]'
+        )
+        result = parse_provisioning_output(WinrmResult(0, output, ''))
+        assert result.user_created
+        assert result.rolled_back
+        assert not result.success
+        assert 'group:Users: denied' in result.error_message
+
+    def test_parse_optional_failure_still_succeeds(self):
+        from utils.provisioning import RESULT_MARKER, parse_provisioning_output
+        from utils.winrm_client import WinrmResult
+
+        output = RESULT_MARKER + (
+            '[{"step":"create_user","success":true,"message":"","required":true},'
+            '{"step":"quota:C:","success":false,"message":"no volume","required":false}]'
+        )
+        result = parse_provisioning_output(WinrmResult(0, output, ''))
+        assert result.success
+        assert [s.step for s in result.failed_steps] == ['quota:C:']
+
+
+class TestHostSemaphore:
+    def test_limits_holders_and_serves_waiters_in_order(self):
+        from utils.host_semaphore import HostSemaphore
+
+        semaphore = HostSemaphore('sem-fifo:5985', limit=1, wait_timeout=5)
+        first = semaphore.acquire()
+        order = []
+
+        def _worker(index):
+            with semaphore.slot():
+                order.append(index)
+                time.sleep(0.01)
+
+        threads = []
+        for index in range(3):
+            thread = threading.Thread(target=_worker, args=(index,))
+            thread.start()
+            threads.append(thread)
+            # 确保按顺序排队
+            time.sleep(0.05)
+        assert order == []
+        first.release()
+        for thread in threads:
+            thread.join(5)
+        assert order == [0, 1, 2]
+
+    def test_timeout_raises_and_records_metrics(self):
+        from utils.host_semaphore import (
+            HostBusyError,
+            HostSemaphore,
+            get_wait_metrics,
+            reset_wait_metrics,
+        )
+
+        reset_wait_metrics()
+        semaphore = HostSemaphore('sem-busy:5985', limit=1, wait_timeout=0.1)
+        errors = []
+        with semaphore.slot():
+            # 同一线程再次申请时复用已持有的槽位
+            with semaphore.slot():
+                pass
+
+            def _other():
+                try:
+                    semaphore.acquire()
+                except HostBusyError as e:
+                    errors.append(e)
+
+            thread = threading.Thread(target=_other)
+            thread.start()
+            thread.join(5)
+
+        assert len(errors) == 1
+        metrics = get_wait_metrics('sem-busy:5985')
+        assert metrics['acquired'] == 1
+        assert metrics['timeouts'] == 1
+        assert metrics['max_wait'] >= 0.1
+        # 释放后可以再次获取
+        semaphore.acquire().release()
+
+    def test_remote_shell_holds_slot_until_closed(self):
+        from utils.host_semaphore import HostBusyError
+        from utils.winrm_client import WinrmClient
+
+        client = WinrmClient('localhost', 'admin', 'secret', use_pool=False, max_retries=1,
+                             max_concurrency=1)
+        client._session = _FakeWinrmSession()
+        client._slots.wait_timeout = 0.1
+        errors = []
+
+        def _other():
+            try:
+                client._slots.acquire()
+            except HostBusyError as e:
+                errors.append(e)
+
+        with client.remote_shell():
+            client.execute_powershell('whoami')
+            thread = threading.Thread(target=_other)
+            thread.start()
+            thread.join(5)
+        assert len(errors) == 1
+        client._slots.acquire().release()
+
+
+class TestHostCircuitBreaker:
+    def setup_method(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def teardown_method(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _breaker(self, **kwargs):
+        from utils.circuit_breaker import HostCircuitBreaker
+        return HostCircuitBreaker(
+            'dead-host:5985', failure_threshold=2, reset_timeout=0.2,
+            max_reset_timeout=5, **kwargs
+        )
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        from utils.circuit_breaker import STATE_CLOSED, STATE_OPEN
+        breaker = self._breaker()
+        breaker.record_failure()
+        assert breaker.allow_request()
+        assert breaker.state == STATE_CLOSED
+        breaker.record_failure()
+        assert breaker.state == STATE_OPEN
+        assert not breaker.allow_request()
+
+    def test_half_open_allows_single_probe(self):
+        from utils.circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN
+        breaker = self._breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        time.sleep(0.25)
+        assert breaker.allow_request()
+        assert breaker.state == STATE_HALF_OPEN
+        assert not breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == STATE_CLOSED
+
+    def test_failed_probe_reopens_with_longer_backoff(self):
+        breaker = self._breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        time.sleep(0.25)
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert not breaker.allow_request()
+        assert breaker._load()['trips'] == 2
+
+    def test_client_fails_fast_when_open(self):
+        from utils.circuit_breaker import CircuitOpenError
+        from utils.winrm_client import WinrmClient
+
+        client = WinrmClient('localhost', 'admin', 'secret', use_pool=False, max_retries=3)
+        client._breaker.failure_threshold = 1
+        fake = _FakeWinrmSession()
+
+        def _boom(*args, **kwargs):
+            raise ConnectionError('timed out')
+        fake.run_ps = _boom
+        client._session = fake
+
+        with pytest.raises(Exception):
+            client.execute_powershell('hostname')
+        with pytest.raises(CircuitOpenError):
+            client.execute_powershell('hostname')
+
+
+class TestDnsResolverCache:
+    def _cache(self, **kwargs):
+        import socket
+        from utils.dns_cache import DnsResolverCache
+
+        calls = []
+
+        def resolver(hostname):
+            calls.append(hostname)
+            if hostname.startswith('bad'):
+                raise socket.gaierror(socket.EAI_NONAME, 'not found')
+            return '10.0.0.%d' % len(calls)
+
+        return DnsResolverCache(resolver=resolver, **kwargs), calls
+
+    def test_positive_and_negative_results_cached(self):
+        import socket
+        cache, calls = self._cache(ttl=60, negative_ttl=60)
+        assert cache.resolve('win01') == cache.resolve('win01')
+        for _ in range(2):
+            with pytest.raises(socket.gaierror):
+                cache.resolve('bad-host')
+        assert calls == ['win01', 'bad-host']
+
+    def test_ip_literal_bypasses_resolver(self):
+        cache, calls = self._cache()
+        assert cache.resolve('192.168.1.10') == '192.168.1.10'
+        assert calls == []
+
+    def test_expired_entry_resolved_again(self):
+        cache, calls = self._cache(ttl=0.05, refresh_ahead=0)
+        cache.resolve('win01')
+        time.sleep(0.06)
+        cache.resolve('win01')
+        assert calls == ['win01', 'win01']
+
+    def test_refresh_ahead_returns_cached_and_refreshes(self):
+        cache, calls = self._cache(ttl=0.5, refresh_ahead=0.1)
+        first = cache.resolve('win01')
+        time.sleep(0.1)
+        assert cache.resolve('win01') == first
+        for _ in range(50):
+            if cache._entries['win01'].address != first:
+                break
+            time.sleep(0.01)
+        assert calls == ['win01', 'win01']
+        assert cache.resolve('win01') != first
+
+    def test_refresh_ahead_error_keeps_entry_and_clears_flag(self):
+        from utils.dns_cache import DnsResolverCache
+
+        calls = []
+
+        def resolver(hostname):
+            calls.append(hostname)
+            if len(calls) > 1:
+                raise TimeoutError('resolver timed out')
+            return '10.0.0.1'
+
+        cache = DnsResolverCache(ttl=5, refresh_ahead=0.001, resolver=resolver)
+        assert cache.resolve('win01') == '10.0.0.1'
+        time.sleep(0.01)
+        assert cache.resolve('win01') == '10.0.0.1'
+        for _ in range(50):
+            if not cache._entries['win01'].refreshing:
+                break
+            time.sleep(0.01)
+        # 后台解析抛出非 gaierror 异常时保留旧结果，并允许再次预刷新
+        assert not cache._entries['win01'].refreshing
+        assert cache.resolve('win01') == '10.0.0.1'
+        for _ in range(50):
+            if len(calls) == 3:
+                break
+            time.sleep(0.01)
+        assert len(calls) == 3
+
+
+class _StreamingProtocol(_FakeProtocol):
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.cleaned = 0
+
+    def _raw_get_command_output(self, shell_id, command_id):
+        return self.responses.pop(0)
+
+    def cleanup_command(self, shell_id, command_id):
+        self.cleaned += 1
+
+
+class TestRemoteStream:
+    def test_progress_markers_split_across_chunks(self):
+        from utils.remote_stream import OutputChunk, OutputCollector
+
+        progress = []
+        collector = OutputCollector(on_progress=lambda p, m: progress.append((p, m)))
+        collector.feed(OutputChunk('stdout', b'step one\r\n##2C2A_PRO'))
+        collector.feed(OutputChunk('stdout', b'GRESS 40 half\r\ndone'))
+        collector.feed(OutputChunk('exit', status_code=0))
+        result = collector.result()
+
+        assert progress == [(40, 'half')]
+        assert result.std_out == 'step one\r\ndone'
+        assert result.success
+
+    def test_retained_output_is_bounded(self):
+        from utils.remote_stream import OutputChunk, OutputCollector
+
+        collector = OutputCollector(max_output=10)
+        for i in range(5):
+            collector.feed(OutputChunk('stdout', f'line{i}\n'.encode()))
+        collector.feed(OutputChunk('exit', status_code=0))
+        out = collector.result().std_out
+        assert out.endswith('e3\nline4\n')
+        assert '已丢弃前 20 个字符' in out
+
+    def test_client_streams_receive_responses(self):
+        from utils.remote_stream import stream_powershell
+        from utils.winrm_client import WinrmClient
+
+        client = WinrmClient('localhost', 'admin', 'secret', use_pool=False, max_retries=1)
+        session = _FakeWinrmSession()
+        session.protocol = _StreamingProtocol([
+            (b'##2C2A_PROGRESS 50 working\r\n', b'', -1, False),
+            (b'finished\r\n', b'', 0, True),
+        ])
+        client._session = session
+
+        seen = []
+        result = stream_powershell(
+            client, 'long-script',
+            on_output=lambda stream, text: seen.append(text),
+            on_progress=lambda p, m: seen.append(p),
+        )
+        assert seen == [50, 'finished\r\n']
+        assert result.std_out == 'finished\r\n'
+        assert result.status_code == 0
+        assert session.protocol.opened == session.protocol.closed == 1
+        assert session.protocol.cleaned == 1
+
+
+# 实现常驻进程协议的 Python 替身，代替 powershell.exe
+_PS_WORKER_STANDIN = r'''
+import base64, json, os, sys, time
+for line in sys.stdin:
+    req = json.loads(line)
+    script = base64.b64decode(req['script']).decode('utf-8')
+    if script == 'crash':
+        sys.exit(3)
+    if script.startswith('sleep '):
+        time.sleep(float(script.split()[1]))
+    print('banner noise')
+    out = f'{os.getpid()}:{script}'
+    resp = {
+        'id': req['id'],
+        'status': 0,
+        'stdout': base64.b64encode(out.encode('utf-8')).decode(),
+        'stderr': '',
+    }
+    print('<<<2C2A_PS_RESPONSE>>>' + json.dumps(resp), flush=True)
+'''
+
+
+class TestPowerShellWorker:
+    def setup_method(self):
+        import sys
+        from utils.powershell_worker import PowerShellWorkerPool
+        self.pool = PowerShellWorkerPool(
+            command=[sys.executable, '-c', _PS_WORKER_STANDIN], size=1, max_requests=0
+        )
+
+    def teardown_method(self):
+        self.pool.close()
+
+    def test_reuses_process_across_requests(self):
+        status, first, _ = self.pool.execute('Get-Date', timeout=10)
+        _, second, _ = self.pool.execute('用户', timeout=10)
+
+        assert status == 0
+        assert first.split(':')[1] == 'Get-Date'
+        assert second.split(':')[1] == '用户'
+        assert first.split(':')[0] == second.split(':')[0]
+
+    def test_timeout_kills_and_restarts(self):
+        from utils.powershell_worker import PowerShellWorkerTimeout
+
+        _, before, _ = self.pool.execute('warmup', timeout=10)
+        with pytest.raises(PowerShellWorkerTimeout):
+            self.pool.execute('sleep 5', timeout=0.3)
+        _, after, _ = self.pool.execute('again', timeout=10)
+        assert after.split(':')[0] != before.split(':')[0]
+
+    def test_crash_fails_request_and_restarts(self):
+        from utils.powershell_worker import PowerShellWorkerError
+
+        with pytest.raises(PowerShellWorkerError):
+            self.pool.execute('crash', timeout=10)
+        status, out, _ = self.pool.execute('recovered', timeout=10)
+        assert status == 0
+        assert out.endswith(':recovered')
+
+    def test_local_client_uses_worker_pool(self, monkeypatch):
+        from utils import local_winserver_client
+        from utils.local_winserver_client import LocalWinServerClient
+
+        monkeypatch.setattr(local_winserver_client, 'get_powershell_pool', lambda: self.pool)
+        client = LocalWinServerClient('admin', 'secret', timeout=1)
+
+        assert client.execute_powershell('Get-LocalUser').std_out.endswith(':Get-LocalUser')
+        assert client.execute_command('net', ['user']).std_out.endswith(':net user')
+        result = client.execute_powershell('sleep 5')
+        assert result.status_code == -1
+        assert '超时' in result.std_err
+
+
+class TestBulkUserOps:
+    def test_parse_maps_results_and_missing_users(self):
+        from utils.bulk_user_ops import RESULT_MARKER, parse_bulk_output
+
+        output = (
+            f'noise\n{RESULT_MARKER}\n'
+            '[{"name":"Alice","status":"disabled","message":"","last_logon":null},'
+            '{"name":"bob","status":"active","message":"","last_logon":"2026-01-01"}]'
+        )
+        statuses = parse_bulk_output(WinrmResult(0, output, ''), ['alice', 'bob', 'carol'])
+
+        assert statuses['alice'].status == 'disabled'
+        assert statuses['bob'].last_logon == '2026-01-01'
+        assert statuses['carol'].status == 'error'
+
+    def test_chunks_scripts_and_rejects_invalid_names(self, monkeypatch):
+        from utils import bulk_user_ops
+
+        monkeypatch.setattr(bulk_user_ops, 'MAX_USERS_PER_SCRIPT', 2)
+        scripts = []
+
+        class _Client:
+            def execute_powershell(self, script):
+                scripts.append(script)
+                names = [line for line in script.splitlines() if line.startswith('$names')][0]
+                users = [n.strip(' "') for n in names[len('$names = @('):-1].split(',')]
+                payload = ','.join(f'{{"name":"{u}","status":"disabled"}}' for u in users)
+                return WinrmResult(0, f'{bulk_user_ops.RESULT_MARKER}[{payload}]', '')
+
+        statuses = bulk_user_ops.bulk_disable_users(
+            _Client(), ['u1', 'u2', 'u3', 'bad;name'], inactive_days=30
+        )
+        assert len(scripts) == 2
+        assert 'AddDays(-30)' in scripts[0]
+        assert [statuses[u].status for u in ('u1', 'u2', 'u3')] == ['disabled'] * 3
+        assert statuses['bad;name'].status == 'error'
+
+    @pytest.mark.parametrize('name_length', [6, 15, 20])
+    def test_chunks_fit_cmd_command_line(self, name_length):
+        from utils import bulk_user_ops
+
+        usernames = [f'u{i:0{name_length - 1}d}' for i in range(450)]
+        scripts = []
+
+        class _Client:
+            def execute_powershell(self, script):
+                scripts.append(script)
+                return WinrmResult(0, '', '')
+
+        for run in (
+            lambda: bulk_user_ops.bulk_disable_users(_Client(), usernames, inactive_days=30),
+            lambda: bulk_user_ops.bulk_enable_users(_Client(), usernames),
+        ):
+            scripts.clear()
+            run()
+            assert len(scripts) > 1
+            for script in scripts:
+                assert bulk_user_ops.encoded_command_length(script) <= bulk_user_ops.MAX_COMMAND_LENGTH
+            covered = ''.join(scripts)
+            assert all(f'"{u}"' in covered for u in usernames)
+
+    def test_enable_script_enables_only_disabled_users(self):
+        from utils.bulk_user_ops import build_bulk_enable_script
+
+        script = build_bulk_enable_script(['alice', 'bob'])
+        assert '$names = @("alice", "bob")' in script
+        assert 'if (-not $user.Enabled) { Enable-LocalUser' in script
+        assert "status = 'enabled'" in script
+
+
+class TestProgressEvents:
+    def test_stream_sends_snapshot_events_and_closes_when_finished(self):
+        from utils import progress_events
+
+        state = {'status': 'running', 'progress': 10}
+        stream = progress_events.event_stream(
+            'test:stream', lambda: dict(state),
+            lambda p: p['status'] == 'success', heartbeat=0.05, max_seconds=5,
+        )
+        assert next(stream).startswith('retry:')
+        assert json.loads(next(stream)[len('data: '):]) == state
+
+        # 没有事件且快照未变化时发送心跳
+        assert next(stream) == ': keepalive\n\n'
+
+        def _publish():
+            time.sleep(0.05)
+            progress_events.publish('test:stream', {'status': 'running', 'progress': 50})
+            progress_events.publish('test:stream', {'status': 'success', 'progress': 100})
+
+        threading.Thread(target=_publish).start()
+        events = [json.loads(chunk[len('data: '):]) for chunk in stream if chunk.startswith('data:')]
+        assert [e['progress'] for e in events] == [50, 100]
+        assert 'test:stream' not in progress_events._local_broker._subscribers
+
+    def test_heartbeat_resyncs_from_snapshot(self):
+        from utils import progress_events
+
+        state = {'status': 'running', 'progress': 10}
+        stream = progress_events.event_stream(
+            'test:resync', lambda: dict(state),
+            lambda p: p['status'] == 'success', heartbeat=0.01, max_seconds=5,
+        )
+        next(stream)
+        next(stream)
+        state.update(status='success', progress=100)
+        assert json.loads(next(stream)[len('data: '):])['progress'] == 100
+        assert list(stream) == []
+
+    def test_default_stream_duration_below_gunicorn_timeout(self):
+        import re
+        from pathlib import Path
+
+        from django.conf import settings
+
+        from utils import progress_events
+
+        manual = Path(settings.BASE_DIR, 'docs', '04_部署运维手册.md').read_text(encoding='utf-8')
+        worker_timeout = int(re.search(r'^timeout = (\d+)', manual, re.M).group(1))
+        assert progress_events.DEFAULT_MAX_SECONDS < worker_timeout
+        assert settings.PROGRESS_STREAM_MAX_SECONDS < worker_timeout
+        # 最后一次心跳快照读取也要在超时前完成
+        assert settings.PROGRESS_STREAM_HEARTBEAT < settings.PROGRESS_STREAM_MAX_SECONDS
@@ -2,11 +2,22 @@
 import logging
 import re
 import os
+from base64 import b64encode
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List, Callable
 from winrm import Session
-from winrm.exceptions import InvalidCredentialsError
+from winrm.exceptions import InvalidCredentialsError, WinRMOperationTimeoutError
 from django.conf import settings
+from utils.circuit_breaker import (
+    STATE_OPEN,
+    CircuitOpenError,
+    backoff_delay,
+    get_circuit_breaker,
+)
+from utils.dns_cache import resolve_hostname
+from utils.host_semaphore import HostBusyError, get_host_semaphore
+from utils.winrm_pool import get_session_pool, make_pool_key
 import socket
 import time
 import secrets
@@ -79,6 +90,234 @@ class WinrmResult:
         return self.status_code == 0
 
 
+class RemoteShell:
+    """
+    WinRM远程Shell - 在同一个WS-Man Shell中执行多条命令
+
+    pywinrm 的 run_cmd/run_ps 每条命令都会创建并删除一个Shell，
+    多步操作（创建用户、加入远程桌面组、设置配额）因此要往返多次。
+    RemoteShell 在进入时创建Shell、退出时删除，期间的命令共用该Shell。
+    Shell内的命令失败不做重试：连接异常后该Shell已不可靠，直接抛出。
+    """
+
+    def __init__(self, client: 'WinrmClient'):
+        self.client = client
+        self.shell_id = None
+        self.command_count = 0
+        self._session = None
+        self._pooled = None
+        self._slot = None
+        self._failed = False
+        self._owner = True
+
+    def __enter__(self) -> 'RemoteShell':
+        if self.client._active_shell is not None:
+            # 嵌套使用时直接复用外层Shell
+            self._owner = False
+            return self.client._active_shell
+        self.open()
+        self.client._active_shell = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self._owner:
+            return False
+        self.client._active_shell = None
+        self.close()
+        return False
+
+    @property
+    def _demo(self) -> bool:
+        return os.environ.get('2C2A_DEMO', '').lower() == '1'
+
+    def open(self):
+        """借用会话并创建远程Shell"""
+        if self._demo:
+            return
+        self.client._check_circuit()
+        # 远程Shell占用主机的一个并发槽位，直到关闭
+        self._slot = self.client._slots.acquire()
+        try:
+            if self.client.use_pool:
+                self._pooled = get_session_pool().acquire(
+                    self.client._pool_key, self.client._create_session
+                )
+                self._session = self._pooled.session
+            else:
+                self._session = self.client.session
+        except Exception:
+            self._release()
+            raise
+        for attempt in range(self.client.max_retries):
+            try:
+                self.shell_id = self._session.protocol.open_shell()
+                self.client._record_success()
+                break
+            except Exception as e:
+                logger.error(
+                    f"创建远程Shell失败 (尝试 {attempt + 1}/{self.client.max_retries}): "
+                    f"主机={self.client.hostname}, 错误: {str(e)}"
+                )
+                self.client._record_failure(e)
+                if attempt == self.client.max_retries - 1 or self.client._circuit_open():
+                    self._failed = True
+                    self._release()
+                    raise Exception(f'创建远程Shell失败: {str(e)}')
+                time.sleep(self.client._retry_delay(attempt))
+        logger.info(f"已创建远程Shell: 主机={self.client.hostname}")
+
+    def close(self):
+        """删除远程Shell并归还会话"""
+        if self.shell_id is not None:
+            try:
+                self._session.protocol.close_shell(self.shell_id)
+            except Exception as e:
+                self._failed = True
+                logger.warning(f"关闭远程Shell失败: 主机={self.client.hostname}, 错误: {str(e)}")
+            self.shell_id = None
+            logger.info(
+                f"已关闭远程Shell: 主机={self.client.hostname}, "
+                f"执行命令数={self.command_count}"
+            )
+        self._release()
+
+    def _release(self):
+        if self._pooled is not None:
+            get_session_pool().release(
+                self.client._pool_key, self._pooled, discard=self._failed
+            )
+            self._pooled = None
+        self._session = None
+        if self._slot is not None:
+            self._slot.release()
+            self._slot = None
+
+    def _run(self, command: str, arguments=()) -> tuple:
+        if self.shell_id is None:
+            raise Exception('远程Shell未打开')
+        protocol = self._session.protocol
+        try:
+            command_id = protocol.run_command(self.shell_id, command, arguments)
+            try:
+                stdout, stderr, status_code = protocol.get_command_output(
+                    self.shell_id, command_id
+                )
+            finally:
+                protocol.cleanup_command(self.shell_id, command_id)
+        except Exception as e:
+            self._failed = True
+            self.client._record_failure(e)
+            raise
+        self.command_count += 1
+        return status_code, stdout, stderr
+
+    def execute_command(
+            self,
+            command: str,
+            arguments: Optional[list] = None
+    ) -> WinrmResult:
+        """在Shell中执行远程命令"""
+        if self._demo:
+            return self.client.execute_command(command, arguments)
+
+        logger.info(f"在远程Shell中执行命令: {command}, 参数: {arguments}")
+        try:
+            status_code, stdout, stderr = self._run(command, arguments or [])
+        except Exception as e:
+            logger.error(f"远程Shell命令执行失败: {command}, 错误: {str(e)}")
+            raise Exception(f'命令执行失败: {str(e)}')
+
+        return WinrmResult(
+            status_code=status_code,
+            std_out=stdout.decode('utf-8', errors='ignore'),
+            std_err=stderr.decode('utf-8', errors='ignore')
+        )
+
+    def execute_powershell(
+            self,
+            script: str,
+            arguments: Optional[Dict[str, Any]] = None
+    ) -> WinrmResult:
+        """在Shell中执行PowerShell脚本"""
+        if self._demo:
+            return self.client.execute_powershell(script, arguments)
+
+        logger.info("在远程Shell中执行PowerShell脚本")
+        encoded_ps = b64encode(script.encode('utf_16_le')).decode('ascii')
+        try:
+            status_code, stdout, stderr = self._run(
+                f'powershell -encodedcommand {encoded_ps}'
+            )
+        except Exception as e:
+            logger.error(f"远程Shell PowerShell脚本执行失败, 错误: {str(e)}")
+            raise Exception(f'PowerShell执行失败: {str(e)}')
+
+        if stderr:
+            stderr = self._session._clean_error_msg(stderr)
+
+        winrm_result = WinrmResult(
+            status_code=status_code,
+            std_out=stdout.decode('utf-8', errors='ignore'),
+            std_err=stderr.decode('utf-8', errors='ignore')
+        )
+        if not winrm_result.success:
+            logger.warning(
+                f"PowerShell脚本执行返回非零状态码: "
+                f"状态码={status_code}, 错误={winrm_result.std_err}"
+            )
+        return winrm_result
+
+    def iter_powershell(self, script: str) -> Iterator['OutputChunk']:
+        """
+        在Shell中执行PowerShell脚本并逐段返回输出
+
+        每个 WS-Man Receive 响应产生 stdout/stderr 片段，
+        命令结束时产生一个 stream='exit' 的片段（携带退出码）。
+        调用方提前停止迭代时会发送终止信号并清理远程命令。
+        """
+        from utils.remote_stream import OutputChunk
+
+        if self._demo:
+            result = self.client.execute_powershell(script)
+            yield OutputChunk('stdout', result.std_out.encode('utf-8'))
+            yield OutputChunk('exit', status_code=result.status_code)
+            return
+        if self.shell_id is None:
+            raise Exception('远程Shell未打开')
+
+        encoded_ps = b64encode(script.encode('utf_16_le')).decode('ascii')
+        protocol = self._session.protocol
+        status_code = -1
+        try:
+            command_id = protocol.run_command(
+                self.shell_id, f'powershell -encodedcommand {encoded_ps}'
+            )
+            try:
+                done = False
+                while not done:
+                    try:
+                        stdout, stderr, status_code, done = \
+                            protocol._raw_get_command_output(self.shell_id, command_id)
+                    except WinRMOperationTimeoutError:
+                        # 长时间无输出时服务端返回超时，继续等待
+                        continue
+                    if stdout:
+                        yield OutputChunk('stdout', stdout)
+                    if stderr:
+                        yield OutputChunk('stderr', stderr)
+            finally:
+                protocol.cleanup_command(self.shell_id, command_id)
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            self._failed = True
+            self.client._record_failure(e)
+            logger.error(f"远程Shell流式执行失败, 错误: {str(e)}")
+            raise Exception(f'PowerShell执行失败: {str(e)}')
+        self.command_count += 1
+        yield OutputChunk('exit', status_code=status_code)
+
+
 class WinrmClient:
     """WinRM客户端 - 远程管理Windows主机"""
 
@@ -94,7 +333,10 @@ class WinrmClient:
             server_cert_validation: str = 'ignore',
             ca_trust_path: Optional[str] = None,
             client_cert_pem: Optional[str] = None,
-            client_cert_key: Optional[str] = None
+            client_cert_key: Optional[str] = None,
+            use_pool: bool = True,
+            max_concurrency: Optional[int] = None,
+            bypass_circuit: bool = False
     ):
         """
         初始化WinRM客户端
@@ -111,6 +353,11 @@ class WinrmClient:
             ca_trust_path: CA证书路径（用于验证服务器证书）
             client_cert_pem: 客户端证书PEM文件路径
             client_cert_key: 客户端证书私钥文件路径
+            use_pool: 是否从进程级会话池复用会话，默认为True
+            max_concurrency: 该主机同时进行的远程操作数上限，
+                默认使用配置文件中的 HOST_MAX_CONCURRENT_OPERATIONS
+            bypass_circuit: 忽略熔断状态直接访问主机（管理员手动重测时使用），
+                成功后熔断器恢复
         """
         # 检查主机名是否包含端口（例如 "hostname:port" 或 "ip:port" 格式）
         if ':' in hostname and not hostname.startswith('http'):
@@ -177,8 +424,41 @@ class WinrmClient:
         if not self._validate_hostname():
             raise ValueError(f"主机名无法解析: {self.hostname}")
 
-        # 初始化会话对象
-        self.session = Session(
+        # 会话池键：相同端点、凭据和证书配置的客户端共享会话
+        self.use_pool = use_pool
+        self._pool_key = make_pool_key(
+            self.endpoint,
+            self.username,
+            self.password,
+            server_cert_validation=self.server_cert_validation,
+            ca_trust_path=self.ca_trust_path,
+            client_cert_pem=self.client_cert_pem,
+            client_cert_key=self.client_cert_key,
+            timeout=self.timeout,
+        )
+        self._session = None
+        # 当前打开的远程Shell（见 remote_shell），打开期间所有命令复用该Shell
+        self._active_shell = None
+
+        # 主机熔断器：主机持续不可达时直接失败，避免每个调用方都等待超时
+        self._breaker = None
+        self.bypass_circuit = bypass_circuit
+        if getattr(settings, 'WINRM_CIRCUIT_ENABLED', True):
+            self._breaker = get_circuit_breaker(f'{self.hostname}:{self.port}')
+
+        # 主机并发槽位：限制同一主机上同时进行的远程操作，避免触发 WinRM 配额限流
+        self._slots = get_host_semaphore(f'{self.hostname}:{self.port}', max_concurrency)
+
+        logger.info(
+            f"初始化WinRM客户端: 主机={self.hostname}, 端口={self.port}, "
+            f"SSL={use_ssl}, 验证模式={server_cert_validation}, "
+            f"超时={self.timeout}秒, 最大重试={self.max_retries}次, "
+            f"会话池={'启用' if use_pool else '禁用'}"
+        )
+
+    def _create_session(self) -> Session:
+        """创建新的pywinrm会话对象"""
+        return Session(
             self.endpoint,
             auth=(self.username, self.password),
             transport='ntlm',
@@ -191,22 +471,77 @@ class WinrmClient:
             read_timeout_sec=self.timeout + 10
         )
 
-        logger.info(
-            f"初始化WinRM客户端: 主机={self.hostname}, 端口={self.port}, "
-            f"SSL={use_ssl}, 验证模式={server_cert_validation}, "
-            f"超时={self.timeout}秒, 最大重试={self.max_retries}次"
+    @property
+    def session(self) -> Session:
+        """
+        客户端独占的会话对象（不经过会话池）
+
+        保留给需要直接操作pywinrm会话的调用方，
+        常规命令执行请使用 _session_scope()。
+        """
+        if self._session is None:
+            self._session = self._create_session()
+        return self._session
+
+    @contextmanager
+    def _session_scope(self):
+        """
+        借用一个会话执行远程操作
+
+        启用会话池时从池中借出，块内出现异常时该会话会被丢弃；
+        否则使用客户端独占的会话。
+        """
+        if not self.use_pool:
+            yield self.session
+            return
+        with get_session_pool().session(self._pool_key, self._create_session) as session:
+            yield session
+
+    def _check_circuit(self):
+        """主机处于熔断状态时抛出 CircuitOpenError（bypass_circuit 时不检查）"""
+        if self.bypass_circuit:
+            return
+        if self._breaker is not None and not self._breaker.allow_request():
+            retry_after = self._breaker.retry_after()
+            logger.warning(
+                f"主机熔断中，跳过远程调用: {self.hostname}:{self.port}, "
+                f"剩余 {retry_after:.0f} 秒"
+            )
+            raise CircuitOpenError(f'{self.hostname}:{self.port}', retry_after)
+
+    def _circuit_open(self) -> bool:
+        return self._breaker is not None and self._breaker.state == STATE_OPEN
+
+    def _record_success(self):
+        if self._breaker is not None:
+            self._breaker.record_success()
+
+    def _record_failure(self, error: Exception):
+        # 认证失败说明主机可达，不计入熔断
+        if self._breaker is not None and not isinstance(error, InvalidCredentialsError):
+            self._breaker.record_failure()
+
+    def _retry_delay(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（带抖动的指数退避）"""
+        return backoff_delay(
+            attempt,
+            getattr(settings, 'WINRM_RETRY_BACKOFF_BASE', 1),
+            getattr(settings, 'WINRM_RETRY_BACKOFF_MAX', 10),
         )
 
     def _validate_hostname(self) -> bool:
         """
         验证主机名是否可以解析
+
+        解析结果（包括失败）由 utils.dns_cache 缓存，
+        同一主机的后续客户端无需再次等待 DNS。
         
         Returns:
             bool: 如果主机名可以解析则返回True，否则返回False
         """
         try:
             # 尝试解析主机名
-            socket.gethostbyname(self.hostname)
+            resolve_hostname(self.hostname)
             return True
         except socket.gaierror:
             logger.error(f"无法解析主机名: {self.hostname}:{self.port}")
@@ -215,6 +550,21 @@ class WinrmClient:
             logger.error(f"验证主机名时发生未知错误: {str(e)}")
             return False
 
+    def remote_shell(self) -> 'RemoteShell':
+        """
+        打开一个可复用的远程Shell
+
+        在 with 块内，本客户端的 execute_command / execute_powershell
+        以及基于它们的用户管理方法都在同一个WS-Man Shell中执行，
+        只需一次Shell创建和删除。
+
+        示例:
+            with client.remote_shell():
+                client.create_user(username, password)
+                set_user_disk_quotas(client, username, quotas)
+        """
+        return RemoteShell(self)
+
     def execute_command(
             self,
             command: str,
@@ -244,11 +594,17 @@ class WinrmClient:
                 std_err=""
             )
         
+        if self._active_shell is not None:
+            return self._active_shell.execute_command(command, arguments)
+
         logger.info(f"执行远程命令: {command}, 参数: {arguments}")
+        self._check_circuit()
 
         for attempt in range(self.max_retries):
             try:
-                result = self.session.run_cmd(command, arguments or [])
+                with self._slots.slot(), self._session_scope() as session:
+                    result = session.run_cmd(command, arguments or [])
+                self._record_success()
                 winrm_result = WinrmResult(
                     status_code=result.status_code,
                     std_out=result.std_out.decode('utf-8', errors='ignore'),
@@ -264,6 +620,9 @@ class WinrmClient:
                     )
 
                 return winrm_result
+            except HostBusyError:
+                # 主机繁忙不是连接故障，不重试也不计入熔断
+                raise
             except Exception as e:
                 # 检查是否是网络连接错误
                 error_str = str(e)
@@ -275,13 +634,14 @@ class WinrmClient:
                     f"命令执行失败 (尝试 {attempt + 1}/{self.max_retries}): "
                     f"{command}, 错误: {str(e)}"
                 )
+                self._record_failure(e)
 
-                if attempt == self.max_retries - 1:
+                if attempt == self.max_retries - 1 or self._circuit_open():
                     logger.error(f"命令执行最终失败: {command}")
                     raise Exception(f'命令执行失败: {str(e)}')
                 
-                # 在重试之间等待一段时间
-                time.sleep(1)
+                # 在重试之间等待一段时间（指数退避）
+                time.sleep(self._retry_delay(attempt))
 
     def execute_powershell(
             self,
@@ -312,11 +672,17 @@ class WinrmClient:
                 std_err=""
             )
         
+        if self._active_shell is not None:
+            return self._active_shell.execute_powershell(script)
+
         logger.info("执行PowerShell脚本")
+        self._check_circuit()
 
         for attempt in range(self.max_retries):
             try:
-                result = self.session.run_ps(script)
+                with self._slots.slot(), self._session_scope() as session:
+                    result = session.run_ps(script)
+                self._record_success()
                 winrm_result = WinrmResult(
                     status_code=result.status_code,
                     std_out=result.std_out.decode('utf-8', errors='ignore'),
@@ -332,6 +698,9 @@ class WinrmClient:
                     )
 
                 return winrm_result
+            except HostBusyError:
+                # 主机繁忙不是连接故障，不重试也不计入熔断
+                raise
             except Exception as e:
                 # 检查是否是网络连接错误
                 error_str = str(e)
@@ -343,13 +712,58 @@ class WinrmClient:
                     f"PowerShell脚本执行失败 (尝试 {attempt + 1}/{self.max_retries}), "
                     f"错误: {str(e)}"
                 )
+                self._record_failure(e)
 
-                if attempt == self.max_retries - 1:
+                if attempt == self.max_retries - 1 or self._circuit_open():
                     logger.error("PowerShell脚本执行最终失败")
                     raise Exception(f'PowerShell执行失败: {str(e)}')
                 
-                # 在重试之间等待一段时间
-                time.sleep(1)
+                # 在重试之间等待一段时间（指数退避）
+                time.sleep(self._retry_delay(attempt))
+
+    def stream_powershell(
+            self,
+            script: str,
+            on_output: Optional[Callable[[str, str], None]] = None,
+            on_progress: Optional[Callable[[int, str], None]] = None,
+            max_output: Optional[int] = None,
+    ) -> WinrmResult:
+        """
+        流式执行PowerShell脚本
+
+        输出随 WS-Man Receive 响应逐段回调，只保留最后 max_output 个字符；
+        脚本输出的进度标记行（见 utils.remote_stream.progress_marker）
+        触发 on_progress 且不计入结果。流式执行不做重试。
+
+        参数:
+            script: 要执行的PowerShell脚本
+            on_output: 输出回调 on_output(stream, text)
+            on_progress: 进度回调 on_progress(percent, message)
+            max_output: 每个流最多保留的字符数，默认 1MB
+
+        返回:
+            WinrmResult对象，包含执行结果
+        """
+        from utils.remote_stream import DEFAULT_MAX_OUTPUT, OutputCollector
+
+        collector = OutputCollector(
+            max_output or DEFAULT_MAX_OUTPUT,
+            on_output=on_output,
+            on_progress=on_progress,
+        )
+        logger.info("流式执行PowerShell脚本")
+        with self.remote_shell() as shell:
+            for chunk in shell.iter_powershell(script):
+                collector.feed(chunk)
+            clean = shell._session._clean_error_msg if shell._session is not None else None
+            result = collector.result(clean_stderr=clean)
+
+        if not result.success:
+            logger.warning(
+                f"PowerShell脚本执行返回非零状态码: "
+                f"状态码={result.status_code}, 错误={result.std_err[:500]}"
+            )
+        return result
 
     def create_user(
             self,
@@ -383,8 +797,9 @@ Add-LocalGroupMember -Group "Users" -Member "{safe_user}" -ErrorAction Stop
             script += f'Add-LocalGroupMember -Group "{safe_group}" -Member "{safe_user}" -ErrorAction Stop\n'
 
         logger.info(f"创建用户: {username}")
-        result = self.execute_powershell(script)
-        self.add_to_remote_users(username)
+        with self.remote_shell():
+            result = self.execute_powershell(script)
+            self.add_to_remote_users(username)
         return result
 
     def create_user_with_reset_password_on_next_login(
@@ -420,8 +835,9 @@ Add-LocalGroupMember -Group "Users" -Member "{safe_user}" -ErrorAction Stop
             script += f'Add-LocalGroupMember -Group "{safe_group}" -Member "{safe_user}" -ErrorAction Stop\n'
 
         logger.info(f"创建用户(首登改密): {username}")
-        result = self.execute_powershell(script)
-        self.add_to_remote_users(username)
+        with self.remote_shell():
+            result = self.execute_powershell(script)
+            self.add_to_remote_users(username)
         return result
 
     def delete_user(self, username: str) -> WinrmResult:
@@ -631,9 +1047,10 @@ Add-LocalGroupMember -Group "Users" -Member "{safe_user}" -ErrorAction Stop
 $pw = ConvertTo-SecureString "{safe_pass}" -AsPlainText -Force
 Set-LocalUser -Name "{safe_user}" -Password $pw
 '''
-        result = self.execute_powershell(script)
-        if result.success:
-            self.add_to_remote_users(username)
+        with self.remote_shell():
+            result = self.execute_powershell(script)
+            if result.success:
+                self.add_to_remote_users(username)
         return result
 
     def add_to_remote_users(self, username: str) -> WinrmResult:
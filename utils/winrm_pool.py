@@ -0,0 +1,356 @@
+"""
+WinRM 会话池
+
+进程级共享的 pywinrm Session 池，按 (端点, 凭据, 证书配置) 复用会话，
+避免每次远程操作都重新进行 TCP/TLS 建连和 NTLM 握手。
+
+特性：
+- 会话以"借出/归还"方式独占使用（NTLM 认证绑定在连接上，不能并发共享）
+- 每个主机的最大会话数限制，超出时等待归还
+- 空闲超时淘汰与最大生命周期回收
+- 借出前健康检查，使用中出现异常的会话直接丢弃
+- fork 后自动重建（Celery prefork 子进程不与父进程共享 socket）
+
+使用方式：
+    from utils.winrm_pool import get_session_pool
+
+    pool = get_session_pool()
+    with pool.session(key, factory) as session:
+        session.run_ps('whoami')
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('2c2a')
+
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_IDLE_TIMEOUT = 300
+DEFAULT_MAX_LIFETIME = 3600
+DEFAULT_ACQUIRE_TIMEOUT = 30
+
+
+class SessionPoolTimeout(Exception):
+    pass
+
+
+def make_pool_key(
+        endpoint: str,
+        username: str,
+        password: str,
+        server_cert_validation: str = 'ignore',
+        ca_trust_path: Optional[str] = None,
+        client_cert_pem: Optional[str] = None,
+        client_cert_key: Optional[str] = None,
+        timeout: Optional[int] = None,
+) -> Tuple:
+    """
+    生成会话池键
+
+    密码只以摘要形式参与键计算，池中不保存明文凭据。
+    """
+    password_digest = hashlib.sha256(
+        (password or '').encode('utf-8')
+    ).hexdigest()
+    return (
+        endpoint,
+        username,
+        password_digest,
+        server_cert_validation,
+        ca_trust_path or '',
+        client_cert_pem or '',
+        client_cert_key or '',
+        timeout or 0,
+    )
+
+
+@dataclass
+class _PooledSession:
+    session: Any
+    created_at: float = field(default_factory=time.monotonic)
+    last_used_at: float = field(default_factory=time.monotonic)
+    use_count: int = 0
+
+
+class _HostSlot:
+    """同一池键下的空闲会话与借出计数"""
+
+    def __init__(self):
+        self.idle: List[_PooledSession] = []
+        self.in_use = 0
+        self.condition = None
+
+
+class WinrmSessionPool:
+    """WinRM 会话池"""
+
+    def __init__(
+            self,
+            max_per_host: int = DEFAULT_MAX_PER_HOST,
+            idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+            max_lifetime: float = DEFAULT_MAX_LIFETIME,
+            acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+    ):
+        """
+        初始化会话池
+
+        参数:
+            max_per_host: 每个池键同时存在的最大会话数（空闲 + 借出）
+            idle_timeout: 空闲会话的淘汰时间（秒）
+            max_lifetime: 会话的最大生命周期（秒），超过后不再复用
+            acquire_timeout: 达到上限时等待会话归还的最长时间（秒）
+        """
+        self.max_per_host = max(1, int(max_per_host))
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._slots: Dict[Tuple, _HostSlot] = {}
+        self._pid = os.getpid()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'evicted': 0,
+            'discarded': 0,
+            'waits': 0,
+        }
+
+    def _check_fork(self):
+        """fork 后丢弃从父进程继承的会话"""
+        if self._pid != os.getpid():
+            self._slots = {}
+            self._pid = os.getpid()
+
+    def _get_slot(self, key: Tuple) -> _HostSlot:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = _HostSlot()
+            slot.condition = threading.Condition(self._lock)
+            self._slots[key] = slot
+        return slot
+
+    def _is_expired(self, pooled: _PooledSession, now: float) -> bool:
+        if self.idle_timeout and now - pooled.last_used_at > self.idle_timeout:
+            return True
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            return True
+        return False
+
+    @staticmethod
+    def _is_healthy(pooled: _PooledSession) -> bool:
+        """
+        借出前的本地健康检查
+
+        不发起远程请求：只确认底层 transport 仍然存在，
+        真正的连接故障会在使用时抛出异常并导致会话被丢弃。
+        """
+        protocol = getattr(pooled.session, 'protocol', None)
+        if protocol is None:
+            return True
+        return getattr(protocol, 'transport', None) is not None
+
+    @staticmethod
+    def _close(pooled: _PooledSession):
+        try:
+            transport = pooled.session.protocol.transport
+            transport.close_session()
+        except Exception:
+            pass
+
+    def acquire(self, key: Tuple, factory: Callable[[], Any]) -> _PooledSession:
+        """
+        借出一个会话，没有可用空闲会话时新建
+
+        异常:
+            SessionPoolTimeout: 达到每主机上限且等待超时
+        """
+        to_close = []
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._lock:
+            self._check_fork()
+            slot = self._get_slot(key)
+            while True:
+                now = time.monotonic()
+                while slot.idle:
+                    pooled = slot.idle.pop()
+                    if self._is_expired(pooled, now) or not self._is_healthy(pooled):
+                        to_close.append(pooled)
+                        self._stats['evicted'] += 1
+                        continue
+                    slot.in_use += 1
+                    self._stats['reused'] += 1
+                    break
+                else:
+                    pooled = None
+
+                if pooled is not None:
+                    break
+                if slot.in_use < self.max_per_host:
+                    slot.in_use += 1
+                    break
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    for stale in to_close:
+                        self._close(stale)
+                    raise SessionPoolTimeout(
+                        f'等待WinRM会话超时: 已达到每主机最大会话数 {self.max_per_host}'
+                    )
+                self._stats['waits'] += 1
+                slot.condition.wait(remaining)
+
+        for stale in to_close:
+            self._close(stale)
+
+        if pooled is not None:
+            return pooled
+
+        try:
+            session = factory()
+        except Exception:
+            with self._lock:
+                slot.in_use -= 1
+                slot.condition.notify()
+            raise
+        with self._lock:
+            self._stats['created'] += 1
+        return _PooledSession(session=session)
+
+    def release(self, key: Tuple, pooled: _PooledSession, discard: bool = False):
+        """
+        归还会话
+
+        参数:
+            discard: 为 True 时关闭会话而不放回池中（使用中出现了异常）
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            slot = self._get_slot(key)
+            slot.in_use = max(0, slot.in_use - 1)
+            pooled.last_used_at = now
+            pooled.use_count += 1
+            keep = not discard and not self._is_expired(pooled, now)
+            if keep:
+                slot.idle.append(pooled)
+            else:
+                self._stats['discarded'] += 1
+            slot.condition.notify()
+        if not keep:
+            self._close(pooled)
+
+    @contextmanager
+    def session(self, key: Tuple, factory: Callable[[], Any]):
+        """
+        以上下文管理器方式借用会话
+
+        代码块内抛出异常时，会话被视为不可靠并直接丢弃。
+        """
+        pooled = self.acquire(key, factory)
+        try:
+            yield pooled.session
+        except BaseException:
+            self.release(key, pooled, discard=True)
+            raise
+        else:
+            self.release(key, pooled)
+
+    def evict_idle(self) -> int:
+        """淘汰所有过期的空闲会话，返回淘汰数量"""
+        now = time.monotonic()
+        to_close = []
+        with self._lock:
+            self._check_fork()
+            for key in list(self._slots.keys()):
+                slot = self._slots[key]
+                alive = []
+                for pooled in slot.idle:
+                    if self._is_expired(pooled, now):
+                        to_close.append(pooled)
+                    else:
+                        alive.append(pooled)
+                slot.idle = alive
+                if not slot.idle and slot.in_use == 0:
+                    del self._slots[key]
+            self._stats['evicted'] += len(to_close)
+        for pooled in to_close:
+            self._close(pooled)
+        return len(to_close)
+
+    def clear(self, key: Optional[Tuple] = None):
+        """关闭空闲会话；指定 key 时只清理该主机"""
+        to_close = []
+        with self._lock:
+            self._check_fork()
+            keys = [key] if key is not None else list(self._slots.keys())
+            for k in keys:
+                slot = self._slots.get(k)
+                if slot is None:
+                    continue
+                to_close.extend(slot.idle)
+                slot.idle = []
+        for pooled in to_close:
+            self._close(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回池的统计信息"""
+        with self._lock:
+            data = dict(self._stats)
+            data['hosts'] = len(self._slots)
+            data['idle'] = sum(len(s.idle) for s in self._slots.values())
+            data['in_use'] = sum(s.in_use for s in self._slots.values())
+        return data
+
+
+_session_pool = None
+_session_pool_lock = threading.Lock()
+
+
+def get_session_pool() -> WinrmSessionPool:
+    """
+    获取进程级共享的会话池
+
+    参数从 settings 读取：
+        WINRM_POOL_MAX_PER_HOST, WINRM_POOL_IDLE_TIMEOUT,
+        WINRM_POOL_MAX_LIFETIME, WINRM_POOL_ACQUIRE_TIMEOUT
+    """
+    global _session_pool
+    if _session_pool is not None:
+        return _session_pool
+
+    with _session_pool_lock:
+        if _session_pool is None:
+            from django.conf import settings
+            _session_pool = WinrmSessionPool(
+                max_per_host=getattr(
+                    settings, 'WINRM_POOL_MAX_PER_HOST', DEFAULT_MAX_PER_HOST
+                ),
+                idle_timeout=getattr(
+                    settings, 'WINRM_POOL_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT
+                ),
+                max_lifetime=getattr(
+                    settings, 'WINRM_POOL_MAX_LIFETIME', DEFAULT_MAX_LIFETIME
+                ),
+                acquire_timeout=getattr(
+                    settings, 'WINRM_POOL_ACQUIRE_TIMEOUT', DEFAULT_ACQUIRE_TIMEOUT
+                ),
+            )
+    return _session_pool
+
+
+def reset_session_pool():
+    """
+    关闭并重置会话池（主要用于测试）
+    """
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is not None:
+            _session_pool.clear()
+        _session_pool = None